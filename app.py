@@ -2,9 +2,22 @@ import os
 import time as _time
 import threading as _threading
 import requests
+import upstream_http
+import rainforest_client
 import json
 import base64
+import hmac
+import hashlib
+import atexit
 import re
+import csv
+import functools
+import platform
+import io
+import shutil
+import tempfile
+import jwt
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 
@@ -65,13 +78,233 @@ def _clear_negative_cache(code):
         _negative_cache.pop(key, None)
 
 
+# In-process L1 cache of resolved api_lookup_cache rows, keyed by
+# (column, CODE) where column is fnsku / asin / upc. Repeat scans of the same
+# item (common on a POS counter or when a batch is retried) otherwise pay a
+# full Supabase round-trip before anything else happens. Entries are bounded
+# (LRU eviction) and short-lived so other workers' writes show up quickly;
+# writes made by this process invalidate the affected codes immediately.
+_product_l1_cache = OrderedDict()  # (column, code) -> (row, expires_at_unix)
+_product_l1_lock = _threading.Lock()
+_PRODUCT_L1_COLUMNS = ('fnsku', 'asin', 'upc')
+
+
+def _product_l1_row_is_cacheable(column, row):
+    """Only cache rows that already carry a usable answer (not pending lookups)."""
+    if not row or not isinstance(row, dict):
+        return False
+    asin = str(row.get('asin') or '').strip()
+    if len(asin) >= 10:
+        return True
+    return column == 'upc' and bool(row.get('product_name'))
+
+
+def _product_l1_get(column, code):
+    if not code or PRODUCT_L1_CACHE_MAX_ENTRIES <= 0:
+        return None
+    key = (column, str(code).strip().upper())
+    now = _time.time()
+    with _product_l1_lock:
+        entry = _product_l1_cache.get(key)
+        if not entry:
+            return None
+        if entry[1] < now:
+            _product_l1_cache.pop(key, None)
+            return None
+        _product_l1_cache.move_to_end(key)
+        return dict(entry[0])
+
+
+def _product_l1_put(column, code, row):
+    if not code or PRODUCT_L1_CACHE_MAX_ENTRIES <= 0:
+        return
+    if not _product_l1_row_is_cacheable(column, row):
+        return
+    key = (column, str(code).strip().upper())
+    with _product_l1_lock:
+        _product_l1_cache[key] = (dict(row), _time.time() + PRODUCT_L1_CACHE_TTL_SECONDS)
+        _product_l1_cache.move_to_end(key)
+        while len(_product_l1_cache) > PRODUCT_L1_CACHE_MAX_ENTRIES:
+            _product_l1_cache.popitem(last=False)
+
+
+def _product_l1_invalidate(*codes):
+    """Drop every L1 entry keyed by, or whose row carries, one of the given FNSKU/ASIN/UPC codes."""
+    targets = {str(c).strip().upper() for c in codes if c and str(c).strip()}
+    if not targets:
+        return
+    with _product_l1_lock:
+        stale = [
+            key for key, (row, _expires) in _product_l1_cache.items()
+            if key[1] in targets or any(
+                str(row.get(column) or '').strip().upper() in targets for column in _PRODUCT_L1_COLUMNS
+            )
+        ]
+        for key in stale:
+            _product_l1_cache.pop(key, None)
+
+
+def _product_l1_clear():
+    with _product_l1_lock:
+        _product_l1_cache.clear()
+
+
+def _rpc_function_missing(error):
+    """True when a PostgREST error says the called function does not exist (migration not applied)."""
+    code = str(getattr(error, 'code', '') or '')
+    if code in ('PGRST202', '42883'):
+        return True
+    message = str(getattr(error, 'message', '') or error).lower()
+    return 'could not find the function' in message or ('function' in message and 'does not exist' in message)
+
+
+# Write-behind accumulator for api_lookup_cache access bookkeeping. Cache hits record
+# (row id -> hits, last access) here instead of issuing an UPDATE on the request path;
+# a daemon thread flushes everything every CACHE_ACCESS_FLUSH_SECONDS through the
+# bump_api_lookup_cache_access RPC (one statement, atomic increments), and atexit
+# flushes whatever is left when the worker shuts down.
+_cache_access_pending = {}  # row id -> {'hits', 'last_accessed', 'seen_count'}
+_cache_access_lock = _threading.Lock()
+_cache_access_wakeup = _threading.Event()
+_cache_access_thread = None
+
+
+def _cache_access_record(cached_row, accessed_at=None):
+    """Count one cache hit for an api_lookup_cache row; the write happens later in bulk."""
+    row_id = cached_row.get('id') if cached_row else None
+    if row_id is None:
+        return
+    accessed_at = accessed_at or datetime.now(timezone.utc).isoformat()
+    with _cache_access_lock:
+        entry = _cache_access_pending.get(row_id)
+        if entry is None:
+            entry = {'hits': 0, 'last_accessed': accessed_at, 'seen_count': cached_row.get('lookup_count') or 0}
+            _cache_access_pending[row_id] = entry
+        entry['hits'] += 1
+        entry['last_accessed'] = max(entry['last_accessed'], accessed_at)
+        backlog = len(_cache_access_pending)
+    _cache_access_ensure_started()
+    if backlog >= CACHE_ACCESS_MAX_PENDING:
+        _cache_access_wakeup.set()
+
+
+def _cache_access_requeue(pending):
+    """Merge entries from a failed flush back into _cache_access_pending."""
+    with _cache_access_lock:
+        for row_id, entry in pending.items():
+            current = _cache_access_pending.get(row_id)
+            if current is None:
+                _cache_access_pending[row_id] = entry
+            else:
+                current['hits'] += entry['hits']
+                current['last_accessed'] = max(current['last_accessed'], entry['last_accessed'])
+                current['seen_count'] = entry['seen_count']
+
+
+def _cache_access_flush():
+    """Write all pending access counts. Returns the number of rows flushed."""
+    with _cache_access_lock:
+        if not _cache_access_pending:
+            return 0
+        pending = dict(_cache_access_pending)
+        _cache_access_pending.clear()
+    if not supabase_admin:
+        return 0
+    rows = [{'id': row_id, 'hits': e['hits'], 'last_accessed': e['last_accessed']} for row_id, e in pending.items()]
+    try:
+        supabase_admin.rpc('bump_api_lookup_cache_access', {'p_rows': rows}).execute()
+        return len(rows)
+    except Exception as e:
+        if not _rpc_function_missing(e):
+            # The RPC may have committed; an absolute write from stale seen_count would clobber other
+            # workers' increments. Keep the hits for the next flush through the additive RPC.
+            logger.warning(f"bump_api_lookup_cache_access failed (retrying on the next flush): {e}")
+            _cache_access_requeue(pending)
+            return 0
+        logger.warning(f"bump_api_lookup_cache_access RPC unavailable (falling back to per-row updates): {e}")
+    flushed = 0
+    for row_id, entry in pending.items():
+        try:
+            supabase_admin.table('api_lookup_cache').update({
+                'last_accessed': entry['last_accessed'],
+                'lookup_count': entry['seen_count'] + entry['hits'],
+            }).eq('id', row_id).execute()
+            flushed += 1
+        except Exception as e:
+            logger.warning(f"Could not update access tracking for api_lookup_cache id={row_id}: {e}")
+    return flushed
+
+
+def _cache_access_loop():
+    while True:
+        _cache_access_wakeup.wait(max(0.5, CACHE_ACCESS_FLUSH_SECONDS))
+        _cache_access_wakeup.clear()
+        try:
+            _cache_access_flush()
+        except Exception as e:
+            logger.warning(f"Cache access flush failed: {e}")
+
+
+def _cache_access_ensure_started():
+    global _cache_access_thread
+    if _cache_access_thread is not None and _cache_access_thread.is_alive():
+        return
+    with _cache_access_lock:
+        if _cache_access_thread is not None and _cache_access_thread.is_alive():
+            return
+        _cache_access_thread = _threading.Thread(target=_cache_access_loop, name='cache-access-flush', daemon=True)
+        _cache_access_thread.start()
+
+
+atexit.register(_cache_access_flush)
+
+
+# Single-flight registry: concurrent callers resolving the same key (e.g. one unknown
+# FNSKU scanned by several people at once) wait for the first caller's result instead
+# of each paying for AddOrGet, the poll loop and Rainforest, and racing on the cache insert.
+_singleflight_calls = {}  # key -> {'event', 'result', 'error'}
+_singleflight_lock = _threading.Lock()
+_SINGLEFLIGHT_WAIT_SECONDS = 60
+
+
+def _singleflight_do(key, fn):
+    """
+    Run fn() at most once per key across concurrent callers in this process.
+    Returns (result, shared) where shared is True for callers that joined an in-flight call.
+    Exceptions raised by the leader are re-raised in every waiter.
+    """
+    with _singleflight_lock:
+        call = _singleflight_calls.get(key)
+        leader = call is None
+        if leader:
+            call = {'event': _threading.Event(), 'result': None, 'error': None}
+            _singleflight_calls[key] = call
+    if not leader:
+        if not call['event'].wait(_SINGLEFLIGHT_WAIT_SECONDS):
+            # Leader is stuck well past every vendor timeout; do the work ourselves.
+            return fn(), False
+        if call['error'] is not None:
+            raise call['error']
+        return call['result'], True
+    try:
+        call['result'] = fn()
+        return call['result'], False
+    except BaseException as e:
+        call['error'] = e
+        raise
+    finally:
+        with _singleflight_lock:
+            _singleflight_calls.pop(key, None)
+        call['event'].set()
+
+
 def _invalidate_used_scan_count_cache():
-    """Drop memoized get_used_scan_count entries after a new scan_history insert."""
+    """Drop memoized scan_history counts (get_used_scan_count) after a new scan_history insert."""
     try:
         with _ttl_cache_lock:
             keys_to_drop = [
                 k for k in list(_ttl_cache_store.keys())
-                if isinstance(k, tuple) and k and k[0] == 'get_used_scan_count'
+                if isinstance(k, tuple) and k and k[0] == '_get_used_scan_count_db'
             ]
             for k in keys_to_drop:
                 _ttl_cache_store.pop(k, None)
@@ -142,26 +375,9 @@ def _schedule_facebook_auto_post(user_id, tenant_id, response_data):
         logger.debug(f"Could not start Facebook auto-post thread: {e}")
 
 
-# #region agent log
-_DEBUG_SCAN_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug-879cbd.log')
-
-
 def _dbg_scan_perf_log(hypothesis_id, location, message, data=None):
-    """Append one NDJSON line for POS/scan performance debugging (session 879cbd)."""
-    try:
-        rec = {
-            'sessionId': '879cbd',
-            'hypothesisId': hypothesis_id,
-            'location': location,
-            'message': message,
-            'timestamp': int(_time.time() * 1000),
-            'data': data or {},
-        }
-        with open(_DEBUG_SCAN_LOG_PATH, 'a', encoding='utf-8') as _df:
-            _df.write(json.dumps(rec, default=str) + '\n')
-    except Exception:
-        pass
-# #endregion
+    """POS/scan performance debug event (session 879cbd); see _debug_event."""
+    _debug_event('879cbd', hypothesis_id, location, message, data)
 
 
 def _ttl_cache(ttl_seconds):
@@ -187,7 +403,7 @@ def _ttl_cache(ttl_seconds):
         return wrapper
     return decorator
 
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, g, has_request_context
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, g, has_request_context, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from dotenv import load_dotenv
@@ -195,6 +411,9 @@ import stripe
 from supabase import create_client, Client
 from subscription_usage_math import compute_stripe_overage_increment
 import logging # For better logging
+import logging.handlers
+import queue
+import random
 import sys
 from facebook_service import (
     get_facebook_oauth_url, exchange_code_for_token, get_user_pages,
@@ -214,14 +433,143 @@ except Exception:
     pass
 
 # Configure logging - ensure it outputs to console
+# With LOG_ASYNC (default) request threads only enqueue records; one listener thread per worker
+# formats and writes them, so a slow stdout never stalls a scan.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').strip().upper() or 'INFO'
+LOG_ASYNC = str(os.environ.get('LOG_ASYNC', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+# Share of requests whose scan/import INFO/DEBUG lines are kept (warnings and errors always are).
+HOT_PATH_LOG_SAMPLE_RATE = float(os.environ.get('HOT_PATH_LOG_SAMPLE_RATE', '0.1'))
+# NDJSON debug event files (debug-<session>.log); off unless explicitly enabled.
+DEBUG_EVENT_LOGS = str(os.environ.get('DEBUG_EVENT_LOGS', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class _DebugEventFileHandler(logging.Handler):
+    """Appends debug events to their debug-<session>.log file, keeping each file open."""
+
+    def __init__(self):
+        super().__init__()
+        self._files = {}
+
+    def emit(self, record):
+        try:
+            path = record.debug_event_path
+            f = self._files.get(path)
+            if f is None:
+                f = self._files[path] = open(path, 'a', encoding='utf-8')
+            f.write(record.getMessage() + '\n')
+            f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for f in self._files.values():
+            try:
+                f.close()
+            except Exception:
+                pass
+        self._files.clear()
+        super().close()
+
+
+_log_stream_handler = logging.StreamHandler()  # Output to console/terminal
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_debug_event_file_handler = _DebugEventFileHandler()
+_log_queue = None
+_log_listener = None
+
+
+def _log_listener_start():
+    global _log_listener
+    _log_listener = logging.handlers.QueueListener(
+        _log_queue, _log_stream_handler, _debug_event_file_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+
+
+def _log_listener_stop():
+    if _log_listener is not None:
+        try:
+            _log_listener.stop()
+        except Exception:
+            pass
+
+
+def _log_queue_handler():
+    handler = logging.handlers.QueueHandler(_log_queue)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+if LOG_ASYNC:
+    _log_queue = queue.SimpleQueue()
+    # Both handlers sit on the one listener: console lines and debug events are told apart here.
+    _log_stream_handler.addFilter(lambda record: not hasattr(record, 'debug_event_path'))
+    _debug_event_file_handler.addFilter(lambda record: hasattr(record, 'debug_event_path'))
+    _log_listener_start()
+    atexit.register(_log_listener_stop)
+    if hasattr(os, 'register_at_fork'):
+        # A worker forked from a process that already imported the app has no listener thread.
+        os.register_at_fork(after_in_child=_log_listener_start)
+
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Output to console/terminal
-    ]
+    level=getattr(logging, LOG_LEVEL, logging.INFO),
+    handlers=[_log_queue_handler() if LOG_ASYNC else _log_stream_handler],
 )
 logger = logging.getLogger(__name__)
+
+
+class _HotPathSampler(logging.Filter):
+    """Keeps WARNING+ and the INFO/DEBUG lines of a sampled share of requests (decided once per request)."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or HOT_PATH_LOG_SAMPLE_RATE >= 1:
+            return True
+        if HOT_PATH_LOG_SAMPLE_RATE <= 0:
+            return False
+        if has_request_context():
+            sampled = getattr(g, '_hot_log_sampled', None)
+            if sampled is None:
+                sampled = g._hot_log_sampled = random.random() < HOT_PATH_LOG_SAMPLE_RATE
+            return sampled
+        return random.random() < HOT_PATH_LOG_SAMPLE_RATE
+
+
+# Per-scan and per-import-batch chatter goes through these instead of `logger`.
+scan_log = logging.getLogger(f'{__name__}.scan')
+scan_log.addFilter(_HotPathSampler())
+import_log = logging.getLogger(f'{__name__}.import')
+import_log.addFilter(_HotPathSampler())
+
+_debug_event_logger = logging.getLogger(f'{__name__}.debug_events')
+_debug_event_logger.propagate = False
+_debug_event_logger.setLevel(logging.DEBUG)
+_debug_event_logger.addHandler(_log_queue_handler() if LOG_ASYNC else _debug_event_file_handler)
+_DEBUG_EVENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _debug_event(session_id, hypothesis_id, location, message, data=None, run_id=None):
+    """Queue one NDJSON line for debug-<session_id>.log (no-op unless DEBUG_EVENT_LOGS is on)."""
+    if not DEBUG_EVENT_LOGS:
+        return
+    try:
+        rec = {'sessionId': session_id}
+        if run_id:
+            rec['runId'] = run_id
+        rec.update({
+            'hypothesisId': hypothesis_id,
+            'location': location,
+            'message': message,
+            'timestamp': int(_time.time() * 1000),
+            'data': data or {},
+        })
+        _debug_event_logger.info(
+            '%s',
+            json.dumps(rec, default=str),
+            extra={'debug_event_path': os.path.join(_DEBUG_EVENT_DIR, f'debug-{session_id}.log')},
+        )
+    except Exception:
+        pass
+
 logger.info("=" * 60)
 logger.info("LOGGING CONFIGURED - All logs will appear in terminal")
 logger.info("=" * 60)
@@ -378,14 +726,65 @@ FNSKU_NOT_IN_DATABASE_MESSAGE = "This product could not be found in our lookup d
 FNSKU_ADD_OR_GET_TIMEOUT = float(os.environ.get('FNSKU_ADD_OR_GET_TIMEOUT', '8'))
 FNSKU_GET_BY_BARCODE_TIMEOUT = float(os.environ.get('FNSKU_GET_BY_BARCODE_TIMEOUT', '8'))
 FNSKU_STATUS_LOOKUP_TIMEOUT = float(os.environ.get('FNSKU_STATUS_LOOKUP_TIMEOUT', '8'))
-RAINFOREST_REQUEST_TIMEOUT = float(os.environ.get('RAINFOREST_REQUEST_TIMEOUT', '8'))
-# Short inline poll, then hand off to /api/scan/status so the first scan can still resolve.
-FNSKU_SCAN_INITIAL_MAX_POLLS = int(os.environ.get('FNSKU_SCAN_INITIAL_MAX_POLLS', '6'))
-FNSKU_SCAN_INITIAL_POLL_INTERVAL_MS = int(os.environ.get('FNSKU_SCAN_INITIAL_POLL_INTERVAL_MS', '700'))
+# RAINFOREST_REQUEST_TIMEOUT, rate limit, retry budget and circuit breaker: see rainforest_client.py
+# Background resolver: owns FNSKU tasks the vendor has not finished so /api/scan can return immediately.
+FNSKU_BACKGROUND_RESOLVER = str(os.environ.get('FNSKU_BACKGROUND_RESOLVER', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+FNSKU_RESOLVER_POLL_INTERVAL_MS = int(os.environ.get('FNSKU_RESOLVER_POLL_INTERVAL_MS', '1500'))
+FNSKU_RESOLVER_BATCH_SIZE = int(os.environ.get('FNSKU_RESOLVER_BATCH_SIZE', '8'))
+FNSKU_RESOLVER_MAX_ATTEMPTS = int(os.environ.get('FNSKU_RESOLVER_MAX_ATTEMPTS', '40'))
+FNSKU_RESOLVER_MAX_TASKS = int(os.environ.get('FNSKU_RESOLVER_MAX_TASKS', '2000'))
 FNSKU_SCAN_RETRY_ADD_AFTER = int(os.environ.get('FNSKU_SCAN_RETRY_ADD_AFTER', '3'))
+# Vendor circuit breaker (see _fnsku_vendor_request): failures or answers slower than
+# FNSKU_BREAKER_SLOW_MS in a row open it; scans then queue codes for the resolver.
+FNSKU_BREAKER_FAILURES = int(os.environ.get('FNSKU_BREAKER_FAILURES', '5'))
+FNSKU_BREAKER_OPEN_SECONDS = float(os.environ.get('FNSKU_BREAKER_OPEN_SECONDS', '30'))
+FNSKU_BREAKER_SLOW_MS = int(os.environ.get('FNSKU_BREAKER_SLOW_MS', '6000'))
+# Scan-path Rainforest calls share the batch import's enrichment lock (see _rainforest_get_product_shared).
+ENRICHMENT_LOCK_SECONDS = int(os.environ.get('ENRICHMENT_LOCK_SECONDS', '30'))
+ENRICHMENT_WAIT_SECONDS = float(os.environ.get('ENRICHMENT_WAIT_SECONDS', '10'))
+# Concurrent Rainforest enrichments per /api/import/batch request (see _import_enrich_rows).
+IMPORT_ENRICHMENT_CONCURRENCY = int(os.environ.get('IMPORT_ENRICHMENT_CONCURRENCY', '8'))
+# POST /api/import/upload: rows per internal batch, and the largest file accepted (MB).
+IMPORT_UPLOAD_BATCH_ROWS = max(1, int(os.environ.get('IMPORT_UPLOAD_BATCH_ROWS', '500')))
+IMPORT_UPLOAD_MAX_MB = float(os.environ.get('IMPORT_UPLOAD_MAX_MB', '200'))
+# Background import jobs (migration 030): run a job runner thread in this worker, how often it looks
+# for queued jobs, when a running job counts as abandoned, and how often a job is retried.
+IMPORT_JOB_RUNNER = str(os.environ.get('IMPORT_JOB_RUNNER', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+IMPORT_JOB_POLL_SECONDS = float(os.environ.get('IMPORT_JOB_POLL_SECONDS', '5'))
+IMPORT_JOB_STALE_SECONDS = float(os.environ.get('IMPORT_JOB_STALE_SECONDS', '120'))
+IMPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('IMPORT_JOB_MAX_ATTEMPTS', '3'))
+# Vendor push: when FNSKU_CALLBACK_URL is set (public URL of POST /api/fnsku/callback), AddOrGet asks
+# the vendor to notify us on completion and the resolver only polls as a slow safety net.
+# FNSKU_CALLBACK_SECRET is required for callbacks to be accepted; it travels as ?token= on the URL.
+FNSKU_CALLBACK_URL = os.environ.get('FNSKU_CALLBACK_URL', '').strip()
+FNSKU_CALLBACK_SECRET = os.environ.get('FNSKU_CALLBACK_SECRET', '').strip()
+FNSKU_CALLBACK_FALLBACK_POLL_MS = int(os.environ.get('FNSKU_CALLBACK_FALLBACK_POLL_MS', '10000'))
+# GET /api/scan/stream (Server-Sent Events alternative to polling /api/scan/status).
+SCAN_STREAM_TIMEOUT_SECONDS = float(os.environ.get('SCAN_STREAM_TIMEOUT_SECONDS', '90'))
+SCAN_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('SCAN_STREAM_HEARTBEAT_SECONDS', '15'))
+SCAN_STREAM_MAX_CODES = int(os.environ.get('SCAN_STREAM_MAX_CODES', '50'))
 # Soft give-up threshold for status polls when the vendor never marks the task terminal.
 FNSKU_NOT_IN_DATABASE_ATTEMPTS = int(os.environ.get('FNSKU_NOT_IN_DATABASE_ATTEMPTS', '12'))
 SKIP_RAINFOREST_ON_STANDARD_SCAN = str(os.environ.get('SKIP_RAINFOREST_ON_STANDARD_SCAN', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+# In-process product cache in front of api_lookup_cache (0 entries disables it).
+PRODUCT_L1_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_L1_CACHE_MAX_ENTRIES', '5000'))
+PRODUCT_L1_CACHE_TTL_SECONDS = float(os.environ.get('PRODUCT_L1_CACHE_TTL_SECONDS', '60'))
+# Write-behind for api_lookup_cache last_accessed / lookup_count (see _cache_access_record).
+CACHE_ACCESS_FLUSH_SECONDS = float(os.environ.get('CACHE_ACCESS_FLUSH_SECONDS', '5'))
+CACHE_ACCESS_MAX_PENDING = int(os.environ.get('CACHE_ACCESS_MAX_PENDING', '2000'))
+# Queued scan_history writer (see log_scan_to_history).
+SCAN_HISTORY_FLUSH_SECONDS = float(os.environ.get('SCAN_HISTORY_FLUSH_SECONDS', '1'))
+SCAN_HISTORY_MAX_PENDING = int(os.environ.get('SCAN_HISTORY_MAX_PENDING', '500'))
+# Local access-token verification (see get_ids_from_request). Legacy projects sign with the JWT
+# secret (HS256); projects on asymmetric signing keys publish them at the JWKS URL.
+SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET', '').strip()
+SUPABASE_JWT_AUDIENCE = os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated').strip()
+AUTH_JWKS_URL = os.environ.get(
+    'SUPABASE_JWKS_URL',
+    f"{os.environ.get('SUPABASE_URL', '').rstrip('/')}/auth/v1/.well-known/jwks.json" if os.environ.get('SUPABASE_URL') else '',
+).strip()
+AUTH_CLAIMS_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CLAIMS_CACHE_MAX_ENTRIES', '10000'))
+AUTH_REMOTE_CLAIMS_TTL_SECONDS = float(os.environ.get('AUTH_REMOTE_CLAIMS_TTL_SECONDS', '60'))
 
 # --- Creator/CEO Configuration ---
 # Only the creator of the software can have CEO role
@@ -648,12 +1047,26 @@ def get_trial_start_date(tenant_id, user_id):
         return default_date
 
 
-@_ttl_cache(5)
 def get_used_scan_count(user_id, tenant_id, trial_start_date=None):
     """
     Count scans for trial limit: (user_id = X) and (tenant_id = Y or tenant_id is null).
     When tenant_id is set, includes legacy rows with tenant_id null so count is correct after refresh.
+    Scans this user still has queued by log_scan_to_history are flushed first: log_scans_and_count
+    inserts them and returns the new usage in the same round-trip (seeding the cached count), and
+    only codes it reports as new are counted. Scans that could not be flushed are added on top.
     Returns 0 if supabase_admin is not available.
+    """
+    if not supabase_admin or not user_id:
+        return 0
+    if _scan_history_pending_count(user_id, tenant_id):
+        _scan_history_flush(user_id, tenant_id)
+    return _get_used_scan_count_db(user_id, tenant_id, trial_start_date) + _scan_history_pending_count(user_id, tenant_id)
+
+
+@_ttl_cache(5)
+def _get_used_scan_count_db(user_id, tenant_id, trial_start_date=None):
+    """
+    scan_history rows counted by get_used_scan_count.
     Cached for 5s — long enough to coalesce a batch, short enough to keep
     the trial limit enforcement responsive.
     """
@@ -680,105 +1093,265 @@ def get_used_scan_count(user_id, tenant_id, trial_start_date=None):
         return 0
 
 
+# Queued scan_history writer. Scans are deduplicated in memory per (user, tenant, code)
+# and written by a daemon thread every SCAN_HISTORY_FLUSH_SECONDS: one log_scans_and_count
+# call per (user, tenant), which inserts idempotently and returns the new trial usage (or a
+# duplicate-check SELECT plus one bulk INSERT when the RPC is missing), instead of a SELECT,
+# an INSERT and a count on every scan request. Reading a user's usage (get_used_scan_count) flushes
+# that user's queued scans first, so a counted scan costs one round-trip and a repeat of a code
+# already in scan_history is never counted as new.
+_scan_history_queue = OrderedDict()  # (user_id, tenant_id, code) -> {'client', 'row', 'attempts'}
+_scan_history_known = OrderedDict()  # keys known to exist in scan_history (bounded LRU)
+_scan_history_lock = _threading.Lock()
+# Serializes flushes (writer thread vs. get_used_scan_count) so a queued scan is sent once.
+_scan_history_flush_lock = _threading.Lock()
+_scan_history_wakeup = _threading.Event()
+_scan_history_thread = None
+_SCAN_HISTORY_KNOWN_MAX = 50000
+_SCAN_HISTORY_MAX_ATTEMPTS = 3
+# log_scans_and_count (migration 028) writes a group and returns the new trial usage in one call;
+# when it is missing the writer falls back to SELECT + INSERT and retries the RPC later.
+_LOG_SCANS_RPC_RETRY_SECONDS = 300
+_log_scans_rpc_disabled_until = 0.0
+
+
+def _scan_history_key(user_id, tenant_id, code):
+    return (str(user_id), str(tenant_id) if tenant_id else None, code)
+
+
+def _scan_history_mark_known(keys):
+    with _scan_history_lock:
+        for key in keys:
+            _scan_history_known[key] = True
+            _scan_history_known.move_to_end(key)
+        while len(_scan_history_known) > _SCAN_HISTORY_KNOWN_MAX:
+            _scan_history_known.popitem(last=False)
+
+
+def _scan_history_counts_for(key, user_id, tenant_id):
+    """True when a queued key is a scan get_used_scan_count counts for this user/tenant."""
+    q_uid, q_tid, _code = key
+    return q_uid == str(user_id) and (not tenant_id or q_tid in (str(tenant_id), None))
+
+
+def _scan_history_pending_count(user_id, tenant_id):
+    """Queued, not yet flushed scans that get_used_scan_count would count for this user/tenant."""
+    with _scan_history_lock:
+        return sum(1 for key in _scan_history_queue if _scan_history_counts_for(key, user_id, tenant_id))
+
+
+def _scan_history_clear():
+    with _scan_history_lock:
+        _scan_history_queue.clear()
+        _scan_history_known.clear()
+
+
+def _seed_used_scan_count(user_id, tenant_id, trial_start_date, used):
+    """Store a scan_history count returned by log_scans_and_count so the next read skips the count query."""
+    try:
+        with _ttl_cache_lock:
+            key = ('_get_used_scan_count_db', (user_id, tenant_id, trial_start_date), ())
+            _ttl_cache_store[key] = (int(used), _time.time() + 5)
+    except Exception:
+        pass
+
+
+def _scan_history_rpc_group(client, user_id, tenant_id, items):
+    """
+    Insert one (user, tenant) group through log_scans_and_count (migration 028): idempotent insert
+    plus updated trial usage in a single call. Returns {'new': codes inserted, 'seed': count to cache},
+    or None when the RPC is unavailable.
+    """
+    global _log_scans_rpc_disabled_until
+    if _time.time() < _log_scans_rpc_disabled_until:
+        return None
+    row_user_id = items[0][1]['row']['user_id']
+    row_tenant_id = items[0][1]['row'].get('tenant_id')
+    try:
+        trial_start_date = get_trial_start_date(row_tenant_id, row_user_id)
+    except Exception:
+        trial_start_date = None
+    scans = [
+        {k: v for k, v in entry['row'].items() if k in ('scanned_code', 'scanned_at', 'api_lookup_cache_id', 'product_description')}
+        for _key, entry in items
+    ]
+    try:
+        res = client.rpc('log_scans_and_count', {
+            'p_user_id': user_id,
+            'p_tenant_id': tenant_id,
+            'p_scans': scans,
+            'p_since': trial_start_date.isoformat() if trial_start_date else None,
+        }).execute()
+        data = getattr(res, 'data', None)
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if not isinstance(data, dict):
+            raise ValueError(f"unexpected log_scans_and_count payload: {type(data).__name__}")
+    except Exception as e:
+        if _rpc_function_missing(e):
+            _log_scans_rpc_disabled_until = _time.time() + _LOG_SCANS_RPC_RETRY_SECONDS
+            logger.warning(f"log_scans_and_count RPC unavailable (falling back to SELECT + INSERT): {e}")
+        else:
+            # Transient or bad answer: this flush only uses the fallback (the insert is idempotent either way).
+            logger.warning(f"log_scans_and_count failed (SELECT + INSERT for this flush): {e}")
+        return None
+    seed = None
+    if data.get('used') is not None and trial_start_date is not None:
+        seed = (row_user_id, row_tenant_id, trial_start_date, data['used'])
+    return {'new': set(data.get('new_codes') or []), 'seed': seed}
+
+
+def _scan_history_flush(user_id=None, tenant_id=None):
+    """
+    Write every queued scan, or only those get_used_scan_count counts for user_id / tenant_id.
+    Returns the number of rows inserted.
+    """
+    with _scan_history_flush_lock:
+        return _scan_history_flush_locked(user_id, tenant_id)
+
+
+def _scan_history_flush_locked(only_user_id, only_tenant_id):
+    with _scan_history_lock:
+        batch = [
+            (key, entry) for key, entry in _scan_history_queue.items()
+            if only_user_id is None or _scan_history_counts_for(key, only_user_id, only_tenant_id)
+        ]
+    if not batch:
+        return 0
+    groups = {}
+    for key, entry in batch:
+        groups.setdefault((id(entry['client']), key[0], key[1]), []).append((key, entry))
+
+    new_items = []
+    known = []
+    inserted = 0
+    seeds = []
+    for (_cid, user_id, tenant_id), items in groups.items():
+        client = items[0][1]['client']
+        rpc_result = _scan_history_rpc_group(client, user_id, tenant_id, items)
+        if rpc_result is not None:
+            known.extend(items)
+            inserted += len(rpc_result['new'])
+            if rpc_result['seed']:
+                seeds.append(rpc_result['seed'])
+            continue
+        codes = [key[2] for key, _entry in items]
+        try:
+            query = client.from_('scan_history').select('scanned_code').eq('user_id', user_id).in_('scanned_code', codes)
+            query = query.eq('tenant_id', tenant_id) if tenant_id else query.is_('tenant_id', 'null')
+            res = query.execute()
+            existing = {row.get('scanned_code') for row in (getattr(res, 'data', None) or [])}
+        except Exception as e:
+            logger.warning(f"scan_history duplicate check failed for user {user_id}: {e}")
+            continue  # stays queued; retried next flush
+        for key, entry in items:
+            (known if key[2] in existing else new_items).append((key, entry))
+
+    failed = []
+    inserted_legacy = False
+    by_client = {}
+    for key, entry in new_items:
+        by_client.setdefault(id(entry['client']), []).append((key, entry))
+    for items in by_client.values():
+        try:
+            items[0][1]['client'].table('scan_history').insert([entry['row'] for _key, entry in items]).execute()
+            known.extend(items)
+            inserted += len(items)
+            inserted_legacy = True
+        except Exception as e:
+            logger.error(f"❌ Failed to bulk insert {len(items)} scan(s) into scan_history: {e}")
+            failed.extend(items)
+
+    with _scan_history_lock:
+        for key, _entry in known:
+            _scan_history_queue.pop(key, None)
+        for key, entry in failed:
+            entry['attempts'] += 1
+            if entry['attempts'] >= _SCAN_HISTORY_MAX_ATTEMPTS:
+                _scan_history_queue.pop(key, None)
+                logger.error(f"Dropping scan_history row after {entry['attempts']} failed inserts: user={key[0]} code={key[2]}")
+    _scan_history_mark_known([key for key, _entry in known])
+    if inserted_legacy or (known and not seeds):
+        _invalidate_used_scan_count_cache()
+    # Seed only after the rows left the queue so they are not counted twice.
+    for seed in seeds:
+        _seed_used_scan_count(*seed)
+    if inserted:
+        logger.info(f"scan_history: bulk-logged {inserted} new scan(s)")
+    return inserted
+
+
+def _scan_history_loop():
+    while True:
+        _scan_history_wakeup.wait(max(0.1, SCAN_HISTORY_FLUSH_SECONDS))
+        _scan_history_wakeup.clear()
+        try:
+            _scan_history_flush()
+        except Exception as e:
+            logger.warning(f"scan_history flush failed: {e}")
+
+
+def _scan_history_ensure_started():
+    global _scan_history_thread
+    if _scan_history_thread is not None and _scan_history_thread.is_alive():
+        return
+    with _scan_history_lock:
+        if _scan_history_thread is not None and _scan_history_thread.is_alive():
+            return
+        _scan_history_thread = _threading.Thread(target=_scan_history_loop, name='scan-history-writer', daemon=True)
+        _scan_history_thread.start()
+
+
+atexit.register(_scan_history_flush)
+
+
 def log_scan_to_history(user_id, tenant_id, code, asin, supabase_client, api_lookup_cache_id=None, product_description=None):
     """
-    Log a scan to scan_history, but only if this user hasn't already scanned this exact code.
+    Queue a scan for scan_history, but only if this user hasn't already scanned this exact code.
     Optionally link to api_lookup_cache so recent scans can show full product details.
-    Returns True if the scan was logged (new scan), False if it was a duplicate.
-    """
-    import sys
-    logger.info(f"{'='*60}")
-    logger.info(f"🔍 LOG_SCAN_TO_HISTORY CALLED")
-    logger.info(f"   user_id: {user_id}")
-    logger.info(f"   tenant_id: {tenant_id}")
-    logger.info(f"   code: {code}")
-    logger.info(f"   supabase_client: {supabase_client is not None}")
-    logger.info(f"{'='*60}")
-    
-    print(f"\n{'='*60}", flush=True)
-    print("LOG_SCAN_TO_HISTORY CALLED", flush=True)
-    print(f"   user_id: {user_id}", flush=True)
-    print(f"   tenant_id: {tenant_id}", flush=True)
-    print(f"   code: {code}", flush=True)
-    print(f"   supabase_client: {supabase_client is not None}", flush=True)
-    print(f"{'='*60}\n", flush=True)
-    sys.stdout.flush()
-    
+    Returns True if the scan was queued as new, False if it is a known duplicate.
+    The row is written asynchronously in bulk (see _scan_history_flush); codes already in
+    scan_history but not yet seen by this process are dropped there, not here.
+    """
     if not supabase_client:
-        error_msg = f"❌❌❌ Cannot log scan: supabase_client is None"
-        logger.error(error_msg)
-        print(error_msg, flush=True)
+        logger.error("❌ Cannot log scan: supabase_client is None")
         return False
-    
     if not user_id:
-        error_msg = f"❌❌❌ Cannot log scan: user_id is None or empty (user_id={user_id})"
-        logger.error(error_msg)
-        print(error_msg, flush=True)
+        logger.error(f"❌ Cannot log scan: user_id is None or empty (user_id={user_id})")
         return False
-    
-    try:
-        # Check if this user has already scanned this exact code
-        logger.info(f"🔍 Checking for duplicate scan: user_id={user_id}, code={code}, tenant_id={tenant_id}")
-        print(f"Checking duplicates: user_id={user_id}, code={code}, tenant_id={tenant_id}")
-        
-        # Build query to check for existing scan
-        # Use scanned_code column (this is the actual column name in scan_history table)
-        query = supabase_client.from_('scan_history').select('id, user_id, scanned_code, tenant_id').eq('user_id', user_id).eq('scanned_code', code)
-        if tenant_id:
-            query = query.eq('tenant_id', tenant_id)
-            print(f"   Query: user_id={user_id} AND scanned_code={code} AND tenant_id={tenant_id}")
-        else:
-            # If no tenant_id, check for null tenant_id to avoid duplicates
-            query = query.is_('tenant_id', 'null')
-            print(f"   Query: user_id={user_id} AND scanned_code={code} AND tenant_id IS NULL")
-        
-        existing = query.limit(1).execute()
-        print(f"   Duplicate check result: {existing.data if hasattr(existing, 'data') else 'No data'}")
-        
-        # If already scanned, don't count it again
-        if existing.data and len(existing.data) > 0:
-            logger.info(f"⏭️ Skipping duplicate scan: user {user_id} already scanned code {code} (found {len(existing.data)} existing record(s))")
-            print(f"⏭️ DUPLICATE SCAN - NOT COUNTING: code={code}")
-            print(f"   Existing record: {existing.data[0]}")
-            return False
-        else:
-            logger.info(f"✅ New scan detected: user {user_id}, code {code} (no duplicates found)")
-            print(f"NEW SCAN - WILL COUNT: code={code}")
-        
-        # This is a new scan - log it
-        # Note: scan_history table uses 'scanned_code' column, not 'code' or 'fnsku'
-        # Link to api_lookup_cache when available so recent scans can show full product details.
-        scan_insert = {
-            'user_id': user_id,
-            'scanned_code': code,
-            'scanned_at': datetime.now(timezone.utc).isoformat()
-        }
-        if tenant_id:
-            scan_insert['tenant_id'] = tenant_id
-        if api_lookup_cache_id:
-            scan_insert['api_lookup_cache_id'] = api_lookup_cache_id
-        if product_description is not None:
-            scan_insert['product_description'] = (str(product_description)[:2000] if product_description else '')
-        
-        print(f"Inserting scan: {scan_insert}")
-        result = supabase_client.table('scan_history').insert(scan_insert).execute()
-        
-        logger.info(f"✅ Logged new scan to scan_history: user {user_id}, code {code}, tenant_id={tenant_id}")
-        logger.info(f"   Insert result: {result.data if hasattr(result, 'data') else 'No data'}")
-        print(f"SCAN LOGGED: user={user_id}, code={code}, tenant={tenant_id}")
-        print(f"   Insert result: {result.data if hasattr(result, 'data') else 'No data'}")
 
-        # Invalidate memoized counts immediately — no sleep; callers query once after this.
-        _invalidate_used_scan_count_cache()
+    key = _scan_history_key(user_id, tenant_id, code)
+    # Note: scan_history table uses 'scanned_code' column, not 'code' or 'fnsku'
+    scan_insert = {
+        'user_id': user_id,
+        'scanned_code': code,
+        'scanned_at': datetime.now(timezone.utc).isoformat()
+    }
+    if tenant_id:
+        scan_insert['tenant_id'] = tenant_id
+    if api_lookup_cache_id:
+        scan_insert['api_lookup_cache_id'] = api_lookup_cache_id
+    if product_description is not None:
+        scan_insert['product_description'] = (str(product_description)[:2000] if product_description else '')
+
+    with _scan_history_lock:
+        if key in _scan_history_known:
+            _scan_history_known.move_to_end(key)
+            return False
+        queued = _scan_history_queue.get(key)
+        if queued is not None:
+            # Same code again before the flush: keep the first scan, fill in a late cache link.
+            if api_lookup_cache_id and not queued['row'].get('api_lookup_cache_id'):
+                queued['row']['api_lookup_cache_id'] = api_lookup_cache_id
+            return False
+        _scan_history_queue[key] = {'client': supabase_client, 'row': scan_insert, 'attempts': 0}
+        backlog = len(_scan_history_queue)
 
-        return True
-    except Exception as e:
-        logger.error(f"❌ Failed to log scan to scan_history: {e}")
-        import traceback
-        logger.error(f"   Traceback: {traceback.format_exc()}")
-        print(f"SCAN LOG FAILED: {e}")
-        print(f"   Traceback: {traceback.format_exc()}")
-        return False
+    scan_log.debug(f"Queued scan for scan_history: user {user_id}, code {code}, tenant_id={tenant_id}")
+    _scan_history_ensure_started()
+    if backlog >= SCAN_HISTORY_MAX_PENDING:
+        _scan_history_wakeup.set()
+    return True
 
 if not STRIPE_API_KEY or not STRIPE_WEBHOOK_SECRET:
     logger.error("Stripe API Key or Webhook Secret not found in .env. Stripe integration will fail.")
@@ -848,33 +1421,158 @@ else:
 
 
 # --- Helper Function to Get User and Tenant IDs from JWT ---
+# Access tokens are verified locally (HS256 with SUPABASE_JWT_SECRET, or ES256/RS256 against the
+# project's JWKS) instead of a Supabase Auth round-trip per request. Decoded ids are cached per
+# token until it expires; tokens that cannot be verified locally still go through auth.get_user.
+_auth_claims_cache = OrderedDict()  # sha256(token) -> (user_id, tenant_id, expires_at)
+_auth_claims_lock = _threading.Lock()
+_auth_jwks_client = None
+_AUTH_JWKS_RETRY_SECONDS = 300
+_auth_jwks_disabled_until = 0.0
+
+
+def _auth_claims_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _auth_claims_cache_get(key):
+    with _auth_claims_lock:
+        entry = _auth_claims_cache.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= _time.time():
+            _auth_claims_cache.pop(key, None)
+            return None
+        _auth_claims_cache.move_to_end(key)
+        return entry[0], entry[1]
+
+
+def _auth_claims_cache_put(key, user_id, tenant_id, expires_at):
+    if AUTH_CLAIMS_CACHE_MAX_ENTRIES <= 0 or not user_id or expires_at <= _time.time():
+        return
+    with _auth_claims_lock:
+        _auth_claims_cache[key] = (user_id, tenant_id, expires_at)
+        _auth_claims_cache.move_to_end(key)
+        while len(_auth_claims_cache) > AUTH_CLAIMS_CACHE_MAX_ENTRIES:
+            _auth_claims_cache.popitem(last=False)
+
+
+def _auth_claims_clear():
+    with _auth_claims_lock:
+        _auth_claims_cache.clear()
+
+
+def _auth_jwks_signing_key(token):
+    """Public key for an asymmetric token from the project's JWKS, or None if unavailable."""
+    global _auth_jwks_client, _auth_jwks_disabled_until
+    if not AUTH_JWKS_URL or _time.time() < _auth_jwks_disabled_until:
+        return None
+    try:
+        if _auth_jwks_client is None:
+            _auth_jwks_client = jwt.PyJWKClient(AUTH_JWKS_URL, cache_keys=True, lifespan=600, timeout=5)
+        return _auth_jwks_client.get_signing_key_from_jwt(token).key
+    except Exception as e:
+        _auth_jwks_disabled_until = _time.time() + _AUTH_JWKS_RETRY_SECONDS
+        logger.warning(f"JWKS unavailable (falling back to auth.get_user): {e}")
+        return None
+
+
+def _verify_access_token_locally(token):
+    """
+    Decoded claims of a locally verifiable access token.
+    Returns None when the token cannot be checked here (no secret / key for its algorithm);
+    raises jwt.InvalidTokenError when it was checked and is invalid.
+    """
+    alg = jwt.get_unverified_header(token).get('alg')
+    if alg == 'HS256':
+        if not SUPABASE_JWT_SECRET:
+            return None
+        key = SUPABASE_JWT_SECRET
+    elif alg in ('ES256', 'RS256'):
+        key = _auth_jwks_signing_key(token)
+        if key is None:
+            return None
+    else:
+        return None
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[alg],
+        audience=SUPABASE_JWT_AUDIENCE or None,
+        options={'require': ['exp', 'sub'], 'verify_aud': bool(SUPABASE_JWT_AUDIENCE)},
+    )
+
+
+def _get_ids_from_token(token):
+    key = _auth_claims_cache_key(token)
+    cached = _auth_claims_cache_get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        claims = _verify_access_token_locally(token)
+    except jwt.ExpiredSignatureError:
+        logger.debug("Access token expired")
+        return None, None
+    except jwt.InvalidTokenError as e:
+        # Possibly a misconfigured secret rather than a forged token: let Supabase Auth decide.
+        logger.warning(f"Local JWT verification failed (falling back to auth.get_user): {e}")
+        claims = None
+    if claims is not None:
+        user_id = claims.get('sub')
+        tenant_id = (claims.get('app_metadata') or {}).get('tenant_id')
+        if not tenant_id:
+            logger.debug(f"tenant_id not found in app_metadata for user {user_id}")
+        _auth_claims_cache_put(key, user_id, tenant_id, float(claims['exp']))
+        return user_id, tenant_id
+
+    if not supabase:
+        logger.error("Supabase client not initialized. Cannot get user from token.")
+        return None, None
+    user_id = None
+    tenant_id = None
+    user_response = supabase.auth.get_user(token)
+    if user_response and hasattr(user_response, 'user') and user_response.user:
+        user = user_response.user
+        user_id = user.id
+        # Supabase client might store app_metadata under raw_app_meta_data or app_metadata
+        app_meta = getattr(user, 'app_metadata', getattr(user, 'raw_app_meta_data', {}))
+        if app_meta and 'tenant_id' in app_meta:
+            tenant_id = app_meta['tenant_id']
+        else:
+            logger.debug(f"tenant_id not found in app_metadata for user {user_id}")
+        # Remote answers are cached briefly (never past the token's own expiry) so a
+        # revoked session stops working within AUTH_REMOTE_CLAIMS_TTL_SECONDS.
+        expires_at = _time.time() + AUTH_REMOTE_CLAIMS_TTL_SECONDS
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+            if exp:
+                expires_at = min(expires_at, float(exp))
+        except Exception:
+            pass
+        _auth_claims_cache_put(key, user_id, tenant_id, expires_at)
+    else:
+        logger.warning(f"No user object in Supabase get_user response. Token: {token[:10]}...")
+    return user_id, tenant_id
+
+
 def get_ids_from_request():
+    # Memoized per request: several helpers ask for the ids during one request.
+    memo = getattr(g, '_auth_ids', None)
+    if memo is not None:
+        return memo
     user_id = None
     tenant_id = None
     auth_header = request.headers.get('Authorization')
     if auth_header and auth_header.startswith('Bearer '):
         token = auth_header.split(' ')[1]
         try:
-            if not supabase:
-                logger.error("Supabase client not initialized. Cannot get user from token.")
-                return None, None
-            user_response = supabase.auth.get_user(token)
-            if user_response and hasattr(user_response, 'user') and user_response.user:
-                user = user_response.user
-                user_id = user.id
-                # Supabase client might store app_metadata under raw_app_meta_data or app_metadata
-                app_meta = getattr(user, 'app_metadata', getattr(user, 'raw_app_meta_data', {}))
-                if app_meta and 'tenant_id' in app_meta:
-                    tenant_id = app_meta['tenant_id']
-                else:
-                    logger.debug(f"tenant_id not found in app_metadata for user {user_id}")
-            else:
-                logger.warning(f"No user object in Supabase get_user response. Token: {token[:10]}...")
-
+            user_id, tenant_id = _get_ids_from_token(token)
         except Exception as e:
             logger.error(f"Error getting user/tenant_id from token: {e}")
     else:
         logger.debug("No Authorization Bearer token found in request headers.")
+    g._auth_ids = (user_id, tenant_id)
     return user_id, tenant_id
 
 @_ttl_cache(60)
@@ -1022,6 +1720,8 @@ def health_check():
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "api_routes": routes,
         "supabase_configured": supabase_admin is not None,
+        "rainforest": rainforest_client.metrics_snapshot(),
+        "fnsku_vendor_breaker": _fnsku_vendor_breaker.state,
         "cors_origins": allowed_origins if 'allowed_origins' in globals() else "unknown"
     }), 200
 
@@ -1562,13 +2262,35 @@ def inventory_list():
 # HELPER FUNCTIONS FOR CSV IMPORT
 # ============================================================================
 
-def normalize_identifiers(fnsku=None, asin=None, lpn=None, upc=None):
-    """
-    Normalize identifiers:
-    - Trim whitespace
-    - Uppercase fnsku, asin, lpn
-    - Fix UPC scientific formats ("12345.0" -> "12345")
-    """
+_UPC_NUMERIC_RE = re.compile(r'-?\d+(\.\d+)?([eE][+-]?\d+)?')
+
+
+def _normalize_upc(value):
+    if not value:
+        return None
+    value = str(value).strip().replace(',', '')
+    if not value:
+        return None
+    # Excel: plain numbers, trailing .0, or scientific notation (e.g. 7.24129E+11)
+    try:
+        if _UPC_NUMERIC_RE.fullmatch(value):
+            # Only coerce float/scientific forms; plain digit strings keep leading zeros (UPC/GTIN)
+            if 'e' in value.lower() or '.' in value:
+                float_val = float(value)
+                if 'e' in value.lower() or abs(float_val) >= 1e6 or float_val.is_integer():
+                    return str(int(round(float_val)))
+    except (ValueError, OverflowError):
+        pass
+    return value
+
+
+def normalize_identifiers(fnsku=None, asin=None, lpn=None, upc=None):
+    """
+    Normalize identifiers:
+    - Trim whitespace
+    - Uppercase fnsku, asin, lpn
+    - Fix UPC scientific formats ("12345.0" -> "12345")
+    """
     def normalize(value):
         if not value:
             return None
@@ -1577,29 +2299,11 @@ def normalize_identifiers(fnsku=None, asin=None, lpn=None, upc=None):
             return None
         return value
     
-    def normalize_upc(value):
-        if not value:
-            return None
-        value = str(value).strip().replace(',', '')
-        if not value:
-            return None
-        # Excel: plain numbers, trailing .0, or scientific notation (e.g. 7.24129E+11)
-        try:
-            if re.fullmatch(r'-?\d+(\.\d+)?([eE][+-]?\d+)?', value):
-                # Only coerce float/scientific forms; plain digit strings keep leading zeros (UPC/GTIN)
-                if 'e' in value.lower() or '.' in value:
-                    float_val = float(value)
-                    if 'e' in value.lower() or abs(float_val) >= 1e6 or float_val.is_integer():
-                        return str(int(round(float_val)))
-        except (ValueError, OverflowError):
-            pass
-        return value
-    
     normalized = {
         'fnsku': normalize(fnsku).upper() if fnsku else None,
         'asin': normalize(asin).upper() if asin else None,
         'lpn': normalize(lpn).upper() if lpn else None,
-        'upc': normalize_upc(upc) if upc else None
+        'upc': _normalize_upc(upc) if upc else None
     }
     
     return normalized
@@ -1616,6 +2320,98 @@ def validate_row(fnsku=None, asin=None, lpn=None):
     # Row is valid if at least one identifier exists
     return bool(fnsku_valid or asin_valid or lpn_valid)
 
+# Named api_lookup_cache column sets. select('*') pulls rainforest_raw_data (often tens of KB)
+# on every hit; callers pick the narrowest set and fetch the raw blob explicitly when needed.
+#   SCAN             - everything a scan response needs (the blob is replaced by scan_projection)
+#   DETAIL           - SCAN plus rainforest_raw_data
+#   ENRICHMENT_CHECK - enough to decide whether an import row still needs a Rainforest call
+API_CACHE_COLUMNS_SCAN = (
+    'id,fnsku,asin,upc,product_name,description,price,category,image_url,source,scan_task_id,'
+    'task_state,asin_found,lookup_count,last_accessed,updated_at,created_at,scan_projection'
+)
+API_CACHE_COLUMNS_DETAIL = API_CACHE_COLUMNS_SCAN + ',rainforest_raw_data'
+API_CACHE_COLUMNS_ENRICHMENT_CHECK = (
+    'id,fnsku,asin,product_name,price,image_url,scan_projection,rf_title:rainforest_raw_data->product->>title'
+)
+
+def _api_cache_fetch_raw_data(supabase_client, row):
+    """Load rainforest_raw_data into a slim api_lookup_cache row (one query by id). Returns the row."""
+    if not row or 'rainforest_raw_data' in row or not row.get('id'):
+        return row
+    res = supabase_client.table('api_lookup_cache').select('rainforest_raw_data').eq('id', row['id']).limit(1).execute()
+    data = getattr(res, 'data', None) if res else None
+    row['rainforest_raw_data'] = data[0].get('rainforest_raw_data') if data else None
+    return row
+
+def _api_cache_ensure_projection(supabase_client, row):
+    """
+    Make sure a slim row carries a current scan_projection. Rows written before migration 026
+    (or with an outdated version) pay one raw-data fetch here and get the projection persisted.
+    """
+    proj = row.get('scan_projection') if row else None
+    if not row or (isinstance(proj, dict) and proj.get('v') == SCAN_PROJECTION_VERSION):
+        return row
+    try:
+        had_raw = 'rainforest_raw_data' in row
+        _api_cache_fetch_raw_data(supabase_client, row)
+        row['scan_projection'] = _build_scan_projection(row)
+        if not had_raw:
+            row.pop('rainforest_raw_data', None)
+        if row.get('id'):
+            supabase_client.table('api_lookup_cache').update({'scan_projection': row['scan_projection']}).eq('id', row['id']).execute()
+    except Exception as e:
+        logger.warning(f"Could not refresh scan_projection for api_lookup_cache id={row.get('id')}: {e}")
+    return row
+
+def _api_cache_lookup(supabase_client, column, code):
+    """
+    Return the api_lookup_cache row whose `column` (fnsku / asin / upc) equals `code`, or None.
+    Rows carry API_CACHE_COLUMNS_SCAN plus a current scan_projection (no raw Rainforest blob).
+    Served from the in-process L1 cache when possible; misses go to Supabase and warm the L1.
+    Query errors propagate so callers keep their existing error handling.
+    """
+    cached = _product_l1_get(column, code)
+    if cached is not None:
+        proj = cached.get('scan_projection')
+        if isinstance(proj, dict) and proj.get('v') == SCAN_PROJECTION_VERSION:
+            return cached
+        row = _api_cache_ensure_projection(supabase_client, cached)
+        _product_l1_put(column, code, row)
+        return row
+    cache_result = supabase_client.table('api_lookup_cache').select(API_CACHE_COLUMNS_SCAN).eq(column, code).limit(1).execute()
+    row = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+    if row:
+        row = _api_cache_ensure_projection(supabase_client, row)
+        _product_l1_put(column, code, row)
+    return row
+
+# resolve_scan_product (migration 025) answers the whole lookup chain in one round-trip.
+# If the function is missing or errors we fall back to the per-table queries and skip
+# the RPC for a while instead of paying a failed call on every scan.
+_RESOLVE_SCAN_RPC_RETRY_SECONDS = 300
+_resolve_scan_rpc_disabled_until = 0.0
+
+def _rpc_resolve_scan_product(supabase_client, code, code_type):
+    """
+    Call resolve_scan_product once and return (product_data, manifest_item_data, source).
+    Returns None when the RPC is unavailable so the caller can run the legacy chain.
+    """
+    global _resolve_scan_rpc_disabled_until
+    if not supabase_client or not code or _time.time() < _resolve_scan_rpc_disabled_until:
+        return None
+    try:
+        res = supabase_client.rpc('resolve_scan_product', {'p_code': code, 'p_code_type': code_type or ''}).execute()
+        data = getattr(res, 'data', None)
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if not isinstance(data, dict):
+            raise ValueError(f"unexpected resolve_scan_product payload: {type(data).__name__}")
+    except Exception as e:
+        _resolve_scan_rpc_disabled_until = _time.time() + _RESOLVE_SCAN_RPC_RETRY_SECONDS
+        logger.warning(f"resolve_scan_product RPC unavailable or failed (falling back to per-table lookups): {e}")
+        return None
+    return data.get('product') or None, data.get('manifest_item') or None, data.get('source') or None
+
 def find_product_in_all_tables(fnsku=None, asin=None, supabase_client=None):
     """
     Check all three tables for a product:
@@ -1651,7 +2447,7 @@ def find_product_in_all_tables(fnsku=None, asin=None, supabase_client=None):
         if asin:
             cache_conditions.append(f"asin.eq.{asin}")
         if cache_conditions:
-            result = supabase_client.table('api_lookup_cache').select('*').or_(','.join(cache_conditions)).limit(1).execute()
+            result = supabase_client.table('api_lookup_cache').select(API_CACHE_COLUMNS_SCAN).or_(','.join(cache_conditions)).limit(1).execute()
             if result and getattr(result, 'data', None) and len(result.data) > 0:
                 return result.data[0], 'api_lookup_cache'
     except Exception as e:
@@ -1667,6 +2463,13 @@ def find_manifest_item_by_lpn(lpn, supabase_client=None):
     if not supabase_client or not lpn:
         return None, None
     
+    resolved = _rpc_resolve_scan_product(supabase_client, lpn, 'LPN')
+    if resolved is not None:
+        product_data, item_data, _ = resolved
+        if not item_data:
+            return None, None
+        return item_data, product_data
+    
     try:
         # Get manifest item from manifest_data table (LPN is stored in "X-Z ASIN" column)
         result = supabase_client.table('manifest_data').select('*').eq('X-Z ASIN', lpn).maybe_single().execute()
@@ -1684,6 +2487,766 @@ def find_manifest_item_by_lpn(lpn, supabase_client=None):
     
     return None, None
 
+
+_IMPORT_FIELD_VARIATIONS = {
+    'fnsku': ['fnsku', 'fn_sku', 'fn-sku', 'fn sku', 'Fn Sku', 'sku'],
+    'asin': ['asin', 'b00_asin', 'b00-asin', 'b00 asin', 'B00 ASIN', 'B00 Asin'],
+    'lpn': ['lpn', 'x-z_asin', 'x-z-asin', 'x-z asin', 'X-Z ASIN', 'xz_asin'],
+    'upc': ['upc', 'barcode', 'ean', 'gtin'],
+    'product_name': ['product_name', 'name', 'title', 'description', 'item_name', 'item_desc', 'Description'],
+    'price': ['price', 'retail', 'msrp', 'cost', 'unit_price'],
+    'category': [
+        'category', 'type', 'department',
+        'Category', 'CATEGORY', 'product category', 'Product Category',
+        'item category', 'merch category', 'gl category', 'commodity category',
+    ],
+    'quantity': ['quantity', 'qty', 'units', 'count'],
+    'brand': ['brand', 'manufacturer', 'vendor']
+}
+
+
+def _import_field_candidates(key):
+    """Header names tried for an import field, in precedence order: the key, its case variants, then variations."""
+    return (key, key.lower(), key.upper(), key.title(), *_IMPORT_FIELD_VARIATIONS.get(key, ()))
+
+
+def _import_get_value(row, key):
+    """CSV column mapping for import rows (raw CSV rows or pre-normalized data from the frontend):
+    get value from row, trying various case variations and field names"""
+    for candidate in _import_field_candidates(key):
+        if candidate in row:
+            return row[candidate]
+    return None
+
+
+# Fields _import_process_items reads from every row ('name' / 'description' back up 'product_name').
+_IMPORT_MAPPED_FIELDS = (
+    'fnsku', 'asin', 'lpn', 'upc', 'product_name', 'name', 'description', 'price', 'category', 'brand', 'quantity',
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _import_compile_columns(headers):
+    """
+    Resolve the header for each of _IMPORT_MAPPED_FIELDS once for rows keyed by `headers` (a tuple):
+    {field: header or None}, the same choice _import_get_value makes row by row. Rows of one file share
+    their keys, so a whole import compiles once and per-row extraction becomes direct key lookups.
+    """
+    present = set(headers)
+    return {
+        field: next((c for c in _import_field_candidates(field) if c in present), None)
+        for field in _IMPORT_MAPPED_FIELDS
+    }
+
+
+class ImportUploadError(ValueError):
+    """The uploaded manifest cannot be read (unsupported type, missing XLSX support, no header row)."""
+
+
+def _import_upload_kind(file_name, content_type):
+    name = (file_name or '').lower()
+    ctype = (content_type or '').lower()
+    if name.endswith(('.xlsx', '.xlsm')) or 'spreadsheetml' in ctype:
+        return 'xlsx'
+    if name.endswith('.xls') or ctype == 'application/vnd.ms-excel':
+        raise ImportUploadError('Legacy .xls files are not supported; save the manifest as .xlsx or .csv')
+    if name.endswith('.tsv') or 'tab-separated' in ctype:
+        return 'tsv'
+    return 'csv'
+
+
+def _import_iter_upload_rows(stream, file_name=None, content_type=None):
+    """
+    Yield one dict per data row of an uploaded CSV / TSV / XLSX manifest, keyed by the stripped header
+    names. CSV is decoded straight off the stream; XLSX is read in openpyxl's read-only mode, which
+    walks the sheet without building it in memory; a raw body, which cannot seek, is spooled first
+    (multipart uploads are already spooled by the form parser).
+    """
+    kind = _import_upload_kind(file_name, content_type)
+    if kind == 'xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportUploadError('XLSX upload needs openpyxl on the server; upload the manifest as .csv')
+        seekable = getattr(stream, 'seekable', None)
+        if not (seekable and seekable()):
+            # A raw request body cannot seek, which zipfile needs; spool it (to disk past 8 MB) first.
+            spooled = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+            shutil.copyfileobj(stream, spooled, 1024 * 1024)
+            spooled.seek(0)
+            stream = spooled
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header:
+                raise ImportUploadError('The sheet has no header row')
+            names = [str(h).strip() if h is not None else '' for h in header]
+            for values in rows:
+                if not values or all(v is None or v == '' for v in values):
+                    continue
+                # Dates and other cell types become text so rows stay JSON-serializable (job staging).
+                yield {
+                    name: value if value is None or isinstance(value, (str, int, float)) else str(value)
+                    for name, value in zip(names, values) if name
+                }
+        finally:
+            workbook.close()
+        return
+
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    reader = csv.reader(text, delimiter='\t' if kind == 'tsv' else ',')
+    header = next(reader, None)
+    if not header:
+        raise ImportUploadError('The file has no header row')
+    names = [h.strip() for h in header]
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        yield {name: value for name, value in zip(names, values) if name}
+
+
+def _import_upload_extras_keys(row):
+    """Columns of an uploaded row that the field mapping does not use; kept as manifest_extras."""
+    mapped = {c for field in _IMPORT_MAPPED_FIELDS for c in _import_field_candidates(field)}
+    return [k for k in row if k not in mapped]
+
+
+def _import_upload_rows(stream, file_name=None, content_type=None):
+    """Upload rows shaped like the frontend's batch items (unmapped columns under manifest_extras)."""
+    extras_keys = None
+    for row in _import_iter_upload_rows(stream, file_name, content_type):
+        if extras_keys is None:
+            extras_keys = _import_upload_extras_keys(row)
+        if extras_keys:
+            row['manifest_extras'] = {k: row.get(k) for k in extras_keys}
+        yield row
+
+
+_IMPORT_TOTAL_KEYS = (
+    'processed', 'valid', 'skipped', 'products_inserted', 'manifest_items_inserted',
+    'cache_hits', 'enrichments_charged', 'enrichments_deferred', 'inventory_upserted',
+)
+
+
+def _import_parse_options(values):
+    """include_in_inventory / enrichment_mode / max_enrichment_calls from a JSON body or form / query values."""
+    include = values.get('include_in_inventory', False)
+    if isinstance(include, str):
+        include = include.strip().lower() in ('1', 'true', 'yes', 'on')
+    enrichment_mode = (values.get('enrichment_mode') or 'none').strip().lower()
+    if enrichment_mode not in ('none', 'missing_only', 'full'):
+        enrichment_mode = 'none'
+    try:
+        max_enrichment_calls = int(values.get('max_enrichment_calls', 100))
+    except (ValueError, TypeError):
+        max_enrichment_calls = 100
+    return bool(include), enrichment_mode, max(0, min(max_enrichment_calls, 5000))
+
+def _import_create_batch_row(user_id, tenant_id, *, include_in_inventory, enrichment_mode, max_enrichment_calls,
+                             rows_total, chunk_index=0, import_session_id=None, file_name=None, status='processing'):
+    """Insert the import_batches audit row (migration 020). Returns its id, or None."""
+    if not supabase_admin:
+        return None
+    try:
+        batch_insert = {
+            'user_id': str(user_id),
+            'include_in_inventory': include_in_inventory,
+            'enrichment_mode': enrichment_mode,
+            'max_enrichment_calls': max_enrichment_calls,
+            'rows_total': rows_total,
+            'chunk_index': int(chunk_index) if chunk_index is not None else 0,
+            'status': status,
+        }
+        if tenant_id:
+            batch_insert['tenant_id'] = str(tenant_id)
+        if import_session_id:
+            batch_insert['import_session_id'] = import_session_id
+        if file_name and isinstance(file_name, str):
+            batch_insert['file_name'] = file_name[:500]
+        ins = supabase_admin.table('import_batches').insert(batch_insert).execute()
+        if ins.data and len(ins.data) > 0:
+            return ins.data[0].get('id')
+    except Exception as batch_err:
+        logger.warning(f"Could not create import_batches row (apply migration 020?): {batch_err}")
+    return None
+
+
+def _import_process_items(items, user_id, tenant_id, *, batch_number=0, include_in_inventory=False,
+                          enrichment_mode='none', max_enrichment_calls=100, import_session_id=None,
+                          file_name=None, import_batch_id=None, row_offset=0, skip_stages=(), on_stage=None,
+                          headers=None):
+    """
+    Run one batch of import rows through the pipeline: normalize / validate, products and manifest_data
+    bulk inserts, enrichment, optional inventory and the import_batches audit. Returns the response payload.
+    Pass import_batch_id when the caller owns the import_batches row (it is then neither created nor
+    finalized here); row_offset shifts row_index in the audit rows.
+    Background jobs pass on_stage(name), called as each of _IMPORT_STAGES finishes, and skip_stages to
+    leave out the stages a resumed chunk already committed.
+    headers: the file's header row as sent by the client; the field mapping is compiled from it once
+    and used for every row keyed by exactly those headers (other rows compile from their own keys).
+    """
+    def stage_done(name):
+        if on_stage is not None:
+            on_stage(name)
+
+    # Caller-owned import_batches row (streamed uploads): the caller creates and finalizes it.
+    own_batch_row = import_batch_id is None
+    if own_batch_row:
+        import_batch_id = _import_create_batch_row(
+            user_id, tenant_id,
+            include_in_inventory=include_in_inventory,
+            enrichment_mode=enrichment_mode,
+            max_enrichment_calls=max_enrichment_calls,
+            rows_total=len(items),
+            chunk_index=batch_number,
+            import_session_id=import_session_id,
+            file_name=file_name,
+        )
+
+    # Process each row
+    products_to_insert = []
+    manifest_data_to_insert = []
+    row_outcomes = []
+    skipped_count = 0
+    processed_count = 0
+
+    # 1) Extract the mapped fields per row. The header -> field mapping is compiled from the client's
+    #    header row, or once per distinct key set (see _import_compile_columns) for rows keyed otherwise;
+    #    frontend rows may be raw CSV or pre-normalized.
+    header_keys = None
+    header_columns = None
+    if headers and isinstance(headers, (list, tuple)):
+        header_names = tuple(str(h) for h in headers)
+        header_keys = frozenset(header_names)
+        header_columns = _import_compile_columns(header_names)
+    extracted = []
+    row_keys = None
+    columns = None
+    for idx, csv_row in enumerate(items):
+        try:
+            row_headers = tuple(csv_row)
+            if row_headers != row_keys:
+                row_keys = row_headers
+                if header_columns is not None and header_keys == frozenset(
+                    k for k in row_headers if k != 'manifest_extras'
+                ):
+                    columns = header_columns
+                else:
+                    columns = _import_compile_columns(row_headers)
+            raw = {field: (csv_row[h] if h is not None else None) for field, h in columns.items()}
+            raw['manifest_extras'] = csv_row.get('manifest_extras') if isinstance(csv_row, dict) else None
+            extracted.append((idx, raw))
+        except Exception as e:
+            # Skip row on error (don't break batch)
+            logger.warning(f"Error processing row {idx} in batch {batch_number}: {str(e)}")
+            skipped_count += 1
+
+    # 2) Normalize / validate / coerce column by column across the chunk.
+    cols = _import_normalize_columns([raw for _idx, raw in extracted])
+
+    # 3) Assemble outcomes and insert payloads for the valid rows.
+    for pos, (idx, raw) in enumerate(extracted):
+        try:
+            raw_product_name = raw['product_name'] or raw['name'] or raw['description']
+            raw_category = raw['category']
+            raw_brand = raw['brand']
+            raw_manifest_extras = raw['manifest_extras']
+
+            if not cols['ok'][pos]:
+                raise ValueError('identifier could not be normalized')
+            fnsku = cols['fnsku'][pos]
+            asin = cols['asin'][pos]
+            lpn = cols['lpn'][pos]
+            upc = cols['upc'][pos]
+
+            # Validate row (must have at least one identifier)
+            if not cols['valid'][pos]:
+                skipped_count += 1
+                continue  # Skip silently
+
+            processed_count += 1
+
+            qty_parsed = _import_cell(cols['quantity'][pos])
+            price_num = _import_cell(cols['price'][pos])
+
+            row_outcomes.append({
+                'row_index': row_offset + idx,
+                'fnsku': fnsku,
+                'asin': asin,
+                'lpn': lpn,
+                'upc': upc,
+                'product_name': raw_product_name,
+                'price': price_num,
+                'quantity': qty_parsed,
+                'category': raw_category,
+                'brand': raw_brand,
+            })
+
+            # Prepare product data (if we have fnsku or asin)
+            if fnsku or asin:
+                # IMPORTANT: All objects must have the same keys for bulk insert
+                # Keep all keys even if None (PostgREST requirement)
+                product_data = {
+                    'fnsku': fnsku,
+                    'asin': asin,
+                    'upc': upc,
+                    'title': raw_product_name,
+                    'brand': raw_brand,  # Use brand from CSV if available
+                    'category': raw_category,
+                    'image': None,  # Always include, even if None
+                    'price': _import_cell(cols['price_text'][pos])
+                }
+                # Only include tenant_id if it exists (column may not exist in DB yet)
+                if tenant_id:
+                    product_data['tenant_id'] = tenant_id
+                products_to_insert.append(product_data)
+
+            # Prepare manifest_data row (if we have lpn)
+            if lpn:
+                # Map to manifest_data table columns
+                # IMPORTANT: All objects must have the same keys for bulk insert
+                manifest_row = {
+                    'X-Z ASIN': lpn,  # LPN goes in "X-Z ASIN" column
+                    'Fn Sku': fnsku,
+                    'B00 Asin': asin,
+                    'Description': raw_product_name,
+                    'MSRP': _import_cell(cols['price_text'][pos]),
+                    'Category': raw_category,
+                    'UPC': upc,
+                    'user_id': user_id  # Required for RLS
+                }
+                if isinstance(raw_manifest_extras, dict) and raw_manifest_extras:
+                    # JSONB: string values only for predictable PostgREST serialization
+                    manifest_row['manifest_extras'] = {
+                        str(k): (v if v is None else str(v))
+                        for k, v in raw_manifest_extras.items()
+                        if k is not None and str(k).strip() != ''
+                    }
+                # Only include tenant_id if it exists
+                if tenant_id:
+                    manifest_row['tenant_id'] = tenant_id
+                manifest_data_to_insert.append(manifest_row)
+
+        except Exception as e:
+            # Skip row on error (don't break batch)
+            logger.warning(f"Error processing row {idx} in batch {batch_number}: {str(e)}")
+            skipped_count += 1
+            continue
+
+    stage_done('rows')
+    import_log.info(f"📦 Batch {batch_number}: Processing {len(items)} items, {processed_count} valid, {skipped_count} skipped")
+    import_log.info(f"📦 Batch {batch_number}: {len(products_to_insert)} products, {len(manifest_data_to_insert)} manifest_data rows to insert")
+
+    # Insert products (ON CONFLICT DO NOTHING) - BULK INSERT via PostgREST
+    products_inserted = 0
+    if products_to_insert and 'products' not in skip_stages:
+        try:
+            # Deduplicate products by (fnsku, asin, tenant_id) before inserting
+            unique_products = {}
+            for product in products_to_insert:
+                key = (product.get('fnsku'), product.get('asin'), product.get('tenant_id'))
+                if key not in unique_products:
+                    unique_products[key] = product
+
+            products_to_insert = list(unique_products.values())
+            import_log.info(f"📦 Batch {batch_number}: Deduplicated to {len(products_to_insert)} unique products")
+
+            # Bulk insert using PostgREST API with ON CONFLICT DO NOTHING
+            supabase_url = os.environ.get("SUPABASE_URL")
+            service_key = os.environ.get("SUPABASE_SERVICE_KEY")
+
+            if supabase_url and service_key:
+                url = f"{supabase_url}/rest/v1/products"
+                headers = {
+                    "apikey": service_key,
+                    "Authorization": f"Bearer {service_key}",
+                    "Content-Type": "application/json",
+                    "Prefer": "return=minimal"  # Return minimal response, handle conflicts gracefully
+                }
+
+                # Bulk insert all products at once
+                try:
+                    response = upstream_http.post(
+                        url,
+                        headers=headers,
+                        json=products_to_insert,  # Send array
+                        timeout=30
+                    )
+                    import_log.info(f"📤 Batch {batch_number}: Products insert response: {response.status_code}")
+
+                    if response.status_code in [200, 201]:
+                        # With resolution=ignore, PostgREST may return empty array or no data
+                        # Check Content-Range header or response body
+                        try:
+                            inserted_data = response.json()
+                            if isinstance(inserted_data, list):
+                                products_inserted = len(inserted_data)
+                                import_log.info(f"📊 Batch {batch_number}: Response contains {products_inserted} products")
+                            else:
+                                # No data returned (all duplicates or resolution=ignore behavior)
+                                # Estimate based on Content-Range header if available
+                                content_range = response.headers.get('Content-Range', '')
+                                if content_range:
+                                    # Format: "0-999/1000" means 1000 items processed
+                                    try:
+                                        total = int(content_range.split('/')[1])
+                                        products_inserted = total
+                                    except:
+                                        products_inserted = len(products_to_insert)  # Estimate
+                                else:
+                                    # Assume all were processed (duplicates skipped silently)
+                                    products_inserted = len(products_to_insert)
+                                import_log.info(f"📊 Batch {batch_number}: Estimated {products_inserted} products processed")
+                        except Exception as parse_error:
+                            logger.warning(f"⚠️ Batch {batch_number}: Could not parse products response: {str(parse_error)}")
+                            # Assume success if status is 200/201
+                            products_inserted = len(products_to_insert)
+                        import_log.info(f"✅ Batch {batch_number}: Processed {products_inserted} products")
+                    elif response.status_code == 409:
+                        # Conflict - duplicates detected (items already exist)
+                        # This is actually fine - it means the data is already in the database
+                        # With unique constraints on fnsku/asin, 409 means all items are duplicates
+                        # We'll treat this as success since the data already exists
+                        try:
+                            inserted_data = response.json()
+                            if isinstance(inserted_data, list) and len(inserted_data) > 0:
+                                products_inserted = len(inserted_data)
+                                import_log.info(f"📊 Batch {batch_number}: {products_inserted} products inserted despite conflicts")
+                            else:
+                                # 409 with no data means all items were duplicates (already exist)
+                                # This is actually fine - count as processed
+                                products_inserted = len(products_to_insert)
+                                import_log.info(f"✅ Batch {batch_number}: All {products_inserted} products already exist (duplicates skipped)")
+                        except:
+                            # Can't parse response, but 409 with unique constraints means duplicates
+                            # Count as successfully processed (they already exist)
+                            products_inserted = len(products_to_insert)
+                            import_log.info(f"✅ Batch {batch_number}: All {products_inserted} products already exist (duplicates)")
+                    else:
+                        error_text = response.text[:500] if response.text else "No error message"
+                        logger.error(f"❌ Batch {batch_number}: Products insert failed ({response.status_code}): {error_text}")
+                        products_inserted = 0
+                except Exception as bulk_error:
+                    logger.error(f"❌ Batch {batch_number}: Bulk products insert error: {str(bulk_error)}")
+                    import traceback
+                    logger.error(f"Traceback: {traceback.format_exc()}")
+                    products_inserted = 0
+            else:
+                logger.error(f"❌ Batch {batch_number}: Missing Supabase credentials")
+        except Exception as e:
+            logger.error(f"Error in products bulk insert: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+
+    stage_done('products')
+
+    # Insert manifest_data (ON CONFLICT DO NOTHING) - BULK INSERT via PostgREST
+    manifest_data_inserted = 0
+    if manifest_data_to_insert and 'manifest_data' not in skip_stages:
+        try:
+            # Bulk insert using PostgREST API with ON CONFLICT DO NOTHING
+            supabase_url = os.environ.get("SUPABASE_URL")
+            service_key = os.environ.get("SUPABASE_SERVICE_KEY")
+
+            if supabase_url and service_key:
+                url = f"{supabase_url}/rest/v1/manifest_data"
+                headers = {
+                    "apikey": service_key,
+                    "Authorization": f"Bearer {service_key}",
+                    "Content-Type": "application/json",
+                    "Prefer": "return=minimal"  # Return minimal response, handle conflicts gracefully
+                }
+
+                # Bulk insert all manifest_data rows at once
+                try:
+                    response = upstream_http.post(
+                        url,
+                        headers=headers,
+                        json=manifest_data_to_insert,  # Send array
+                        timeout=30
+                    )
+                    import_log.info(f"📤 Batch {batch_number}: Manifest_data insert response: {response.status_code}")
+
+                    if response.status_code in [200, 201]:
+                        # With resolution=ignore, PostgREST may return empty array or no data
+                        try:
+                            inserted_data = response.json()
+                            if isinstance(inserted_data, list):
+                                manifest_data_inserted = len(inserted_data)
+                                import_log.info(f"📊 Batch {batch_number}: Response contains {manifest_data_inserted} manifest_data rows")
+                            else:
+                                # No data returned (all duplicates or resolution=ignore behavior)
+                                content_range = response.headers.get('Content-Range', '')
+                                if content_range:
+                                    try:
+                                        total = int(content_range.split('/')[1])
+                                        manifest_data_inserted = total
+                                    except:
+                                        manifest_data_inserted = len(manifest_data_to_insert)
+                                else:
+                                    manifest_data_inserted = len(manifest_data_to_insert)
+                                import_log.info(f"📊 Batch {batch_number}: Estimated {manifest_data_inserted} manifest_data rows processed")
+                        except Exception as parse_error:
+                            logger.warning(f"⚠️ Batch {batch_number}: Could not parse manifest_data response: {str(parse_error)}")
+                            manifest_data_inserted = len(manifest_data_to_insert)
+                        import_log.info(f"✅ Batch {batch_number}: Processed {manifest_data_inserted} manifest_data rows")
+                    elif response.status_code == 409:
+                        # Conflict - duplicates detected (items already exist)
+                        # This is actually fine - it means the data is already in the database
+                        try:
+                            inserted_data = response.json()
+                            if isinstance(inserted_data, list) and len(inserted_data) > 0:
+                                manifest_data_inserted = len(inserted_data)
+                                import_log.info(f"📊 Batch {batch_number}: {manifest_data_inserted} manifest_data rows inserted despite conflicts")
+                            else:
+                                # 409 with no data means all items were duplicates (already exist)
+                                # This is actually fine - count as processed
+                                manifest_data_inserted = len(manifest_data_to_insert)
+                                import_log.info(f"✅ Batch {batch_number}: All {manifest_data_inserted} manifest_data rows already exist (duplicates skipped)")
+                        except:
+                            # Can't parse response, but 409 means duplicates
+                            # Count as successfully processed (they already exist)
+                            manifest_data_inserted = len(manifest_data_to_insert)
+                            import_log.info(f"✅ Batch {batch_number}: All {manifest_data_inserted} manifest_data rows already exist (duplicates)")
+                    else:
+                        error_text = response.text[:500] if response.text else "No error message"
+                        logger.error(f"❌ Batch {batch_number}: Manifest_data insert failed ({response.status_code}): {error_text}")
+                        manifest_data_inserted = 0
+                except Exception as bulk_error:
+                    logger.error(f"❌ Batch {batch_number}: Bulk manifest_data insert error: {str(bulk_error)}")
+                    import traceback
+                    logger.error(f"Traceback: {traceback.format_exc()}")
+                    manifest_data_inserted = 0
+            else:
+                logger.error(f"❌ Batch {batch_number}: Missing Supabase credentials")
+        except Exception as e:
+            logger.error(f"Error in manifest_data bulk insert: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+
+    stage_done('manifest_data')
+
+    # ----- Enrichment (Rainforest) — global api_lookup_cache, capped + DB locks -----
+    cache_hits = 0
+    enrichments_charged = 0
+    enrichments_deferred = 0
+
+    cache_index = None
+    if supabase_admin and row_outcomes and 'enrichment' not in skip_stages:
+        if enrichment_mode != 'none':
+            cache_index = _import_prefetch_api_cache_rows(supabase_admin, row_outcomes)
+        cache_hits, enrichments_charged, enrichments_deferred = _import_enrich_rows(
+            supabase_admin, row_outcomes, enrichment_mode, max_enrichment_calls, cache_index
+        )
+
+    stage_done('enrichment')
+
+    # ----- Optional per-business inventory (tenant / user scoped) -----
+    inventory_upserted = 0
+    if include_in_inventory and supabase_admin and row_outcomes and 'inventory' not in skip_stages:
+        inv_map = {}
+        for outcome in row_outcomes:
+            sku = (outcome.get('fnsku') or outcome.get('asin') or outcome.get('lpn') or '').strip()
+            if not sku:
+                continue
+            name = (outcome.get('product_name') or '').strip() or f'Item {sku}'
+            qty = int(outcome.get('quantity') or 1)
+            price = float(outcome.get('price') or 0)
+            if sku not in inv_map:
+                inv_map[sku] = {
+                    'sku': sku[:255],
+                    'name': name[:500],
+                    'quantity': max(1, qty),
+                    'price': price,
+                    'cost': 0.0,
+                    'location': 'Import',
+                    'condition': 'New',
+                    'fnsku': outcome.get('fnsku'),
+                    'asin': outcome.get('asin'),
+                }
+            else:
+                inv_map[sku]['quantity'] += max(1, qty)
+                if name and (not inv_map[sku]['name'] or inv_map[sku]['name'].startswith('Item ')):
+                    inv_map[sku]['name'] = name[:500]
+
+        # Rows enriched above changed the cache: reload the index rather than serve stale images.
+        if cache_index is None or enrichments_charged:
+            cache_index = _import_prefetch_api_cache_rows(supabase_admin, inv_map.values())
+
+        inv_candidates = []
+        for row in inv_map.values():
+            img_url = None
+            cr = _import_get_api_cache_row(supabase_admin, row.get('fnsku'), row.get('asin'), index=cache_index)
+            if cr:
+                try:
+                    iu = cr.get('image_url')
+                    if iu:
+                        if isinstance(iu, str) and iu.strip().startswith('['):
+                            parsed = json.loads(iu)
+                            if isinstance(parsed, list) and parsed:
+                                img_url = parsed[0]
+                        else:
+                            img_url = iu
+                    if not img_url:
+                        if not isinstance(cr.get('scan_projection'), dict):
+                            _api_cache_fetch_raw_data(supabase_admin, cr)
+                        urls = _scan_projection(cr)['images']
+                        if urls:
+                            img_url = urls[0]
+                except Exception:
+                    pass
+            cand = {
+                'sku': row['sku'],
+                'name': row['name'],
+                'quantity': row['quantity'],
+                'price': row['price'],
+                'cost': row['cost'],
+                'location': row['location'],
+                'condition': row['condition'],
+                'image_url': img_url,
+                'user_id': str(user_id),
+            }
+            if row.get('asin'):
+                cand['asin'] = (row['asin'] or '')[:32]
+            if tenant_id:
+                cand['tenant_id'] = str(tenant_id)
+            inv_candidates.append(cand)
+
+        inventory_upserted, inv_candidates = _import_inventory_upsert_rpc(
+            supabase_admin, user_id, tenant_id, inv_candidates,
+            apply_key=f"{import_batch_id}:{batch_number}" if import_batch_id else None,
+        )
+        if inv_candidates:
+            # Fallback without migration 031: per-SKU writes (quantity is read-modify-write here).
+            skus_list = [cand['sku'] for cand in inv_candidates]
+            existing_by_sku = {}
+            if skus_list:
+                try:
+                    CH = 80
+                    for i in range(0, len(skus_list), CH):
+                        chunk = skus_list[i:i + CH]
+                        q = supabase_admin.table('inventory').select('id,sku,quantity').eq('user_id', str(user_id))
+                        if tenant_id:
+                            q = q.eq('tenant_id', str(tenant_id))
+                        er = q.in_('sku', chunk).execute()
+                        for exrow in (er.data or []):
+                            existing_by_sku[exrow['sku']] = exrow
+                except Exception as inv_e:
+                    logger.warning(f"Inventory existing fetch failed: {inv_e}")
+
+            for cand in inv_candidates:
+                try:
+                    ex = existing_by_sku.get(cand['sku'])
+                    payload = {
+                        'sku': cand['sku'],
+                        'name': cand['name'],
+                        'quantity': (ex['quantity'] or 0) + cand['quantity'] if ex else cand['quantity'],
+                        'price': cand['price'],
+                        'cost': cand['cost'],
+                        'location': cand['location'],
+                        'condition': cand['condition'],
+                        'image_url': cand['image_url'],
+                        'user_id': cand['user_id'],
+                    }
+                    if cand.get('asin'):
+                        payload['asin'] = cand['asin']
+                    if tenant_id:
+                        payload['tenant_id'] = str(tenant_id)
+                    if ex:
+                        supabase_admin.table('inventory').update(payload).eq('id', ex['id']).execute()
+                    else:
+                        supabase_admin.table('inventory').insert(payload).execute()
+                    inventory_upserted += 1
+                except Exception as ie:
+                    logger.warning(f"Inventory row failed for sku {cand.get('sku')}: {ie}")
+
+    stage_done('inventory')
+
+    # ----- Persist import audit rows + finalize batch metrics -----
+    if import_batch_id and supabase_admin and row_outcomes and 'audit' not in skip_stages:
+        try:
+            item_payloads = []
+            for outcome in row_outcomes:
+                meta = outcome.get('_import_meta') or {}
+                raw_row = {
+                    'fnsku': outcome.get('fnsku'),
+                    'asin': outcome.get('asin'),
+                    'lpn': outcome.get('lpn'),
+                    'upc': outcome.get('upc'),
+                    'product_name': outcome.get('product_name'),
+                    'price': outcome.get('price'),
+                    'quantity': outcome.get('quantity'),
+                    'category': outcome.get('category'),
+                    'brand': outcome.get('brand'),
+                }
+                item_payloads.append({
+                    'import_batch_id': import_batch_id,
+                    'row_index': outcome['row_index'],
+                    'fnsku': outcome.get('fnsku'),
+                    'asin': outcome.get('asin'),
+                    'lpn': outcome.get('lpn'),
+                    'enrichment_status': meta.get('enrichment_status'),
+                    'cache_hit': meta.get('cache_hit', False),
+                    'enrichment_charged': meta.get('enrichment_charged', False),
+                    'included_in_inventory': include_in_inventory,
+                    'raw_row': raw_row,
+                })
+            STEP = 200
+            for i in range(0, len(item_payloads), STEP):
+                supabase_admin.table('import_batch_items').insert(item_payloads[i:i + STEP]).execute()
+        except Exception as aud_e:
+            logger.warning(f"import_batch_items insert failed: {aud_e}")
+
+    stage_done('audit')
+
+    if own_batch_row and import_batch_id and supabase_admin:
+        try:
+            supabase_admin.table('import_batches').update({
+                'rows_valid': processed_count,
+                'rows_skipped': skipped_count,
+                'cache_hits': cache_hits,
+                'enrichments_charged': enrichments_charged,
+                'enrichments_deferred': enrichments_deferred,
+                'inventory_upserted': inventory_upserted,
+                'products_touched': products_inserted,
+                'manifest_rows_touched': manifest_data_inserted,
+                'status': 'completed',
+            }).eq('id', import_batch_id).execute()
+        except Exception as ub_e:
+            logger.warning(f"import_batches final update failed: {ub_e}")
+
+    # Numeric `success` for frontend aggregation (sum across chunks); boolean status as import_ok
+    success_count = products_inserted + manifest_data_inserted
+    failed_count = skipped_count
+
+    import_log.info(
+        f"✅ Batch {batch_number} complete: {success_count} db rows touched, {failed_count} skipped, "
+        f"cache_hits={cache_hits}, enrichments_charged={enrichments_charged}, inventory={inventory_upserted}"
+    )
+
+    return {
+        "import_ok": True,
+        "processed": len(items),
+        "success": success_count,
+        "failed": failed_count,
+        "products_inserted": products_inserted,
+        "manifest_items_inserted": manifest_data_inserted,
+        "skipped": skipped_count,
+        "valid": processed_count,
+        "batch": batch_number,
+        "include_in_inventory": include_in_inventory,
+        "enrichment_mode": enrichment_mode,
+        "cache_hits": cache_hits,
+        "enrichments_charged": enrichments_charged,
+        "enrichments_deferred": enrichments_deferred,
+        "inventory_upserted": inventory_upserted,
+        "import_batch_id": str(import_batch_id) if import_batch_id else None,
+    }
+
+
 @app.route('/api/import/batch', methods=['POST', 'OPTIONS'])
 def batch_import():
     """
@@ -1737,678 +3300,178 @@ def batch_import():
         batch_number = data.get('batch', 0)
         csv_headers = data.get('headers', [])
 
-        include_in_inventory = bool(data.get('include_in_inventory', False))
-        enrichment_mode = (data.get('enrichment_mode') or 'none').strip().lower()
-        if enrichment_mode not in ('none', 'missing_only', 'full'):
-            enrichment_mode = 'none'
-        try:
-            max_enrichment_calls = int(data.get('max_enrichment_calls', 100))
-        except (ValueError, TypeError):
-            max_enrichment_calls = 100
-        max_enrichment_calls = max(0, min(max_enrichment_calls, 5000))
+        include_in_inventory, enrichment_mode, max_enrichment_calls = _import_parse_options(data)
         import_session_id = data.get('import_session_id')
         file_name = data.get('file_name')
 
-        import_batch_id = None
-        if supabase_admin:
-            try:
-                batch_insert = {
-                    'user_id': str(user_id),
-                    'include_in_inventory': include_in_inventory,
-                    'enrichment_mode': enrichment_mode,
-                    'max_enrichment_calls': max_enrichment_calls,
-                    'rows_total': len(items),
-                    'chunk_index': int(batch_number) if batch_number is not None else 0,
-                    'status': 'processing',
-                }
-                if tenant_id:
-                    batch_insert['tenant_id'] = str(tenant_id)
-                if import_session_id:
-                    batch_insert['import_session_id'] = import_session_id
-                if file_name and isinstance(file_name, str):
-                    batch_insert['file_name'] = file_name[:500]
-                ins = supabase_admin.table('import_batches').insert(batch_insert).execute()
-                if ins.data and len(ins.data) > 0:
-                    import_batch_id = ins.data[0].get('id')
-            except Exception as batch_err:
-                logger.warning(f"Could not create import_batches row (apply migration 020?): {batch_err}")
-        
-        # CSV column mapping - handle both raw CSV rows and pre-normalized data from frontend
-        def get_value(row, key):
-            """Get value from row, trying various case variations and field names"""
-            # Direct key match
-            if key in row:
-                return row[key]
-            # Try lowercase
-            if key.lower() in row:
-                return row[key.lower()]
-            # Try uppercase
-            if key.upper() in row:
-                return row[key.upper()]
-            # Try title case
-            if key.title() in row:
-                return row[key.title()]
-            # Try common variations
-            variations = {
-                'fnsku': ['fnsku', 'fn_sku', 'fn-sku', 'fn sku', 'Fn Sku', 'sku'],
-                'asin': ['asin', 'b00_asin', 'b00-asin', 'b00 asin', 'B00 ASIN', 'B00 Asin'],
-                'lpn': ['lpn', 'x-z_asin', 'x-z-asin', 'x-z asin', 'X-Z ASIN', 'xz_asin'],
-                'upc': ['upc', 'barcode', 'ean', 'gtin'],
-                'product_name': ['product_name', 'name', 'title', 'description', 'item_name', 'item_desc', 'Description'],
-                'price': ['price', 'retail', 'msrp', 'cost', 'unit_price'],
-                'category': [
-                    'category', 'type', 'department',
-                    'Category', 'CATEGORY', 'product category', 'Product Category',
-                    'item category', 'merch category', 'gl category', 'commodity category',
-                ],
-                'quantity': ['quantity', 'qty', 'units', 'count'],
-                'brand': ['brand', 'manufacturer', 'vendor']
-            }
-            if key in variations:
-                for var in variations[key]:
-                    if var in row:
-                        return row[var]
-            return None
-        
-        # Process each row
-        products_to_insert = []
-        manifest_data_to_insert = []
-        row_outcomes = []
-        skipped_count = 0
-        processed_count = 0
+        if data.get('background'):
+            job_id, chunks, rows = _import_job_enqueue(
+                user_id, tenant_id, items,
+                include_in_inventory=include_in_inventory,
+                enrichment_mode=enrichment_mode,
+                max_enrichment_calls=max_enrichment_calls,
+                import_session_id=import_session_id,
+                file_name=file_name,
+            )
+            return _import_job_response(job_id, chunks, rows)
+
+        result = _import_process_items(
+            items, user_id, tenant_id,
+            batch_number=batch_number,
+            include_in_inventory=include_in_inventory,
+            enrichment_mode=enrichment_mode,
+            max_enrichment_calls=max_enrichment_calls,
+            import_session_id=import_session_id,
+            file_name=file_name,
+            headers=csv_headers,
+        )
+        return jsonify(result), 200
         
-        for idx, csv_row in enumerate(items):
-            try:
-                # Extract values - frontend may send pre-normalized data or raw CSV rows
-                # Check if data is already normalized (has clean field names)
-                raw_fnsku = get_value(csv_row, 'fnsku')
-                raw_asin = get_value(csv_row, 'asin')
-                raw_lpn = get_value(csv_row, 'lpn')
-                raw_upc = get_value(csv_row, 'upc')
-                raw_product_name = get_value(csv_row, 'product_name') or get_value(csv_row, 'name') or get_value(csv_row, 'description')
-                raw_price = get_value(csv_row, 'price')
-                raw_category = get_value(csv_row, 'category')
-                raw_brand = get_value(csv_row, 'brand')
-                raw_quantity = get_value(csv_row, 'quantity')
-                raw_manifest_extras = csv_row.get('manifest_extras') if isinstance(csv_row, dict) else None
-                
-                # Normalize identifiers
-                normalized = normalize_identifiers(
-                    fnsku=raw_fnsku,
-                    asin=raw_asin,
-                    lpn=raw_lpn,
-                    upc=raw_upc
-                )
-                
-                fnsku = normalized['fnsku']
-                asin = normalized['asin']
-                lpn = normalized['lpn']
-                upc = normalized['upc']
-                
-                # Validate row (must have at least one identifier)
-                if not validate_row(fnsku=fnsku, asin=asin, lpn=lpn):
-                    skipped_count += 1
-                    continue  # Skip silently
-                
-                processed_count += 1
-
-                qty_parsed = _import_parse_quantity(raw_quantity)
-                try:
-                    if raw_price is None or raw_price == '':
-                        price_num = 0.0
-                    elif isinstance(raw_price, (int, float)):
-                        price_num = float(raw_price)
-                    else:
-                        price_num = float(str(raw_price).strip())
-                except (ValueError, TypeError):
-                    price_num = 0.0
-
-                row_outcomes.append({
-                    'row_index': idx,
-                    'fnsku': fnsku,
-                    'asin': asin,
-                    'lpn': lpn,
-                    'upc': upc,
-                    'product_name': raw_product_name,
-                    'price': price_num,
-                    'quantity': qty_parsed,
-                    'category': raw_category,
-                    'brand': raw_brand,
-                })
-                
-                # Prepare product data (if we have fnsku or asin)
-                if fnsku or asin:
-                    # IMPORTANT: All objects must have the same keys for bulk insert
-                    # Keep all keys even if None (PostgREST requirement)
-                    # Clean price: convert to string if numeric, handle None
-                    price_str = None
-                    if raw_price is not None:
-                        if isinstance(raw_price, (int, float)):
-                            price_str = str(raw_price)
-                        else:
-                            try:
-                                price_str = str(float(raw_price))
-                            except (ValueError, TypeError):
-                                price_str = None
-                    
-                    product_data = {
-                        'fnsku': fnsku,
-                        'asin': asin,
-                        'upc': upc,
-                        'title': raw_product_name,
-                        'brand': raw_brand,  # Use brand from CSV if available
-                        'category': raw_category,
-                        'image': None,  # Always include, even if None
-                        'price': price_str
-                    }
-                    # Only include tenant_id if it exists (column may not exist in DB yet)
-                    if tenant_id:
-                        product_data['tenant_id'] = tenant_id
-                    products_to_insert.append(product_data)
-                
-                # Prepare manifest_data row (if we have lpn)
-                if lpn:
-                    # Map to manifest_data table columns
-                    # IMPORTANT: All objects must have the same keys for bulk insert
-                    # Clean price: convert to string if numeric, handle None
-                    msrp_str = None
-                    if raw_price is not None:
-                        if isinstance(raw_price, (int, float)):
-                            msrp_str = str(raw_price)
-                        else:
-                            try:
-                                msrp_str = str(float(raw_price))
-                            except (ValueError, TypeError):
-                                msrp_str = None
-                    
-                    manifest_row = {
-                        'X-Z ASIN': lpn,  # LPN goes in "X-Z ASIN" column
-                        'Fn Sku': fnsku,
-                        'B00 Asin': asin,
-                        'Description': raw_product_name,
-                        'MSRP': msrp_str,
-                        'Category': raw_category,
-                        'UPC': upc,
-                        'user_id': user_id  # Required for RLS
-                    }
-                    if isinstance(raw_manifest_extras, dict) and raw_manifest_extras:
-                        # JSONB: string values only for predictable PostgREST serialization
-                        manifest_row['manifest_extras'] = {
-                            str(k): (v if v is None else str(v))
-                            for k, v in raw_manifest_extras.items()
-                            if k is not None and str(k).strip() != ''
-                        }
-                    # Only include tenant_id if it exists
-                    if tenant_id:
-                        manifest_row['tenant_id'] = tenant_id
-                    manifest_data_to_insert.append(manifest_row)
-                
-            except Exception as e:
-                # Skip row on error (don't break batch)
-                logger.warning(f"Error processing row {idx} in batch {batch_number}: {str(e)}")
-                skipped_count += 1
-                continue
-        
-        logger.info(f"📦 Batch {batch_number}: Processing {len(items)} items, {processed_count} valid, {skipped_count} skipped")
-        logger.info(f"📦 Batch {batch_number}: {len(products_to_insert)} products, {len(manifest_data_to_insert)} manifest_data rows to insert")
-        
-        # Insert products (ON CONFLICT DO NOTHING) - BULK INSERT via PostgREST
-        products_inserted = 0
-        if products_to_insert:
-            try:
-                # Deduplicate products by (fnsku, asin, tenant_id) before inserting
-                unique_products = {}
-                for product in products_to_insert:
-                    key = (product.get('fnsku'), product.get('asin'), product.get('tenant_id'))
-                    if key not in unique_products:
-                        unique_products[key] = product
-                
-                products_to_insert = list(unique_products.values())
-                logger.info(f"📦 Batch {batch_number}: Deduplicated to {len(products_to_insert)} unique products")
-                
-                # Bulk insert using PostgREST API with ON CONFLICT DO NOTHING
-                supabase_url = os.environ.get("SUPABASE_URL")
-                service_key = os.environ.get("SUPABASE_SERVICE_KEY")
-                
-                if supabase_url and service_key:
-                    url = f"{supabase_url}/rest/v1/products"
-                    headers = {
-                        "apikey": service_key,
-                        "Authorization": f"Bearer {service_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal"  # Return minimal response, handle conflicts gracefully
-                    }
-                    
-                    # Bulk insert all products at once
-                    try:
-                        response = requests.post(
-                            url,
-                            headers=headers,
-                            json=products_to_insert,  # Send array
-                            timeout=30
-                        )
-                        logger.info(f"📤 Batch {batch_number}: Products insert response: {response.status_code}")
-                        
-                        if response.status_code in [200, 201]:
-                            # With resolution=ignore, PostgREST may return empty array or no data
-                            # Check Content-Range header or response body
-                            try:
-                                inserted_data = response.json()
-                                if isinstance(inserted_data, list):
-                                    products_inserted = len(inserted_data)
-                                    logger.info(f"📊 Batch {batch_number}: Response contains {products_inserted} products")
-                                else:
-                                    # No data returned (all duplicates or resolution=ignore behavior)
-                                    # Estimate based on Content-Range header if available
-                                    content_range = response.headers.get('Content-Range', '')
-                                    if content_range:
-                                        # Format: "0-999/1000" means 1000 items processed
-                                        try:
-                                            total = int(content_range.split('/')[1])
-                                            products_inserted = total
-                                        except:
-                                            products_inserted = len(products_to_insert)  # Estimate
-                                    else:
-                                        # Assume all were processed (duplicates skipped silently)
-                                        products_inserted = len(products_to_insert)
-                                    logger.info(f"📊 Batch {batch_number}: Estimated {products_inserted} products processed")
-                            except Exception as parse_error:
-                                logger.warning(f"⚠️ Batch {batch_number}: Could not parse products response: {str(parse_error)}")
-                                # Assume success if status is 200/201
-                                products_inserted = len(products_to_insert)
-                            logger.info(f"✅ Batch {batch_number}: Processed {products_inserted} products")
-                        elif response.status_code == 409:
-                            # Conflict - duplicates detected (items already exist)
-                            # This is actually fine - it means the data is already in the database
-                            # With unique constraints on fnsku/asin, 409 means all items are duplicates
-                            # We'll treat this as success since the data already exists
-                            try:
-                                inserted_data = response.json()
-                                if isinstance(inserted_data, list) and len(inserted_data) > 0:
-                                    products_inserted = len(inserted_data)
-                                    logger.info(f"📊 Batch {batch_number}: {products_inserted} products inserted despite conflicts")
-                                else:
-                                    # 409 with no data means all items were duplicates (already exist)
-                                    # This is actually fine - count as processed
-                                    products_inserted = len(products_to_insert)
-                                    logger.info(f"✅ Batch {batch_number}: All {products_inserted} products already exist (duplicates skipped)")
-                            except:
-                                # Can't parse response, but 409 with unique constraints means duplicates
-                                # Count as successfully processed (they already exist)
-                                products_inserted = len(products_to_insert)
-                                logger.info(f"✅ Batch {batch_number}: All {products_inserted} products already exist (duplicates)")
-                        else:
-                            error_text = response.text[:500] if response.text else "No error message"
-                            logger.error(f"❌ Batch {batch_number}: Products insert failed ({response.status_code}): {error_text}")
-                            products_inserted = 0
-                    except Exception as bulk_error:
-                        logger.error(f"❌ Batch {batch_number}: Bulk products insert error: {str(bulk_error)}")
-                        import traceback
-                        logger.error(f"Traceback: {traceback.format_exc()}")
-                        products_inserted = 0
-                else:
-                    logger.error(f"❌ Batch {batch_number}: Missing Supabase credentials")
-            except Exception as e:
-                logger.error(f"Error in products bulk insert: {str(e)}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
-        
-        # Insert manifest_data (ON CONFLICT DO NOTHING) - BULK INSERT via PostgREST
-        manifest_data_inserted = 0
-        if manifest_data_to_insert:
-            try:
-                # Bulk insert using PostgREST API with ON CONFLICT DO NOTHING
-                supabase_url = os.environ.get("SUPABASE_URL")
-                service_key = os.environ.get("SUPABASE_SERVICE_KEY")
-                
-                if supabase_url and service_key:
-                    url = f"{supabase_url}/rest/v1/manifest_data"
-                    headers = {
-                        "apikey": service_key,
-                        "Authorization": f"Bearer {service_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal"  # Return minimal response, handle conflicts gracefully
-                    }
-                    
-                    # Bulk insert all manifest_data rows at once
-                    try:
-                        response = requests.post(
-                            url,
-                            headers=headers,
-                            json=manifest_data_to_insert,  # Send array
-                            timeout=30
-                        )
-                        logger.info(f"📤 Batch {batch_number}: Manifest_data insert response: {response.status_code}")
-                        
-                        if response.status_code in [200, 201]:
-                            # With resolution=ignore, PostgREST may return empty array or no data
-                            try:
-                                inserted_data = response.json()
-                                if isinstance(inserted_data, list):
-                                    manifest_data_inserted = len(inserted_data)
-                                    logger.info(f"📊 Batch {batch_number}: Response contains {manifest_data_inserted} manifest_data rows")
-                                else:
-                                    # No data returned (all duplicates or resolution=ignore behavior)
-                                    content_range = response.headers.get('Content-Range', '')
-                                    if content_range:
-                                        try:
-                                            total = int(content_range.split('/')[1])
-                                            manifest_data_inserted = total
-                                        except:
-                                            manifest_data_inserted = len(manifest_data_to_insert)
-                                    else:
-                                        manifest_data_inserted = len(manifest_data_to_insert)
-                                    logger.info(f"📊 Batch {batch_number}: Estimated {manifest_data_inserted} manifest_data rows processed")
-                            except Exception as parse_error:
-                                logger.warning(f"⚠️ Batch {batch_number}: Could not parse manifest_data response: {str(parse_error)}")
-                                manifest_data_inserted = len(manifest_data_to_insert)
-                            logger.info(f"✅ Batch {batch_number}: Processed {manifest_data_inserted} manifest_data rows")
-                        elif response.status_code == 409:
-                            # Conflict - duplicates detected (items already exist)
-                            # This is actually fine - it means the data is already in the database
-                            try:
-                                inserted_data = response.json()
-                                if isinstance(inserted_data, list) and len(inserted_data) > 0:
-                                    manifest_data_inserted = len(inserted_data)
-                                    logger.info(f"📊 Batch {batch_number}: {manifest_data_inserted} manifest_data rows inserted despite conflicts")
-                                else:
-                                    # 409 with no data means all items were duplicates (already exist)
-                                    # This is actually fine - count as processed
-                                    manifest_data_inserted = len(manifest_data_to_insert)
-                                    logger.info(f"✅ Batch {batch_number}: All {manifest_data_inserted} manifest_data rows already exist (duplicates skipped)")
-                            except:
-                                # Can't parse response, but 409 means duplicates
-                                # Count as successfully processed (they already exist)
-                                manifest_data_inserted = len(manifest_data_to_insert)
-                                logger.info(f"✅ Batch {batch_number}: All {manifest_data_inserted} manifest_data rows already exist (duplicates)")
-                        else:
-                            error_text = response.text[:500] if response.text else "No error message"
-                            logger.error(f"❌ Batch {batch_number}: Manifest_data insert failed ({response.status_code}): {error_text}")
-                            manifest_data_inserted = 0
-                    except Exception as bulk_error:
-                        logger.error(f"❌ Batch {batch_number}: Bulk manifest_data insert error: {str(bulk_error)}")
-                        import traceback
-                        logger.error(f"Traceback: {traceback.format_exc()}")
-                        manifest_data_inserted = 0
-                else:
-                    logger.error(f"❌ Batch {batch_number}: Missing Supabase credentials")
-            except Exception as e:
-                logger.error(f"Error in manifest_data bulk insert: {str(e)}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
-        
-        # ----- Enrichment (Rainforest) — global api_lookup_cache, capped + DB locks -----
-        cache_hits = 0
-        enrichments_charged = 0
-        enrichments_deferred = 0
-        asin_enriched_locally = set()
-
-        if supabase_admin and row_outcomes:
-            for outcome in row_outcomes:
-                estatus = 'idle'
-                c_hit = False
-                charged = False
-                fn = outcome.get('fnsku')
-                a_raw = outcome.get('asin')
-
-                if enrichment_mode == 'none':
-                    estatus = 'skipped_mode_none'
-                elif not _import_valid_asin(a_raw):
-                    estatus = 'no_asin'
-                else:
-                    a = a_raw.strip().upper()
-                    cache_row = _import_get_api_cache_row(supabase_admin, fn, a_raw)
-                    complete = _import_rainforest_cache_complete(cache_row)
-
-                    if complete and enrichment_mode != 'full':
-                        cache_hits += 1
-                        c_hit = True
-                        estatus = 'cache_hit'
-                    elif enrichments_charged >= max_enrichment_calls:
-                        enrichments_deferred += 1
-                        estatus = 'deferred_cap'
-                    elif a in asin_enriched_locally and enrichment_mode != 'full':
-                        cache_hits += 1
-                        c_hit = True
-                        estatus = 'local_dedupe'
-                    else:
-                        lock_key = f'asin:{a}'
-                        got_lock = _import_try_enrichment_lock(supabase_admin, lock_key)
-                        if not got_lock:
-                            enrichments_deferred += 1
-                            estatus = 'deferred_lock'
-                        else:
-                            try:
-                                cache_row2 = _import_get_api_cache_row(supabase_admin, fn, a_raw)
-                                if _import_rainforest_cache_complete(cache_row2) and enrichment_mode != 'full':
-                                    cache_hits += 1
-                                    c_hit = True
-                                    estatus = 'cache_hit_after_lock'
-                                else:
-                                    rf = _import_fetch_rainforest_product(a_raw)
-                                    if rf and rf.get('product'):
-                                        cfnsku = fn.strip().upper() if fn else _import_synthetic_fnsku_for_asin(a_raw)
-                                        if cfnsku:
-                                            if import_save_rainforest_to_cache(supabase_admin, cfnsku, a_raw, rf):
-                                                enrichments_charged += 1
-                                                charged = True
-                                                estatus = 'enriched_rainforest'
-                                                asin_enriched_locally.add(a)
-                                                p = rf.get('product') or {}
-                                                imgs = []
-                                                mi = p.get('main_image', {}).get('link') if isinstance(p.get('main_image'), dict) else None
-                                                if mi:
-                                                    imgs.append(mi)
-                                                for im in p.get('images') or []:
-                                                    if isinstance(im, dict) and im.get('link'):
-                                                        imgs.append(im['link'])
-                                                if imgs:
-                                                    _import_patch_products_image(supabase_admin, fn, a_raw, imgs[0])
-                                            else:
-                                                enrichments_deferred += 1
-                                                estatus = 'cache_save_failed'
-                                        else:
-                                            enrichments_deferred += 1
-                                            estatus = 'no_cache_key'
-                                    else:
-                                        enrichments_deferred += 1
-                                        estatus = 'rainforest_empty_or_failed'
-                            finally:
-                                _import_release_enrichment_lock(supabase_admin, lock_key)
-
-                outcome['_import_meta'] = {
-                    'enrichment_status': estatus,
-                    'cache_hit': c_hit,
-                    'enrichment_charged': charged,
-                }
-
-        # ----- Optional per-business inventory (tenant / user scoped) -----
-        inventory_upserted = 0
-        if include_in_inventory and supabase_admin and row_outcomes:
-            inv_map = {}
-            for outcome in row_outcomes:
-                sku = (outcome.get('fnsku') or outcome.get('asin') or outcome.get('lpn') or '').strip()
-                if not sku:
-                    continue
-                name = (outcome.get('product_name') or '').strip() or f'Item {sku}'
-                qty = int(outcome.get('quantity') or 1)
-                price = float(outcome.get('price') or 0)
-                if sku not in inv_map:
-                    inv_map[sku] = {
-                        'sku': sku[:255],
-                        'name': name[:500],
-                        'quantity': max(1, qty),
-                        'price': price,
-                        'cost': 0.0,
-                        'location': 'Import',
-                        'condition': 'New',
-                        'fnsku': outcome.get('fnsku'),
-                        'asin': outcome.get('asin'),
-                    }
-                else:
-                    inv_map[sku]['quantity'] += max(1, qty)
-                    if name and (not inv_map[sku]['name'] or inv_map[sku]['name'].startswith('Item ')):
-                        inv_map[sku]['name'] = name[:500]
-
-            inv_candidates = []
-            for row in inv_map.values():
-                img_url = None
-                cr = _import_get_api_cache_row(supabase_admin, row.get('fnsku'), row.get('asin'))
-                if cr:
-                    try:
-                        iu = cr.get('image_url')
-                        if iu:
-                            if isinstance(iu, str) and iu.strip().startswith('['):
-                                parsed = json.loads(iu)
-                                if isinstance(parsed, list) and parsed:
-                                    img_url = parsed[0]
-                            else:
-                                img_url = iu
-                        if not img_url and cr.get('rainforest_raw_data'):
-                            urls = _all_image_urls_from_rainforest_raw(cr)
-                            if urls:
-                                img_url = urls[0]
-                    except Exception:
-                        pass
-                cand = {
-                    'sku': row['sku'],
-                    'name': row['name'],
-                    'quantity': row['quantity'],
-                    'price': row['price'],
-                    'cost': row['cost'],
-                    'location': row['location'],
-                    'condition': row['condition'],
-                    'image_url': img_url,
-                    'user_id': str(user_id),
-                }
-                if row.get('asin'):
-                    cand['asin'] = (row['asin'] or '')[:32]
-                if tenant_id:
-                    cand['tenant_id'] = str(tenant_id)
-                inv_candidates.append(cand)
+    except Exception as e:
+        logger.error(f"Error in batch_import: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            "success": False,
+            "error": "server_error",
+            "message": str(e)
+        }), 500
 
-            skus_list = list(inv_map.keys())
-            existing_by_sku = {}
-            if skus_list:
-                try:
-                    CH = 80
-                    for i in range(0, len(skus_list), CH):
-                        chunk = skus_list[i:i + CH]
-                        q = supabase_admin.table('inventory').select('id,sku,quantity').eq('user_id', str(user_id))
-                        if tenant_id:
-                            q = q.eq('tenant_id', str(tenant_id))
-                        er = q.in_('sku', chunk).execute()
-                        for exrow in (er.data or []):
-                            existing_by_sku[exrow['sku']] = exrow
-                except Exception as inv_e:
-                    logger.warning(f"Inventory existing fetch failed: {inv_e}")
+@app.route('/api/import/upload', methods=['POST', 'OPTIONS'])
+def upload_import():
+    """
+    Streamed manifest import: the raw CSV / TSV / XLSX file, either as multipart field `file` or as the
+    request body (file name in ?file_name=), is parsed row by row and fed through the same pipeline as
+    /api/import/batch in batches of IMPORT_UPLOAD_BATCH_ROWS, under a single import_batches row.
+    Options come as form or query fields: include_in_inventory, enrichment_mode, max_enrichment_calls
+    (a cap for the whole file) and import_session_id. Returns the totals across all batches, or with
+    background=1 stages the rows as a background job and answers 202 (see /api/import/status).
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
 
-            for cand in inv_candidates:
-                try:
-                    ex = existing_by_sku.get(cand['sku'])
-                    payload = {
-                        'sku': cand['sku'],
-                        'name': cand['name'],
-                        'quantity': (ex['quantity'] or 0) + cand['quantity'] if ex else cand['quantity'],
-                        'price': cand['price'],
-                        'cost': cand['cost'],
-                        'location': cand['location'],
-                        'condition': cand['condition'],
-                        'image_url': cand['image_url'],
-                        'user_id': cand['user_id'],
-                    }
-                    if cand.get('asin'):
-                        payload['asin'] = cand['asin']
-                    if tenant_id:
-                        payload['tenant_id'] = str(tenant_id)
-                    if ex:
-                        supabase_admin.table('inventory').update(payload).eq('id', ex['id']).execute()
-                    else:
-                        supabase_admin.table('inventory').insert(payload).execute()
-                    inventory_upserted += 1
-                except Exception as ie:
-                    logger.warning(f"Inventory row failed for sku {cand.get('sku')}: {ie}")
+    try:
+        user_id, tenant_id = get_ids_from_request()
+        if not user_id:
+            return jsonify({
+                "success": False,
+                "error": "unauthorized",
+                "message": "User authentication required"
+            }), 401
+        if not supabase_admin:
+            return jsonify({
+                "success": False,
+                "error": "database_error",
+                "message": "Database not available"
+            }), 500
+        if request.content_length and request.content_length > IMPORT_UPLOAD_MAX_MB * 1024 * 1024:
+            return jsonify({
+                "success": False,
+                "error": "file_too_large",
+                "message": f"Manifest uploads are limited to {IMPORT_UPLOAD_MAX_MB:g} MB"
+            }), 413
 
-        # ----- Persist import audit rows + finalize batch metrics -----
-        if import_batch_id and supabase_admin and row_outcomes:
-            try:
-                item_payloads = []
-                for outcome in row_outcomes:
-                    meta = outcome.get('_import_meta') or {}
-                    raw_row = {
-                        'fnsku': outcome.get('fnsku'),
-                        'asin': outcome.get('asin'),
-                        'lpn': outcome.get('lpn'),
-                        'upc': outcome.get('upc'),
-                        'product_name': outcome.get('product_name'),
-                        'price': outcome.get('price'),
-                        'quantity': outcome.get('quantity'),
-                        'category': outcome.get('category'),
-                        'brand': outcome.get('brand'),
-                    }
-                    item_payloads.append({
-                        'import_batch_id': import_batch_id,
-                        'row_index': outcome['row_index'],
-                        'fnsku': outcome.get('fnsku'),
-                        'asin': outcome.get('asin'),
-                        'lpn': outcome.get('lpn'),
-                        'enrichment_status': meta.get('enrichment_status'),
-                        'cache_hit': meta.get('cache_hit', False),
-                        'enrichment_charged': meta.get('enrichment_charged', False),
-                        'included_in_inventory': include_in_inventory,
-                        'raw_row': raw_row,
-                    })
-                STEP = 200
-                for i in range(0, len(item_payloads), STEP):
-                    supabase_admin.table('import_batch_items').insert(item_payloads[i:i + STEP]).execute()
-            except Exception as aud_e:
-                logger.warning(f"import_batch_items insert failed: {aud_e}")
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        if upload is None and not request.content_length:
+            return jsonify({
+                "success": False,
+                "error": "invalid_request",
+                "message": "Send the manifest as multipart field 'file' or as the request body"
+            }), 400
+        if upload is not None:
+            stream, file_name, content_type = upload.stream, upload.filename, upload.mimetype
+            options = request.form
+        else:
+            stream, file_name, content_type = request.stream, request.args.get('file_name'), request.mimetype
+            options = request.args
+
+        include_in_inventory, enrichment_mode, max_enrichment_calls = _import_parse_options(options)
+        import_session_id = options.get('import_session_id')
+
+        if str(options.get('background') or '').strip().lower() in ('1', 'true', 'yes', 'on'):
+            job_id, chunks, rows = _import_job_enqueue(
+                user_id, tenant_id, _import_upload_rows(stream, file_name, content_type),
+                include_in_inventory=include_in_inventory,
+                enrichment_mode=enrichment_mode,
+                max_enrichment_calls=max_enrichment_calls,
+                import_session_id=import_session_id,
+                file_name=file_name,
+            )
+            return _import_job_response(job_id, chunks, rows)
+
+        import_batch_id = _import_create_batch_row(
+            user_id, tenant_id,
+            include_in_inventory=include_in_inventory,
+            enrichment_mode=enrichment_mode,
+            max_enrichment_calls=max_enrichment_calls,
+            rows_total=0,
+            import_session_id=import_session_id,
+            file_name=file_name,
+        )
 
-        if import_batch_id and supabase_admin:
+        totals = dict.fromkeys(_IMPORT_TOTAL_KEYS, 0)
+        batches = 0
+
+        def run_batch(items):
+            nonlocal batches
+            result = _import_process_items(
+                items, user_id, tenant_id,
+                batch_number=batches,
+                include_in_inventory=include_in_inventory,
+                enrichment_mode=enrichment_mode,
+                # The cap applies to the whole file, not to each internal batch.
+                max_enrichment_calls=max(0, max_enrichment_calls - totals['enrichments_charged']),
+                import_session_id=import_session_id,
+                file_name=file_name,
+                import_batch_id=import_batch_id,
+                row_offset=totals['processed'],
+            )
+            for key in totals:
+                totals[key] += result.get(key) or 0
+            batches += 1
+
+        items = []
+        for row in _import_upload_rows(stream, file_name, content_type):
+            items.append(row)
+            if len(items) >= IMPORT_UPLOAD_BATCH_ROWS:
+                run_batch(items)
+                items = []
+        if items:
+            run_batch(items)
+
+        if import_batch_id:
             try:
                 supabase_admin.table('import_batches').update({
-                    'rows_valid': processed_count,
-                    'rows_skipped': skipped_count,
-                    'cache_hits': cache_hits,
-                    'enrichments_charged': enrichments_charged,
-                    'enrichments_deferred': enrichments_deferred,
-                    'inventory_upserted': inventory_upserted,
-                    'products_touched': products_inserted,
-                    'manifest_rows_touched': manifest_data_inserted,
+                    'rows_total': totals['processed'],
+                    **_import_totals_columns(totals),
                     'status': 'completed',
                 }).eq('id', import_batch_id).execute()
             except Exception as ub_e:
                 logger.warning(f"import_batches final update failed: {ub_e}")
 
-        # Numeric `success` for frontend aggregation (sum across chunks); boolean status as import_ok
-        success_count = products_inserted + manifest_data_inserted
-        failed_count = skipped_count
-
-        logger.info(
-            f"✅ Batch {batch_number} complete: {success_count} db rows touched, {failed_count} skipped, "
-            f"cache_hits={cache_hits}, enrichments_charged={enrichments_charged}, inventory={inventory_upserted}"
+        import_log.info(
+            f"📦 Upload {file_name or '(body)'} complete: {totals['processed']} rows in {batches} batches, "
+            f"{totals['skipped']} skipped, enrichments_charged={totals['enrichments_charged']}"
         )
-
         return jsonify({
             "import_ok": True,
-            "processed": len(items),
-            "success": success_count,
-            "failed": failed_count,
-            "products_inserted": products_inserted,
-            "manifest_items_inserted": manifest_data_inserted,
-            "skipped": skipped_count,
-            "batch": batch_number,
+            **totals,
+            "success": totals['products_inserted'] + totals['manifest_items_inserted'],
+            "failed": totals['skipped'],
+            "batches": batches,
             "include_in_inventory": include_in_inventory,
             "enrichment_mode": enrichment_mode,
-            "cache_hits": cache_hits,
-            "enrichments_charged": enrichments_charged,
-            "enrichments_deferred": enrichments_deferred,
-            "inventory_upserted": inventory_upserted,
             "import_batch_id": str(import_batch_id) if import_batch_id else None,
         }), 200
-        
+
+    except ImportUploadError as e:
+        return jsonify({
+            "success": False,
+            "error": "unsupported_file",
+            "message": str(e)
+        }), 415
     except Exception as e:
-        logger.error(f"Error in batch_import: {str(e)}")
+        logger.error(f"Error in upload_import: {str(e)}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({
@@ -2417,6 +3480,314 @@ def batch_import():
             "message": str(e)
         }), 500
 
+
+# ----- Background import jobs (migration 030) -----
+# A background import stages its rows in import_job_chunks and queues its import_batches row; a runner
+# thread in every worker claims queued jobs (and jobs whose runner stopped heartbeating) through
+# claim_import_job and works through the chunks not yet marked done.
+_IMPORT_STAGES = ('rows', 'products', 'manifest_data', 'enrichment', 'inventory', 'audit')
+_IMPORT_JOB_STATUS_COLUMNS = (
+    'id,status,stage,file_name,import_session_id,rows_total,rows_done,chunks_total,chunks_done,'
+    'rows_valid,rows_skipped,cache_hits,enrichments_charged,enrichments_deferred,inventory_upserted,'
+    'products_touched,manifest_rows_touched,error,attempts,created_at,updated_at'
+)
+_IMPORT_JOB_CLAIM_RETRY_SECONDS = 300
+_import_job_claim_disabled_until = 0.0
+_import_job_lock = _threading.Lock()
+_import_job_wakeup = _threading.Event()
+_import_job_thread = None
+
+
+def _import_job_update(job_id, **columns):
+    columns['updated_at'] = datetime.now(timezone.utc).isoformat()
+    supabase_admin.table('import_batches').update(columns).eq('id', job_id).execute()
+
+
+def _import_job_enqueue(user_id, tenant_id, rows, *, include_in_inventory, enrichment_mode, max_enrichment_calls,
+                        import_session_id=None, file_name=None):
+    """
+    Stage rows (any iterable; consumed IMPORT_UPLOAD_BATCH_ROWS at a time) as import_job_chunks and queue
+    the job. Returns (import_batch_id, chunks, rows). Raises RuntimeError if the job row cannot be created.
+    """
+    job_id = _import_create_batch_row(
+        user_id, tenant_id,
+        include_in_inventory=include_in_inventory,
+        enrichment_mode=enrichment_mode,
+        max_enrichment_calls=max_enrichment_calls,
+        rows_total=0,
+        import_session_id=import_session_id,
+        file_name=file_name,
+        status='staging',
+    )
+    if not job_id:
+        raise RuntimeError('Could not create the import job (apply migrations 020 and 030?)')
+
+    chunks = 0
+    total = 0
+    try:
+        items = []
+        for row in rows:
+            items.append(row)
+            if len(items) >= IMPORT_UPLOAD_BATCH_ROWS:
+                supabase_admin.table('import_job_chunks').insert({
+                    'import_batch_id': job_id, 'chunk_index': chunks, 'row_offset': total, 'items': items,
+                }).execute()
+                chunks += 1
+                total += len(items)
+                items = []
+        if items:
+            supabase_admin.table('import_job_chunks').insert({
+                'import_batch_id': job_id, 'chunk_index': chunks, 'row_offset': total, 'items': items,
+            }).execute()
+            chunks += 1
+            total += len(items)
+        # Only fully staged jobs become claimable.
+        _import_job_update(job_id, status='queued', stage='queued', rows_total=total, chunks_total=chunks)
+    except Exception as e:
+        try:
+            _import_job_update(job_id, status='failed', error=f'staging failed: {e}'[:1000])
+        except Exception:
+            pass
+        raise
+
+    _import_job_ensure_started()
+    _import_job_wakeup.set()
+    import_log.info(f"📦 Import job {job_id} queued: {total} rows in {chunks} chunks")
+    return job_id, chunks, total
+
+
+def _import_totals_columns(totals):
+    """import_batches metric columns for totals accumulated from _import_process_items results."""
+    return {
+        'rows_valid': totals['valid'],
+        'rows_skipped': totals['skipped'],
+        'cache_hits': totals['cache_hits'],
+        'enrichments_charged': totals['enrichments_charged'],
+        'enrichments_deferred': totals['enrichments_deferred'],
+        'inventory_upserted': totals['inventory_upserted'],
+        'products_touched': totals['products_inserted'],
+        'manifest_rows_touched': totals['manifest_items_inserted'],
+    }
+
+
+def _import_job_worker_id():
+    return f"{platform.node()}:{os.getpid()}"
+
+
+def _import_job_claim():
+    """Claim the next runnable job through claim_import_job. Returns its id, or None."""
+    global _import_job_claim_disabled_until
+    if not supabase_admin or _time.time() < _import_job_claim_disabled_until:
+        return None
+    try:
+        res = supabase_admin.rpc('claim_import_job', {
+            'p_worker': _import_job_worker_id(),
+            'p_stale_seconds': int(IMPORT_JOB_STALE_SECONDS),
+        }).execute()
+    except Exception as e:
+        _import_job_claim_disabled_until = _time.time() + _IMPORT_JOB_CLAIM_RETRY_SECONDS
+        logger.warning(f"claim_import_job RPC unavailable or failed (apply migration 030?): {e}")
+        return None
+    data = getattr(res, 'data', None)
+    if isinstance(data, list):
+        data = data[0] if data else None
+    return data or None
+
+
+def _import_job_heartbeat(job_id, stop):
+    """Keep heartbeat_at fresh while a job runs so other workers do not claim it as stale."""
+    interval = max(1.0, IMPORT_JOB_STALE_SECONDS / 3.0)
+    while not stop.wait(interval):
+        try:
+            _import_job_update(job_id, heartbeat_at=datetime.now(timezone.utc).isoformat())
+        except Exception as e:
+            logger.warning(f"Import job {job_id} heartbeat failed: {e}")
+
+
+def _import_job_run(job_id):
+    """Process the chunks of a claimed job that are not done yet, in order. Returns the job's final status."""
+    res = supabase_admin.table('import_batches').select('*').eq('id', job_id).limit(1).execute()
+    job = (getattr(res, 'data', None) or [None])[0]
+    if not job:
+        return None
+    if (job.get('attempts') or 0) > IMPORT_JOB_MAX_ATTEMPTS:
+        _import_job_update(job_id, status='failed', error=f"gave up after {IMPORT_JOB_MAX_ATTEMPTS} attempts")
+        return 'failed'
+
+    totals = dict.fromkeys(_IMPORT_TOTAL_KEYS, 0)
+    res = supabase_admin.table('import_job_chunks').select('result') \
+        .eq('import_batch_id', job_id).eq('status', 'done').execute()
+    done_chunks = getattr(res, 'data', None) or []
+    for chunk in done_chunks:
+        for key in totals:
+            totals[key] += (chunk.get('result') or {}).get(key) or 0
+    chunks_done = len(done_chunks)
+    chunks_total = job.get('chunks_total') or 0
+    if chunks_done:
+        import_log.info(f"📦 Import job {job_id} resuming after chunk {chunks_done}/{chunks_total}")
+
+    stop = _threading.Event()
+    _threading.Thread(target=_import_job_heartbeat, args=(job_id, stop), name='import-job-heartbeat', daemon=True).start()
+    try:
+        while True:
+            res = supabase_admin.table('import_job_chunks').select('chunk_index,row_offset,items,stages_done') \
+                .eq('import_batch_id', job_id).eq('status', 'pending').order('chunk_index').limit(1).execute()
+            pending = getattr(res, 'data', None) or []
+            if not pending:
+                break
+            chunk = pending[0]
+            chunk_index = chunk['chunk_index']
+            stages_done = list(chunk.get('stages_done') or [])
+
+            def on_stage(name):
+                if name not in stages_done:
+                    stages_done.append(name)
+                    supabase_admin.table('import_job_chunks').update({'stages_done': stages_done}) \
+                        .eq('import_batch_id', job_id).eq('chunk_index', chunk_index).execute()
+                _import_job_update(job_id, stage=f"chunk {chunk_index + 1}/{chunks_total}: {name}")
+
+            result = _import_process_items(
+                chunk.get('items') or [], job['user_id'], job.get('tenant_id'),
+                batch_number=chunk_index,
+                include_in_inventory=bool(job.get('include_in_inventory')),
+                enrichment_mode=job.get('enrichment_mode') or 'none',
+                # The cap applies to the whole job, not to each chunk.
+                max_enrichment_calls=max(0, (job.get('max_enrichment_calls') or 0) - totals['enrichments_charged']),
+                import_session_id=job.get('import_session_id'),
+                file_name=job.get('file_name'),
+                import_batch_id=job_id,
+                row_offset=chunk.get('row_offset') or 0,
+                skip_stages=tuple(stages_done),
+                on_stage=on_stage,
+            )
+            chunk_totals = {key: result.get(key) or 0 for key in totals}
+            supabase_admin.table('import_job_chunks').update({
+                'status': 'done',
+                'result': chunk_totals,
+                'items': [],
+                'processed_at': datetime.now(timezone.utc).isoformat(),
+            }).eq('import_batch_id', job_id).eq('chunk_index', chunk_index).execute()
+            for key in totals:
+                totals[key] += chunk_totals[key]
+            chunks_done += 1
+            _import_job_update(
+                job_id, chunks_done=chunks_done, rows_done=totals['processed'], **_import_totals_columns(totals)
+            )
+    finally:
+        stop.set()
+
+    _import_job_update(job_id, status='completed', stage='done', error=None)
+    import_log.info(
+        f"✅ Import job {job_id} complete: {totals['processed']} rows in {chunks_done} chunks, "
+        f"enrichments_charged={totals['enrichments_charged']}, inventory={totals['inventory_upserted']}"
+    )
+    return 'completed'
+
+
+def _import_job_loop():
+    while True:
+        job_id = None
+        try:
+            job_id = _import_job_claim()
+            if job_id:
+                _import_job_run(job_id)
+                continue
+        except Exception as e:
+            logger.error(f"Import job {job_id} failed (it will be retried): {e}")
+            if job_id:
+                try:
+                    _import_job_update(job_id, status='queued', error=str(e)[:1000])
+                except Exception:
+                    pass
+        _import_job_wakeup.wait(max(0.5, IMPORT_JOB_POLL_SECONDS))
+        _import_job_wakeup.clear()
+
+
+def _import_job_ensure_started():
+    global _import_job_thread
+    if not IMPORT_JOB_RUNNER or not supabase_admin:
+        return
+    with _import_job_lock:
+        if _import_job_thread is not None and _import_job_thread.is_alive():
+            return
+        _import_job_thread = _threading.Thread(target=_import_job_loop, name='import-job-runner', daemon=True)
+        _import_job_thread.start()
+
+
+def _import_job_response(job_id, chunks, rows):
+    return jsonify({
+        "import_ok": True,
+        "queued": True,
+        "import_batch_id": str(job_id),
+        "chunks": chunks,
+        "rows_total": rows,
+        "status_url": f"/api/import/status?import_batch_id={job_id}",
+    }), 202
+
+
+@app.route('/api/import/status', methods=['GET'])
+def import_status():
+    """
+    Progress of background imports: ?import_batch_id= for one job, or ?import_session_id= for every
+    job of an import session. Each job reports status (staging / queued / running / completed / failed),
+    the current chunk and stage, rows and chunks done, and the running metrics.
+    """
+    user_id, _tenant_id = get_ids_from_request()
+    if not user_id:
+        return jsonify({
+            "success": False,
+            "error": "unauthorized",
+            "message": "User authentication required"
+        }), 401
+    if not supabase_admin:
+        return jsonify({
+            "success": False,
+            "error": "database_error",
+            "message": "Database not available"
+        }), 500
+    job_id = request.args.get('import_batch_id')
+    session_id = request.args.get('import_session_id')
+    if not job_id and not session_id:
+        return jsonify({
+            "success": False,
+            "error": "invalid_request",
+            "message": "import_batch_id or import_session_id is required"
+        }), 400
+
+    try:
+        q = supabase_admin.table('import_batches').select(_IMPORT_JOB_STATUS_COLUMNS).eq('user_id', str(user_id))
+        q = q.eq('id', job_id) if job_id else q.eq('import_session_id', session_id).order('created_at')
+        jobs = getattr(q.execute(), 'data', None) or []
+    except Exception as e:
+        logger.error(f"Error in import_status: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": "server_error",
+            "message": str(e)
+        }), 500
+    if job_id and not jobs:
+        return jsonify({
+            "success": False,
+            "error": "not_found",
+            "message": "Import job not found"
+        }), 404
+
+    for job in jobs:
+        rows_total = job.get('rows_total') or 0
+        job['progress'] = round((job.get('rows_done') or 0) / rows_total, 4) if rows_total else None
+    if job_id:
+        return jsonify({"success": True, "job": jobs[0]}), 200
+    return jsonify({
+        "success": True,
+        "jobs": jobs,
+        "done": bool(jobs) and all(j.get('status') in ('completed', 'failed') for j in jobs),
+    }), 200
+
+
+# Resume jobs left behind by a restart without waiting for the next import.
+_import_job_ensure_started()
+
+
 # OLD HTML TEMPLATE ROUTES - COMMENTED OUT (React frontend handles routing)
 # These routes conflict with React Router and are no longer used
 # @app.route('/search', methods=['GET'])
@@ -2486,19 +3857,12 @@ def external_lookup():
         # Use limit(1) instead of maybe_single() to avoid PostgREST 406 when no rows
         if supabase_admin:
             try:
-                cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('fnsku', fnsku).limit(1).execute()
-                cached = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+                cached = _api_cache_lookup(supabase_admin, 'fnsku', fnsku)
                 if cached:
                     logger.info(f"✅ Found FNSKU {fnsku} in Supabase cache - NO API CHARGE!")
                     
-                    # Update last_accessed and lookup_count
-                    now = datetime.now(timezone.utc).isoformat()
-                    current_count = cached.get('lookup_count') or 0
-                    supabase_admin.table('api_lookup_cache').update({
-                        'last_accessed': now,
-                        'lookup_count': current_count + 1,
-                        'updated_at': now
-                    }).eq('id', cached['id']).execute()
+                    # Update last_accessed and lookup_count (write-behind, flushed in bulk)
+                    _cache_access_record(cached)
                     
                     # Log scan to history (even if cached, it counts toward trial limit)
                     # But only count unique scans per user
@@ -2511,74 +3875,21 @@ def external_lookup():
                             product_description=cached.get('product_name') or ''
                         )
                     
-                    # Extract images from cached data
-                    all_images = []
-                    try:
-                        image_url_data = cached.get('image_url', '')
-                        if image_url_data:
-                            parsed = json.loads(image_url_data) if isinstance(image_url_data, str) else image_url_data
-                            if isinstance(parsed, list):
-                                all_images = parsed
-                            else:
-                                all_images = [image_url_data] if image_url_data else []
-                    except:
-                        all_images = [cached.get('image_url')] if cached.get('image_url') else []
-                    if cached.get('rainforest_raw_data'):
-                        for u in _all_image_urls_from_rainforest_raw(cached):
-                            if u and u not in all_images:
-                                all_images.append(u)
-                    
-                    # Extract videos from rainforest_raw_data if available
-                    videos = []
-                    videos_count = 0
-                    if cached.get('rainforest_raw_data'):
-                        try:
-                            raw_data = cached.get('rainforest_raw_data')
-                            if isinstance(raw_data, str):
-                                raw_data = json.loads(raw_data)
-                            if raw_data and raw_data.get('product'):
-                                product = raw_data.get('product')
-                                if product.get('videos_additional') and isinstance(product.get('videos_additional'), list):
-                                    videos = product.get('videos_additional', [])
-                                    videos_count = product.get('videos_count', len(videos))
-                        except Exception as video_error:
-                            logger.warning(f"Could not extract videos from cache: {video_error}")
-                    
-                    # Check if cache has complete product data (Rainforest data)
+                    # Images, videos and the completeness flag come from the precomputed scan_projection
+                    proj = _scan_projection(cached)
+                    all_images = list(proj['images'])
+                    videos = proj['videos']
+                    videos_count = proj['videos_count']
                     cached_asin = cached.get('asin') or ''
-                    has_rainforest_data = cached.get('rainforest_raw_data') is not None
-                    product_name = cached.get('product_name') or ''
-                    
-                    # Check if product_name is a placeholder (incomplete data)
-                    is_placeholder = (
-                        not product_name or 
-                        product_name == f"Product {fnsku}" or 
-                        product_name.startswith("Amazon Product (ASIN:") or
-                        product_name.startswith("FNSKU:") or
-                        len(product_name) < 10  # Too short to be a real product name
-                    )
+                    has_complete_data = proj['complete']
                     
-                    # Check if we have essential product data
-                    has_price = cached.get('price') and float(cached.get('price') or 0) > 0
-                    has_image = cached.get('image_url') and len(str(cached.get('image_url', ''))) > 0
-                    has_complete_data = not is_placeholder and has_price and (has_image or has_rainforest_data)
-                    
-                    logger.info(f"📊 Cache completeness check for {fnsku}: ASIN={cached_asin}, has_rainforest={has_rainforest_data}, is_placeholder={is_placeholder}, has_price={has_price}, has_image={has_image}, complete={has_complete_data}")
+                    logger.info(f"📊 Cache completeness check for {fnsku}: ASIN={cached_asin}, has_rainforest={proj['has_rainforest_data']}, complete={has_complete_data}")
                     
                     # If we have ASIN but incomplete data, fetch from Rainforest API to enrich
-                    if cached_asin and len(cached_asin) >= 10 and RAINFOREST_API_KEY and not has_complete_data:
+                    if cached_asin and len(cached_asin) >= 10 and rainforest_client.is_configured() and not has_complete_data:
                         logger.info(f"📦 Cache has ASIN {cached_asin} but incomplete data - fetching from Rainforest API to enrich...")
                         try:
-                            rainforest_response = requests.get(
-                                'https://api.rainforestapi.com/request',
-                                params={
-                                    'api_key': RAINFOREST_API_KEY,
-                                    'type': 'product',
-                                    'amazon_domain': 'amazon.com',
-                                    'asin': cached_asin
-                                },
-                                timeout=10
-                            )
+                            rainforest_response = _rainforest_get_product_shared(cached_asin)
                             
                             if rainforest_response.status_code == 200:
                                 response_json = rainforest_response.json()
@@ -2698,7 +4009,7 @@ def external_lookup():
         
         # Try to lookup existing scan for this barcode
         params = {'BarCode': fnsku}
-        response = requests.get(lookup_url, headers=headers, params=params, timeout=30)
+        response = _fnsku_vendor_request('GET', lookup_url, headers=headers, params=params, timeout=30)
         
         scan_data = None
         if response.status_code == 200:
@@ -2712,10 +4023,10 @@ def external_lookup():
             
             payload = {
                 "barCode": fnsku,
-                "callbackUrl": ""  # Optional callback URL
+                "callbackUrl": _fnsku_callback_url()  # Vendor push to /api/fnsku/callback when configured
             }
             
-            response = requests.post(add_scan_url, headers=headers, json=payload, timeout=30)
+            response = _fnsku_vendor_request('POST', add_scan_url, headers=headers, json=payload, timeout=30)
             
             if response.status_code == 200:
                 add_result = response.json()
@@ -2816,14 +4127,17 @@ def external_lookup():
                         # Update existing entry - increment lookup_count
                         current_count = existing_data.get('lookup_count') or 0
                         cache_data['lookup_count'] = current_count + 1
+                        cache_data['scan_projection'] = None  # stored rainforest_raw_data is kept; recompute on read
                         supabase_admin.table('api_lookup_cache').update(cache_data).eq('id', existing_data['id']).execute()
                         logger.info(f"✅ Updated cache entry for FNSKU {fnsku} (lookup #{cache_data['lookup_count']})")
                     else:
                         # Insert new entry
                         cache_data['created_at'] = now
                         cache_data['lookup_count'] = 1
+                        cache_data['scan_projection'] = _build_scan_projection(cache_data)
                         supabase_admin.table('api_lookup_cache').insert(cache_data).execute()
                         logger.info(f"✅ Saved new cache entry for FNSKU {fnsku} - future lookups will be FREE!")
+                    _product_l1_invalidate(fnsku, asin, upc)
                     
                     product_data["saved_to_cache"] = True
                     product_data["message"] = "Found via fnskutoasin.com API (charged lookup) - saved to cache for future use"
@@ -2889,7 +4203,7 @@ def lookup_upc(upc_code):
         params = {'upc': upc_code}
         
         logger.info(f"🔍 Looking up UPC {upc_code} via UPCitemdb API (free)")
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream_http.get(url, params=params, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -2953,8 +4267,7 @@ def get_scan_count():
         is_ceo_admin = is_unlimited_scan_user(user_id)
         user_role = get_user_role(user_id) if user_id else None
         # region agent log
-        with open('debug-bff232.log', 'a', encoding='utf-8') as _dbg:
-            _dbg.write(json.dumps({"sessionId":"bff232","runId":f"scan-count-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}","hypothesisId":"H10","location":"app.py:get_scan_count:role_check","message":"Scan count role evaluation","data":{"userId":user_id or None,"role":user_role or None,"isUnlimitedScanUser":bool(is_ceo_admin),"tenantId":tenant_id or None},"timestamp":int(datetime.now(timezone.utc).timestamp()*1000)}) + '\n')
+        _debug_event('bff232', 'H10', 'app.py:get_scan_count:role_check', 'Scan count role evaluation', {"userId":user_id or None,"role":user_role or None,"isUnlimitedScanUser":bool(is_ceo_admin),"tenantId":tenant_id or None}, run_id=f"scan-count-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}")
         # endregion
         
         # Log CEO/admin status for debugging
@@ -3001,6 +4314,9 @@ def lookup_product_for_scan(code, code_type, supabase_client=None):
     3. products (by FNSKU/ASIN)
     4. api_lookup_cache again via find_product_in_all_tables if not in fast path
     
+    The whole chain runs in one resolve_scan_product RPC call when that function exists;
+    the per-table queries below are the fallback.
+    
     Returns (product_data, manifest_item_data, source) where source is:
     - 'manifest_data' - Found in manifest_data
     - 'products' - Found in products
@@ -3013,13 +4329,30 @@ def lookup_product_for_scan(code, code_type, supabase_client=None):
     # Normalize code based on type
     code_upper = str(code).strip().upper() if code else None
     
+    if code_upper and code_type in ['ASIN', 'FNSKU', 'SKU']:
+        l1_row = _product_l1_get('fnsku', code_upper) or _product_l1_get('asin', code_upper)
+        if l1_row:
+            return l1_row, None, 'api_lookup_cache'
+    
+    if code_upper:
+        resolved = _rpc_resolve_scan_product(supabase_client, code_upper, code_type)
+        if resolved is not None:
+            product_data, item_data, source = resolved
+            if product_data and source == 'api_lookup_cache':
+                matched_column = 'fnsku' if str(product_data.get('fnsku') or '').strip().upper() == code_upper else 'asin'
+                _product_l1_put(matched_column, code_upper, product_data)
+            return product_data, item_data, source
+    
     # Fast path: for ASIN/FNSKU/SKU, check api_lookup_cache first in one query (cache hits = 1 round-trip)
     if code_upper and code_type in ['ASIN', 'FNSKU', 'SKU']:
         try:
             cache_conditions = [f"fnsku.eq.{code_upper}", f"asin.eq.{code_upper}"]
-            cache_result = supabase_client.table('api_lookup_cache').select('*').or_(','.join(cache_conditions)).limit(1).execute()
+            cache_result = supabase_client.table('api_lookup_cache').select(API_CACHE_COLUMNS_SCAN).or_(','.join(cache_conditions)).limit(1).execute()
             if cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0:
-                return cache_result.data[0], None, 'api_lookup_cache'
+                row = cache_result.data[0]
+                matched_column = 'fnsku' if str(row.get('fnsku') or '').strip().upper() == code_upper else 'asin'
+                _product_l1_put(matched_column, code_upper, row)
+                return row, None, 'api_lookup_cache'
         except Exception as e:
             logger.warning(f"Fast path api_lookup_cache check failed: {e}")
     
@@ -3228,6 +4561,86 @@ def _brand_category_description_from_rainforest_raw(cached_row):
     return brand, category, description
 
 
+# api_lookup_cache.scan_projection (migration 026): the parts of a scan response that are
+# derived from image_url / rainforest_raw_data, computed once when the row is written so
+# cache hits do not re-parse the raw Rainforest blob. Bump the version when the shape changes;
+# older projections are then ignored and recomputed on read.
+SCAN_PROJECTION_VERSION = 1
+
+
+def _cache_row_is_placeholder(cached_row):
+    """Placeholder product_name left by an early FNSKU lookup (no real title yet)."""
+    product_name = (cached_row.get('product_name') or '') if cached_row else ''
+    if not product_name or len(product_name) < 10:
+        return True
+    if product_name.startswith("Amazon Product (ASIN:") or product_name.startswith("FNSKU:"):
+        return True
+    for code in (cached_row.get('fnsku'), cached_row.get('asin')):
+        if code and product_name == f"Product {code}":
+            return True
+    return False
+
+
+def _build_scan_projection(cached_row):
+    """Compute the scan_projection dict for an api_lookup_cache row (needs image_url and rainforest_raw_data)."""
+    row = cached_row or {}
+    images = []
+    image_url_data = row.get('image_url') or ''
+    try:
+        if image_url_data:
+            parsed = json.loads(image_url_data) if isinstance(image_url_data, str) else image_url_data
+            images = list(parsed) if isinstance(parsed, list) else [image_url_data]
+    except Exception:
+        images = [image_url_data]
+    videos = []
+    videos_count = 0
+    raw = row.get('rainforest_raw_data')
+    if raw:
+        for u in _all_image_urls_from_rainforest_raw(row):
+            if u and u not in images:
+                images.append(u)
+        try:
+            raw = json.loads(raw) if isinstance(raw, str) else raw
+            p = raw.get('product') if isinstance(raw, dict) else None
+            if p and isinstance(p.get('videos_additional'), list) and p.get('videos_additional'):
+                videos = p.get('videos_additional')
+                videos_count = p.get('videos_count', len(videos))
+        except Exception:
+            pass
+    brand, category, description = _brand_category_description_from_rainforest_raw(row)
+    try:
+        has_price = bool(row.get('price')) and float(row.get('price') or 0) > 0
+    except (TypeError, ValueError):
+        has_price = False
+    has_image = bool(image_url_data) and len(str(image_url_data)) > 0
+    has_rainforest_data = row.get('rainforest_raw_data') is not None
+    return {
+        'v': SCAN_PROJECTION_VERSION,
+        'images': images,
+        'videos': videos,
+        'videos_count': videos_count,
+        'brand': brand or row.get('brand') or '',
+        'category': category or row.get('category') or '',
+        'description': description or row.get('description') or '',
+        'price': str(row.get('price')) if row.get('price') else '',
+        'has_rainforest_data': has_rainforest_data,
+        'complete': bool(not _cache_row_is_placeholder(row) and has_price and (has_image or has_rainforest_data)),
+    }
+
+
+def _scan_projection(cached_row):
+    """Stored scan_projection for a cache row, or one computed on the fly for rows not yet backfilled."""
+    proj = cached_row.get('scan_projection') if cached_row else None
+    if isinstance(proj, str):
+        try:
+            proj = json.loads(proj)
+        except Exception:
+            proj = None
+    if isinstance(proj, dict) and proj.get('v') == SCAN_PROJECTION_VERSION:
+        return proj
+    return _build_scan_projection(cached_row)
+
+
 def _rainforest_price_obj_value(price_obj):
     """Extract numeric `value` from a Rainforest price dict, or coerce a bare number. Treat 0 as missing (unpriced / discontinued)."""
     if price_obj is None:
@@ -3444,6 +4857,7 @@ def _build_fnsku_scan_response_and_save(code, asin, scan_data, rainforest_data,
             'task_state': str(scan_data.get('taskState', '')) if (scan_data and scan_data.get('taskState')) else None,
             'asin_found': True, 'last_accessed': now, 'updated_at': now, 'rainforest_raw_data': rainforest_raw_data_to_save
         }
+        cache_data['scan_projection'] = _build_scan_projection(cache_data)
         if existing_data:
             cache_data['lookup_count'] = (existing_data.get('lookup_count') or 0) + 1
             supabase_admin.table('api_lookup_cache').update(cache_data).eq('id', existing_data['id']).execute()
@@ -3456,6 +4870,7 @@ def _build_fnsku_scan_response_and_save(code, asin, scan_data, rainforest_data,
             if insert_result and getattr(insert_result, 'data', None) and len(insert_result.data) > 0:
                 cache_row_id = insert_result.data[0].get('id')
             logger.info(f"✅ Cache INSERTED for fnsku={code} asin={asin} (rainforest_raw_data={'yes' if rainforest_raw_data_to_save else 'no'}) - future scans will not be charged")
+        _product_l1_invalidate(code, asin, cache_data.get('upc'))
         response_data["saved_to_cache"] = True
     except Exception as save_error:
         logger.warning(f"Cache save failed in _build_fnsku_scan_response_and_save: {save_error}")
@@ -3485,34 +4900,126 @@ def _import_synthetic_fnsku_for_asin(asin):
     return f'__ASIN__{a}' if _import_valid_asin(a) else None
 
 
-def _import_get_api_cache_row(supabase_admin, fnsku, asin):
-    """Global cache lookup: prefer real FNSKU, then ASIN match, then synthetic ASIN key."""
+def _import_get_api_cache_row(supabase_admin, fnsku, asin, columns=API_CACHE_COLUMNS_ENRICHMENT_CHECK, index=None):
+    """
+    Global cache lookup: prefer real FNSKU, then ASIN match, then synthetic ASIN key.
+    Selects `columns` (default: the enrichment-check set, which reads the Rainforest title via a JSON path
+    instead of downloading the whole blob).
+    With `index` from _import_prefetch_api_cache_rows the answer comes from memory (no queries).
+    """
+    if index is not None:
+        return _import_api_cache_index_lookup(index, fnsku, asin)
     if not supabase_admin:
         return None
     try:
+        row = None
         if fnsku:
             fn = fnsku.strip().upper()
-            cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('fnsku', fn).limit(1).execute()
+            cache_result = supabase_admin.table('api_lookup_cache').select(columns).eq('fnsku', fn).limit(1).execute()
             if cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0:
-                return cache_result.data[0]
-        if _import_valid_asin(asin):
+                row = cache_result.data[0]
+        if row is None and _import_valid_asin(asin):
             a = asin.strip().upper()
-            cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('asin', a).limit(1).execute()
+            cache_result = supabase_admin.table('api_lookup_cache').select(columns).eq('asin', a).limit(1).execute()
             if cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0:
-                return cache_result.data[0]
+                row = cache_result.data[0]
             syn = _import_synthetic_fnsku_for_asin(a)
-            if syn:
-                cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('fnsku', syn).limit(1).execute()
+            if row is None and syn:
+                cache_result = supabase_admin.table('api_lookup_cache').select(columns).eq('fnsku', syn).limit(1).execute()
                 if cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0:
-                    return cache_result.data[0]
+                    row = cache_result.data[0]
+        if row is not None and 'rf_title' in row and row.get('rf_title') is None:
+            # Blob stored as a JSON string (older writers used json.dumps) or missing: the JSON path
+            # cannot see inside it, so fall back to the raw data when the projection says there is some.
+            proj = row.get('scan_projection')
+            if not isinstance(proj, dict) or proj.get('has_rainforest_data'):
+                _api_cache_fetch_raw_data(supabase_admin, row)
+        return row
+    except Exception as e:
+        logger.warning(f"_import_get_api_cache_row failed: {e}")
+    return None
+
+
+_IMPORT_CACHE_PREFETCH_CHUNK = 250
+
+
+def _import_api_cache_index_lookup(index, fnsku, asin):
+    """Same precedence as _import_get_api_cache_row: real FNSKU, then ASIN, then synthetic ASIN key."""
+    row = None
+    if fnsku:
+        row = index['fnsku'].get(fnsku.strip().upper())
+    if row is None and _import_valid_asin(asin):
+        a = asin.strip().upper()
+        row = index['asin'].get(a) or index['fnsku'].get(_import_synthetic_fnsku_for_asin(a))
+    return row
+
+
+def _import_prefetch_api_cache_rows(supabase_admin, rows, columns=API_CACHE_COLUMNS_ENRICHMENT_CHECK):
+    """
+    Load every api_lookup_cache row a chunk can ask for with IN-list queries (real + synthetic FNSKUs
+    together, then ASINs) instead of up to three queries per row. Rows whose title the JSON path cannot
+    read get their raw data in one extra query by id.
+    Returns the index for _import_get_api_cache_row(..., index=...), or None if the prefetch failed
+    (callers then fall back to per-row lookups).
+    """
+    if not supabase_admin:
+        return None
+    fnskus, asins = set(), set()
+    for row in rows:
+        fn = (row.get('fnsku') or '').strip().upper()
+        if fn:
+            fnskus.add(fn)
+        a_raw = row.get('asin')
+        if _import_valid_asin(a_raw):
+            a = a_raw.strip().upper()
+            asins.add(a)
+            fnskus.add(_import_synthetic_fnsku_for_asin(a))
+
+    index = {'fnsku': {}, 'asin': {}}
+    try:
+        fetched = []
+        for column, values in (('fnsku', sorted(fnskus)), ('asin', sorted(asins))):
+            for i in range(0, len(values), _IMPORT_CACHE_PREFETCH_CHUNK):
+                chunk = values[i:i + _IMPORT_CACHE_PREFETCH_CHUNK]
+                res = supabase_admin.table('api_lookup_cache').select(columns).in_(column, chunk).execute()
+                fetched.extend(getattr(res, 'data', None) or [])
+
+        # Same fallback as the per-row lookup for blobs stored as JSON strings, batched by id.
+        needs_raw = {}
+        for row in fetched:
+            if 'rf_title' in row and row.get('rf_title') is None and row.get('id'):
+                proj = row.get('scan_projection')
+                if not isinstance(proj, dict) or proj.get('has_rainforest_data'):
+                    needs_raw.setdefault(row['id'], []).append(row)
+        ids = list(needs_raw)
+        raw_by_id = {}
+        for i in range(0, len(ids), _IMPORT_CACHE_PREFETCH_CHUNK):
+            res = supabase_admin.table('api_lookup_cache').select('id,rainforest_raw_data') \
+                .in_('id', ids[i:i + _IMPORT_CACHE_PREFETCH_CHUNK]).execute()
+            for r in getattr(res, 'data', None) or []:
+                raw_by_id[r.get('id')] = r.get('rainforest_raw_data')
+        for row_id, same_id_rows in needs_raw.items():
+            for row in same_id_rows:
+                row['rainforest_raw_data'] = raw_by_id.get(row_id)
     except Exception as e:
-        logger.warning(f"_import_get_api_cache_row failed: {e}")
-    return None
+        logger.warning(f"_import_prefetch_api_cache_rows failed, using per-row lookups: {e}")
+        return None
+
+    for row in fetched:
+        fn = (row.get('fnsku') or '').upper()
+        a = (row.get('asin') or '').upper()
+        if fn:
+            index['fnsku'].setdefault(fn, row)
+        if a:
+            index['asin'].setdefault(a, row)
+    return index
 
 
 def _import_rainforest_cache_complete(cached):
     if not cached:
         return False
+    if 'rainforest_raw_data' not in cached and cached.get('rf_title') is not None:
+        return len(str(cached.get('rf_title')).strip()) >= 3
     raw = cached.get('rainforest_raw_data')
     if not raw:
         return False
@@ -3530,11 +5037,11 @@ def _import_rainforest_cache_complete(cached):
         return False
 
 
-def _import_try_enrichment_lock(supabase_admin, canonical_key):
+def _import_try_enrichment_lock(supabase_admin, canonical_key, seconds=90):
     if not supabase_admin or not canonical_key:
         return True
     try:
-        res = supabase_admin.rpc('try_lock_enrichment', {'p_key': canonical_key, 'p_seconds': 90}).execute()
+        res = supabase_admin.rpc('try_lock_enrichment', {'p_key': canonical_key, 'p_seconds': seconds}).execute()
         data = getattr(res, 'data', None)
         if data is None:
             return True
@@ -3560,16 +5067,7 @@ def _import_fetch_rainforest_product(asin):
     if not api_key or not _import_valid_asin(asin):
         return None
     try:
-        response = requests.get(
-            'https://api.rainforestapi.com/request',
-            params={
-                'api_key': api_key,
-                'type': 'product',
-                'amazon_domain': 'amazon.com',
-                'asin': asin.strip().upper()
-            },
-            timeout=20
-        )
+        response = rainforest_client.get_product(asin.strip().upper(), key=api_key, timeout=20)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -3577,6 +5075,164 @@ def _import_fetch_rainforest_product(asin):
     return None
 
 
+# Shared in-flight enrichment for the live scan paths. Concurrent requests for one ASIN in this
+# worker share a single call (_singleflight_do); across workers and dynos the same
+# try_lock_enrichment key as batch import ('asin:<ASIN>') elects one caller to pay Rainforest
+# while the others poll for its result: a scan-path holder leaves it on its lock row (migration 032)
+# until the lock expires, an import holder writes the api_lookup_cache row as usual.
+_ENRICHMENT_WAIT_POLL_SECONDS = 0.5
+
+
+def _rainforest_response_from_json(data):
+    """requests.Response carrying a Rainforest JSON body reused from api_lookup_cache."""
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response._content = json.dumps(data, default=str).encode('utf-8')
+    return response
+
+
+def _enrichment_product_raw(raw):
+    """raw (dict or JSON text) when it is a Rainforest answer with a product, else None."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(raw, dict) and raw.get('product'):
+        return raw
+    return None
+
+
+def _enrichment_cached_raw(asin, since_iso, lock_key=None):
+    """
+    Rainforest JSON for asin handed over on the lock row for lock_key, or written to api_lookup_cache
+    at or after since_iso; None when neither has it yet.
+    """
+    if lock_key:
+        try:
+            res = (
+                supabase_admin.table('global_enrichment_locks')
+                .select('result')
+                .eq('canonical_key', lock_key)
+                .limit(1)
+                .execute()
+            )
+            for row in res.data or []:
+                raw = _enrichment_product_raw(row.get('result'))
+                if raw is not None:
+                    return raw
+        except Exception as e:
+            logger.debug(f"Enrichment lock result poll failed for {asin}: {e}")
+    try:
+        res = (
+            supabase_admin.table('api_lookup_cache')
+            .select('rainforest_raw_data,updated_at')
+            .eq('asin', asin)
+            .gte('updated_at', since_iso)
+            .order('updated_at', desc=True)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        logger.debug(f"Enrichment wait poll failed for {asin}: {e}")
+        return None
+    for row in res.data or []:
+        raw = _enrichment_product_raw(row.get('rainforest_raw_data'))
+        if raw is not None:
+            return raw
+    return None
+
+
+def _enrichment_wait_for_cache(asin, since_iso, lock_key):
+    """
+    Wait (up to ENRICHMENT_WAIT_SECONDS) for the lock holder's Rainforest data on asin. Returns
+    (raw, got_lock): raw is the holder's JSON or None; got_lock is True once the lock was taken
+    over (the holder released it or its lease ran out), and the caller then owns and must release it.
+    """
+    if not supabase_admin:
+        return None, False
+    deadline = _time.time() + ENRICHMENT_WAIT_SECONDS
+    while _time.time() < deadline:
+        _time.sleep(_ENRICHMENT_WAIT_POLL_SECONDS)
+        raw = _enrichment_cached_raw(asin, since_iso, lock_key)
+        if raw is not None:
+            return raw, False
+        if _import_try_enrichment_lock(supabase_admin, lock_key, seconds=ENRICHMENT_LOCK_SECONDS):
+            # The holder is gone; it may have saved right before releasing.
+            return _enrichment_cached_raw(asin, since_iso), True
+    return None, False
+
+
+def _enrichment_share_result(lock_key, response):
+    """
+    Hand a paid Rainforest answer to waiting workers: store it on the lock row and keep the lock for
+    ENRICHMENT_WAIT_SECONDS more, after which try_lock_enrichment drops the row. Returns True when
+    handed over (the lock must then not be released), False when the caller should release it.
+    """
+    if not supabase_admin or getattr(response, 'status_code', None) != 200:
+        return False
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    if not isinstance(data, dict) or not isinstance(data.get('product'), dict):
+        return False
+    until = datetime.now(timezone.utc) + timedelta(seconds=ENRICHMENT_WAIT_SECONDS)
+    try:
+        res = (
+            supabase_admin.table('global_enrichment_locks')
+            .update({'result': data, 'locked_until': until.isoformat()})
+            .eq('canonical_key', lock_key)
+            .execute()
+        )
+    except Exception as e:
+        # e.g. migration 032 not applied yet; waiters take the lock over once it is released.
+        logger.debug(f"Enrichment result handoff failed for {lock_key}: {e}")
+        return False
+    return bool(getattr(res, 'data', None))
+
+
+def _rainforest_get_product_shared(asin, key=None):
+    """
+    rainforest_client.get_product for the scan paths, coordinated so each ASIN is paid for once:
+    in-process callers join the first call; other processes holding the enrichment lock are
+    waited on (up to ENRICHMENT_WAIT_SECONDS) and their cached result is returned instead.
+    The lock holder leaves its result on the lock row until the lock expires instead of releasing
+    it. If the holder does not deliver in time the call is made anyway; if it releases without a
+    result, the waiter takes the lock over.
+    """
+    asin_key = str(asin or '').strip().upper()
+
+    def _leader():
+        lock_key = f'asin:{asin_key}'
+        started_iso = datetime.now(timezone.utc).isoformat()
+        got_lock = _import_try_enrichment_lock(supabase_admin, lock_key, seconds=ENRICHMENT_LOCK_SECONDS)
+        if not got_lock:
+            reused, got_lock = _enrichment_wait_for_cache(asin_key, started_iso, lock_key)
+            if reused is not None:
+                if got_lock:
+                    _import_release_enrichment_lock(supabase_admin, lock_key)
+                scan_log.info(f"♻️ Reused Rainforest result for {asin_key} enriched by another worker")
+                return _rainforest_response_from_json(reused)
+            if not got_lock:
+                logger.info(f"Enrichment lock for {asin_key} still held after {ENRICHMENT_WAIT_SECONDS}s - calling Rainforest")
+        handed_over = False
+        try:
+            response = rainforest_client.get_product(asin_key, key=key)
+            if got_lock:
+                handed_over = _enrichment_share_result(lock_key, response)
+            return response
+        finally:
+            if got_lock and not handed_over:
+                _import_release_enrichment_lock(supabase_admin, lock_key)
+
+    response, shared = _singleflight_do(f'rainforest:{asin_key}', _leader)
+    if shared:
+        scan_log.info(f"🔗 Joined in-flight Rainforest call for {asin_key}")
+    return response
+
+
 def import_save_rainforest_to_cache(supabase_admin, cache_fnsku, asin, rf_full_json):
     """Persist full Rainforest JSON globally on api_lookup_cache (one row per cache_fnsku)."""
     if not supabase_admin or not cache_fnsku or not rf_full_json:
@@ -3620,6 +5276,7 @@ def import_save_rainforest_to_cache(supabase_admin, cache_fnsku, asin, rf_full_j
             'updated_at': now,
             'rainforest_raw_data': rf_full_json,
         }
+        cache_data['scan_projection'] = _build_scan_projection(cache_data)
         if existing_data:
             cache_data['lookup_count'] = (existing_data.get('lookup_count') or 0) + 1
             supabase_admin.table('api_lookup_cache').update(cache_data).eq('id', existing_data['id']).execute()
@@ -3627,35 +5284,902 @@ def import_save_rainforest_to_cache(supabase_admin, cache_fnsku, asin, rf_full_j
             cache_data['created_at'] = now
             cache_data['lookup_count'] = 1
             supabase_admin.table('api_lookup_cache').insert(cache_data).execute()
+        _product_l1_invalidate(cache_fnsku, cache_data.get('asin'))
         return True
     except Exception as e:
         logger.error(f"import_save_rainforest_to_cache failed: {e}")
         return False
 
 
-def _import_patch_products_image(supabase_admin, fnsku, asin, primary_image_url):
-    if not supabase_admin or not primary_image_url:
-        return
+def _import_patch_products_image(supabase_admin, fnsku, asin, primary_image_url):
+    if not supabase_admin or not primary_image_url:
+        return
+    try:
+        if fnsku:
+            supabase_admin.table('products').update({'image': primary_image_url[:2000]}).eq('fnsku', fnsku.strip().upper()).execute()
+        elif _import_valid_asin(asin):
+            supabase_admin.table('products').update({'image': primary_image_url[:2000]}).eq('asin', asin.strip().upper()).execute()
+    except Exception as e:
+        logger.warning(f"_import_patch_products_image failed: {e}")
+
+
+def _import_enrich_one(supabase_admin, outcome, enrichment_mode, state, cache_index=None):
+    """
+    Enrichment for one import row; sets outcome['_import_meta']. state is shared by all rows of the
+    batch: 'lock', 'charged' / 'reserved' against 'max_calls', 'cache_hits', 'deferred' and the
+    'enriched' ASIN set for local dedupe.
+    """
+    estatus = 'idle'
+    c_hit = False
+    charged = False
+    fn = outcome.get('fnsku')
+    a_raw = outcome.get('asin')
+    lock = state['lock']
+
+    def _count(key):
+        with lock:
+            state[key] += 1
+
+    if enrichment_mode == 'none':
+        estatus = 'skipped_mode_none'
+    elif not _import_valid_asin(a_raw):
+        estatus = 'no_asin'
+    else:
+        a = a_raw.strip().upper()
+        cache_row = _import_get_api_cache_row(supabase_admin, fn, a_raw, index=cache_index)
+        complete = _import_rainforest_cache_complete(cache_row)
+
+        with lock:
+            if complete and enrichment_mode != 'full':
+                state['cache_hits'] += 1
+                c_hit = True
+                estatus = 'cache_hit'
+            elif state['charged'] + state['reserved'] >= state['max_calls']:
+                state['deferred'] += 1
+                estatus = 'deferred_cap'
+            elif a in state['enriched'] and enrichment_mode != 'full':
+                state['cache_hits'] += 1
+                c_hit = True
+                estatus = 'local_dedupe'
+            else:
+                # Hold a slot under the cap while this row's Rainforest call is in flight.
+                state['reserved'] += 1
+                estatus = None
+
+        if estatus is None:
+            try:
+                lock_key = f'asin:{a}'
+                got_lock = _import_try_enrichment_lock(supabase_admin, lock_key)
+                if not got_lock:
+                    _count('deferred')
+                    estatus = 'deferred_lock'
+                else:
+                    try:
+                        cache_row2 = _import_get_api_cache_row(supabase_admin, fn, a_raw)
+                        if _import_rainforest_cache_complete(cache_row2) and enrichment_mode != 'full':
+                            _count('cache_hits')
+                            c_hit = True
+                            estatus = 'cache_hit_after_lock'
+                        else:
+                            rf = _import_fetch_rainforest_product(a_raw)
+                            if rf and rf.get('product'):
+                                cfnsku = fn.strip().upper() if fn else _import_synthetic_fnsku_for_asin(a_raw)
+                                if cfnsku:
+                                    if import_save_rainforest_to_cache(supabase_admin, cfnsku, a_raw, rf):
+                                        with lock:
+                                            state['charged'] += 1
+                                            state['enriched'].add(a)
+                                        charged = True
+                                        estatus = 'enriched_rainforest'
+                                        p = rf.get('product') or {}
+                                        imgs = []
+                                        mi = p.get('main_image', {}).get('link') if isinstance(p.get('main_image'), dict) else None
+                                        if mi:
+                                            imgs.append(mi)
+                                        for im in p.get('images') or []:
+                                            if isinstance(im, dict) and im.get('link'):
+                                                imgs.append(im['link'])
+                                        if imgs:
+                                            _import_patch_products_image(supabase_admin, fn, a_raw, imgs[0])
+                                    else:
+                                        _count('deferred')
+                                        estatus = 'cache_save_failed'
+                                else:
+                                    _count('deferred')
+                                    estatus = 'no_cache_key'
+                            else:
+                                _count('deferred')
+                                estatus = 'rainforest_empty_or_failed'
+                    finally:
+                        _import_release_enrichment_lock(supabase_admin, lock_key)
+            finally:
+                with lock:
+                    state['reserved'] -= 1
+
+    outcome['_import_meta'] = {
+        'enrichment_status': estatus,
+        'cache_hit': c_hit,
+        'enrichment_charged': charged,
+    }
+
+
+def _import_enrich_rows(supabase_admin, row_outcomes, enrichment_mode, max_enrichment_calls, cache_index=None):
+    """
+    Run the enrichment stage for a batch on up to IMPORT_ENRICHMENT_CONCURRENCY threads.
+    Rows sharing an ASIN stay in one sequential group (in file order) so local dedupe behaves as
+    before; different ASINs enrich concurrently. The first cache check per row is answered from
+    cache_index when given; the re-check after taking the lock always reads the database.
+    Returns (cache_hits, charged, deferred).
+    """
+    state = {
+        'lock': _threading.Lock(), 'max_calls': max_enrichment_calls,
+        'charged': 0, 'reserved': 0, 'cache_hits': 0, 'deferred': 0, 'enriched': set(),
+    }
+    groups = OrderedDict()
+    for outcome in row_outcomes:
+        a_raw = outcome.get('asin')
+        if enrichment_mode == 'none' or not _import_valid_asin(a_raw):
+            _import_enrich_one(supabase_admin, outcome, enrichment_mode, state, cache_index)
+            continue
+        groups.setdefault(a_raw.strip().upper(), []).append(outcome)
+
+    def _run_group(outcomes):
+        for outcome in outcomes:
+            _import_enrich_one(supabase_admin, outcome, enrichment_mode, state, cache_index)
+
+    workers = max(1, min(IMPORT_ENRICHMENT_CONCURRENCY, len(groups)))
+    if workers == 1:
+        for outcomes in groups.values():
+            _run_group(outcomes)
+    elif groups:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-enrich') as executor:
+            list(executor.map(_run_group, groups.values()))
+    return state['cache_hits'], state['charged'], state['deferred']
+
+
+# import_inventory_upsert (migrations 029 / 031) adds a chunk's quantities in SQL in one call; when it
+# is missing batch_import falls back to per-SKU UPDATE / INSERT and retries the RPC later. Each call
+# carries an apply key, so a retried slice that already committed is not added twice.
+_IMPORT_INVENTORY_RPC_RETRY_SECONDS = 300
+_IMPORT_INVENTORY_RPC_CHUNK = 500
+_import_inventory_rpc_disabled_until = 0.0
+
+
+def _import_inventory_upsert_rpc(supabase_admin, user_id, tenant_id, candidates, apply_key=None):
+    """
+    Upsert inventory candidates through import_inventory_upsert, _IMPORT_INVENTORY_RPC_CHUNK SKUs per call.
+    apply_key ('<import_batch_id>:<chunk_index>') plus the slice start makes each call idempotent, so
+    re-running the chunk skips slices that already committed.
+    Returns (rows upserted, candidates still to write); the remainder is everything not yet written
+    when the RPC does not exist (migration 031 not applied). Any other failure is raised: the call
+    may have committed, so re-applying its quantities through the per-SKU path could double them.
+    """
+    global _import_inventory_rpc_disabled_until
+    if _time.time() < _import_inventory_rpc_disabled_until:
+        return 0, candidates
+    fields = ('sku', 'name', 'quantity', 'price', 'cost', 'location', 'condition', 'image_url', 'asin')
+    upserted = 0
+    for i in range(0, len(candidates), _IMPORT_INVENTORY_RPC_CHUNK):
+        chunk = candidates[i:i + _IMPORT_INVENTORY_RPC_CHUNK]
+        try:
+            res = supabase_admin.rpc('import_inventory_upsert', {
+                'p_user_id': str(user_id),
+                'p_tenant_id': str(tenant_id) if tenant_id else None,
+                'p_rows': [{k: cand.get(k) for k in fields} for cand in chunk],
+                'p_apply_key': f"{apply_key}:{i}" if apply_key else None,
+            }).execute()
+            data = getattr(res, 'data', None)
+            if isinstance(data, list):
+                data = data[0] if data else None
+            upserted += int(data) if data is not None else len(chunk)
+        except Exception as e:
+            if not _rpc_function_missing(e):
+                logger.error(f"import_inventory_upsert failed after {upserted} rows; failing the batch: {e}")
+                raise
+            _import_inventory_rpc_disabled_until = _time.time() + _IMPORT_INVENTORY_RPC_RETRY_SECONDS
+            logger.warning(f"import_inventory_upsert RPC unavailable (falling back to per-SKU writes): {e}")
+            return upserted, candidates[i:]
+    return upserted, []
+
+
+def _import_parse_price(raw_price):
+    """Row price as a number for outcomes / inventory (0.0 when missing or unparseable)."""
+    try:
+        if raw_price is None or raw_price == '':
+            return 0.0
+        if isinstance(raw_price, (int, float)):
+            return float(raw_price)
+        return float(str(raw_price).strip())
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _import_price_text(raw_price):
+    """Row price as text for products.price / manifest_data.MSRP (None when missing or unparseable)."""
+    if raw_price is None:
+        return None
+    if isinstance(raw_price, (int, float)):
+        return str(raw_price)
+    try:
+        return str(float(raw_price))
+    except (ValueError, TypeError):
+        return None
+
+
+# Column value whose row-path conversion raised; the row is skipped as an error, as before.
+_IMPORT_BAD_CELL = object()
+
+
+def _import_apply_cell(fn, value):
+    try:
+        return fn(value)
+    except Exception:
+        return _IMPORT_BAD_CELL
+
+
+def _import_map_column(fn, values):
+    """
+    fn over one column of a chunk, computed once per distinct value: manifests repeat the same prices,
+    quantities and UPC spellings across thousands of rows. Values are told apart by type as well
+    (1, 1.0 and '1' normalize differently).
+    """
+    memo = {}
+    out = []
+    append = out.append
+    for value in values:
+        try:
+            key = (value.__class__, value)
+            result = memo[key]
+        except KeyError:
+            result = memo[key] = _import_apply_cell(fn, value)
+        except TypeError:
+            # Unhashable cell (list / dict from a JSON body).
+            result = _import_apply_cell(fn, value)
+        append(result)
+    return out
+
+
+def _import_normalize_identifier_cell(value):
+    """normalize_identifiers for one FNSKU / ASIN / LPN; a whitespace-only value fails there too."""
+    if not value:
+        return None
+    text = str(value).strip()
+    if not text:
+        raise ValueError('blank identifier')
+    return text.upper()
+
+
+def _import_normalize_columns(raw_rows):
+    """
+    Columnar normalize / validate for a chunk of extracted rows (dicts of _IMPORT_MAPPED_FIELDS values).
+    Returns parallel lists: fnsku / asin / lpn / upc (normalize_identifiers), quantity, price, price_text,
+    plus masks `ok` (identifiers converted without error) and `valid` (validate_row).
+    """
+    cols = {
+        field: _import_map_column(_import_normalize_identifier_cell, [r[field] for r in raw_rows])
+        for field in ('fnsku', 'asin', 'lpn')
+    }
+    cols['upc'] = _import_map_column(lambda v: _normalize_upc(v) if v else None, [r['upc'] for r in raw_rows])
+    prices = [r['price'] for r in raw_rows]
+    cols['price'] = _import_map_column(_import_parse_price, prices)
+    cols['price_text'] = _import_map_column(_import_price_text, prices)
+    cols['quantity'] = _import_map_column(_import_parse_quantity, [r['quantity'] for r in raw_rows])
+    bad = _IMPORT_BAD_CELL
+    cols['ok'] = [
+        f is not bad and a is not bad and l is not bad and u is not bad
+        for f, a, l, u in zip(cols['fnsku'], cols['asin'], cols['lpn'], cols['upc'])
+    ]
+    cols['valid'] = [
+        ok and bool(f or a or l)
+        for ok, f, a, l in zip(cols['ok'], cols['fnsku'], cols['asin'], cols['lpn'])
+    ]
+    return cols
+
+
+def _import_cell(value):
+    """A normalized column value for use in a row; raises for _IMPORT_BAD_CELL like the row path did."""
+    if value is _IMPORT_BAD_CELL:
+        raise ValueError('value could not be converted')
+    return value
+
+
+def _import_parse_quantity(raw_quantity):
+    if raw_quantity is None or raw_quantity == '':
+        return 1
+    try:
+        if isinstance(raw_quantity, (int, float)):
+            q = int(raw_quantity)
+            return max(1, q)
+        q = int(float(str(raw_quantity).strip()))
+        return max(1, q)
+    except (ValueError, TypeError):
+        return 1
+
+
+def _fetch_rainforest_scan_data(asin, rainforest_api_key, should_fetch_rainforest, force_api_lookup=False):
+    """
+    Fetch Rainforest product data for a resolved FNSKU scan.
+    Standard scans can skip enrichment for faster first response; force_api_lookup keeps full enrichment.
+    Returns the rainforest_data dict expected by _build_fnsku_scan_response_and_save, or None.
+    """
+    rainforest_data = None
+    logger.info(
+        f"🔍 Checking Rainforest API conditions - ASIN: '{asin}' (len={len(asin) if asin else 0}), "
+        f"API Key: {'SET' if rainforest_api_key else 'MISSING'}, should_fetch={should_fetch_rainforest}, force_api_lookup={force_api_lookup}"
+    )
+
+    if asin and len(asin) >= 10 and should_fetch_rainforest:
+        if not rainforest_api_key:
+            logger.warning("⚠️ RAINFOREST_API_KEY not set - skipping Rainforest API call")
+        else:
+            logger.info(f"📦 Fetching product data from Rainforest API for ASIN {asin}...")
+            try:
+                # Request product data from Rainforest API
+                # The API returns all available images by default
+                rainforest_response = _rainforest_get_product_shared(asin, key=rainforest_api_key)
+
+                logger.info(f"📡 Rainforest API response status: {rainforest_response.status_code}")
+
+                if rainforest_response.status_code == 200:
+                    response_json = rainforest_response.json()
+                    logger.info(f"📦 Rainforest API response keys: {list(response_json.keys())}")
+                    logger.info(f"📦 Response includes: request_info, request_parameters, request_metadata, product, brand_store, newer_model, similar_to_consider")
+
+                    # SAVE COMPLETE RAINFOREST API RESPONSE - You're paying for ALL this data!
+                    # Store the ENTIRE response_json - EVERYTHING from the API
+                    # This includes: request_info, request_parameters, request_metadata, product (all fields), 
+                    # brand_store, newer_model, similar_to_consider, and any other data
+                    rainforest_full_response = response_json
+                    response_size_bytes = len(json.dumps(response_json))
+                    logger.info(f"💾 Complete response size: {response_size_bytes:,} bytes - Storing EVERYTHING for future data sales")
+
+                    if response_json.get('product'):
+                        product = response_json['product']
+                        logger.info(f"✅ Product found in Rainforest response. Title: {product.get('title', 'N/A')[:50]}...")
+
+                        # Collect ALL images from Rainforest API
+                        all_images = []
+
+                        # Add main_image if it exists
+                        main_image_link = product.get('main_image', {}).get('link')
+                        if main_image_link:
+                            all_images.append(main_image_link)
+
+                        # Add all images from images array
+                        images_array = product.get('images', [])
+                        if images_array:
+                            for img in images_array:
+                                img_link = img.get('link') if isinstance(img, dict) else img
+                                if img_link and img_link not in all_images:  # Avoid duplicates
+                                    all_images.append(img_link)
+
+                        # Fallback: if no images collected, try images_flat
+                        if not all_images and product.get('images_flat'):
+                            images_flat = product.get('images_flat', '')
+                            if images_flat:
+                                flat_images = [url.strip() for url in images_flat.split(',') if url.strip()]
+                                all_images.extend(flat_images)
+
+                        # Log image count for debugging
+                        logger.info(f"📸 Collected {len(all_images)} images from Rainforest API for ASIN {asin}")
+
+                        # If we only got one image, log a warning (might need to re-fetch)
+                        if len(all_images) == 1:
+                            logger.warning(f"⚠️ Only 1 image found for ASIN {asin}. Product may have more images available.")
+
+                        # Primary image (first one) for backward compatibility
+                        primary_image = all_images[0] if all_images else ''
+
+                        # Extract videos from product data
+                        videos_additional = product.get('videos_additional', [])
+                        videos_count = product.get('videos_count', len(videos_additional))
+
+                        # Extract commonly used fields for quick access
+                        rainforest_data = {
+                            'title': product.get('title', ''),
+                            'image': primary_image,  # Primary image for backward compatibility
+                            'images': all_images,  # ALL images as array
+                            'images_count': len(all_images),
+                            'videos': videos_additional,  # ALL videos as array
+                            'videos_count': videos_count,
+                            'price': _rainforest_retail_price_from_product(product),
+                            'rating': product.get('rating'),
+                            'reviews_count': product.get('reviews_total'),
+                            'brand': product.get('brand', ''),
+                            'category': _rainforest_category_from_product(product),
+                            'description': product.get('description', ''),
+                            # Store the FULL response for access to everything
+                            'full_response': rainforest_full_response  # Complete response with all data
+                        }
+
+                        if videos_count > 0:
+                            logger.info(f"🎥 Found {videos_count} videos for ASIN {asin}")
+                        logger.info(f"✅ Rainforest API data retrieved for ASIN {asin}: title={rainforest_data.get('title', '')[:50]}, price={rainforest_data.get('price')}, brand={rainforest_data.get('brand')}, images_count={rainforest_data.get('images_count', 0)}")
+                        logger.info(f"💾 Storing complete Rainforest API response ({len(str(rainforest_full_response))} chars) - includes request_info, product, brand_store, newer_model, similar_to_consider, etc.")
+
+                        # Verify all expected keys are in the response
+                        expected_keys = ['request_info', 'request_parameters', 'request_metadata', 'product', 'brand_store']
+                        missing_keys = [key for key in expected_keys if key not in rainforest_full_response]
+                        if missing_keys:
+                            logger.warning(f"⚠️ Missing keys in response: {missing_keys}")
+                        else:
+                            logger.info(f"✅ All expected keys present in response")
+
+                        # Log presence of optional keys
+                        optional_keys = ['newer_model', 'similar_to_consider']
+                        for key in optional_keys:
+                            if key in rainforest_full_response:
+                                logger.info(f"✅ {key} present in response")
+                            else:
+                                logger.info(f"ℹ️ {key} not present in response (may not be available for this product)")
+                    else:
+                        logger.warning(f"⚠️ Rainforest API response does not contain 'product' key. Response: {str(response_json)[:200]}")
+                        # Even if no product, save the complete response anyway
+                        rainforest_full_response = response_json
+                        rainforest_data = {
+                            'full_response': rainforest_full_response
+                        }
+                else:
+                    logger.error(f"❌ Rainforest API returned status {rainforest_response.status_code}. Response: {rainforest_response.text[:200]}")
+            except requests.exceptions.Timeout:
+                logger.error("❌ Rainforest API timeout after 15 seconds")
+            except Exception as rf_error:
+                logger.error(f"❌ Rainforest API error: {type(rf_error).__name__}: {str(rf_error)}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+    else:
+        if not should_fetch_rainforest:
+            logger.info(f"⏩ Skipping Rainforest API for standard scan (force_api_lookup={force_api_lookup}).")
+        else:
+            logger.warning(f"⚠️ Cannot call Rainforest API - ASIN invalid: '{asin}' (len={len(asin) if asin else 0})")
+    return rainforest_data
+
+
+# ----- Background FNSKU task resolver -----
+# Vendor tasks that have no ASIN yet used to be polled inline with time.sleep, pinning one of the
+# two sync gunicorn workers for several seconds per unknown code, and /api/scan/status re-polled
+# GetByBarCode on every client attempt on top of that. The resolver owns those tasks instead:
+# one daemon thread per worker wakes every FNSKU_RESOLVER_POLL_INTERVAL_MS, polls the due tasks
+# as a batch on a small pool, and writes resolved rows to api_lookup_cache through
+# _build_fnsku_scan_response_and_save. Finished outcomes are remembered briefly so status polls
+# can be answered from memory.
+_fnsku_resolver_tasks = {}  # code -> task dict (see _fnsku_resolver_submit)
+_fnsku_resolver_lock = _threading.Lock()
+# Signalled whenever a task finishes so /api/scan/stream subscribers wake up without polling.
+_fnsku_resolver_done = _threading.Condition()
+_fnsku_resolver_wakeup = _threading.Event()
+_fnsku_resolver_thread = None
+_fnsku_resolver_pool = None
+_FNSKU_RESOLVER_RESULT_TTL_SECONDS = 5 * 60
+_FNSKU_BASE_URL = "https://ato.fnskutoasin.com"
+# Vendor health: while open, /api/scan queues FNSKUs for the resolver instead of waiting out
+# AddOrGet / GetByBarCode timeouts, /api/scan/status answers "pending" without calling the
+# vendor, and the resolver's polls act as the half-open probes.
+_fnsku_vendor_breaker = upstream_http.CircuitBreaker('fnskutoasin', FNSKU_BREAKER_FAILURES, FNSKU_BREAKER_OPEN_SECONDS)
+
+
+def _fnsku_vendor_request(method, url, **kwargs):
+    """
+    GET/POST to the FNSKU vendor that feeds _fnsku_vendor_breaker: exceptions, 429 / 5xx and
+    answers slower than FNSKU_BREAKER_SLOW_MS count as failures. Raises upstream_http.CircuitOpenError
+    without calling the vendor while the breaker is open.
+    """
+    if not _fnsku_vendor_breaker.allow():
+        raise upstream_http.CircuitOpenError('fnskutoasin.com circuit breaker is open')
+    t0 = _time.time()
+    try:
+        response = upstream_http.post(url, **kwargs) if method == 'POST' else upstream_http.get(url, **kwargs)
+    except Exception:
+        _fnsku_vendor_breaker.record_failure()
+        raise
+    elapsed_ms = int((_time.time() - t0) * 1000)
+    if response.status_code == 429 or response.status_code >= 500 or elapsed_ms >= FNSKU_BREAKER_SLOW_MS:
+        _fnsku_vendor_breaker.record_failure()
+        if _fnsku_vendor_breaker.state == 'open':
+            logger.warning(f"fnskutoasin.com breaker open (last call {response.status_code} in {elapsed_ms} ms)")
+    else:
+        _fnsku_vendor_breaker.record_success()
+    return response
+
+
+def _fnsku_queue_while_vendor_down(code, fetch_rainforest):
+    """
+    Outcome for _resolve_fnsku_external when the vendor breaker is open: hand the code to the resolver.
+    When the resolver cannot take it (disabled or full) nothing would ever send AddOrGet, so the
+    outcome is 'vendor_unavailable' and the caller asks the client to retry.
+    """
+    queued = _fnsku_resolver_submit(code, None, fetch_rainforest=fetch_rainforest, needs_add=True)
+    if not queued:
+        scan_log.info(f"⏸️ fnskutoasin.com breaker open - {code} not queued (resolver disabled or full)")
+        return {'status': 'vendor_unavailable', 'scan_data': None, 'asin': None, 'task_id': None, 'queued': False}
+    scan_log.info(f"⏸️ fnskutoasin.com breaker open - {code} queued for the resolver")
+    return {'status': 'pending', 'scan_data': None, 'asin': None, 'task_id': None, 'queued': True}
+
+
+def _fnsku_callback_url():
+    """callbackUrl sent with AddOrGet: the configured receiver plus its token, or '' when push is off."""
+    if not FNSKU_CALLBACK_URL or not FNSKU_CALLBACK_SECRET:
+        return ''
+    separator = '&' if '?' in FNSKU_CALLBACK_URL else '?'
+    return f"{FNSKU_CALLBACK_URL}{separator}token={FNSKU_CALLBACK_SECRET}"
+
+
+def _fnsku_resolver_poll_interval():
+    """Seconds between resolver polls of one task; much longer when the vendor pushes completions."""
+    interval_ms = FNSKU_CALLBACK_FALLBACK_POLL_MS if _fnsku_callback_url() else FNSKU_RESOLVER_POLL_INTERVAL_MS
+    return max(200, interval_ms) / 1000.0
+
+
+def _fnsku_asin_from_scan_data(scan_data):
+    """Valid ASIN from a vendor ScanTask payload, or ''."""
+    if not scan_data or not isinstance(scan_data, dict):
+        return ''
+    asin = str(scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or '').strip()
+    return asin if len(asin) >= 10 else ''
+
+
+def _fnsku_resolver_submit(code, scan_data=None, fetch_rainforest=True, needs_add=False):
+    """
+    Hand an unresolved FNSKU to the background resolver. Returns True when the resolver owns it
+    (newly added or already tracked), False when disabled or at capacity.
+    needs_add: no vendor task exists yet (queued while the vendor was down), so the first poll issues AddOrGet.
+    """
+    if not FNSKU_BACKGROUND_RESOLVER or not code:
+        return False
+    key = str(code).strip().upper()
+    now = _time.time()
+    with _fnsku_resolver_lock:
+        task = _fnsku_resolver_tasks.get(key)
+        if task and task['state'] == 'pending':
+            task['fetch_rainforest'] = task['fetch_rainforest'] or bool(fetch_rainforest)
+            return True
+        pending = sum(1 for t in _fnsku_resolver_tasks.values() if t['state'] == 'pending')
+        if pending >= FNSKU_RESOLVER_MAX_TASKS:
+            logger.warning(f"FNSKU resolver at capacity ({pending} tasks); {key} left to client polling")
+            return False
+        _fnsku_resolver_tasks[key] = {
+            'code': key,
+            'scan_data': scan_data or None,
+            'task_id': (scan_data or {}).get('id'),
+            'fetch_rainforest': bool(fetch_rainforest),
+            'needs_add': bool(needs_add),
+            'attempts': 0,
+            'state': 'pending',
+            'submitted_at': now,
+            'next_poll_at': now + _fnsku_resolver_poll_interval(),
+            'finished_at': None,
+            'response': None,
+            # Held while a poll or a vendor callback is settling this task.
+            'lock': _threading.Lock(),
+        }
+    _fnsku_resolver_ensure_started()
+    return True
+
+
+def _fnsku_resolver_status(code):
+    """Snapshot of the resolver's task for code ('pending' / 'resolved' / 'not_found' / 'expired'), or None."""
+    if not code:
+        return None
+    with _fnsku_resolver_lock:
+        task = _fnsku_resolver_tasks.get(str(code).strip().upper())
+        if not task:
+            return None
+        snapshot = dict(task)
+        snapshot.pop('lock', None)
+        return snapshot
+
+
+def _fnsku_resolver_clear():
+    with _fnsku_resolver_lock:
+        _fnsku_resolver_tasks.clear()
+
+
+def _fnsku_resolver_ensure_started():
+    global _fnsku_resolver_thread, _fnsku_resolver_pool
+    with _fnsku_resolver_lock:
+        if _fnsku_resolver_thread is not None and _fnsku_resolver_thread.is_alive():
+            return
+        if _fnsku_resolver_pool is None:
+            _fnsku_resolver_pool = ThreadPoolExecutor(
+                max_workers=max(1, FNSKU_RESOLVER_BATCH_SIZE), thread_name_prefix='fnsku-resolver-poll'
+            )
+        _fnsku_resolver_thread = _threading.Thread(target=_fnsku_resolver_loop, name='fnsku-resolver', daemon=True)
+        _fnsku_resolver_thread.start()
+
+
+def _fnsku_resolver_finish(task, state, response=None):
+    if response:
+        # The debug 'raw' payload carries the full Rainforest JSON; keep memory per task small.
+        response = {k: v for k, v in response.items() if k != 'raw'}
+    with _fnsku_resolver_lock:
+        task['state'] = state
+        task['response'] = response
+        task['finished_at'] = _time.time()
+    with _fnsku_resolver_done:
+        _fnsku_resolver_done.notify_all()
+
+
+def _fnsku_resolver_loop():
+    interval = max(200, FNSKU_RESOLVER_POLL_INTERVAL_MS) / 1000.0
+    while True:
+        _fnsku_resolver_wakeup.wait(interval)
+        _fnsku_resolver_wakeup.clear()
+        try:
+            now = _time.time()
+            with _fnsku_resolver_lock:
+                for key in [
+                    k for k, t in _fnsku_resolver_tasks.items()
+                    if t['finished_at'] and now - t['finished_at'] > _FNSKU_RESOLVER_RESULT_TTL_SECONDS
+                ]:
+                    _fnsku_resolver_tasks.pop(key, None)
+                due = sorted(
+                    (t for t in _fnsku_resolver_tasks.values() if t['state'] == 'pending' and t['next_poll_at'] <= now),
+                    key=lambda t: t['next_poll_at'],
+                )[:max(1, FNSKU_RESOLVER_BATCH_SIZE)]
+            if due:
+                list(_fnsku_resolver_pool.map(_fnsku_resolver_poll_one, due))
+        except Exception as e:
+            logger.warning(f"FNSKU resolver tick failed: {e}")
+
+
+def _fnsku_resolver_poll_one(task):
+    """Poll the vendor once for one task and finish it when the ASIN arrives or the task is terminal."""
+    if not task['lock'].acquire(blocking=False):
+        return  # A vendor callback is settling this task right now.
+    try:
+        if task['state'] != 'pending':
+            return
+        code = task['code']
+        if _fnsku_vendor_breaker.state == 'open':
+            # Vendor down: wait for the breaker's probe window without spending an attempt.
+            with _fnsku_resolver_lock:
+                task['next_poll_at'] = _time.time() + _fnsku_resolver_poll_interval()
+            return
+        task['attempts'] += 1
+        fnsku_api_key = os.environ.get('FNSKU_API_KEY')
+        if not fnsku_api_key:
+            _fnsku_resolver_finish(task, 'expired')
+            return
+        headers = {'api-key': fnsku_api_key, 'Content-Type': 'application/json', 'Accept': 'application/json'}
+        scan_data = None
+        try:
+            if task.get('needs_add') or task['attempts'] == max(1, FNSKU_SCAN_RETRY_ADD_AFTER):
+                # Create the task (queued while the vendor was down), or re-issue AddOrGet once
+                # to nudge tasks the vendor has not started processing.
+                retry_response = _fnsku_vendor_request(
+                    'POST', f"{_FNSKU_BASE_URL}/api/v1/ScanTask/AddOrGet", headers=headers,
+                    json={"barCode": code, "callbackUrl": _fnsku_callback_url()}, timeout=FNSKU_ADD_OR_GET_TIMEOUT,
+                )
+                if retry_response.status_code == 200:
+                    retry_result = retry_response.json()
+                    if retry_result.get('succeeded') and retry_result.get('data'):
+                        scan_data = retry_result['data']
+                        task['needs_add'] = False
+                        task['task_id'] = task.get('task_id') or scan_data.get('id')
+            if not _fnsku_asin_from_scan_data(scan_data):
+                poll_response = _fnsku_vendor_request(
+                    'GET', f"{_FNSKU_BASE_URL}/api/v1/ScanTask/GetByBarCode", headers=headers,
+                    params={'BarCode': code}, timeout=FNSKU_GET_BY_BARCODE_TIMEOUT,
+                )
+                if poll_response.status_code == 200 and poll_response.text and poll_response.text.strip():
+                    poll_result = poll_response.json()
+                    if poll_result.get('succeeded') and poll_result.get('data'):
+                        scan_data = poll_result['data']
+        except upstream_http.CircuitOpenError:
+            # Another caller holds the half-open probe (or the breaker just opened): try again later.
+            task['attempts'] -= 1
+            with _fnsku_resolver_lock:
+                task['next_poll_at'] = _time.time() + _fnsku_resolver_poll_interval()
+            return
+        except Exception as e:
+            logger.warning(f"FNSKU resolver poll {task['attempts']} failed for {code}: {e}")
+
+        if _fnsku_resolver_settle(task, scan_data):
+            return
+        if task['attempts'] >= max(1, FNSKU_RESOLVER_MAX_ATTEMPTS):
+            # Soft give-up: no negative cache so a later rescan can still resolve.
+            _fnsku_resolver_finish(task, 'expired')
+            return
+        with _fnsku_resolver_lock:
+            if scan_data:
+                task['scan_data'] = scan_data
+            task['next_poll_at'] = _time.time() + _fnsku_resolver_poll_interval()
+    finally:
+        task['lock'].release()
+
+
+def _fnsku_resolver_settle(task, scan_data):
+    """
+    Finish task from a vendor ScanTask payload (poll result or callback). Caller holds task['lock'].
+    Saves resolved ASINs through _build_fnsku_scan_response_and_save, negative-caches terminal misses.
+    Returns True when the task is finished.
+    """
+    code = task['code']
+    asin = _fnsku_asin_from_scan_data(scan_data)
+    if asin:
+        try:
+            rainforest_data = _fetch_rainforest_scan_data(
+                asin, os.environ.get('RAINFOREST_API_KEY'), task['fetch_rainforest']
+            )
+            response_data, _ = _build_fnsku_scan_response_and_save(code, asin, scan_data, rainforest_data, supabase_admin)
+            _clear_negative_cache(code)
+            _fnsku_resolver_finish(task, 'resolved', response_data)
+            logger.info(f"✅ FNSKU resolver: {code} -> {asin} after {task['attempts']} polls")
+        except Exception as e:
+            logger.warning(f"FNSKU resolver could not save {code}: {e}")
+            _fnsku_resolver_finish(task, 'expired')
+        return True
+    if scan_data and _is_fnsku_task_terminal(scan_data):
+        _mark_negatively_cached(code)
+        task['scan_data'] = scan_data
+        _fnsku_resolver_finish(task, 'not_found')
+        logger.info(f"FNSKU resolver: vendor task for {code} finished without ASIN")
+        return True
+    return False
+
+
+def _fnsku_resolver_accept_callback(scan_data):
+    """
+    Hand a vendor task-completed notification to the resolver. Creates the task when this worker
+    was not tracking the code (the scan may have happened on another worker). Settling runs on the
+    resolver pool so the vendor gets its acknowledgement without waiting on Rainforest.
+    """
+    code = str(scan_data.get('barCode') or scan_data.get('BarCode') or scan_data.get('bar_code') or '').strip().upper()
+    fetch_rainforest = not SKIP_RAINFOREST_ON_STANDARD_SCAN
+    with _fnsku_resolver_lock:
+        task = _fnsku_resolver_tasks.get(code)
+    if not task or task['state'] != 'pending':
+        if not _fnsku_resolver_submit(code, scan_data, fetch_rainforest=fetch_rainforest):
+            # Resolver disabled or full: settle on a throwaway task so the cache still gets written.
+            task = {
+                'code': code, 'scan_data': scan_data, 'task_id': scan_data.get('id'), 'fetch_rainforest': fetch_rainforest,
+                'attempts': 0, 'state': 'pending', 'finished_at': None, 'response': None, 'lock': _threading.Lock(),
+            }
+        else:
+            with _fnsku_resolver_lock:
+                task = _fnsku_resolver_tasks[code]
+
+    def _settle():
+        with task['lock']:
+            if task['state'] == 'pending':
+                _fnsku_resolver_settle(task, scan_data)
+
+    pool = _fnsku_resolver_pool
+    if pool is not None:
+        pool.submit(_settle)
+    else:
+        _settle()
+    return code
+
+
+def _resolve_fnsku_external(code, fnsku_api_key, rainforest_api_key, should_fetch_rainforest, force_api_lookup=False):
+    """
+    Resolve an FNSKU that missed api_lookup_cache: AddOrGet / GetByBarCode, optional Rainforest
+    enrichment, then save via _build_fnsku_scan_response_and_save. Tasks the vendor has not finished
+    yet are handed to the background resolver instead of being polled inline.
+    Contains no per-user work so concurrent scans of one code can share a single call (see _singleflight_do).
+    Returns an outcome dict with status 'no_task', 'pending', 'not_found', 'resolved' or
+    'vendor_unavailable' (breaker open and the resolver could not queue the code).
+    """
+    fnsku_external_t0 = _time.time()
+    if _fnsku_vendor_breaker.state == 'open':
+        return _fnsku_queue_while_vendor_down(code, should_fetch_rainforest)
+
+    # STEP 2: Not in cache - call FNSKU API. AddOrGet first for fastest first-scan (GetByBarCode often fails or is slow).
+    scan_log.info(f"💰 FNSKU {code} not in cache - calling API (will be charged)")
+    BASE_URL = "https://ato.fnskutoasin.com"
+    headers = {
+        'api-key': fnsku_api_key,
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+    add_scan_url = f"{BASE_URL}/api/v1/ScanTask/AddOrGet"
+    lookup_url = f"{BASE_URL}/api/v1/ScanTask/GetByBarCode"
+    payload = {"barCode": code, "callbackUrl": _fnsku_callback_url()}
+    scan_data = None
+    asin = None
+
+    # Call AddOrGet first: creates or returns task and often returns ASIN immediately (one round trip)
     try:
-        if fnsku:
-            supabase_admin.table('products').update({'image': primary_image_url[:2000]}).eq('fnsku', fnsku.strip().upper()).execute()
-        elif _import_valid_asin(asin):
-            supabase_admin.table('products').update({'image': primary_image_url[:2000]}).eq('asin', asin.strip().upper()).execute()
+        response = _fnsku_vendor_request('POST', add_scan_url, headers=headers, json=payload, timeout=FNSKU_ADD_OR_GET_TIMEOUT)
+        if response.status_code == 200:
+            add_result = response.json()
+            if add_result.get('succeeded') and add_result.get('data'):
+                scan_data = add_result['data']
+                scan_log.info(f"✅ AddOrGet returned scan task {scan_data.get('id')} for FNSKU {code}")
+                potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
+                if potential_asin:
+                    asin = str(potential_asin).strip()
+                    if asin and len(asin) >= 10:
+                        scan_log.info(f"🎉 ASIN found immediately in AddOrGet response: {asin}")
+                    else:
+                        asin = None
+    except upstream_http.CircuitOpenError:
+        return _fnsku_queue_while_vendor_down(code, should_fetch_rainforest)
     except Exception as e:
-        logger.warning(f"_import_patch_products_image failed: {e}")
+        logger.warning(f"AddOrGet failed: {e}")
 
+    # If AddOrGet didn't return a task or we need to check existing, try GetByBarCode once
+    if not scan_data and _fnsku_vendor_breaker.state != 'open':
+        try:
+            response = _fnsku_vendor_request('GET', lookup_url, headers=headers, params={'BarCode': code}, timeout=FNSKU_GET_BY_BARCODE_TIMEOUT)
+            if response.status_code == 200 and response.text and response.text.strip():
+                lookup_result = response.json()
+                if lookup_result.get('succeeded') and lookup_result.get('data'):
+                    scan_data = lookup_result['data']
+                    potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
+                    if potential_asin:
+                        asin = str(potential_asin).strip()
+                        if asin and len(asin) >= 10:
+                            scan_log.info(f"✅ GetByBarCode returned ASIN: {asin}")
+        except upstream_http.CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.warning(f"GetByBarCode failed: {e}")
 
-def _import_parse_quantity(raw_quantity):
-    if raw_quantity is None or raw_quantity == '':
-        return 1
-    try:
-        if isinstance(raw_quantity, (int, float)):
-            q = int(raw_quantity)
-            return max(1, q)
-        q = int(float(str(raw_quantity).strip()))
-        return max(1, q)
-    except (ValueError, TypeError):
-        return 1
+    if not scan_data:
+        if _fnsku_vendor_breaker.state != 'closed':
+            # This lookup tripped (or found) the breaker: queue it rather than report a failure.
+            return _fnsku_queue_while_vendor_down(code, should_fetch_rainforest)
+        logger.error(f"❌ Failed to get or create scan task for FNSKU {code}")
+        return {'status': 'no_task', 'scan_data': None, 'asin': None, 'task_id': None}
+
+    # Only overwrite asin if we don't already have it from existing scan task
+    if not asin or len(asin) < 10:
+        potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
+        if potential_asin:
+            asin = str(potential_asin).strip()
+    task_id = scan_data.get('id') if scan_data else None
+
+    # STEP 3: No ASIN yet — soft misses stay pending and the background resolver keeps polling the
+    # vendor task, so this worker is not pinned by sleeps; the client follows up via /api/scan/status.
+    if not asin or not isinstance(asin, str) or len(asin.strip()) < 10:
+        ext_ms = int((_time.time() - fnsku_external_t0) * 1000)
+        is_terminal_miss = _is_fnsku_task_terminal(scan_data)
+        # #region agent log
+        _dbg_scan_perf_log(
+            'H1',
+            'app.py:scan_product:fnsku_no_asin',
+            'terminal_not_found_after_add_or_get' if is_terminal_miss else 'pending_handed_to_resolver',
+            {
+                'code': code,
+                'external_ms': ext_ms,
+                'task_id': str(task_id) if task_id else None,
+                'terminal': is_terminal_miss,
+            },
+        )
+        # #endregion
+        if not is_terminal_miss:
+            _fnsku_resolver_submit(code, scan_data, fetch_rainforest=should_fetch_rainforest)
+        return {
+            'status': 'not_found' if is_terminal_miss else 'pending',
+            'scan_data': scan_data,
+            'asin': None,
+            'task_id': task_id,
+        }
+
+    # #region agent log
+    _dbg_scan_perf_log('H1', 'app.py:scan_product:fnsku_asin_ok', 'asin_resolved', {
+        'code': code, 'external_ms': int((_time.time() - fnsku_external_t0) * 1000),
+        'asin_len': len(str(asin).strip()) if asin else 0,
+    })
+    # #endregion
+    scan_server_perf_mark('after_fnsku_external_asin')
+
+    # STEP 4: If we have ASIN, optionally fetch from Rainforest API.
+    rainforest_data = _fetch_rainforest_scan_data(asin, rainforest_api_key, should_fetch_rainforest, force_api_lookup)
+    scan_server_perf_mark('after_rainforest_block')
+
+    response_data, cache_row_id = _build_fnsku_scan_response_and_save(code, asin, scan_data, rainforest_data, supabase_admin)
+    scan_server_perf_mark('after_db_save_build')
+    return {
+        'status': 'resolved',
+        'scan_data': scan_data,
+        'asin': asin,
+        'task_id': task_id,
+        'response_data': response_data,
+        'cache_row_id': cache_row_id,
+    }
 
 
 @app.route('/api/scan', methods=['POST'])
@@ -3692,28 +6216,9 @@ def scan_product():
 
         # Detect code type
         code_type = detect_code_type(code)
-        # Use both print and logger to ensure visibility
-        print("\n" + "=" * 60)
-        print("SCAN REQUEST RECEIVED")
-        print(f"   Code: {code}")
-        print(f"   Type: {code_type}")
-        print(f"   UserID: {user_id}")
-        print(f"   TenantID: {tenant_id}")
-        print(f"   Supabase admin client: {supabase_admin is not None}")
-        print("=" * 60)
-        
-        logger.info(f"🔍 ========== SCAN REQUEST RECEIVED ==========")
-        logger.info(f"   Code: {code}")
-        logger.info(f"   Type: {code_type}")
-        logger.info(f"   UserID: {user_id}")
-        logger.info(f"   TenantID: {tenant_id}")
-        logger.info(f"   Supabase admin client: {supabase_admin is not None}")
-        if supabase_admin:
-            logger.info(f"   ✅ Supabase is READY for saving to api_lookup_cache")
-            print("Supabase is READY for saving to api_lookup_cache")
-        else:
+        scan_log.info("🔍 SCAN REQUEST code=%s type=%s user_id=%s tenant_id=%s", code, code_type, user_id, tenant_id)
+        if not supabase_admin:
             logger.error(f"   ❌ Supabase is NOT READY - save will FAIL")
-            print("Supabase is NOT READY - save will FAIL")
         
         if not code:
             return jsonify({
@@ -3763,24 +6268,20 @@ def scan_product():
                 is_ceo_admin = is_unlimited_scan_user(user_id) if supabase_admin else False
                 
                 # Log CEO/admin status for debugging
-                logger.info(f"👤 User role check: user_id={user_id}, role={user_role}, is_ceo_admin={is_ceo_admin}")
-                print(f"User role check: user_id={user_id}, role={user_role}, is_ceo_admin={is_ceo_admin}")
+                scan_log.info(f"👤 User role check: user_id={user_id}, role={user_role}, is_ceo_admin={is_ceo_admin}")
                 
                 # CEO accounts completely bypass ALL pricing and trial restrictions
                 # Note: Creator check is only for upgrading TO CEO, not for using CEO privileges
                 if is_ceo_admin:
-                    logger.info(f"✅✅✅ CEO/Admin account detected - BYPASSING ALL TRIAL LIMITS AND PRICING RESTRICTIONS")
-                    print("CEO/Admin account - UNLIMITED SCANNING - NO TRIAL CHECKS - SKIPPING ALL PRICING CHECKS")
+                    scan_log.info(f"✅✅✅ CEO/Admin account detected - BYPASSING ALL TRIAL LIMITS AND PRICING RESTRICTIONS")
         except Exception as role_error:
             logger.error(f"Error checking user role: {role_error}")
-            print(f"Error checking user role: {role_error}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
         
         # If CEO/admin, completely skip all trial/pricing checks
         if is_ceo_admin:
-            logger.info(f"🚀 CEO/Admin account - proceeding with scan without any trial/pricing checks")
-            print("CEO/Admin account - proceeding with scan without any trial/pricing checks")
+            scan_log.info(f"🚀 CEO/Admin account - proceeding with scan without any trial/pricing checks")
         elif supabase_admin:
             try:
                 # Treat tenants without an active subscription as on the free trial
@@ -3790,11 +6291,11 @@ def scan_product():
                 if not is_paid:
                     trial_start_date = get_trial_start_date(tenant_id, user_id)
                     if tenant_id:
-                        logger.info(f"Checking free trial usage for tenant {tenant_id} (trial started: {trial_start_date})")
+                        scan_log.info(f"Checking free trial usage for tenant {tenant_id} (trial started: {trial_start_date})")
                     else:
-                        logger.info(f"Checking free trial usage for user {user_id} (no tenant_id, trial started: {trial_start_date})")
+                        scan_log.info(f"Checking free trial usage for user {user_id} (no tenant_id, trial started: {trial_start_date})")
                     used_scans = get_used_scan_count(user_id, tenant_id, trial_start_date)
-                    logger.info(f"Free trial usage: used_scans={used_scans}, limit={FREE_TRIAL_SCAN_LIMIT}, "
+                    scan_log.info(f"Free trial usage: used_scans={used_scans}, limit={FREE_TRIAL_SCAN_LIMIT}, "
                                 f"tenant_id={tenant_id}, user_id={user_id}")
 
                     if used_scans >= FREE_TRIAL_SCAN_LIMIT:
@@ -3820,7 +6321,7 @@ def scan_product():
         scan_server_perf_mark('after_trial_gate')
         # Handle ASIN codes directly with Rainforest API
         if code_type == 'ASIN':
-            logger.info(f"📦 Detected ASIN code - checking 3-layer architecture")
+            scan_log.info(f"📦 Detected ASIN code - checking 3-layer architecture")
             asin = code
             
             # NEW: Use 3-layer lookup (manifest_items → products → api_lookup_cache → API)
@@ -3848,7 +6349,7 @@ def scan_product():
                     }
                     # Add scan count and return
                     # ... (scan count logic would go here)
-                    logger.info(f"✅ Returning manifest_data for ASIN {asin}")
+                    scan_log.info(f"✅ Returning manifest_data for ASIN {asin}")
                     return jsonify(response_data)
                 elif source in ['products', 'api_lookup_cache']:
                     # Return product data
@@ -3863,76 +6364,33 @@ def scan_product():
                         "cost_status": "no_charge",
                         "cached": True
                     }
-                    logger.info(f"✅ Returning {source} data for ASIN {asin}")
+                    scan_log.info(f"✅ Returning {source} data for ASIN {asin}")
                     return jsonify(response_data)
             
             # Not found in any table - check cache for backward compatibility (limit(1) avoids 406)
             if supabase_admin:
                 try:
-                    cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('asin', asin).limit(1).execute()
-                    cached = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+                    cached = _api_cache_lookup(supabase_admin, 'asin', asin)
                     if cached:
                         from datetime import timedelta
                         now = datetime.now(timezone.utc)
                         cached_date = datetime.fromisoformat(cached.get('updated_at', cached.get('created_at', now.isoformat())))
                         age_days = (now - cached_date).days
                         
-                        # Update access tracking
-                        current_count = cached.get('lookup_count') or 0
-                        supabase_admin.table('api_lookup_cache').update({
-                            'last_accessed': now.isoformat(),
-                            'lookup_count': current_count + 1
-                        }).eq('id', cached['id']).execute()
+                        # Update access tracking (write-behind, flushed in bulk)
+                        _cache_access_record(cached, now.isoformat())
                         
-                        # Check if cache has complete product data
-                        product_name = cached.get('product_name') or ''
-                        is_placeholder = (
-                            not product_name or 
-                            product_name.startswith("Amazon Product (ASIN:") or
-                            product_name.startswith("FNSKU:") or
-                            len(product_name) < 10
-                        )
-                        has_price = cached.get('price') and float(cached.get('price') or 0) > 0
-                        has_image = cached.get('image_url') and len(str(cached.get('image_url', ''))) > 0
-                        has_rainforest_data = cached.get('rainforest_raw_data') is not None
-                        has_complete_data = not is_placeholder and has_price and (has_image or has_rainforest_data)
+                        # Check if cache has complete product data (precomputed in scan_projection)
+                        proj = _scan_projection(cached)
+                        has_complete_data = proj['complete']
                         
-                        logger.info(f"📊 ASIN cache completeness: is_placeholder={is_placeholder}, has_price={has_price}, has_image={has_image}, complete={has_complete_data}")
+                        scan_log.info(f"📊 ASIN cache completeness: has_rainforest={proj['has_rainforest_data']}, complete={has_complete_data}")
                         
                         # If cache is fresh and complete, return it (unless client requests a fresh Amazon fetch)
                         if age_days < 30 and has_complete_data and not force_api_lookup:
-                            # Extract images
-                            all_images = []
-                            try:
-                                image_url_data = cached.get('image_url', '')
-                                if image_url_data:
-                                    parsed = json.loads(image_url_data) if isinstance(image_url_data, str) else image_url_data
-                                    if isinstance(parsed, list):
-                                        all_images = parsed
-                                    else:
-                                        all_images = [image_url_data] if image_url_data else []
-                            except:
-                                all_images = [cached.get('image_url')] if cached.get('image_url') else []
-                            if cached.get('rainforest_raw_data'):
-                                for u in _all_image_urls_from_rainforest_raw(cached):
-                                    if u and u not in all_images:
-                                        all_images.append(u)
-                            
-                            # Extract videos
-                            videos = []
-                            videos_count = 0
-                            if cached.get('rainforest_raw_data'):
-                                try:
-                                    raw_data = cached.get('rainforest_raw_data')
-                                    if isinstance(raw_data, str):
-                                        raw_data = json.loads(raw_data)
-                                    if raw_data and raw_data.get('product'):
-                                        product = raw_data.get('product')
-                                        if product.get('videos_additional') and isinstance(product.get('videos_additional'), list):
-                                            videos = product.get('videos_additional', [])
-                                            videos_count = product.get('videos_count', len(videos))
-                                except Exception as video_error:
-                                    logger.warning(f"Could not extract videos from cache: {video_error}")
+                            all_images = list(proj['images'])
+                            videos = proj['videos']
+                            videos_count = proj['videos_count']
                             
                             # Log scan to history (link to cache so recent scans show full product details)
                             scan_was_logged = log_scan_to_history(
@@ -3991,7 +6449,7 @@ def scan_product():
                             if scan_count_data:
                                 response_data['scan_count'] = scan_count_data
                             
-                            logger.info(f"✅ Returning cached ASIN data: {asin}")
+                            scan_log.info(f"✅ Returning cached ASIN data: {asin}")
                             return jsonify(response_data)
                         # If cache is incomplete, fetch fresh data below
                 except Exception as cache_error:
@@ -4005,19 +6463,10 @@ def scan_product():
                     "message": "Rainforest API key not configured"
                 }), 500
             
-            logger.info(f"💰 ASIN {asin} not in cache or incomplete - calling Rainforest API (will be charged)")
+            scan_log.info(f"💰 ASIN {asin} not in cache or incomplete - calling Rainforest API (will be charged)")
             
             try:
-                rainforest_response = requests.get(
-                    'https://api.rainforestapi.com/request',
-                    params={
-                        'api_key': RAINFOREST_API_KEY,
-                        'type': 'product',
-                        'amazon_domain': 'amazon.com',
-                        'asin': asin
-                    },
-                    timeout=10
-                )
+                rainforest_response = _rainforest_get_product_shared(asin, key=RAINFOREST_API_KEY)
                 
                 if rainforest_response.status_code == 200:
                     response_json = rainforest_response.json()
@@ -4119,8 +6568,8 @@ def scan_product():
                                             "Content-Type": "application/json",
                                             "Prefer": "resolution=ignore"  # ON CONFLICT DO NOTHING
                                         }
-                                        requests.post(url, headers=headers, json=product_data, timeout=10)
-                                        logger.info(f"✅ Saved to products table: ASIN {asin}, tenant_id: {tenant_id}")
+                                        upstream_http.post(url, headers=headers, json=product_data, timeout=10)
+                                        scan_log.info(f"✅ Saved to products table: ASIN {asin}, tenant_id: {tenant_id}")
                                 except Exception as product_save_error:
                                     logger.warning(f"Error saving to products table: {str(product_save_error)}")
                                 
@@ -4139,16 +6588,18 @@ def scan_product():
                                     'lookup_count': 1,
                                     'updated_at': now
                                 }
+                                cache_data['scan_projection'] = _build_scan_projection(cache_data)
                                 
                                 # Check if entry already exists (limit(1) avoids 406)
                                 existing_row = existing_asin_row
                                 if existing_row:
                                     supabase_admin.table('api_lookup_cache').update(cache_data).eq('id', existing_row['id']).execute()
-                                    logger.info(f"✅ Updated api_lookup_cache entry for ASIN {asin}")
+                                    scan_log.info(f"✅ Updated api_lookup_cache entry for ASIN {asin}")
                                 else:
                                     cache_data['created_at'] = now
                                     supabase_admin.table('api_lookup_cache').insert(cache_data).execute()
-                                    logger.info(f"✅ Saved new api_lookup_cache entry for ASIN {asin}")
+                                    scan_log.info(f"✅ Saved new api_lookup_cache entry for ASIN {asin}")
+                                _product_l1_invalidate(asin, upc)
                             except Exception as cache_save_error:
                                 logger.error(f"Error saving ASIN to cache: {cache_save_error}")
                         
@@ -4175,7 +6626,7 @@ def scan_product():
                         if scan_count_data:
                             response_data['scan_count'] = scan_count_data
                         
-                        logger.info(f"✅ Successfully fetched ASIN {asin} from Rainforest API")
+                        scan_log.info(f"✅ Successfully fetched ASIN {asin} from Rainforest API")
                         return jsonify(response_data)
                     else:
                         return jsonify({
@@ -4190,6 +6641,13 @@ def scan_product():
                         "error": "api_error",
                         "message": f"Rainforest API returned status {rainforest_response.status_code}"
                     }), 500
+            except (upstream_http.CircuitOpenError, rainforest_client.RainforestUnavailable) as rainforest_error:
+                logger.warning(f"Rainforest API skipped for ASIN {asin}: {rainforest_error}")
+                return jsonify({
+                    "success": False,
+                    "error": "vendor_unavailable",
+                    "message": "Product lookup is temporarily unavailable. Please try again shortly."
+                }), 503
             except Exception as rainforest_error:
                 logger.error(f"Error calling Rainforest API for ASIN {asin}: {rainforest_error}")
                 return jsonify({
@@ -4200,25 +6658,20 @@ def scan_product():
         
         # Handle UPC codes with free UPCitemdb API
         if code_type == 'UPC':
-            logger.info(f"📦 Detected UPC code - using free UPCitemdb API")
+            scan_log.info(f"📦 Detected UPC code - using free UPCitemdb API")
             
             # Check cache first (by UPC) (limit(1) avoids 406)
             if supabase_admin:
                 try:
-                    cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('upc', code).limit(1).execute()
-                    cached = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+                    cached = _api_cache_lookup(supabase_admin, 'upc', code)
                     if cached:
                         from datetime import timedelta
                         now = datetime.now(timezone.utc)
                         cached_date = datetime.fromisoformat(cached.get('updated_at', cached.get('created_at', now.isoformat())))
                         age_days = (now - cached_date).days
                         
-                        # Update access tracking
-                        current_count = cached.get('lookup_count') or 0
-                        supabase_admin.table('api_lookup_cache').update({
-                            'last_accessed': now.isoformat(),
-                            'lookup_count': current_count + 1
-                        }).eq('id', cached['id']).execute()
+                        # Update access tracking (write-behind, flushed in bulk)
+                        _cache_access_record(cached, now.isoformat())
                         
                         # If cache is fresh (<30 days), return immediately
                         if age_days < 30:
@@ -4240,17 +6693,8 @@ def scan_product():
                                 and RAINFOREST_API_KEY
                             ):
                                 try:
-                                    logger.info(f"🔍 Cached UPC has ASIN {cached_asin}, fetching current Amazon price...")
-                                    rainforest_response = requests.get(
-                                        'https://api.rainforestapi.com/request',
-                                        params={
-                                            'api_key': RAINFOREST_API_KEY,
-                                            'type': 'product',
-                                            'amazon_domain': 'amazon.com',
-                                            'asin': cached_asin
-                                        },
-                                        timeout=RAINFOREST_REQUEST_TIMEOUT
-                                    )
+                                    scan_log.info(f"🔍 Cached UPC has ASIN {cached_asin}, fetching current Amazon price...")
+                                    rainforest_response = _rainforest_get_product_shared(cached_asin, key=RAINFOREST_API_KEY)
                                     
                                     if rainforest_response.status_code == 200:
                                         rainforest_json = rainforest_response.json()
@@ -4260,26 +6704,20 @@ def scan_product():
                                             if amazon_price:
                                                 cached_price = amazon_price
                                                 price_source = 'amazon_rainforest'
-                                                logger.info(f"✅ Updated price from Amazon (list price when available): ${cached_price}")
+                                                scan_log.info(f"✅ Updated price from Amazon (list price when available): ${cached_price}")
                                 except Exception as rainforest_error:
                                     logger.warning(f"⚠️ Could not fetch Amazon price for cached UPC: {rainforest_error}")
                             elif cached_asin and not needs_price_refresh:
-                                logger.info(f"⏩ Skipping Rainforest price refresh for cached UPC {code} (complete cache hit)")
+                                scan_log.info(f"⏩ Skipping Rainforest price refresh for cached UPC {code} (complete cache hit)")
                             # Log scan to history (even if cached, it counts toward trial limit)
                             # But only count unique scans per user
-                            print(f"\nABOUT TO CALL log_scan_to_history (UPC)")
-                            print(f"   user_id: {user_id}")
-                            print(f"   tenant_id: {tenant_id}")
-                            print(f"   code: {code}")
-                            print(f"   supabase_admin: {supabase_admin is not None}")
-                            logger.info(f"🔵 Calling log_scan_to_history (UPC): user_id={user_id}, tenant_id={tenant_id}, code={code}")
+                            scan_log.info(f"🔵 Calling log_scan_to_history (UPC): user_id={user_id}, tenant_id={tenant_id}, code={code}")
                             scan_was_logged = log_scan_to_history(
                                 user_id, tenant_id, code, cached_asin, supabase_admin,
                                 api_lookup_cache_id=cached.get('id'),
                                 product_description=cached.get('product_name') or ''
                             )
-                            print(f"log_scan_to_history RETURNED (UPC): {scan_was_logged}")
-                            logger.info(f"🔵 log_scan_to_history returned (UPC): {scan_was_logged}")
+                            scan_log.info(f"🔵 log_scan_to_history returned (UPC): {scan_was_logged}")
                             
                             # Get updated scan count for response (always calculate, not just if logged)
                             scan_count_data = None
@@ -4287,20 +6725,17 @@ def scan_product():
                                 try:
                                     is_paid = tenant_has_paid_subscription(tenant_id) if tenant_id else False
                                     if not is_paid:
-                                        if scan_was_logged:
-                                            _invalidate_used_scan_count_cache()
                                         try:
                                             trial_start_date = get_trial_start_date(tenant_id, user_id)
-                                            print(f"   Trial start date: {trial_start_date}")
+                                            scan_log.debug(f"   Trial start date: {trial_start_date}")
                                         except Exception as trial_date_error:
                                             logger.error(f"Error getting trial start date: {trial_date_error}")
-                                            print(f"   Trial date error: {trial_date_error}, using fallback")
+                                            scan_log.debug(f"   Trial date error: {trial_date_error}, using fallback")
                                             from datetime import timedelta
                                             trial_start_date = datetime.now(timezone.utc) - timedelta(days=30)
 
                                         used_scans = get_used_scan_count(user_id, tenant_id, trial_start_date)
-                                        logger.info(f"📊 UPC cached scan count: used={used_scans}, was_logged={scan_was_logged}")
-                                        print(f"FINAL SCAN COUNT (UPC): {used_scans}/{FREE_TRIAL_SCAN_LIMIT} (was_logged={scan_was_logged})")
+                                        scan_log.info(f"📊 UPC cached scan count: used={used_scans}, was_logged={scan_was_logged}")
                                         scan_count_data = {
                                             'used': used_scans,
                                             'limit': FREE_TRIAL_SCAN_LIMIT,
@@ -4349,7 +6784,7 @@ def scan_product():
                                     'is_paid': False
                                 }
                             
-                            logger.info(f"✅ Returning cached UPC data for {code} (age: {age_days} days)")
+                            scan_log.info(f"✅ Returning cached UPC data for {code} (age: {age_days} days)")
                             return jsonify(response_data)
                 except Exception as cache_error:
                     logger.warning(f"Error checking UPC cache: {cache_error}")
@@ -4387,17 +6822,8 @@ def scan_product():
                 # If we found an ASIN, try to get actual Amazon price from Rainforest API
                 if potential_asin and len(potential_asin) >= 10 and RAINFOREST_API_KEY:
                     try:
-                        logger.info(f"🔍 Found ASIN {potential_asin} from UPCitemdb, fetching Amazon price from Rainforest API...")
-                        rainforest_response = requests.get(
-                            'https://api.rainforestapi.com/request',
-                            params={
-                                'api_key': RAINFOREST_API_KEY,
-                                'type': 'product',
-                                'amazon_domain': 'amazon.com',
-                                'asin': potential_asin
-                            },
-                            timeout=10
-                        )
+                        scan_log.info(f"🔍 Found ASIN {potential_asin} from UPCitemdb, fetching Amazon price from Rainforest API...")
+                        rainforest_response = _rainforest_get_product_shared(potential_asin, key=RAINFOREST_API_KEY)
                         
                         if rainforest_response.status_code == 200:
                             rainforest_json = rainforest_response.json()
@@ -4406,7 +6832,7 @@ def scan_product():
                                 amazon_price = _rainforest_retail_price_from_product(product)
                                 if amazon_price:
                                     price_source = 'amazon_rainforest'
-                                    logger.info(f"✅ Got Amazon price from Rainforest (list when available): ${amazon_price}")
+                                    scan_log.info(f"✅ Got Amazon price from Rainforest (list when available): ${amazon_price}")
                                 # Also update ASIN if we got it from Rainforest
                                 if product.get('asin'):
                                     potential_asin = product.get('asin')
@@ -4427,7 +6853,7 @@ def scan_product():
                 scan_was_logged = False
                 if supabase_admin and user_id:
                     scan_was_logged = log_scan_to_history(user_id, tenant_id, code, '', supabase_admin)
-                    logger.info(f"📝 Logged UPC scan to history: {scan_was_logged}")
+                    scan_log.info(f"📝 Logged UPC scan to history: {scan_was_logged}")
                 
                 # Save to cache
                 if supabase_admin:
@@ -4453,10 +6879,13 @@ def scan_product():
                         existing = supabase_admin.table('api_lookup_cache').select('id').eq('upc', code).limit(1).execute()
                         existing_row = (existing.data[0] if (existing and getattr(existing, 'data', None) and len(existing.data) > 0) else None)
                         if existing_row:
+                            cache_data['scan_projection'] = None  # stored rainforest_raw_data is kept; recompute on read
                             supabase_admin.table('api_lookup_cache').update(cache_data).eq('id', existing_row['id']).execute()
                         else:
+                            cache_data['scan_projection'] = _build_scan_projection(cache_data)
                             supabase_admin.table('api_lookup_cache').insert(cache_data).execute()
-                        logger.info(f"✅ Saved UPC {code} to cache")
+                        _product_l1_invalidate(code)
+                        scan_log.info(f"✅ Saved UPC {code} to cache")
                     except Exception as save_error:
                         logger.warning(f"⚠️ Could not save UPC to cache: {save_error}")
                 
@@ -4474,8 +6903,6 @@ def scan_product():
                                 from datetime import timedelta
                                 trial_start_date = datetime.now(timezone.utc) - timedelta(days=30)
 
-                            if scan_was_logged:
-                                _invalidate_used_scan_count_cache()
                             used_scans = get_used_scan_count(user_id, tenant_id, trial_start_date)
 
                             scan_count_data = {
@@ -4531,7 +6958,7 @@ def scan_product():
                         'is_paid': False
                     }
                 
-                logger.info(f"✅ Returning UPC data from UPCitemdb for {code}")
+                scan_log.info(f"✅ Returning UPC data from UPCitemdb for {code}")
                 return jsonify(response_data)
             else:
                 return jsonify({
@@ -4557,48 +6984,36 @@ def scan_product():
         if supabase_admin:
             try:
                 scan_server_perf_mark('before_fnsku_cache')
-                logger.info(f"🔍 Checking cache for {code_type} code: {code}")
+                scan_log.info(f"🔍 Checking cache for {code_type} code: {code}")
                 if code_type == 'UPC':
-                    cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('upc', code).limit(1).execute()
-                    logger.info(f"   Cache query: looking for UPC={code}")
+                    cached = _api_cache_lookup(supabase_admin, 'upc', code)
+                    scan_log.info(f"   Cache query: looking for UPC={code}")
                 else:
-                    cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('fnsku', code).limit(1).execute()
-                    logger.info(f"   Cache query: looking for FNSKU={code}")
-                cached = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+                    cached = _api_cache_lookup(supabase_admin, 'fnsku', code)
+                    scan_log.info(f"   Cache query: looking for FNSKU={code}")
                 if cached:
-                    logger.info(f"✅✅✅ FOUND IN CACHE! Code: {code}, ASIN: {cached.get('asin', 'N/A')}")
-                    print(f"FOUND IN CACHE! Code: {code}")
+                    scan_log.info(f"✅✅✅ FOUND IN CACHE! Code: {code}, ASIN: {cached.get('asin', 'N/A')}")
                     from datetime import timedelta
                     now = datetime.now(timezone.utc)
                     cached_date = datetime.fromisoformat(cached.get('updated_at', cached.get('created_at', now.isoformat())))
                     age_days = (now - cached_date).days
                     
-                    # Update access tracking
-                    current_count = cached.get('lookup_count') or 0
-                    supabase_admin.table('api_lookup_cache').update({
-                        'last_accessed': now.isoformat(),
-                        'lookup_count': current_count + 1
-                    }).eq('id', cached['id']).execute()
+                    # Update access tracking (write-behind, flushed in bulk)
+                    _cache_access_record(cached, now.isoformat())
                     
                     # If cache is fresh (<30 days), return immediately (even if some fields are missing)
                     # We'll return cached data if it exists, regardless of completeness
                     if age_days < 30:
-                        logger.info(f"✅ Found cached data for {code_type} {code} (age: {age_days} days)")
+                        scan_log.info(f"✅ Found cached data for {code_type} {code} (age: {age_days} days)")
                         # Log scan to history (even if cached, it counts toward trial limit)
                         # But only count unique scans per user
-                        print(f"\nABOUT TO CALL log_scan_to_history")
-                        print(f"   user_id: {user_id}")
-                        print(f"   tenant_id: {tenant_id}")
-                        print(f"   code: {code}")
-                        print(f"   supabase_admin: {supabase_admin is not None}")
-                        logger.info(f"🔵 Calling log_scan_to_history: user_id={user_id}, tenant_id={tenant_id}, code={code}")
+                        scan_log.info(f"🔵 Calling log_scan_to_history: user_id={user_id}, tenant_id={tenant_id}, code={code}")
                         scan_was_logged = log_scan_to_history(
                             user_id, tenant_id, code, cached.get('asin', ''), supabase_admin,
                             api_lookup_cache_id=cached.get('id'),
                             product_description=cached.get('product_name') or ''
                         )
-                        print(f"log_scan_to_history RETURNED: {scan_was_logged}")
-                        logger.info(f"🔵 log_scan_to_history returned: {scan_was_logged}")
+                        scan_log.info(f"🔵 log_scan_to_history returned: {scan_was_logged}")
                         
                         # Get updated scan count for response (always calculate, not just if logged)
                         scan_count_data = None
@@ -4606,12 +7021,9 @@ def scan_product():
                             try:
                                 is_paid = tenant_has_paid_subscription(tenant_id) if tenant_id else False
                                 if not is_paid:
-                                    if scan_was_logged:
-                                        _invalidate_used_scan_count_cache()
                                     trial_start_date = get_trial_start_date(tenant_id, user_id)
                                     used_scans = get_used_scan_count(user_id, tenant_id, trial_start_date)
-                                    logger.info(f"📊 FNSKU cached scan count: used={used_scans}, was_logged={scan_was_logged}, limit={FREE_TRIAL_SCAN_LIMIT}")
-                                    print(f"FINAL SCAN COUNT: {used_scans}/{FREE_TRIAL_SCAN_LIMIT} (was_logged={scan_was_logged})")
+                                    scan_log.info(f"📊 FNSKU cached scan count: used={used_scans}, was_logged={scan_was_logged}, limit={FREE_TRIAL_SCAN_LIMIT}")
                                     scan_count_data = {
                                         'used': used_scans,
                                         'limit': FREE_TRIAL_SCAN_LIMIT,
@@ -4628,59 +7040,15 @@ def scan_product():
                             except Exception as count_error:
                                 logger.error(f"❌ Failed to get scan count for cached FNSKU response: {count_error}")
                         
-                        # Extract images from cached data
-                        all_images = []
-                        try:
-                            image_url_data = cached.get('image_url', '')
-                            if image_url_data:
-                                parsed = json.loads(image_url_data) if isinstance(image_url_data, str) else image_url_data
-                                if isinstance(parsed, list):
-                                    all_images = parsed
-                                else:
-                                    all_images = [image_url_data] if image_url_data else []
-                        except:
-                            all_images = [cached.get('image_url')] if cached.get('image_url') else []
-                        if cached.get('rainforest_raw_data'):
-                            for u in _all_image_urls_from_rainforest_raw(cached):
-                                if u and u not in all_images:
-                                    all_images.append(u)
-                        
-                        # Extract videos from rainforest_raw_data if available
-                        videos = []
-                        videos_count = 0
-                        if cached.get('rainforest_raw_data'):
-                            try:
-                                raw_data = cached.get('rainforest_raw_data')
-                                if isinstance(raw_data, str):
-                                    raw_data = json.loads(raw_data)
-                                if raw_data and raw_data.get('product'):
-                                    product = raw_data.get('product')
-                                    if product.get('videos_additional') and isinstance(product.get('videos_additional'), list):
-                                        videos = product.get('videos_additional', [])
-                                        videos_count = product.get('videos_count', len(videos))
-                            except Exception as video_error:
-                                logger.warning(f"Could not extract videos from cache: {video_error}")
-                        
-                        # Check if cache has complete product data (Rainforest data)
+                        # Images, videos and the completeness flag come from the precomputed scan_projection
+                        proj = _scan_projection(cached)
+                        all_images = list(proj['images'])
+                        videos = proj['videos']
+                        videos_count = proj['videos_count']
                         cached_asin = cached.get('asin') or ''
-                        has_rainforest_data = cached.get('rainforest_raw_data') is not None
-                        product_name = cached.get('product_name') or ''
-                        
-                        # Check if product_name is a placeholder (incomplete data)
-                        is_placeholder = (
-                            not product_name or 
-                            product_name == f"Product {code}" or 
-                            product_name.startswith("Amazon Product (ASIN:") or
-                            product_name.startswith("FNSKU:") or
-                            len(product_name) < 10  # Too short to be a real product name
-                        )
+                        has_complete_data = proj['complete']
                         
-                        # Check if we have essential product data
-                        has_price = cached.get('price') and float(cached.get('price') or 0) > 0
-                        has_image = cached.get('image_url') and len(str(cached.get('image_url', ''))) > 0
-                        has_complete_data = not is_placeholder and has_price and (has_image or has_rainforest_data)
-                        
-                        logger.info(f"📊 Cache completeness check for {code}: ASIN={cached_asin}, has_rainforest={has_rainforest_data}, is_placeholder={is_placeholder}, has_price={has_price}, has_image={has_image}, complete={has_complete_data}")
+                        scan_log.info(f"📊 Cache completeness check for {code}: ASIN={cached_asin}, has_rainforest={proj['has_rainforest_data']}, complete={has_complete_data}")
                         
                         # Rainforest sync is slow (~3–10s). Only call when cache is incomplete or when the
                         # client explicitly forces refresh *and* we still have no usable image URLs assembled.
@@ -4694,21 +7062,12 @@ def scan_product():
                             )
                         )
                         if should_enrich_cache:
-                            logger.info(
+                            scan_log.info(
                                 f"📦 Rainforest enrich for {code} (asin={cached_asin}, complete={has_complete_data}, "
                                 f"force_api_lookup={force_api_lookup}, usable_images={has_usable_images})"
                             )
                             try:
-                                rainforest_response = requests.get(
-                                    'https://api.rainforestapi.com/request',
-                                    params={
-                                        'api_key': RAINFOREST_API_KEY,
-                                        'type': 'product',
-                                        'amazon_domain': 'amazon.com',
-                                        'asin': cached_asin
-                                    },
-                                    timeout=10
-                                )
+                                rainforest_response = _rainforest_get_product_shared(cached_asin, key=RAINFOREST_API_KEY)
                                 
                                 if rainforest_response.status_code == 200:
                                     response_json = rainforest_response.json()
@@ -4742,7 +7101,7 @@ def scan_product():
                                             videos = product.get('videos_additional', [])
                                             videos_count = product.get('videos_count', len(videos))
                                         
-                                        logger.info(f"✅ Enriched cached data with Rainforest API: title={enriched_title[:50]}, price={enriched_price}, brand={enriched_brand}")
+                                        scan_log.info(f"✅ Enriched cached data with Rainforest API: title={enriched_title[:50]}, price={enriched_price}, brand={enriched_brand}")
                                         
                                         # Persist to api_lookup_cache so the next scan loads images/details without another Rainforest call
                                         if supabase_admin and cached.get('id'):
@@ -4768,8 +7127,10 @@ def scan_product():
                                                 if enriched_description:
                                                     desc_s = enriched_description if isinstance(enriched_description, str) else str(enriched_description)
                                                     cache_upd['description'] = desc_s[:2000]
+                                                cache_upd['scan_projection'] = _build_scan_projection({**cached, **cache_upd})
                                                 supabase_admin.table('api_lookup_cache').update(cache_upd).eq('id', cached['id']).execute()
-                                                logger.info(f"✅ Persisted Rainforest enrich to api_lookup_cache id={cached['id']} (fnsku={code})")
+                                                _product_l1_invalidate(code, cached.get('fnsku'), cached.get('asin'), cached.get('upc'))
+                                                scan_log.info(f"✅ Persisted Rainforest enrich to api_lookup_cache id={cached['id']} (fnsku={code})")
                                             except Exception as persist_e:
                                                 logger.warning(f"⚠️ Could not persist enrich to api_lookup_cache: {persist_e}")
                                         
@@ -4800,21 +7161,15 @@ def scan_product():
                                         if scan_count_data:
                                             response_data['scan_count'] = scan_count_data
                                         
-                                        logger.info(f"✅ Returning enriched cached data for {code_type} {code}")
+                                        scan_log.info(f"✅ Returning enriched cached data for {code_type} {code}")
                                         scan_server_perf_mark('fnsku_cache_return')
                                         return jsonify(response_data)
                             except Exception as enrich_error:
                                 logger.warning(f"⚠️ Could not enrich cache with Rainforest API: {enrich_error}")
                                 # Fall through to return cached data
                         
-                        # Brand/category/description are not table columns; get from rainforest_raw_data when present
-                        cached_brand, cached_category, cached_description = _brand_category_description_from_rainforest_raw(cached)
-                        if not cached_brand:
-                            cached_brand = cached.get('brand', '')
-                        if not cached_category:
-                            cached_category = cached.get('category', '')
-                        if not cached_description:
-                            cached_description = cached.get('description', '')
+                        # Brand/category/description are not table columns; the projection takes them from rainforest_raw_data
+                        cached_brand, cached_category, cached_description = proj['brand'], proj['category'], proj['description']
                         response_data = {
                             "success": True,
                             "fnsku": cached.get('fnsku', code),
@@ -4839,10 +7194,7 @@ def scan_product():
                         # Always include scan_count, even if calculation failed (use fallback)
                         if scan_count_data:
                             response_data['scan_count'] = scan_count_data
-                            logger.info(f"✅ Scan count included in response: {scan_count_data}")
-                            print(
-                                f"SCAN COUNT IN RESPONSE: {scan_count_data.get('used', 'N/A')}/{scan_count_data.get('limit', 'N/A')}"
-                            )
+                            scan_log.info(f"✅ Scan count included in response: {scan_count_data}")
                         else:
                             # Fallback: return basic count info even if calculation failed
                             logger.warning(f"⚠️ Scan count calculation failed, using fallback")
@@ -4853,20 +7205,16 @@ def scan_product():
                                 'is_paid': False
                             }
                         
-                        logger.info(f"Returning cached data for {code_type} {code} (age: {age_days} days)")
-                        logger.info(f"   Response includes scan_count: {response_data.get('scan_count', 'MISSING')}")
-                        print("Returning cached data - NO API CHARGE")
-                        print(f"Final scan_count in response: {response_data.get('scan_count', {})}")
+                        scan_log.info(f"Returning cached data for {code_type} {code} (age: {age_days} days)")
+                        scan_log.info(f"   Response includes scan_count: {response_data.get('scan_count', 'MISSING')}")
                         scan_server_perf_mark('fnsku_cache_return')
                         return jsonify(response_data)
                 else:
-                    logger.info(f"NOT FOUND IN CACHE: {code_type} {code}")
-                    print(f"NOT FOUND IN CACHE: {code}")
+                    scan_log.info(f"NOT FOUND IN CACHE: {code_type} {code}")
             except Exception as cache_error:
                 logger.error(f"❌ Error checking cache: {cache_error}")
                 import traceback
                 logger.error(f"   Traceback: {traceback.format_exc()}")
-                print(f"Cache check error: {cache_error}")
         scan_server_perf_mark('after_fnsku_cache_block')
         
         # ---- Server negative cache (single /api/scan fast fail; same semantics as batch) ----
@@ -4890,172 +7238,40 @@ def scan_product():
             return jsonify(neg), 200
 
         scan_server_perf_mark('before_fnsku_external')
-        fnsku_external_t0 = _time.time()
 
-        # STEP 2: Not in cache - call FNSKU API. AddOrGet first for fastest first-scan (GetByBarCode often fails or is slow).
-        logger.info(f"💰 {code_type} {code} not in cache - calling API (will be charged)")
-        print(f"CALLING EXTERNAL API - THIS WILL BE CHARGED")
-        BASE_URL = "https://ato.fnskutoasin.com"
-        headers = {
-            'api-key': FNSKU_API_KEY,
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        add_scan_url = f"{BASE_URL}/api/v1/ScanTask/AddOrGet"
-        lookup_url = f"{BASE_URL}/api/v1/ScanTask/GetByBarCode"
-        payload = {"barCode": code, "callbackUrl": ""}
-        scan_data = None
-        asin = None
-        
-        # Call AddOrGet first: creates or returns task and often returns ASIN immediately (one round trip)
-        try:
-            response = requests.post(add_scan_url, headers=headers, json=payload, timeout=FNSKU_ADD_OR_GET_TIMEOUT)
-            if response.status_code == 200:
-                add_result = response.json()
-                if add_result.get('succeeded') and add_result.get('data'):
-                    scan_data = add_result['data']
-                    logger.info(f"✅ AddOrGet returned scan task {scan_data.get('id')} for FNSKU {code}")
-                    potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
-                    if potential_asin:
-                        asin = str(potential_asin).strip()
-                        if asin and len(asin) >= 10:
-                            logger.info(f"🎉 ASIN found immediately in AddOrGet response: {asin}")
-                        else:
-                            asin = None
-        except Exception as e:
-            logger.warning(f"AddOrGet failed: {e}")
-        
-        # If AddOrGet didn't return a task or we need to check existing, try GetByBarCode once
-        if not scan_data:
-            try:
-                response = requests.get(lookup_url, headers=headers, params={'BarCode': code}, timeout=FNSKU_GET_BY_BARCODE_TIMEOUT)
-                if response.status_code == 200 and response.text and response.text.strip():
-                    lookup_result = response.json()
-                    if lookup_result.get('succeeded') and lookup_result.get('data'):
-                        scan_data = lookup_result['data']
-                        potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
-                        if potential_asin:
-                            asin = str(potential_asin).strip()
-                            if asin and len(asin) >= 10:
-                                logger.info(f"✅ GetByBarCode returned ASIN: {asin}")
-            except Exception as e:
-                logger.warning(f"GetByBarCode failed: {e}")
-        
-        if not scan_data:
-            logger.error(f"❌ Failed to get or create scan task for FNSKU {code}")
+        # STEP 2-5: vendor lookup, Rainforest and cache save. Concurrent scans of the same code
+        # (several scanners on one pallet, or duplicates inside /api/scan/batch) share one call.
+        should_fetch_rainforest = bool(force_api_lookup) or (not SKIP_RAINFOREST_ON_STANDARD_SCAN)
+        outcome, coalesced = _singleflight_do(
+            f"fnsku:{code}:{'rf' if should_fetch_rainforest else 'basic'}",
+            lambda: _resolve_fnsku_external(
+                code, FNSKU_API_KEY, RAINFOREST_API_KEY, should_fetch_rainforest, force_api_lookup
+            ),
+        )
+        if coalesced:
+            scan_server_perf_mark('fnsku_external_coalesced')
+            scan_log.info(f"🔗 Joined in-flight lookup for {code} (status={outcome.get('status')})")
+        scan_data = outcome.get('scan_data')
+        asin = outcome.get('asin')
+        task_id = outcome.get('task_id')
+
+        if outcome['status'] == 'vendor_unavailable':
+            # No vendor call was made or queued: not a lookup, so the scan is not logged or counted.
+            return jsonify({
+                "success": False,
+                "error": "vendor_unavailable",
+                "message": "Product lookup is temporarily unavailable. Please try again shortly."
+            }), 503
+
+        if outcome['status'] == 'no_task':
             return jsonify({
                 "success": False,
                 "error": "Product not found",
                 "message": "Could not create or retrieve scan task. Please try again."
             }), 404
-        # STEP 3: Poll for ASIN so first scan often succeeds in one go (target ≤10s)
-        # Only overwrite asin if we don't already have it from existing scan task
-        if not asin or len(asin) < 10:
-            potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
-            if potential_asin:
-                asin = str(potential_asin).strip()
-        
-        task_id = scan_data.get('id') if scan_data else None
-        max_polls = max(1, FNSKU_SCAN_INITIAL_MAX_POLLS)
-        poll_interval = max(200, FNSKU_SCAN_INITIAL_POLL_INTERVAL_MS)
-        retry_add_or_get_after = max(1, FNSKU_SCAN_RETRY_ADD_AFTER)
-        
-        # If ASIN not available, poll for it
-        if not asin or len(asin) < 10:
-            logger.info(f"⏳ ASIN not immediately available. Polling for task {task_id} (max {max_polls} attempts, ~{max_polls}s)...")
-            task_state = 0  # Initialize task_state before polling loop
-            for attempt in range(1, max_polls + 1):
-                # Retry AddOrGet after 2 polls to trigger processing
-                if attempt == retry_add_or_get_after:
-                    logger.info(f"🔄 Retrying AddOrGet to trigger processing (attempt {attempt})...")
-                    try:
-                        retry_response = requests.post(add_scan_url, headers=headers, json=payload, timeout=FNSKU_ADD_OR_GET_TIMEOUT)
-                        if retry_response.status_code == 200:
-                            retry_result = retry_response.json()
-                            if retry_result.get('succeeded') and retry_result.get('data'):
-                                scan_data = retry_result['data']
-                                # Get ASIN properly
-                                potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
-                                if potential_asin:
-                                    asin = str(potential_asin).strip()
-                                else:
-                                    asin = ''
-                                # Check if ASIN is valid (at least 10 characters, usually starts with B)
-                                if asin and len(asin) >= 10:
-                                    logger.info(f"🎉 ASIN found after retry: {asin}")
-                                    break
-                    except Exception as e:
-                        logger.warning(f"Retry AddOrGet failed: {e}")
-                
-                # Wait between polls (skip wait after retry attempt)
-                if attempt > 1 and attempt != retry_add_or_get_after + 1:
-                    import time
-                    time.sleep(poll_interval / 1000)  # 1 second between polls
-                
-                try:
-                    poll_response = requests.get(lookup_url, headers=headers, params={'BarCode': code}, timeout=FNSKU_GET_BY_BARCODE_TIMEOUT)
-                    if poll_response.status_code == 200:
-                        poll_result = poll_response.json()
-                        if poll_result.get('succeeded') and poll_result.get('data'):
-                            scan_data = poll_result['data']
-                            # Get ASIN - check multiple possible fields and handle None/empty
-                            potential_asin = scan_data.get('asin') or scan_data.get('ASIN') or scan_data.get('Asin') or ''
-                            if potential_asin:
-                                asin = str(potential_asin).strip()
-                            else:
-                                asin = ''
-                            
-                            task_state = scan_data.get('taskState') or scan_data.get('task_state', 0)
-                            
-                            # Log what we found (every attempt for debugging)
-                            logger.info(f"📊 Poll {attempt}/{max_polls}: ASIN='{asin}' (len={len(asin)}), State={task_state}")
-                            
-                            # Check if ASIN is valid (at least 10 characters, usually starts with B)
-                            if asin and len(asin) >= 10:
-                                logger.info(f"🎉🎉🎉 ASIN FOUND after {attempt} polls: '{asin}' - BREAKING POLLING LOOP NOW!")
-                                break  # Exit polling loop immediately - this should work!
-                            
-                            # If task completed/failed but no ASIN, stop
-                            if task_state in [2, 3] or scan_data.get('finishedOn'):
-                                if not asin or len(asin) < 10:
-                                    logger.warning(f"⚠️ Task {task_state} completed but no ASIN found. Stopping.")
-                                    break
-                            
-                            if attempt % 3 == 0:  # Log every 3 attempts
-                                logger.info(f"📊 Polling progress: Attempt {attempt}/{max_polls}, State: {task_state}, ASIN: '{asin or 'not found'}'")
-                except Exception as poll_error:
-                    logger.warning(f"Poll attempt {attempt} failed: {poll_error}")
-                    # Don't slow down - keep trying fast
-                
-                # Double-check ASIN after each iteration (in case it was set in retry)
-                if asin and isinstance(asin, str) and len(asin.strip()) >= 10:
-                    logger.info(f"✅ ASIN confirmed available: {asin} - exiting polling immediately")
-                    break
-            # After bounded inline poll: hand off to /api/scan/status unless the vendor task is terminal.
-            if not asin or not isinstance(asin, str) or len(asin.strip()) < 10:
-                if _is_fnsku_task_terminal(scan_data):
-                    logger.info(f"⏳ Short poll done, vendor task terminal without ASIN — returning not_in_api_database.")
-                else:
-                    logger.info(f"⏳ Short poll done, ASIN not yet available — returning lookup_still_pending for client poll.")
-        
-        # Final ASIN validation — soft misses stay pending so the first scan can still resolve via status polling.
-        if not asin or not isinstance(asin, str) or len(asin.strip()) < 10:
-            ext_ms = int((_time.time() - fnsku_external_t0) * 1000)
-            is_terminal_miss = _is_fnsku_task_terminal(scan_data)
-            # #region agent log
-            _dbg_scan_perf_log(
-                'H1',
-                'app.py:scan_product:fnsku_no_asin',
-                'terminal_not_found_after_bounded_poll' if is_terminal_miss else 'pending_after_bounded_poll',
-                {
-                    'code': code,
-                    'external_ms': ext_ms,
-                    'task_id': str(task_id) if task_id else None,
-                    'terminal': is_terminal_miss,
-                },
-            )
-            # #endregion
-            if is_terminal_miss:
+
+        if outcome['status'] in ('pending', 'not_found'):
+            if outcome['status'] == 'not_found':
                 _mark_negatively_cached(code)
                 not_found_response = {
                     "success": True,
@@ -5106,6 +7322,9 @@ def scan_product():
                 "bar_code": code,
                 "source": "fnsku_external",
             }
+            if outcome.get('queued'):
+                # Vendor breaker open: nothing was sent yet, the resolver will create the task.
+                pending_response['queued'] = True
             if supabase_admin and user_id:
                 log_scan_to_history(
                     user_id, tenant_id, code, code or '', supabase_admin,
@@ -5117,159 +7336,6 @@ def scan_product():
                     pending_response['scan_count'] = scan_count_data
             return jsonify(pending_response), 200
         
-        # #region agent log
-        _dbg_scan_perf_log('H1', 'app.py:scan_product:fnsku_asin_ok', 'asin_resolved', {
-            'code': code, 'external_ms': int((_time.time() - fnsku_external_t0) * 1000),
-            'asin_len': len(str(asin).strip()) if asin else 0,
-        })
-        # #endregion
-        scan_server_perf_mark('after_fnsku_external_asin')
-        
-        # STEP 4: If we have ASIN, optionally fetch from Rainforest API.
-        # Standard scans can skip enrichment for faster first response; force_api_lookup keeps full enrichment.
-        rainforest_data = None
-        should_fetch_rainforest = bool(force_api_lookup) or (not SKIP_RAINFOREST_ON_STANDARD_SCAN)
-        logger.info(
-            f"🔍 Checking Rainforest API conditions - ASIN: '{asin}' (len={len(asin) if asin else 0}), "
-            f"API Key: {'SET' if RAINFOREST_API_KEY else 'MISSING'}, should_fetch={should_fetch_rainforest}, force_api_lookup={force_api_lookup}"
-        )
-        
-        if asin and len(asin) >= 10 and should_fetch_rainforest:
-            if not RAINFOREST_API_KEY:
-                logger.warning("⚠️ RAINFOREST_API_KEY not set - skipping Rainforest API call")
-            else:
-                logger.info(f"📦 Fetching product data from Rainforest API for ASIN {asin}...")
-                try:
-                    # Request product data from Rainforest API
-                    # The API returns all available images by default
-                    rainforest_response = requests.get(
-                        'https://api.rainforestapi.com/request',
-                        params={
-                            'api_key': RAINFOREST_API_KEY,
-                            'type': 'product',
-                            'amazon_domain': 'amazon.com',
-                            'asin': asin
-                        },
-                        timeout=RAINFOREST_REQUEST_TIMEOUT
-                    )
-                    
-                    logger.info(f"📡 Rainforest API response status: {rainforest_response.status_code}")
-                    
-                    if rainforest_response.status_code == 200:
-                        response_json = rainforest_response.json()
-                        logger.info(f"📦 Rainforest API response keys: {list(response_json.keys())}")
-                        logger.info(f"📦 Response includes: request_info, request_parameters, request_metadata, product, brand_store, newer_model, similar_to_consider")
-                        
-                        # SAVE COMPLETE RAINFOREST API RESPONSE - You're paying for ALL this data!
-                        # Store the ENTIRE response_json - EVERYTHING from the API
-                        # This includes: request_info, request_parameters, request_metadata, product (all fields), 
-                        # brand_store, newer_model, similar_to_consider, and any other data
-                        rainforest_full_response = response_json
-                        response_size_bytes = len(json.dumps(response_json))
-                        logger.info(f"💾 Complete response size: {response_size_bytes:,} bytes - Storing EVERYTHING for future data sales")
-                        
-                        if response_json.get('product'):
-                            product = response_json['product']
-                            logger.info(f"✅ Product found in Rainforest response. Title: {product.get('title', 'N/A')[:50]}...")
-                            
-                            # Collect ALL images from Rainforest API
-                            all_images = []
-                            
-                            # Add main_image if it exists
-                            main_image_link = product.get('main_image', {}).get('link')
-                            if main_image_link:
-                                all_images.append(main_image_link)
-                            
-                            # Add all images from images array
-                            images_array = product.get('images', [])
-                            if images_array:
-                                for img in images_array:
-                                    img_link = img.get('link') if isinstance(img, dict) else img
-                                    if img_link and img_link not in all_images:  # Avoid duplicates
-                                        all_images.append(img_link)
-                            
-                            # Fallback: if no images collected, try images_flat
-                            if not all_images and product.get('images_flat'):
-                                images_flat = product.get('images_flat', '')
-                                if images_flat:
-                                    flat_images = [url.strip() for url in images_flat.split(',') if url.strip()]
-                                    all_images.extend(flat_images)
-                            
-                            # Log image count for debugging
-                            logger.info(f"📸 Collected {len(all_images)} images from Rainforest API for ASIN {asin}")
-                            
-                            # If we only got one image, log a warning (might need to re-fetch)
-                            if len(all_images) == 1:
-                                logger.warning(f"⚠️ Only 1 image found for ASIN {asin}. Product may have more images available.")
-                            
-                            # Primary image (first one) for backward compatibility
-                            primary_image = all_images[0] if all_images else ''
-                            
-                            # Extract videos from product data
-                            videos_additional = product.get('videos_additional', [])
-                            videos_count = product.get('videos_count', len(videos_additional))
-                            
-                            # Extract commonly used fields for quick access
-                            rainforest_data = {
-                                'title': product.get('title', ''),
-                                'image': primary_image,  # Primary image for backward compatibility
-                                'images': all_images,  # ALL images as array
-                                'images_count': len(all_images),
-                                'videos': videos_additional,  # ALL videos as array
-                                'videos_count': videos_count,
-                                'price': _rainforest_retail_price_from_product(product),
-                                'rating': product.get('rating'),
-                                'reviews_count': product.get('reviews_total'),
-                                'brand': product.get('brand', ''),
-                                'category': _rainforest_category_from_product(product),
-                                'description': product.get('description', ''),
-                                # Store the FULL response for access to everything
-                                'full_response': rainforest_full_response  # Complete response with all data
-                            }
-                            
-                            if videos_count > 0:
-                                logger.info(f"🎥 Found {videos_count} videos for ASIN {asin}")
-                            logger.info(f"✅ Rainforest API data retrieved for ASIN {asin}: title={rainforest_data.get('title', '')[:50]}, price={rainforest_data.get('price')}, brand={rainforest_data.get('brand')}, images_count={rainforest_data.get('images_count', 0)}")
-                            logger.info(f"💾 Storing complete Rainforest API response ({len(str(rainforest_full_response))} chars) - includes request_info, product, brand_store, newer_model, similar_to_consider, etc.")
-                            
-                            # Verify all expected keys are in the response
-                            expected_keys = ['request_info', 'request_parameters', 'request_metadata', 'product', 'brand_store']
-                            missing_keys = [key for key in expected_keys if key not in rainforest_full_response]
-                            if missing_keys:
-                                logger.warning(f"⚠️ Missing keys in response: {missing_keys}")
-                            else:
-                                logger.info(f"✅ All expected keys present in response")
-                            
-                            # Log presence of optional keys
-                            optional_keys = ['newer_model', 'similar_to_consider']
-                            for key in optional_keys:
-                                if key in rainforest_full_response:
-                                    logger.info(f"✅ {key} present in response")
-                                else:
-                                    logger.info(f"ℹ️ {key} not present in response (may not be available for this product)")
-                        else:
-                            logger.warning(f"⚠️ Rainforest API response does not contain 'product' key. Response: {str(response_json)[:200]}")
-                            # Even if no product, save the complete response anyway
-                            rainforest_full_response = response_json
-                            rainforest_data = {
-                                'full_response': rainforest_full_response
-                            }
-                    else:
-                        logger.error(f"❌ Rainforest API returned status {rainforest_response.status_code}. Response: {rainforest_response.text[:200]}")
-                except requests.exceptions.Timeout:
-                    logger.error("❌ Rainforest API timeout after 15 seconds")
-                except Exception as rf_error:
-                    logger.error(f"❌ Rainforest API error: {type(rf_error).__name__}: {str(rf_error)}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-        else:
-            if not should_fetch_rainforest:
-                logger.info(f"⏩ Skipping Rainforest API for standard scan (force_api_lookup={force_api_lookup}).")
-            else:
-                logger.warning(f"⚠️ Cannot call Rainforest API - ASIN invalid: '{asin}' (len={len(asin) if asin else 0})")
-        scan_server_perf_mark('after_rainforest_block')
-        
-        # STEP 5: Build response and save to cache (shared helper used by POST /api/scan and GET /api/scan/status)
         if not scan_data:
             logger.error(f"❌ scan_data is None when building response for FNSKU {code}")
             return jsonify({
@@ -5277,8 +7343,9 @@ def scan_product():
                 "error": "Internal server error",
                 "message": "Failed to retrieve scan task data. Please try again."
             }), 500
-        response_data, cache_row_id = _build_fnsku_scan_response_and_save(code, asin, scan_data, rainforest_data, supabase_admin)
-        scan_server_perf_mark('after_db_save_build')
+        # Callers that joined an in-flight lookup get their own copy to attach per-user fields to.
+        response_data = dict(outcome['response_data'])
+        cache_row_id = outcome.get('cache_row_id')
         
         # Log scan event for Stripe usage tracking and local analytics
         # Also record the scan in scan_history so free trial limits and reporting work.
@@ -5300,7 +7367,7 @@ def scan_product():
                     'fnsku_scanned': code,
                     'asin_retrieved': asin,
                     'api_source': 'fnskutoasin.com',
-                    'is_charged_call': True,
+                    'is_charged_call': not coalesced,
                 }
                 if cache_row_id is not None:
                     log_payload['api_lookup_cache_id'] = cache_row_id
@@ -5316,28 +7383,14 @@ def scan_product():
                 response_data['scan_count'] = scan_count_data
         
         # Log final response status
-        print("\n" + "=" * 60)
-        print("FINAL RESPONSE STATUS:")
-        print(f"   - saved_to_cache: {response_data.get('saved_to_cache', 'NOT SET')}")
-        print(f"   - cached: {response_data.get('cached', False)}")
-        print(f"   - asin: {asin}")
-        print(f"   - fnsku: {code}")
-        print(f"   - supabase_admin exists: {supabase_admin is not None}")
-        print("=" * 60 + "\n")
-        
-        logger.info(f"📤 FINAL RESPONSE STATUS:")
-        logger.info(f"   - saved_to_cache: {response_data.get('saved_to_cache', 'NOT SET')}")
-        logger.info(f"   - cached: {response_data.get('cached', False)}")
-        logger.info(f"   - asin: {asin}")
-        logger.info(f"   - fnsku: {code}")
-        logger.info(f"   - supabase_admin exists: {supabase_admin is not None}")
+        scan_log.info(
+            "📤 SCAN RESPONSE fnsku=%s asin=%s cached=%s saved_to_cache=%s",
+            code, asin, response_data.get('cached', False), response_data.get('saved_to_cache', 'NOT SET'),
+        )
         
         # CRITICAL: If save failed but we have valid ASIN, log warning
         if asin and len(asin) >= 10 and not response_data.get('saved_to_cache'):
             error_msg = f"❌❌❌ WARNING: Valid ASIN '{asin}' but saved_to_cache is False!"
-            print(f"\n{error_msg}")
-            print(f"   This means the save to api_lookup_cache FAILED or was SKIPPED")
-            print(f"   Check logs above for error messages\n")
             logger.error(error_msg)
             logger.error(f"   This means the save to api_lookup_cache FAILED or was SKIPPED")
             logger.error(f"   Check logs above for error messages")
@@ -5520,19 +7573,32 @@ def scan_product_batch():
                 # Two cheap IN-list queries cover the common code types.
                 try:
                     res_fnsku = supabase_admin.table('api_lookup_cache') \
-                        .select('id,fnsku,asin,product_name,price,image_url,category,description,upc,api_source,updated_at,created_at,lookup_count,rainforest_raw_data') \
+                        .select('id,fnsku,asin,product_name,price,image_url,category,description,upc,api_source,updated_at,created_at,lookup_count,scan_projection') \
                         .in_('fnsku', codes).execute()
                     bulk_rows.extend(getattr(res_fnsku, 'data', None) or [])
                 except Exception as e:
                     logger.warning(f"Bulk cache fnsku prefetch failed: {e}")
                 try:
                     res_asin = supabase_admin.table('api_lookup_cache') \
-                        .select('id,fnsku,asin,product_name,price,image_url,category,description,upc,api_source,updated_at,created_at,lookup_count,rainforest_raw_data') \
+                        .select('id,fnsku,asin,product_name,price,image_url,category,description,upc,api_source,updated_at,created_at,lookup_count,scan_projection') \
                         .in_('asin', codes).execute()
                     bulk_rows.extend(getattr(res_asin, 'data', None) or [])
                 except Exception as e:
                     logger.warning(f"Bulk cache asin prefetch failed: {e}")
 
+                # Rows written before scan_projection existed: fetch their raw blob in one query.
+                unprojected_ids = list({row['id'] for row in bulk_rows if not row.get('scan_projection') and row.get('id')})
+                if unprojected_ids:
+                    try:
+                        res_raw = supabase_admin.table('api_lookup_cache') \
+                            .select('id,rainforest_raw_data').in_('id', unprojected_ids).execute()
+                        raw_by_id = {r.get('id'): r.get('rainforest_raw_data') for r in (getattr(res_raw, 'data', None) or [])}
+                        for row in bulk_rows:
+                            if row.get('id') in raw_by_id:
+                                row['rainforest_raw_data'] = raw_by_id[row['id']]
+                    except Exception as e:
+                        logger.warning(f"Bulk cache raw data fetch failed: {e}")
+
                 indexed = {}
                 for row in bulk_rows:
                     fnsku = (row.get('fnsku') or '').upper()
@@ -5561,7 +7627,7 @@ def scan_product_batch():
                     except Exception:
                         if image_field:
                             images = [image_field]
-                    rb, rc, rd = _brand_category_description_from_rainforest_raw(cached)
+                    proj = _scan_projection(cached)
                     results[code] = {
                         'success': True,
                         'asin': cached.get('asin') or '',
@@ -5571,9 +7637,9 @@ def scan_product_batch():
                         'image': images[0] if images else '',
                         'images': images,
                         'images_count': len(images),
-                        'brand': rb or (cached.get('brand') or ''),
-                        'category': (cached.get('category') or '') or rc,
-                        'description': (cached.get('description') or '') or rd,
+                        'brand': proj['brand'],
+                        'category': (cached.get('category') or '') or proj['category'],
+                        'description': (cached.get('description') or '') or proj['description'],
                         'upc': cached.get('upc') or '',
                         'amazon_url': f"https://www.amazon.com/dp/{cached.get('asin')}" if cached.get('asin') else '',
                         'source': 'cache',
@@ -5596,52 +7662,16 @@ def scan_product_batch():
                 logger.warning(f"Batch bulk prefetch failed, falling back to thread pool only: {e}")
                 codes_to_thread = list(codes)
 
-        # ---- Bulk-log the fast-path scans to scan_history ----
-        # One SELECT to find which codes the user has already scanned (those
-        # do not count again), then ONE bulk INSERT for the new ones. Keeps
-        # trial enforcement accurate without N round-trips.
+        # ---- Queue the fast-path scans for scan_history ----
+        # The queued writer deduplicates and bulk-inserts them with every other
+        # scan in the next flush; pending scans already count toward the trial.
         if fast_path_codes_for_logging and supabase_admin:
-            try:
-                fp_codes_only = [r['code'] for r in fast_path_codes_for_logging]
-                dedup_q = supabase_admin.from_('scan_history').select('scanned_code') \
-                    .eq('user_id', user_id).in_('scanned_code', fp_codes_only)
-                if tenant_id:
-                    dedup_q = dedup_q.eq('tenant_id', tenant_id)
-                else:
-                    dedup_q = dedup_q.is_('tenant_id', 'null')
-                dedup_res = dedup_q.execute()
-                already_scanned = {row.get('scanned_code') for row in (getattr(dedup_res, 'data', None) or [])}
-
-                now_iso = datetime.now(timezone.utc).isoformat()
-                new_rows = []
-                for entry in fast_path_codes_for_logging:
-                    if entry['code'] in already_scanned:
-                        continue
-                    row = {
-                        'user_id': user_id,
-                        'scanned_code': entry['code'],
-                        'scanned_at': now_iso,
-                    }
-                    if tenant_id:
-                        row['tenant_id'] = tenant_id
-                    if entry.get('cache_id') is not None:
-                        row['api_lookup_cache_id'] = entry['cache_id']
-                    if entry.get('product_name'):
-                        row['product_description'] = str(entry['product_name'])[:2000]
-                    new_rows.append(row)
-                if new_rows:
-                    supabase_admin.table('scan_history').insert(new_rows).execute()
-                    # Invalidate the count cache so the response below reflects reality.
-                    try:
-                        with _ttl_cache_lock:
-                            keys_to_drop = [k for k in _ttl_cache_store.keys() if k[0] == 'get_used_scan_count']
-                            for k in keys_to_drop:
-                                _ttl_cache_store.pop(k, None)
-                    except Exception:
-                        pass
-                    logger.info(f"Batch fast path: bulk-logged {len(new_rows)} new scans to scan_history")
-            except Exception as e:
-                logger.warning(f"Batch fast-path scan_history bulk insert failed: {e}")
+            for entry in fast_path_codes_for_logging:
+                log_scan_to_history(
+                    user_id, tenant_id, entry['code'], '', supabase_admin,
+                    api_lookup_cache_id=entry.get('cache_id'),
+                    product_description=entry.get('product_name') or None,
+                )
 
         # ---- Attach scan_count to one fast-path result so the UI updates ----
         if results and supabase_admin:
@@ -5729,10 +7759,27 @@ def _scan_count_for_response(user_id, tenant_id):
         return None
 
 
+def _scan_status_cache_response(cached, code):
+    """Scan payload for an api_lookup_cache row that already has an ASIN (shared by /api/scan/status and /api/scan/stream)."""
+    cached_asin = (cached.get('asin') or '').strip()
+    proj = _scan_projection(cached)
+    all_images = proj['images']
+    return {
+        "success": True, "fnsku": cached.get('fnsku', code), "asin": cached_asin,
+        "title": cached.get('product_name', ''), "price": proj['price'],
+        "image": all_images[0] if all_images else (cached.get('image_url') or ''),
+        "images": all_images, "images_count": len(all_images), "videos": proj['videos'], "videos_count": proj['videos_count'],
+        "brand": proj['brand'], "category": proj['category'], "description": proj['description'], "upc": cached.get('upc', ''),
+        "amazon_url": f"https://www.amazon.com/dp/{cached_asin}" if cached_asin else '',
+        "source": "cache", "cost_status": "no_charge", "cached": True
+    }
+
+
 @app.route('/api/scan/status', methods=['GET'])
 def scan_status():
     """
-    Lightweight poll endpoint for scan progress. Check cache first; if miss, call FNSKU GetByBarCode once.
+    Lightweight poll endpoint for scan progress. Check cache first, then the background resolver's
+    view of the task; only codes the resolver does not own yet cost one FNSKU GetByBarCode call.
     If ASIN now present, call Rainforest, save cache, return full data.
     If still no ASIN after many attempts (attempt>=5), return not_in_api_database so the app can show a clear "not in database" message.
     """
@@ -5748,51 +7795,11 @@ def scan_status():
     if not supabase_admin:
         return jsonify({"success": False, "error": "Service unavailable", "message": "Database not available"}), 503
     try:
-        cache_result = supabase_admin.table('api_lookup_cache').select('*').eq('fnsku', code).limit(1).execute()
-        cached = (cache_result.data[0] if (cache_result and getattr(cache_result, 'data', None) and len(cache_result.data) > 0) else None)
+        cached = _api_cache_lookup(supabase_admin, 'fnsku', code)
         if cached:
             cached_asin = (cached.get('asin') or '').strip()
             if cached_asin and len(cached_asin) >= 10:
-                all_images = []
-                try:
-                    image_url_data = cached.get('image_url', '')
-                    if image_url_data:
-                        parsed = json.loads(image_url_data) if isinstance(image_url_data, str) else image_url_data
-                        all_images = parsed if isinstance(parsed, list) else ([image_url_data] if image_url_data else [])
-                except Exception:
-                    all_images = [cached.get('image_url')] if cached.get('image_url') else []
-                if cached.get('rainforest_raw_data'):
-                    for u in _all_image_urls_from_rainforest_raw(cached):
-                        if u and u not in all_images:
-                            all_images.append(u)
-                videos = []
-                videos_count = 0
-                if cached.get('rainforest_raw_data'):
-                    try:
-                        raw = cached.get('rainforest_raw_data')
-                        raw = json.loads(raw) if isinstance(raw, str) else raw
-                        if raw and raw.get('product'):
-                            p = raw['product']
-                            videos = p.get('videos_additional', []) or []
-                            videos_count = p.get('videos_count', len(videos))
-                    except Exception:
-                        pass
-                brand, cat, desc = _brand_category_description_from_rainforest_raw(cached)
-                if not brand:
-                    brand = cached.get('brand', '')
-                if not cat:
-                    cat = cached.get('category', '')
-                if not desc:
-                    desc = cached.get('description', '')
-                full_response = {
-                    "success": True, "fnsku": cached.get('fnsku', code), "asin": cached_asin,
-                    "title": cached.get('product_name', ''), "price": str(cached.get('price', 0)) if cached.get('price') else '',
-                    "image": all_images[0] if all_images else (cached.get('image_url') or ''),
-                    "images": all_images, "images_count": len(all_images), "videos": videos, "videos_count": videos_count,
-                    "brand": brand, "category": cat, "description": desc, "upc": cached.get('upc', ''),
-                    "amazon_url": f"https://www.amazon.com/dp/{cached_asin}" if cached_asin else '',
-                    "source": "cache", "cost_status": "no_charge", "cached": True
-                }
+                full_response = _scan_status_cache_response(cached, code)
                 if include_scan_count:
                     scan_count_data = _scan_count_for_response(user_id, tenant_id)
                     if scan_count_data:
@@ -5811,10 +7818,52 @@ def scan_status():
                 "message": "FNSKU API key not configured on server.",
                 "bar_code": code,
             }), 200
-        BASE_URL = "https://ato.fnskutoasin.com"
+        # The background resolver already owns this code: answer from memory instead of re-polling the vendor.
+        tracked = _fnsku_resolver_status(code)
+        if tracked and tracked['state'] == 'resolved' and tracked.get('response'):
+            response_data = dict(tracked['response'])
+            if include_scan_count:
+                scan_count_data = _scan_count_for_response(user_id, tenant_id)
+                if scan_count_data:
+                    response_data['scan_count'] = scan_count_data
+            return jsonify(response_data)
+        if tracked and tracked['state'] in ('pending', 'not_found'):
+            tracked_scan = tracked.get('scan_data') or {}
+            tracked_title = tracked_scan.get('productName') or tracked_scan.get('name') or f"FNSKU: {code}"
+            tracked_task_id = str(tracked['task_id']) if tracked.get('task_id') else None
+            if tracked['state'] == 'not_found' or attempt >= FNSKU_NOT_IN_DATABASE_ATTEMPTS:
+                return jsonify({
+                    "success": True, "processing": False, "lookup_still_pending": False,
+                    "not_in_api_database": True, "not_found": True,
+                    "fnsku": code, "asin": "", "title": tracked_title,
+                    "message": FNSKU_NOT_IN_DATABASE_MESSAGE,
+                    "scan_task_id": tracked_task_id, "bar_code": code
+                }), 200
+            return jsonify({
+                "success": True,
+                "processing": True,
+                "lookup_still_pending": True,
+                "fnsku": code,
+                "asin": "",
+                "title": tracked_title,
+                "message": FNSKU_PROCESSING_MESSAGE,
+                "scan_task_id": tracked_task_id,
+                "bar_code": code,
+            }), 200
         headers = {'api-key': FNSKU_API_KEY, 'Content-Type': 'application/json', 'Accept': 'application/json'}
-        lookup_url = f"{BASE_URL}/api/v1/ScanTask/GetByBarCode"
-        resp = requests.get(lookup_url, headers=headers, params={'BarCode': code}, timeout=FNSKU_STATUS_LOOKUP_TIMEOUT)
+        lookup_url = f"{_FNSKU_BASE_URL}/api/v1/ScanTask/GetByBarCode"
+        try:
+            resp = _fnsku_vendor_request('GET', lookup_url, headers=headers, params={'BarCode': code}, timeout=FNSKU_STATUS_LOOKUP_TIMEOUT)
+        except upstream_http.CircuitOpenError:
+            # Vendor down: keep the client waiting (a resolver task may already be queued).
+            return jsonify({
+                "success": True,
+                "processing": True,
+                "lookup_still_pending": True,
+                "fnsku": code,
+                "message": FNSKU_PROCESSING_MESSAGE,
+                "bar_code": code,
+            }), 200
         try:
             fnsku_json = resp.json() if resp.text and resp.text.strip() else {}
         except (ValueError, json.JSONDecodeError, requests.exceptions.JSONDecodeError) as json_err:
@@ -5862,6 +7911,8 @@ def scan_status():
                     "message": FNSKU_NOT_IN_DATABASE_MESSAGE,
                     "scan_task_id": str(scan_data.get('id')) if scan_data.get('id') else None, "bar_code": code
                 }), 200
+            # Not tracked here yet (another worker took the scan, or this process restarted).
+            _fnsku_resolver_submit(code, scan_data, fetch_rainforest=include_enrichment)
             return jsonify({
                 "success": True,
                 "processing": True,
@@ -5876,9 +7927,7 @@ def scan_status():
         rainforest_data = None
         if include_enrichment and RAINFOREST_API_KEY:
             try:
-                rf_resp = requests.get('https://api.rainforestapi.com/request', params={
-                    'api_key': RAINFOREST_API_KEY, 'type': 'product', 'amazon_domain': 'amazon.com', 'asin': asin
-                }, timeout=RAINFOREST_REQUEST_TIMEOUT)
+                rf_resp = _rainforest_get_product_shared(asin, key=RAINFOREST_API_KEY)
                 if rf_resp.status_code == 200:
                     response_json = rf_resp.json()
                     rainforest_full_response = response_json
@@ -5917,6 +7966,158 @@ def scan_status():
         return jsonify({"success": False, "error": "Internal server error", "message": str(e)}), 500
 
 
+@app.route('/api/scan/stream', methods=['GET'])
+def scan_stream():
+    """
+    Server-Sent Events alternative to polling /api/scan/status.
+    Subscribe with ?codes=CODE1,CODE2 (or ?code=CODE). Each code gets exactly one event:
+    `resolved` (same payload as a successful /api/scan/status), `not_in_api_database`, or
+    `timeout` when it is still pending after SCAN_STREAM_TIMEOUT_SECONDS (fall back to status polling).
+    The stream then ends with a `done` event. Comment lines are sent as keep-alives.
+    Only codes that already have a vendor task (tracked by the resolver, or a scan_task_id in
+    api_lookup_cache) are watched; the stream never starts vendor work, so any other code gets
+    `timeout` straight away.
+    """
+    user_id, _tenant_id = get_ids_from_request()
+    if not user_id:
+        return jsonify({
+            "success": False,
+            "error": "unauthorized",
+            "message": "User authentication required"
+        }), 401
+    codes = []
+    for raw_code in (request.args.get('codes') or request.args.get('code') or '').split(','):
+        c = raw_code.strip().upper()
+        if c and c not in codes:
+            codes.append(c)
+    if not codes:
+        return jsonify({"success": False, "error": "Invalid code", "message": "Query param 'codes' is required"}), 400
+    if not all(re.fullmatch(r'[A-Z0-9]{6,40}', c) for c in codes):
+        return jsonify({"success": False, "error": "Invalid code", "message": "Codes must be 6-40 letters or digits"}), 400
+    if len(codes) > SCAN_STREAM_MAX_CODES:
+        return jsonify({
+            "success": False, "error": "Too many codes",
+            "message": f"Subscribe to at most {SCAN_STREAM_MAX_CODES} codes per stream"
+        }), 400
+    if not supabase_admin:
+        return jsonify({"success": False, "error": "Service unavailable", "message": "Database not available"}), 503
+    include_enrichment = str(request.args.get('include_enrichment', '')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def _event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+    def _not_found_payload(code, scan_data=None):
+        scan_data = scan_data or {}
+        return {
+            "success": True, "processing": False, "lookup_still_pending": False,
+            "not_in_api_database": True, "not_found": True, "fnsku": code, "asin": "",
+            "title": scan_data.get('productName') or scan_data.get('name') or f"FNSKU: {code}",
+            "message": FNSKU_NOT_IN_DATABASE_MESSAGE, "bar_code": code,
+        }
+
+    def _timeout_payload(code):
+        return {
+            "success": True, "processing": True, "lookup_still_pending": True, "fnsku": code,
+            "message": FNSKU_PROCESSING_MESSAGE, "bar_code": code,
+        }
+
+    def _settled_event(code):
+        """Event for a code the resolver has finished with, or None while it is still pending."""
+        tracked = _fnsku_resolver_status(code)
+        if not tracked or tracked['state'] == 'expired':
+            return _event('timeout', _timeout_payload(code))
+        if tracked['state'] == 'resolved' and tracked.get('response'):
+            return _event('resolved', tracked['response'])
+        if tracked['state'] == 'not_found':
+            return _event('not_in_api_database', _not_found_payload(code, tracked.get('scan_data')))
+        return None
+
+    def _generate():
+        deadline = _time.time() + max(1.0, SCAN_STREAM_TIMEOUT_SECONDS)
+        pending = []
+        # Settle what we can right away: cache hits, known misses, codes this worker already tracks.
+        for code in codes:
+            if _is_negatively_cached(code):
+                yield _event('not_in_api_database', _not_found_payload(code))
+                continue
+            try:
+                cached = _api_cache_lookup(supabase_admin, 'fnsku', code)
+            except Exception as e:
+                logger.warning(f"scan_stream cache lookup failed for {code}: {e}")
+                cached = None
+            if cached and len(str(cached.get('asin') or '').strip()) >= 10:
+                yield _event('resolved', _scan_status_cache_response(cached, code))
+                continue
+            tracked = _fnsku_resolver_status(code)
+            task_id = (cached or {}).get('scan_task_id')
+            if tracked and tracked['state'] != 'expired':
+                pending.append(code)
+            elif task_id and _fnsku_resolver_submit(
+                code, {'id': task_id, 'barCode': code}, fetch_rainforest=include_enrichment
+            ):
+                # The vendor task exists (scanned on another worker): the resolver only polls it.
+                pending.append(code)
+            else:
+                yield _event('timeout', _timeout_payload(code))
+        while pending:
+            remaining = deadline - _time.time()
+            if remaining <= 0:
+                break
+            with _fnsku_resolver_done:
+                _fnsku_resolver_done.wait(min(remaining, max(1.0, SCAN_STREAM_HEARTBEAT_SECONDS)))
+            settled_any = False
+            for code in list(pending):
+                event = _settled_event(code)
+                if event:
+                    pending.remove(code)
+                    settled_any = True
+                    yield event
+            if not settled_any:
+                yield ": keep-alive\n\n"
+        for code in pending:
+            yield _event('timeout', _timeout_payload(code))
+        yield _event('done', {"codes": codes})
+
+    return Response(
+        stream_with_context(_generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/fnsku/callback', methods=['POST'])
+def fnsku_callback():
+    """
+    Receiver for the FNSKU vendor's task-completed notification (the callbackUrl sent with AddOrGet).
+    The URL carries FNSKU_CALLBACK_SECRET as ?token= (an X-Callback-Token header is accepted too).
+    The body is the vendor ScanTask, optionally wrapped as {"succeeded": ..., "data": {...}}.
+    Finished tasks are settled by the background resolver (Rainforest + cache save), which also
+    wakes /api/scan/stream subscribers.
+    """
+    if not FNSKU_CALLBACK_SECRET:
+        return jsonify({"success": False, "error": "not_configured", "message": "FNSKU callbacks are not enabled"}), 404
+    token = str(request.args.get('token') or request.headers.get('X-Callback-Token') or '')
+    if not hmac.compare_digest(token.encode('utf-8'), FNSKU_CALLBACK_SECRET.encode('utf-8')):
+        logger.warning("Rejected FNSKU callback with invalid token")
+        return jsonify({"success": False, "error": "forbidden", "message": "Invalid callback token"}), 403
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get('data'), dict):
+        data = data['data']
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "invalid_json", "message": "JSON ScanTask body is required"}), 400
+    code = str(data.get('barCode') or data.get('BarCode') or data.get('bar_code') or '').strip().upper()
+    if not re.fullmatch(r'[A-Z0-9]{6,40}', code):
+        return jsonify({"success": False, "error": "invalid_code", "message": "barCode is missing or malformed"}), 400
+    if not supabase_admin:
+        return jsonify({"success": False, "error": "Service unavailable", "message": "Database not available"}), 503
+    if not _fnsku_asin_from_scan_data(data) and not _is_fnsku_task_terminal(data):
+        # Progress notification without a result; the resolver keeps the task.
+        return jsonify({"success": True, "accepted": False, "bar_code": code, "message": "Task not finished"}), 202
+    data = dict(data, barCode=code)
+    _fnsku_resolver_accept_callback(data)
+    return jsonify({"success": True, "accepted": True, "bar_code": code}), 202
+
+
 # OLD HTML TEMPLATE ROUTES - COMMENTED OUT (React frontend handles routing)
 # @app.route('/dashboard')
 # def dashboard():
@@ -5956,7 +8157,7 @@ def get_ebay_token():
         'scope': 'https://api.ebay.com/oauth/api_scope/sell.marketing.readonly https://api.ebay.com/oauth/api_scope/sell.marketing https://api.ebay.com/oauth/api_scope/sell.inventory.readonly https://api.ebay.com/oauth/api_scope/sell.inventory'
     }
     
-    response = requests.post(token_url, headers=headers, data=data)
+    response = upstream_http.post(token_url, headers=headers, data=data)
     
     if response.status_code == 200:
         return response.json().get('access_token')
@@ -6014,7 +8215,7 @@ def create_ebay_listing():
         
         # Create inventory item first
         inventory_key = data.get('sku', f"item-{data.get('title', '').replace(' ', '-')}")
-        response = requests.put(f"{listing_url}/{inventory_key}", 
+        response = upstream_http.put(f"{listing_url}/{inventory_key}", 
                               headers=headers, 
                               json=ebay_data)
         
@@ -6041,7 +8242,7 @@ def create_ebay_listing():
                 }
             }
             
-            offer_response = requests.post(offer_url, headers=headers, json=offer_data)
+            offer_response = upstream_http.post(offer_url, headers=headers, json=offer_data)
             
             if offer_response.status_code in [200, 201]:
                 return jsonify({
@@ -6129,7 +8330,7 @@ def create_shopify_product():
             'Content-Type': 'application/json'
         }
         
-        response = requests.post(shopify_url, headers=headers, json=data)
+        response = upstream_http.post(shopify_url, headers=headers, json=data)
         
         if response.status_code in [200, 201]:
             return jsonify({
@@ -6163,7 +8364,7 @@ def get_shopify_collections():
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(shopify_url, headers=headers)
+        response = upstream_http.get(shopify_url, headers=headers)
         
         if response.status_code == 200:
             collections = response.json().get('collections', [])
@@ -6554,8 +8755,7 @@ def delete_user(user_id):
         current_user_id, tenant_id = get_ids_from_request()
         delete_run_id = f"delete-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
         # region agent log
-        with open('debug-bff232.log', 'a', encoding='utf-8') as _dbg:
-            _dbg.write(json.dumps({"sessionId":"bff232","runId":delete_run_id,"hypothesisId":"H6","location":"app.py:delete_user:start","message":"Delete user request received","data":{"requesterId":current_user_id or None,"targetUserId":user_id or None,"hasTenant":bool(tenant_id)},"timestamp":int(datetime.now(timezone.utc).timestamp()*1000)}) + '\n')
+        _debug_event('bff232', 'H6', 'app.py:delete_user:start', 'Delete user request received', {"requesterId":current_user_id or None,"targetUserId":user_id or None,"hasTenant":bool(tenant_id)}, run_id=delete_run_id)
         # endregion
         if not current_user_id:
             return jsonify({'error': 'Unauthorized'}), 401
@@ -6572,15 +8772,13 @@ def delete_user(user_id):
                 return jsonify({'error': str(response.error)}), 500
 
             # region agent log
-            with open('debug-bff232.log', 'a', encoding='utf-8') as _dbg:
-                _dbg.write(json.dumps({"sessionId":"bff232","runId":delete_run_id,"hypothesisId":"H6","location":"app.py:delete_user:result","message":"Delete user completed","data":{"targetUserId":user_id or None,"success":True},"timestamp":int(datetime.now(timezone.utc).timestamp()*1000)}) + '\n')
+            _debug_event('bff232', 'H6', 'app.py:delete_user:result', 'Delete user completed', {"targetUserId":user_id or None,"success":True}, run_id=delete_run_id)
             # endregion
             return jsonify({'message': 'User deleted successfully'}), 200
         except Exception as delete_error:
             logger.error(f"Error deleting user: {delete_error}")
             # region agent log
-            with open('debug-bff232.log', 'a', encoding='utf-8') as _dbg:
-                _dbg.write(json.dumps({"sessionId":"bff232","runId":delete_run_id,"hypothesisId":"H7","location":"app.py:delete_user:error","message":"Delete user failed","data":{"targetUserId":user_id or None,"error":str(delete_error)[:180]},"timestamp":int(datetime.now(timezone.utc).timestamp()*1000)}) + '\n')
+            _debug_event('bff232', 'H7', 'app.py:delete_user:error', 'Delete user failed', {"targetUserId":user_id or None,"error":str(delete_error)[:180]}, run_id=delete_run_id)
             # endregion
             return jsonify({'error': f'Failed to delete user: {str(delete_error)}'}), 500
 
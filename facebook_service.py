@@ -4,7 +4,7 @@ Handles Facebook OAuth, Graph API calls, and product posting
 """
 
 import os
-import requests
+import upstream_http
 import json
 import base64
 from urllib.parse import urlencode
@@ -154,14 +154,14 @@ def exchange_code_for_token(code):
     
     # Use POST instead of GET for Meta v19+ compliance and security
     # POST prevents secrets from appearing in URL parameters
-    response = requests.post(token_url, data=params)
+    response = upstream_http.post(token_url, data=params)
     response.raise_for_status()
     
     data = response.json()
     
     # Get user ID
     user_info_url = f"{GRAPH_API_BASE}/me"
-    user_response = requests.get(
+    user_response = upstream_http.get(
         user_info_url,
         params={'access_token': data['access_token']}
     )
@@ -188,7 +188,7 @@ def get_user_pages(access_token):
         'fields': 'id,name,category,access_token'
     }
     
-    response = requests.get(url, params=params)
+    response = upstream_http.get(url, params=params)
     response.raise_for_status()
     
     data = response.json()
@@ -212,7 +212,7 @@ def get_page_access_token(page_id, user_access_token):
     
     # Use POST instead of GET for Meta v19+ compliance and security
     # POST prevents secrets from appearing in URL parameters
-    response = requests.post(exchange_url, data=params)
+    response = upstream_http.post(exchange_url, data=params)
     response.raise_for_status()
     long_lived_token = response.json()['access_token']
     
@@ -223,7 +223,7 @@ def get_page_access_token(page_id, user_access_token):
         'fields': 'id,access_token'
     }
     
-    response = requests.get(pages_url, params=params)
+    response = upstream_http.get(pages_url, params=params)
     response.raise_for_status()
     
     pages = response.json().get('data', [])
@@ -269,7 +269,7 @@ def create_catalog_product(catalog_id, page_access_token, product_data):
         'access_token': page_access_token
     }
     
-    response = requests.post(url, params=params, json=fb_product)
+    response = upstream_http.post(url, params=params, json=fb_product)
     response.raise_for_status()
     
     result = response.json()
@@ -292,7 +292,7 @@ def upload_photo_to_page(page_id, page_access_token, image_url, caption=None, pu
     if caption:
         params['caption'] = caption
     
-    response = requests.post(url, params=params)
+    response = upstream_http.post(url, params=params)
     response.raise_for_status()
     
     result = response.json()
@@ -326,7 +326,7 @@ def create_page_post(page_id, page_access_token, message, photo_ids=None, produc
     if product_id:
         params['product_item'] = json.dumps({'product_id': product_id})
     
-    response = requests.post(url, params=params)
+    response = upstream_http.post(url, params=params)
     response.raise_for_status()
     
     result = response.json()
@@ -354,7 +354,7 @@ def verify_token(access_token):
         'access_token': FACEBOOK_APP_ID + '|' + FACEBOOK_APP_SECRET
     }
     
-    response = requests.get(url, params=params)
+    response = upstream_http.get(url, params=params)
     response.raise_for_status()
     
     data = response.json()
@@ -1,62 +1,151 @@
 #!/usr/bin/env python3
+import argparse
 import csv
+import io
 import json
+import os
 import psycopg2
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+# Rows sent per COPY statement; bounds memory for any file size.
+DEFAULT_BATCH_SIZE = 10000
+
 def connect_db():
     return psycopg2.connect(
-        dbname="manifests_db",
-        user="manifest_user",
-        password="manifest_password",
-        host="localhost",
-        port="5432"
+        dbname=os.environ.get("MANIFEST_DB_NAME", "manifests_db"),
+        user=os.environ.get("MANIFEST_DB_USER", "manifest_user"),
+        password=os.environ.get("MANIFEST_DB_PASSWORD", "manifest_password"),
+        host=os.environ.get("MANIFEST_DB_HOST", "localhost"),
+        port=os.environ.get("MANIFEST_DB_PORT", "5432")
     )
 
-def import_csv(csv_path):
+def iter_copy_batches(f, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Read a manifest CSV from an open file and yield (buffer, row_count) pairs, where buffer holds up to
+    batch_size rows as (raw_row, data) in COPY's CSV format. Rows are read one at a time, so only one
+    batch is ever in memory.
+    """
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if not header:
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    count = 0
+    for values in reader:
+        if not values:
+            # Blank line (csv.DictReader skipped these too)
+            continue
+        # Short rows get None for the missing columns, like csv.DictReader
+        data = dict(zip(header, values))
+        for name in header[len(values):]:
+            data[name] = None
+        writer.writerow((",".join(values), json.dumps(data)))
+        count += 1
+        if count >= batch_size:
+            buf.seek(0)
+            yield buf, count
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            count = 0
+    if count:
+        buf.seek(0)
+        yield buf, count
+
+def import_csv(csv_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load one manifest CSV into manifests with COPY FROM STDIN, batch_size rows per COPY, in a single
+    transaction (a failed file leaves nothing behind). Returns (rows, seconds); raises on error.
+    """
+    started = time.monotonic()
+    rows = 0
     conn = connect_db()
     cur = conn.cursor()
-    
+
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            # Prepare the insert statement
-            insert_query = """
-                INSERT INTO manifests (raw_row, data)
-                VALUES (%s, %s)
-            """
-            
-            # Process each row
-            for row in reader:
-                # Convert row to JSON string
-                json_data = json.dumps(dict(row))
-                # Get the raw row as a string
-                raw_row = ','.join(row.values())
-                
-                # Insert the data
-                cur.execute(insert_query, (raw_row, json_data))
-            
-            # Commit the transaction
-            conn.commit()
-            print(f"Successfully imported {cur.rowcount} rows from {csv_path}")
-            
-    except Exception as e:
-        print(f"Error importing CSV: {e}")
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for buf, count in iter_copy_batches(f, batch_size):
+                cur.copy_expert("COPY manifests (raw_row, data) FROM STDIN WITH (FORMAT csv)", buf)
+                # COPY reports the rows it wrote; fall back to what was sent on old servers
+                rows += cur.rowcount if cur.rowcount >= 0 else count
+
+        conn.commit()
+    except Exception:
         conn.rollback()
+        raise
     finally:
         cur.close()
         conn.close()
 
+    return rows, time.monotonic() - started
+
+def collect_csv_paths(paths):
+    """Expand directories to the *.csv files in them (sorted); plain files are kept as given."""
+    csv_paths = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            csv_paths.extend(sorted(p for p in path.iterdir() if p.suffix.lower() == ".csv"))
+        else:
+            csv_paths.append(path)
+    return csv_paths
+
+def format_rate(rows, seconds):
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load manifest CSV files into the manifests table.")
+    parser.add_argument("paths", nargs="+", help="CSV files, or directories of CSV files")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per COPY statement (default {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="files loaded in parallel, each on its own connection (default 1)")
+    args = parser.parse_args(argv)
+
+    csv_paths = collect_csv_paths(args.paths)
+    missing = [p for p in csv_paths if not p.exists()]
+    if missing:
+        for path in missing:
+            print(f"Error: File {path} does not exist")
+        return 1
+    if not csv_paths:
+        print("Error: No CSV files found")
+        return 1
+
+    batch_size = max(1, args.batch_size)
+    started = time.monotonic()
+    total_rows = 0
+    failed = []
+
+    def report(path, load):
+        nonlocal total_rows
+        try:
+            rows, seconds = load()
+        except Exception as e:
+            failed.append(path)
+            print(f"Error importing {path}: {e}")
+            return
+        total_rows += rows
+        print(f"Imported {rows:,} rows from {path} in {seconds:.1f}s ({format_rate(rows, seconds)})")
+
+    if args.jobs > 1 and len(csv_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(csv_paths))) as pool:
+            futures = {pool.submit(import_csv, path, batch_size): path for path in csv_paths}
+            for future in as_completed(futures):
+                report(futures[future], future.result)
+    else:
+        for path in csv_paths:
+            report(path, lambda: import_csv(path, batch_size))
+
+    elapsed = time.monotonic() - started
+    loaded = len(csv_paths) - len(failed)
+    print(f"Total: {total_rows:,} rows from {loaded}/{len(csv_paths)} files in {elapsed:.1f}s "
+          f"({format_rate(total_rows, elapsed)})")
+    return 1 if failed else 0
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python import_manifest.py <path_to_csv>")
-        sys.exit(1)
-    
-    csv_path = Path(sys.argv[1])
-    if not csv_path.exists():
-        print(f"Error: File {csv_path} does not exist")
-        sys.exit(1)
-    
-    import_csv(csv_path) 
\ No newline at end of file
+    sys.exit(main())
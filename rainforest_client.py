@@ -0,0 +1,165 @@
+"""
+Rainforest API client shared by every Amazon product lookup (scan, scan status, import enrichment).
+
+All calls go through get_product(), which adds on top of the pooled upstream_http session:
+  - a per-worker token bucket so bursts (batch scans, imports) cannot flood the vendor,
+  - a bounded retry budget with jittered backoff (retries never exceed the budget's rate),
+  - a circuit breaker that fails fast with CircuitOpenError while the vendor is degraded,
+  - latency / outcome counters exposed through metrics_snapshot().
+
+Environment:
+  RAINFOREST_API_KEY                   API key (read per call)
+  RAINFOREST_REQUEST_TIMEOUT           per-attempt timeout in seconds (default 8)
+  RAINFOREST_RATE_PER_SECOND           token bucket refill rate, 0 disables it (default 5)
+  RAINFOREST_RATE_BURST                token bucket size (default 10)
+  RAINFOREST_RATE_MAX_WAIT_SECONDS     longest a call waits for a token (default 2)
+  RAINFOREST_MAX_RETRIES               retries per call on 429 / 5xx / network errors (default 1)
+  RAINFOREST_RETRY_BUDGET_PER_SECOND   retries allowed per second across all calls (default 0.5)
+  RAINFOREST_RETRY_BUDGET_BURST        retries that may be spent at once (default 5)
+  RAINFOREST_BREAKER_FAILURES          consecutive failures that open the breaker (default 5)
+  RAINFOREST_BREAKER_OPEN_SECONDS      how long it stays open before a probe (default 30)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+import upstream_http
+from upstream_http import CircuitBreaker, CircuitOpenError, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+RAINFOREST_URL = 'https://api.rainforestapi.com/request'
+RAINFOREST_REQUEST_TIMEOUT = float(os.environ.get('RAINFOREST_REQUEST_TIMEOUT', '8'))
+RAINFOREST_RATE_PER_SECOND = float(os.environ.get('RAINFOREST_RATE_PER_SECOND', '5'))
+RAINFOREST_RATE_BURST = float(os.environ.get('RAINFOREST_RATE_BURST', '10'))
+RAINFOREST_RATE_MAX_WAIT_SECONDS = float(os.environ.get('RAINFOREST_RATE_MAX_WAIT_SECONDS', '2'))
+RAINFOREST_MAX_RETRIES = int(os.environ.get('RAINFOREST_MAX_RETRIES', '1'))
+RAINFOREST_RETRY_BUDGET_PER_SECOND = float(os.environ.get('RAINFOREST_RETRY_BUDGET_PER_SECOND', '0.5'))
+RAINFOREST_RETRY_BUDGET_BURST = float(os.environ.get('RAINFOREST_RETRY_BUDGET_BURST', '5'))
+RAINFOREST_BREAKER_FAILURES = int(os.environ.get('RAINFOREST_BREAKER_FAILURES', '5'))
+RAINFOREST_BREAKER_OPEN_SECONDS = float(os.environ.get('RAINFOREST_BREAKER_OPEN_SECONDS', '30'))
+
+_RETRY_BACKOFF_BASE_SECONDS = 0.2
+_RETRY_BACKOFF_MAX_SECONDS = 2.0
+
+
+class RainforestUnavailable(Exception):
+    """The call was not made: no API key, or no rate-limit token within the allowed wait."""
+
+
+breaker = CircuitBreaker('rainforest', RAINFOREST_BREAKER_FAILURES, RAINFOREST_BREAKER_OPEN_SECONDS)
+_rate_limiter = TokenBucket(RAINFOREST_RATE_PER_SECOND, RAINFOREST_RATE_BURST)
+_retry_budget = TokenBucket(RAINFOREST_RETRY_BUDGET_PER_SECOND, RAINFOREST_RETRY_BUDGET_BURST)
+
+_metrics_lock = threading.Lock()
+_outcomes = {}
+_latencies_ms = deque(maxlen=500)
+
+
+def api_key():
+    return os.environ.get('RAINFOREST_API_KEY') or None
+
+
+def is_configured():
+    return bool(api_key())
+
+
+def _record(outcome, elapsed_ms=None):
+    with _metrics_lock:
+        _outcomes[outcome] = _outcomes.get(outcome, 0) + 1
+        if elapsed_ms is not None:
+            _latencies_ms.append(elapsed_ms)
+
+
+def metrics_snapshot():
+    """Outcome counters, recent latency percentiles and breaker state for this worker."""
+    with _metrics_lock:
+        outcomes = dict(_outcomes)
+        latencies = sorted(_latencies_ms)
+
+    def pct(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        'breaker': breaker.state,
+        'outcomes': outcomes,
+        'latency_ms': {'samples': len(latencies), 'p50': pct(0.5), 'p95': pct(0.95), 'max': latencies[-1] if latencies else None},
+    }
+
+
+def reset():
+    """Clear breaker, limiter and metrics (tests)."""
+    global _rate_limiter, _retry_budget
+    breaker.reset()
+    _rate_limiter = TokenBucket(RAINFOREST_RATE_PER_SECOND, RAINFOREST_RATE_BURST)
+    _retry_budget = TokenBucket(RAINFOREST_RETRY_BUDGET_PER_SECOND, RAINFOREST_RETRY_BUDGET_BURST)
+    with _metrics_lock:
+        _outcomes.clear()
+        _latencies_ms.clear()
+
+
+def _retryable_status(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+def get_product(asin, *, key=None, timeout=None, max_retries=None, amazon_domain='amazon.com'):
+    """
+    Rainforest `type=product` request for asin. Returns the final requests.Response (any status).
+
+    Raises CircuitOpenError while the breaker is open, RainforestUnavailable when there is no key
+    or no rate-limit token, and the last requests exception if every attempt failed at the network level.
+    """
+    key = key or api_key()
+    if not key:
+        raise RainforestUnavailable('RAINFOREST_API_KEY not set')
+    if not breaker.allow():
+        _record('breaker_open')
+        raise CircuitOpenError('Rainforest circuit breaker is open')
+    if not _rate_limiter.acquire(RAINFOREST_RATE_MAX_WAIT_SECONDS):
+        # The breaker let this call through (possibly as its half-open probe): hand the slot back.
+        breaker.release_probe()
+        _record('throttled')
+        raise RainforestUnavailable('Rainforest rate limit reached')
+
+    timeout = RAINFOREST_REQUEST_TIMEOUT if timeout is None else timeout
+    retries_left = RAINFOREST_MAX_RETRIES if max_retries is None else max_retries
+    params = {'api_key': key, 'type': 'product', 'amazon_domain': amazon_domain, 'asin': asin}
+    attempt = 0
+    while True:
+        t0 = time.monotonic()
+        error = None
+        response = None
+        try:
+            response = upstream_http.get(RAINFOREST_URL, params=params, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            error = e
+        elapsed_ms = int((time.monotonic() - t0) * 1000)
+
+        if error is None and not _retryable_status(response.status_code):
+            breaker.record_success()
+            _record('ok' if response.status_code < 400 else 'http_4xx', elapsed_ms)
+            return response
+
+        if error is not None:
+            outcome = 'timeout' if isinstance(error, requests.exceptions.Timeout) else 'network_error'
+        else:
+            outcome = 'http_429' if response.status_code == 429 else 'http_5xx'
+        _record(outcome, elapsed_ms)
+        breaker.record_failure()
+
+        if retries_left <= 0 or not _retry_budget.try_acquire() or not breaker.allow():
+            logger.warning(f"Rainforest {outcome} for {asin} after {attempt + 1} attempt(s) ({elapsed_ms} ms)")
+            if error is not None:
+                raise error
+            return response
+        retries_left -= 1
+        attempt += 1
+        time.sleep(random.uniform(0, min(_RETRY_BACKOFF_MAX_SECONDS, _RETRY_BACKOFF_BASE_SECONDS * (2 ** attempt))))
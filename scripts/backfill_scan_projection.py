@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Fill api_lookup_cache.scan_projection for rows written before migration 026."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from supabase_migrate import connect, load_database_url, mask_database_url  # noqa: E402
+from app import SCAN_PROJECTION_VERSION, _build_scan_projection  # noqa: E402
+
+SELECT_BATCH = """
+SELECT id, fnsku, asin, product_name, price, image_url, category, description, rainforest_raw_data
+FROM api_lookup_cache
+WHERE id > %s
+  AND (scan_projection IS NULL OR {stale_check})
+ORDER BY id
+LIMIT %s
+"""
+
+
+def backfill(database_url: str, *, batch_size: int, dry_run: bool, refresh_all: bool) -> int:
+    stale_check = "TRUE" if refresh_all else "COALESCE((scan_projection->>'v')::int, 0) <> %s" % int(SCAN_PROJECTION_VERSION)
+    query = SELECT_BATCH.format(stale_check=stale_check)
+    columns = ["id", "fnsku", "asin", "product_name", "price", "image_url", "category", "description", "rainforest_raw_data"]
+
+    print(f"Target: {mask_database_url(database_url)}")
+    conn = connect(database_url)
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(query, (last_id, batch_size))
+                rows = [dict(zip(columns, r)) for r in cur.fetchall()]
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            for row in rows:
+                # NUMERIC arrives as Decimal; PostgREST (what the app reads through) returns floats.
+                if row["price"] is not None:
+                    row["price"] = float(row["price"])
+            values = [(row["id"], json.dumps(_build_scan_projection(row))) for row in rows]
+            if not dry_run:
+                with conn.cursor() as cur:
+                    execute_values(
+                        cur,
+                        "UPDATE api_lookup_cache AS c SET scan_projection = v.projection::jsonb "
+                        "FROM (VALUES %s) AS v(id, projection) WHERE c.id = v.id",
+                        values,
+                    )
+                conn.commit()
+            updated += len(values)
+            print(f"  {'would update' if dry_run else 'updated'} {updated} row(s) (last id {last_id})")
+    finally:
+        conn.close()
+
+    print(f"Done — {updated} row(s) {'need a projection' if dry_run else 'backfilled'}.")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backfill api_lookup_cache.scan_projection (migration 026).")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per SELECT/UPDATE round-trip")
+    parser.add_argument("--dry-run", action="store_true", help="Count rows without writing")
+    parser.add_argument("--all", dest="refresh_all", action="store_true", help="Recompute every row, not only missing/stale ones")
+    args = parser.parse_args()
+
+    database_url = load_database_url()
+    if not database_url:
+        print("ERROR: DATABASE_URL is missing from .env")
+        return 1
+    return backfill(database_url, batch_size=max(1, args.batch_size), dry_run=args.dry_run, refresh_all=args.refresh_all)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+-- Migration: 025_resolve_scan_product_rpc.sql
+-- One-round-trip product resolution for scans.
+-- lookup_product_for_scan used to walk api_lookup_cache -> manifest_data (LPN) ->
+-- products -> api_lookup_cache again, up to five sequential PostgREST calls on a miss.
+-- resolve_scan_product runs the same chain inside the database and returns
+-- {"product": ..., "manifest_item": ..., "source": ...} in a single call.
+--
+-- source is 'api_lookup_cache', 'products', 'manifest_data' or NULL (not found), matching
+-- the Python fallback in app.py. Runs as the caller (service role from the backend).
+-- api_lookup_cache rows come back without rainforest_raw_data (see API_CACHE_COLUMNS_SCAN).
+
+CREATE OR REPLACE FUNCTION public.resolve_scan_product(p_code text, p_code_type text DEFAULT NULL)
+ RETURNS jsonb
+ LANGUAGE plpgsql
+ STABLE
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_code TEXT := upper(trim(coalesce(p_code, '')));
+    v_type TEXT := upper(trim(coalesce(p_code_type, '')));
+    v_fnsku TEXT;
+    v_asin TEXT;
+    v_item JSONB;
+    v_product JSONB;
+BEGIN
+    IF v_code = '' THEN
+        RETURN jsonb_build_object('product', NULL, 'manifest_item', NULL, 'source', NULL);
+    END IF;
+
+    -- 1) Fast path: api_lookup_cache by fnsku OR asin
+    IF v_type IN ('ASIN', 'FNSKU', 'SKU') THEN
+        SELECT to_jsonb(c) - 'rainforest_raw_data' INTO v_product
+        FROM api_lookup_cache c
+        WHERE c.fnsku = v_code OR c.asin = v_code
+        LIMIT 1;
+        IF v_product IS NOT NULL THEN
+            RETURN jsonb_build_object('product', v_product, 'manifest_item', NULL, 'source', 'api_lookup_cache');
+        END IF;
+    END IF;
+
+    -- 2) LPN (stored in manifest_data."X-Z ASIN"), then the product behind it
+    IF v_type NOT IN ('ASIN', 'FNSKU', 'SKU', 'UPC') THEN
+        SELECT to_jsonb(m) INTO v_item
+        FROM manifest_data m
+        WHERE m."X-Z ASIN" = v_code
+        LIMIT 1;
+        IF v_item IS NOT NULL THEN
+            v_fnsku := nullif(trim(v_item->>'Fn Sku'), '');
+            v_asin := nullif(trim(v_item->>'B00 Asin'), '');
+            IF v_fnsku IS NOT NULL OR v_asin IS NOT NULL THEN
+                SELECT to_jsonb(p) INTO v_product
+                FROM products p
+                WHERE p.fnsku = v_fnsku OR p.asin = v_asin
+                LIMIT 1;
+                IF v_product IS NULL THEN
+                    SELECT to_jsonb(c) - 'rainforest_raw_data' INTO v_product
+                    FROM api_lookup_cache c
+                    WHERE c.fnsku = v_fnsku OR c.asin = v_asin
+                    LIMIT 1;
+                END IF;
+            END IF;
+            RETURN jsonb_build_object('product', v_product, 'manifest_item', v_item, 'source', 'manifest_data');
+        END IF;
+    END IF;
+
+    -- 3) products, then api_lookup_cache, by FNSKU or ASIN
+    IF v_type IN ('FNSKU', 'SKU') THEN
+        v_fnsku := v_code;
+    ELSIF v_type = 'ASIN' THEN
+        v_asin := v_code;
+    ELSIF length(v_code) > 10 THEN
+        v_fnsku := v_code;
+    ELSIF length(v_code) = 10 THEN
+        v_asin := v_code;
+    ELSE
+        RETURN jsonb_build_object('product', NULL, 'manifest_item', NULL, 'source', NULL);
+    END IF;
+
+    SELECT to_jsonb(p) INTO v_product
+    FROM products p
+    WHERE p.fnsku = v_fnsku OR p.asin = v_asin
+    LIMIT 1;
+    IF v_product IS NOT NULL THEN
+        RETURN jsonb_build_object('product', v_product, 'manifest_item', NULL, 'source', 'products');
+    END IF;
+
+    SELECT to_jsonb(c) - 'rainforest_raw_data' INTO v_product
+    FROM api_lookup_cache c
+    WHERE c.fnsku = v_fnsku OR c.asin = v_asin
+    LIMIT 1;
+    IF v_product IS NOT NULL THEN
+        RETURN jsonb_build_object('product', v_product, 'manifest_item', NULL, 'source', 'api_lookup_cache');
+    END IF;
+
+    RETURN jsonb_build_object('product', NULL, 'manifest_item', NULL, 'source', NULL);
+END;
+$function$;
+
+-- Lookups above filter on these columns; keep them indexed.
+CREATE INDEX IF NOT EXISTS idx_manifest_data_xz_asin ON manifest_data ("X-Z ASIN");
+CREATE INDEX IF NOT EXISTS idx_api_cache_asin ON api_lookup_cache(asin);
+
+GRANT EXECUTE ON FUNCTION public.resolve_scan_product(text, text) TO authenticated, service_role;
@@ -0,0 +1,50 @@
+-- Migration: 026_api_lookup_cache_scan_projection.sql
+-- Precomputed scan response pieces for api_lookup_cache rows.
+-- The backend writes scan_projection (images, videos, brand, category, description, price,
+-- completeness flag) whenever it writes a row, so cache hits no longer re-parse image_url
+-- and the full rainforest_raw_data blob on every scan.
+-- Rows with a NULL projection are computed on read; backfill with
+--   python scripts/backfill_scan_projection.py
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_name = 'api_lookup_cache'
+          AND column_name = 'scan_projection'
+    ) THEN
+        ALTER TABLE api_lookup_cache
+        ADD COLUMN scan_projection JSONB;
+
+        COMMENT ON COLUMN api_lookup_cache.scan_projection IS
+          'Compact scan response derived from product_name/price/image_url/rainforest_raw_data (see _build_scan_projection in app.py). NULL = recompute on read.';
+    END IF;
+END $$;
+
+-- Writers that change content without refreshing the projection (e.g. the web client's
+-- saveLookup) must not leave a stale one behind: drop it so it is recomputed on read.
+CREATE OR REPLACE FUNCTION public.api_lookup_cache_reset_scan_projection()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.scan_projection IS NOT DISTINCT FROM OLD.scan_projection AND (
+       NEW.product_name IS DISTINCT FROM OLD.product_name
+    OR NEW.price IS DISTINCT FROM OLD.price
+    OR NEW.image_url IS DISTINCT FROM OLD.image_url
+    OR NEW.category IS DISTINCT FROM OLD.category
+    OR NEW.description IS DISTINCT FROM OLD.description
+    OR NEW.fnsku IS DISTINCT FROM OLD.fnsku
+    OR NEW.asin IS DISTINCT FROM OLD.asin
+    OR NEW.rainforest_raw_data IS DISTINCT FROM OLD.rainforest_raw_data
+  ) THEN
+    NEW.scan_projection = NULL;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS api_lookup_cache_reset_scan_projection ON api_lookup_cache;
+CREATE TRIGGER api_lookup_cache_reset_scan_projection
+  BEFORE UPDATE ON api_lookup_cache
+  FOR EACH ROW
+  EXECUTE FUNCTION public.api_lookup_cache_reset_scan_projection();
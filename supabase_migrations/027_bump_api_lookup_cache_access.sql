@@ -0,0 +1,29 @@
+-- Migration: 027_bump_api_lookup_cache_access.sql
+-- Batched access bookkeeping for api_lookup_cache.
+-- Cache hits used to UPDATE last_accessed / lookup_count one row at a time on the request path
+-- (a read-modify-write that loses increments under concurrency). The backend now accumulates
+-- hits in memory and flushes them periodically through this function as one statement.
+--
+-- p_rows: [{"id": 123, "hits": 4, "last_accessed": "2026-10-17T12:00:00+00:00"}, ...]
+-- Returns the number of rows updated.
+
+CREATE OR REPLACE FUNCTION public.bump_api_lookup_cache_access(p_rows jsonb)
+ RETURNS integer
+ LANGUAGE plpgsql
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE api_lookup_cache c
+    SET lookup_count = COALESCE(c.lookup_count, 0) + x.hits,
+        last_accessed = GREATEST(COALESCE(c.last_accessed, x.last_accessed), x.last_accessed)
+    FROM jsonb_to_recordset(COALESCE(p_rows, '[]'::jsonb)) AS x(id bigint, hits integer, last_accessed timestamptz)
+    WHERE c.id = x.id
+      AND x.hits > 0;
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$function$;
+
+GRANT EXECUTE ON FUNCTION public.bump_api_lookup_cache_access(jsonb) TO service_role;
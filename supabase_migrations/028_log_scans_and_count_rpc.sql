@@ -0,0 +1,72 @@
+-- Migration: 028_log_scans_and_count_rpc.sql
+-- Idempotent scan logging that returns the updated trial usage in the same round-trip.
+-- Before: a duplicate-check SELECT, an INSERT and a separate count='exact' query per scan,
+-- and two concurrent scans of the same code could both pass the SELECT and double count.
+-- Now a unique index on (user_id, tenant_id, scanned_code) makes the insert idempotent and
+-- log_scans_and_count inserts a batch with ON CONFLICT DO NOTHING and returns
+-- {"new_codes": [...], "used": <trial usage>} (usage counted the way get_used_scan_count does).
+
+-- Existing duplicates would block the unique index: keep the earliest row per key.
+DELETE FROM scan_history s
+USING (
+    SELECT id,
+           row_number() OVER (
+               PARTITION BY user_id, tenant_id, scanned_code
+               ORDER BY scanned_at ASC NULLS LAST, id
+           ) AS rn
+    FROM scan_history
+    WHERE user_id IS NOT NULL
+) d
+WHERE s.id = d.id
+  AND d.rn > 1;
+
+-- NULLS NOT DISTINCT so scans without a tenant are deduplicated too (PostgreSQL 15+).
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_scan_history_user_tenant_code
+ON scan_history (user_id, tenant_id, scanned_code) NULLS NOT DISTINCT
+WHERE user_id IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.log_scans_and_count(
+    p_user_id uuid,
+    p_tenant_id uuid,
+    p_scans jsonb,
+    p_since timestamptz DEFAULT NULL
+)
+ RETURNS jsonb
+ LANGUAGE plpgsql
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_new_codes JSONB;
+    v_used INTEGER;
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN jsonb_build_object('new_codes', '[]'::jsonb, 'used', 0);
+    END IF;
+
+    WITH ins AS (
+        INSERT INTO scan_history (user_id, tenant_id, scanned_code, scanned_at, api_lookup_cache_id, product_description)
+        SELECT p_user_id,
+               p_tenant_id,
+               x.scanned_code,
+               COALESCE(x.scanned_at, NOW()),
+               x.api_lookup_cache_id,
+               x.product_description
+        FROM jsonb_to_recordset(COALESCE(p_scans, '[]'::jsonb))
+             AS x(scanned_code text, scanned_at timestamptz, api_lookup_cache_id bigint, product_description text)
+        WHERE COALESCE(x.scanned_code, '') <> ''
+        ON CONFLICT (user_id, tenant_id, scanned_code) WHERE user_id IS NOT NULL DO NOTHING
+        RETURNING scanned_code
+    )
+    SELECT COALESCE(jsonb_agg(scanned_code), '[]'::jsonb) INTO v_new_codes FROM ins;
+
+    SELECT count(*) INTO v_used
+    FROM scan_history h
+    WHERE h.user_id = p_user_id
+      AND (p_tenant_id IS NULL OR h.tenant_id = p_tenant_id OR h.tenant_id IS NULL)
+      AND (p_since IS NULL OR h.scanned_at >= p_since);
+
+    RETURN jsonb_build_object('new_codes', v_new_codes, 'used', v_used);
+END;
+$function$;
+
+GRANT EXECUTE ON FUNCTION public.log_scans_and_count(uuid, uuid, jsonb, timestamptz) TO service_role;
@@ -0,0 +1,79 @@
+-- Migration: 029_import_inventory_upsert.sql
+-- Set-based inventory upsert for /api/import/batch.
+-- Before: existing SKUs were fetched in chunks of 80, then one UPDATE or INSERT per SKU with
+-- quantity computed in the backend (read-modify-write), so two chunks of the same import running
+-- concurrently could overwrite each other's increments.
+-- Now one call per chunk adds quantities in SQL (quantity = quantity + x.quantity) and inserts the
+-- SKUs the owner does not have yet. A transaction-scoped advisory lock per (user, tenant) serializes
+-- concurrent imports for the same owner so two chunks cannot both insert the same new SKU.
+--
+-- p_rows: [{"sku": "X00ABC", "name": "...", "quantity": 3, "price": 9.99, "cost": 0, "location": "Import",
+--           "condition": "New", "image_url": "https://...", "asin": "B0..."}, ...]  (one entry per SKU)
+-- Returns the number of inventory rows updated or inserted.
+
+CREATE OR REPLACE FUNCTION public.import_inventory_upsert(
+    p_user_id uuid,
+    p_tenant_id uuid,
+    p_rows jsonb
+)
+ RETURNS integer
+ LANGUAGE plpgsql
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(
+        hashtextextended('import_inventory_upsert:' || p_user_id::text || ':' || COALESCE(p_tenant_id::text, ''), 0)
+    );
+
+    WITH x AS (
+        SELECT *
+        FROM jsonb_to_recordset(COALESCE(p_rows, '[]'::jsonb))
+             AS x(sku text, name text, quantity integer, price numeric, cost numeric,
+                  location text, condition text, image_url text, asin text)
+        WHERE COALESCE(x.sku, '') <> ''
+    ),
+    existing AS (
+        -- Same match as the app: user, plus tenant when one is given. Oldest row wins on duplicates.
+        SELECT DISTINCT ON (i.sku) i.id, i.sku
+        FROM inventory i
+        JOIN x ON x.sku = i.sku
+        WHERE i.user_id = p_user_id
+          AND (p_tenant_id IS NULL OR i.tenant_id = p_tenant_id)
+        ORDER BY i.sku, i.id
+    ),
+    upd AS (
+        UPDATE inventory i
+        SET name = x.name,
+            quantity = COALESCE(i.quantity, 0) + x.quantity,
+            price = x.price,
+            cost = x.cost,
+            location = x.location,
+            condition = x.condition,
+            image_url = x.image_url,
+            asin = COALESCE(x.asin, i.asin)
+        FROM existing e
+        JOIN x ON x.sku = e.sku
+        WHERE i.id = e.id
+        RETURNING 1
+    ),
+    ins AS (
+        INSERT INTO inventory (sku, name, quantity, price, cost, location, condition, image_url, asin, user_id, tenant_id)
+        SELECT x.sku, x.name, x.quantity, x.price, x.cost, x.location, x.condition, x.image_url, x.asin,
+               p_user_id, p_tenant_id
+        FROM x
+        WHERE NOT EXISTS (SELECT 1 FROM existing e WHERE e.sku = x.sku)
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM upd) + (SELECT count(*) FROM ins) INTO v_count;
+
+    RETURN v_count;
+END;
+$function$;
+
+GRANT EXECUTE ON FUNCTION public.import_inventory_upsert(uuid, uuid, jsonb) TO service_role;
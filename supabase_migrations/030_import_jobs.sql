@@ -0,0 +1,78 @@
+-- Migration: 030_import_jobs.sql
+-- Background import jobs on top of import_batches.
+-- Before: parsing, bulk inserts, Rainforest enrichment, inventory and audit rows all ran inside the
+-- upload request (gunicorn --timeout 120), so large manifests failed halfway and held a web thread.
+-- Now a background import stages its rows in import_job_chunks, the import_batches row becomes the
+-- job (status queued -> running -> completed / failed) with per-stage progress, and a runner thread in
+-- any worker claims it through claim_import_job. A job whose runner stopped heartbeating (dyno restart)
+-- is claimed again and resumes at its first chunk not yet marked done.
+
+ALTER TABLE import_batches
+  ADD COLUMN IF NOT EXISTS stage TEXT,
+  ADD COLUMN IF NOT EXISTS chunks_total INTEGER DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS chunks_done INTEGER DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS rows_done INTEGER DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS error TEXT,
+  ADD COLUMN IF NOT EXISTS worker_id TEXT,
+  ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_import_batches_job_queue
+  ON import_batches (created_at)
+  WHERE status IN ('queued', 'running');
+
+CREATE INDEX IF NOT EXISTS idx_import_batches_session
+  ON import_batches (import_session_id)
+  WHERE import_session_id IS NOT NULL;
+
+-- Staged rows of a background import, one row per chunk. stages_done lists the pipeline stages
+-- already committed for a chunk, so a resumed chunk does not add inventory or audit rows twice.
+CREATE TABLE IF NOT EXISTS import_job_chunks (
+  import_batch_id UUID NOT NULL REFERENCES import_batches(id) ON DELETE CASCADE,
+  chunk_index INTEGER NOT NULL,
+  row_offset INTEGER NOT NULL DEFAULT 0,
+  items JSONB NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  stages_done TEXT[] NOT NULL DEFAULT '{}',
+  result JSONB,
+  processed_at TIMESTAMPTZ,
+  PRIMARY KEY (import_batch_id, chunk_index)
+);
+
+-- Written and read by the backend (service role) only.
+ALTER TABLE import_job_chunks ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.claim_import_job(p_worker text, p_stale_seconds integer DEFAULT 300)
+ RETURNS uuid
+ LANGUAGE plpgsql
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_id UUID;
+BEGIN
+    SELECT id INTO v_id
+    FROM import_batches
+    WHERE status = 'queued'
+       OR (status = 'running'
+           AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - (p_stale_seconds * INTERVAL '1 second')))
+    ORDER BY created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+
+    IF v_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE import_batches
+    SET status = 'running',
+        worker_id = p_worker,
+        heartbeat_at = NOW(),
+        attempts = COALESCE(attempts, 0) + 1,
+        updated_at = NOW()
+    WHERE id = v_id;
+
+    RETURN v_id;
+END;
+$function$;
+
+GRANT EXECUTE ON FUNCTION public.claim_import_job(text, integer) TO service_role;
@@ -0,0 +1,102 @@
+-- Migration: 031_import_inventory_upsert_idempotent.sql
+-- Make import_inventory_upsert (029) safe to retry.
+-- Before: the function adds quantities, so a retried call (a background job re-running its inventory
+-- stage after a timeout, a disconnect or a crash before the stage was recorded) added them twice.
+-- Now the caller passes p_apply_key ('<import_batch_id>:<chunk_index>:<slice start>'); the key is
+-- recorded in import_inventory_applied in the same transaction as the upsert, and a call whose key
+-- is already recorded changes nothing and returns the count stored with it.
+-- Calls without a key behave as before.
+
+CREATE TABLE IF NOT EXISTS import_inventory_applied (
+  apply_key TEXT PRIMARY KEY,
+  applied_count INTEGER NOT NULL DEFAULT 0,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Written and read by the backend (service role) only.
+ALTER TABLE import_inventory_applied ENABLE ROW LEVEL SECURITY;
+
+-- The signature gains p_apply_key; drop the 029 version so PostgREST does not see two candidates.
+DROP FUNCTION IF EXISTS public.import_inventory_upsert(uuid, uuid, jsonb);
+
+CREATE OR REPLACE FUNCTION public.import_inventory_upsert(
+    p_user_id uuid,
+    p_tenant_id uuid,
+    p_rows jsonb,
+    p_apply_key text DEFAULT NULL
+)
+ RETURNS integer
+ LANGUAGE plpgsql
+ SET search_path TO 'public'
+AS $function$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(
+        hashtextextended('import_inventory_upsert:' || p_user_id::text || ':' || COALESCE(p_tenant_id::text, ''), 0)
+    );
+
+    IF p_apply_key IS NOT NULL THEN
+        INSERT INTO import_inventory_applied (apply_key) VALUES (p_apply_key)
+        ON CONFLICT (apply_key) DO NOTHING;
+        IF NOT FOUND THEN
+            -- Already applied by an earlier call that committed.
+            SELECT applied_count INTO v_count FROM import_inventory_applied WHERE apply_key = p_apply_key;
+            RETURN COALESCE(v_count, 0);
+        END IF;
+    END IF;
+
+    WITH x AS (
+        SELECT *
+        FROM jsonb_to_recordset(COALESCE(p_rows, '[]'::jsonb))
+             AS x(sku text, name text, quantity integer, price numeric, cost numeric,
+                  location text, condition text, image_url text, asin text)
+        WHERE COALESCE(x.sku, '') <> ''
+    ),
+    existing AS (
+        -- Same match as the app: user, plus tenant when one is given. Oldest row wins on duplicates.
+        SELECT DISTINCT ON (i.sku) i.id, i.sku
+        FROM inventory i
+        JOIN x ON x.sku = i.sku
+        WHERE i.user_id = p_user_id
+          AND (p_tenant_id IS NULL OR i.tenant_id = p_tenant_id)
+        ORDER BY i.sku, i.id
+    ),
+    upd AS (
+        UPDATE inventory i
+        SET name = x.name,
+            quantity = COALESCE(i.quantity, 0) + x.quantity,
+            price = x.price,
+            cost = x.cost,
+            location = x.location,
+            condition = x.condition,
+            image_url = x.image_url,
+            asin = COALESCE(x.asin, i.asin)
+        FROM existing e
+        JOIN x ON x.sku = e.sku
+        WHERE i.id = e.id
+        RETURNING 1
+    ),
+    ins AS (
+        INSERT INTO inventory (sku, name, quantity, price, cost, location, condition, image_url, asin, user_id, tenant_id)
+        SELECT x.sku, x.name, x.quantity, x.price, x.cost, x.location, x.condition, x.image_url, x.asin,
+               p_user_id, p_tenant_id
+        FROM x
+        WHERE NOT EXISTS (SELECT 1 FROM existing e WHERE e.sku = x.sku)
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM upd) + (SELECT count(*) FROM ins) INTO v_count;
+
+    IF p_apply_key IS NOT NULL THEN
+        UPDATE import_inventory_applied SET applied_count = v_count WHERE apply_key = p_apply_key;
+    END IF;
+
+    RETURN v_count;
+END;
+$function$;
+
+GRANT EXECUTE ON FUNCTION public.import_inventory_upsert(uuid, uuid, jsonb, text) TO service_role;
@@ -0,0 +1,9 @@
+-- Migration: 032_enrichment_lock_result.sql
+-- Let a scan-path enrichment lock holder hand its Rainforest answer to waiting workers.
+-- Before: the holder saved a second full copy of the raw JSON under the ASIN's synthetic
+-- api_lookup_cache key so waiters could find it, permanently doubling the cache for every paid scan.
+-- Now the holder writes the JSON onto its own global_enrichment_locks row and extends locked_until
+-- by the wait window instead of releasing; waiters read it from there. The row is removed by
+-- try_lock_enrichment (020) once it expires, so nothing is kept past the handoff.
+
+ALTER TABLE global_enrichment_locks ADD COLUMN IF NOT EXISTS result JSONB;
@@ -0,0 +1,59 @@
+"""
+Local stand-in for the ato.fnskutoasin.com ScanTask API, used by the callback tests.
+
+Patch ``post`` / ``get`` over ``app.requests`` to serve AddOrGet and GetByBarCode from memory,
+then call ``complete()`` to deliver the vendor's task-completed callback to the Flask app
+through its test client, exactly as the vendor would hit the configured callbackUrl.
+"""
+import json
+from urllib.parse import urlsplit
+
+
+class FakeVendorResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeFnskuVendor:
+    def __init__(self):
+        self.tasks = {}
+        self.callback_urls = {}
+        self.calls = []
+
+    def post(self, url, headers=None, json=None, timeout=None, **kwargs):
+        self.calls.append(('POST', url))
+        if not url.endswith('/api/v1/ScanTask/AddOrGet'):
+            return FakeVendorResponse(404, {})
+        code = str((json or {}).get('barCode') or '').upper()
+        self.callback_urls[code] = (json or {}).get('callbackUrl') or ''
+        task = self.tasks.setdefault(code, {
+            'id': f"task-{len(self.tasks) + 1}",
+            'barCode': code,
+            'asin': '',
+            'taskState': 1,
+            'finishedOn': None,
+        })
+        return FakeVendorResponse(200, {'succeeded': True, 'data': dict(task)})
+
+    def get(self, url, headers=None, params=None, timeout=None, **kwargs):
+        self.calls.append(('GET', url))
+        if not url.endswith('/api/v1/ScanTask/GetByBarCode'):
+            return FakeVendorResponse(404, {})
+        task = self.tasks.get(str((params or {}).get('BarCode') or '').upper())
+        if not task:
+            return FakeVendorResponse(200, {'succeeded': False, 'data': None})
+        return FakeVendorResponse(200, {'succeeded': True, 'data': dict(task)})
+
+    def complete(self, code, client, asin='', url=None):
+        """Finish the task (with or without an ASIN) and POST the callback to the app."""
+        code = code.upper()
+        task = self.tasks[code]
+        task.update({'asin': asin, 'taskState': 2, 'finishedOn': '2026-01-01T00:00:00Z'})
+        parts = urlsplit(url or self.callback_urls[code])
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        return client.post(path, json={'succeeded': True, 'data': dict(task)})
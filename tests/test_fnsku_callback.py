@@ -0,0 +1,98 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Ensure repo root (app) and this directory (vendor stub) are on path
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, Path(__file__).resolve().parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import app as app_mod
+from fnsku_vendor_stub import FakeFnskuVendor
+
+
+CALLBACK_URL = 'https://scanner.example.com/api/fnsku/callback'
+
+
+class TestFnskuCallback(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app_mod.app.testing = True
+        cls.client = app_mod.app.test_client()
+
+    def setUp(self):
+        self.vendor = FakeFnskuVendor()
+        self.mock_admin = MagicMock()
+        self.saved = {
+            'admin': app_mod.supabase_admin,
+            'url': app_mod.FNSKU_CALLBACK_URL,
+            'secret': app_mod.FNSKU_CALLBACK_SECRET,
+            'rainforest_key': app_mod.os.environ.pop('RAINFOREST_API_KEY', None),
+        }
+        app_mod.supabase_admin = self.mock_admin
+        app_mod.FNSKU_CALLBACK_URL = CALLBACK_URL
+        app_mod.FNSKU_CALLBACK_SECRET = 's3cret'
+        app_mod._fnsku_resolver_clear()
+        app_mod._clear_negative_cache('X00CALLBK1')
+        self.patches = [
+            patch('app.upstream_http.post', self.vendor.post),
+            patch('app.upstream_http.get', self.vendor.get),
+            patch('app._fnsku_resolver_ensure_started'),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        app_mod._fnsku_resolver_clear()
+        app_mod.supabase_admin = self.saved['admin']
+        app_mod.FNSKU_CALLBACK_URL = self.saved['url']
+        app_mod.FNSKU_CALLBACK_SECRET = self.saved['secret']
+        if self.saved['rainforest_key'] is not None:
+            app_mod.os.environ['RAINFOREST_API_KEY'] = self.saved['rainforest_key']
+
+    def _start_pending_scan(self, code):
+        outcome = app_mod._resolve_fnsku_external(code, 'test-key', None, False)
+        self.assertEqual(outcome['status'], 'pending')
+        return outcome
+
+    def test_callback_resolves_pending_scan(self):
+        self._start_pending_scan('X00CALLBK1')
+        self.assertEqual(self.vendor.callback_urls['X00CALLBK1'], CALLBACK_URL + '?token=s3cret')
+
+        resp = self.vendor.complete('X00CALLBK1', self.client, asin='B0CALLBACK')
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertTrue((resp.get_json() or {}).get('accepted'))
+        status = app_mod._fnsku_resolver_status('X00CALLBK1')
+        self.assertEqual(status['state'], 'resolved')
+        self.assertEqual(status['response']['asin'], 'B0CALLBACK')
+        inserted = self.mock_admin.table.return_value.insert.call_args[0][0]
+        self.assertEqual((inserted['fnsku'], inserted['asin']), ('X00CALLBK1', 'B0CALLBACK'))
+
+    def test_callback_terminal_miss_marks_negative_cache(self):
+        self._start_pending_scan('X00CALLBK1')
+        resp = self.vendor.complete('X00CALLBK1', self.client, asin='')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(app_mod._fnsku_resolver_status('X00CALLBK1')['state'], 'not_found')
+        self.assertTrue(app_mod._is_negatively_cached('X00CALLBK1'))
+        app_mod._clear_negative_cache('X00CALLBK1')
+
+    def test_callback_rejects_bad_token(self):
+        self._start_pending_scan('X00CALLBK1')
+        resp = self.vendor.complete('X00CALLBK1', self.client, asin='B0CALLBACK', url=CALLBACK_URL + '?token=nope')
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(app_mod._fnsku_resolver_status('X00CALLBK1')['state'], 'pending')
+
+    def test_callback_disabled_without_secret(self):
+        app_mod.FNSKU_CALLBACK_SECRET = ''
+        resp = self.client.post('/api/fnsku/callback?token=', json={'barCode': 'X00CALLBK1', 'asin': 'B0CALLBACK'})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(app_mod._fnsku_callback_url(), '')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Unit tests for the manifest_processor COPY loader (no database)."""
+
+import csv
+import io
+import json
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT / "manifest_processor") not in sys.path:
+    sys.path.insert(0, str(ROOT / "manifest_processor"))
+
+import import_manifest
+
+
+def _copied_rows(buffers):
+    return [row for buf, _count in buffers for row in csv.reader(buf)]
+
+
+def test_copy_batches_match_the_old_row_format():
+    text = 'LPN,Description,Qty\nLPN1,"Lamp, 2 pack",3\n\nLPN2,"Say ""hi""\nagain"\nLPN3\n'
+    batches = list(import_manifest.iter_copy_batches(io.StringIO(text), batch_size=2))
+
+    assert [count for _buf, count in batches] == [2, 1]
+    rows = _copied_rows(batches)
+    assert rows[0] == ["LPN1,Lamp, 2 pack,3", json.dumps({"LPN": "LPN1", "Description": "Lamp, 2 pack", "Qty": "3"})]
+    assert json.loads(rows[1][1]) == {"LPN": "LPN2", "Description": 'Say "hi"\nagain', "Qty": None}
+    assert rows[2][0] == "LPN3"
+
+
+def test_import_csv_sums_copy_row_counts(tmp_path):
+    path = tmp_path / "m.csv"
+    path.write_text("LPN\n" + "".join(f"LPN{i}\n" for i in range(5)), encoding="utf-8")
+    cur = MagicMock(rowcount=2)
+    conn = MagicMock()
+    conn.cursor.return_value = cur
+    with patch.object(import_manifest, "connect_db", return_value=conn):
+        rows, _seconds = import_manifest.import_csv(path, batch_size=2)
+
+    assert cur.copy_expert.call_count == 3
+    assert rows == 6  # what the server reported, not what was sent
+    conn.commit.assert_called_once()
+
+
+def test_failed_file_rolls_back_and_sets_exit_code(tmp_path, capsys):
+    path = tmp_path / "bad.csv"
+    path.write_text("LPN\nLPN1\n", encoding="utf-8")
+    conn = MagicMock()
+    conn.cursor.return_value.copy_expert.side_effect = RuntimeError("boom")
+    with patch.object(import_manifest, "connect_db", return_value=conn):
+        assert import_manifest.main([str(tmp_path)]) == 1
+
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+    assert "Total: 0 rows from 0/1 files" in capsys.readouterr().out
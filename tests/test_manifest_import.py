@@ -2,11 +2,15 @@
 Tests for manifest import helpers (shared cache, ASIN validation, Rainforest cache completeness).
 Run: python -m unittest tests.test_manifest_import -v
 """
+import importlib.util
+import io
 import json
+import os
+import random
 import sys
 import unittest
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 # Ensure repo root is on path
 ROOT = Path(__file__).resolve().parents[1]
@@ -14,6 +18,58 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 
+class _FakeTable:
+    """Just enough of the PostgREST query builder for the import job runner: eq / order / limit filters."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._filters, self._update, self._insert, self._limit, self._order = [], None, None, None, None
+
+    def select(self, _columns="*"):
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, value))
+        return self
+
+    def order(self, column):
+        self._order = column
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def update(self, values):
+        self._update = values
+        return self
+
+    def insert(self, values):
+        self._insert = values
+        return self
+
+    def execute(self):
+        if self._insert is not None:
+            inserted = self._insert if isinstance(self._insert, list) else [self._insert]
+            self.rows.extend(dict(r) for r in inserted)
+            return MagicMock(data=inserted)
+        hits = [r for r in self.rows if all(r.get(c) == v for c, v in self._filters)]
+        if self._update is not None:
+            for r in hits:
+                r.update(self._update)
+        if self._order:
+            hits.sort(key=lambda r: r[self._order])
+        return MagicMock(data=[dict(r) for r in hits[:self._limit]])
+
+
+class _FakeSupabase:
+    def __init__(self, **tables):
+        self.tables = tables
+
+    def table(self, name):
+        return _FakeTable(self.tables.setdefault(name, []))
+
+
 class TestManifestImportHelpers(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -77,6 +133,21 @@ class TestManifestImportHelpers(unittest.TestCase):
         self.assertIn("hidden_from_inventory_list", text)
         self.assertIn("inventory_hidden_manifest", text)
 
+    def test_migration_029_import_inventory_upsert_exists(self):
+        p = ROOT / "supabase_migrations" / "029_import_inventory_upsert.sql"
+        self.assertTrue(p.is_file())
+        text = p.read_text(encoding="utf-8")
+        self.assertIn("import_inventory_upsert", text)
+        self.assertIn("COALESCE(i.quantity, 0) + x.quantity", text)
+
+    def test_migration_031_import_inventory_upsert_records_apply_key(self):
+        p = ROOT / "supabase_migrations" / "031_import_inventory_upsert_idempotent.sql"
+        self.assertTrue(p.is_file())
+        text = p.read_text(encoding="utf-8")
+        self.assertIn("import_inventory_applied", text)
+        self.assertIn("p_apply_key text DEFAULT NULL", text)
+        self.assertIn("ON CONFLICT (apply_key) DO NOTHING", text)
+
     def test_get_api_cache_row_prefers_fnsku(self):
         """Global cache: first lookup by FNSKU when present."""
         admin = MagicMock()
@@ -105,5 +176,375 @@ class TestManifestImportHelpers(unittest.TestCase):
         self.assertEqual(r.get("asin"), "B012345678")
 
 
+    def test_import_enrich_rows_runs_asins_concurrently_within_cap(self):
+        """Distinct ASINs enrich in parallel; repeats dedupe locally and the cap still holds."""
+        m = self.app
+        rows = [
+            {"fnsku": "XFN1", "asin": "B000000001"},
+            {"fnsku": "XFN2", "asin": "B000000001"},
+            {"fnsku": None, "asin": "B000000002"},
+            {"fnsku": None, "asin": "B000000003"},
+            {"fnsku": None, "asin": "nope"},
+        ]
+        fetched = []
+        with patch.object(m, "IMPORT_ENRICHMENT_CONCURRENCY", 4), \
+                patch.object(m, "_import_get_api_cache_row", return_value=None), \
+                patch.object(m, "_import_try_enrichment_lock", return_value=True), \
+                patch.object(m, "_import_release_enrichment_lock") as release, \
+                patch.object(m, "_import_fetch_rainforest_product",
+                             side_effect=lambda a: fetched.append(a) or {"product": {"asin": a}}), \
+                patch.object(m, "import_save_rainforest_to_cache", return_value=True):
+            hits, charged, deferred = m._import_enrich_rows(MagicMock(), rows, "missing_only", 2)
+
+        statuses = [r["_import_meta"]["enrichment_status"] for r in rows]
+        self.assertEqual(statuses[:2], ["enriched_rainforest", "local_dedupe"])
+        self.assertEqual(statuses[4], "no_asin")
+        self.assertEqual(sorted(statuses[2:4]), ["deferred_cap", "enriched_rainforest"])
+        self.assertEqual((hits, charged, deferred), (1, 2, 1))
+        self.assertEqual(len(fetched), 2)
+        self.assertEqual(release.call_count, 2)
+
+    def test_prefetch_api_cache_rows_answers_lookups_from_memory(self):
+        """One IN-list query per key column for the chunk; lookups keep FNSKU > ASIN > synthetic order."""
+        m = self.app
+        by_column = {
+            "fnsku": [
+                {"id": 1, "fnsku": "XFN1", "asin": "B000000001", "rf_title": "Widget one"},
+                {"id": 3, "fnsku": "__ASIN__B000000003", "asin": None, "rf_title": "Synthetic three"},
+            ],
+            "asin": [{"id": 2, "fnsku": "XOTHER", "asin": "B000000002", "rf_title": "Widget two"}],
+        }
+        admin = MagicMock()
+        tbl = admin.table.return_value
+        tbl.select.return_value = tbl
+        tbl.in_.side_effect = lambda column, values: MagicMock(
+            execute=MagicMock(return_value=MagicMock(data=by_column[column]))
+        )
+        rows = [
+            {"fnsku": "xfn1", "asin": "B000000001"},
+            {"fnsku": None, "asin": "B000000002"},
+            {"fnsku": None, "asin": "B000000003"},
+            {"fnsku": "XNONE", "asin": "bad"},
+        ]
+        index = m._import_prefetch_api_cache_rows(admin, rows)
+
+        self.assertEqual([c.args[0] for c in tbl.in_.call_args_list], ["fnsku", "asin"])
+        fnsku_values = tbl.in_.call_args_list[0].args[1]
+        self.assertIn("__ASIN__B000000002", fnsku_values)
+        self.assertIn("XNONE", fnsku_values)
+        tbl.execute.assert_not_called()
+
+        lookup = lambda fn, a: m._import_get_api_cache_row(admin, fn, a, index=index)
+        self.assertEqual(lookup("XFN1", "B000000001")["id"], 1)
+        self.assertEqual(lookup(None, "B000000002")["id"], 2)
+        self.assertEqual(lookup(None, "B000000003")["id"], 3)
+        self.assertIsNone(lookup("XNONE", "bad"))
+        self.assertEqual(tbl.in_.call_count, 2)
+
+    def test_import_inventory_upsert_rpc_chunks_and_hands_back_unwritten_rows(self):
+        """One RPC per chunk; when the function is missing the rest goes to the per-SKU fallback and the RPC backs off."""
+        from postgrest.exceptions import APIError
+
+        m = self.app
+        cands = [{"sku": f"SKU{i}", "name": f"Item {i}", "quantity": 1, "user_id": "u1"} for i in range(5)]
+        admin = MagicMock()
+        missing = APIError({"code": "PGRST202", "message": "Could not find the function public.import_inventory_upsert"})
+        admin.rpc.return_value.execute.side_effect = [MagicMock(data=2), missing]
+        with patch.object(m, "_IMPORT_INVENTORY_RPC_CHUNK", 2), \
+                patch.object(m, "_import_inventory_rpc_disabled_until", 0.0):
+            upserted, remaining = m._import_inventory_upsert_rpc(admin, "u1", None, cands)
+            self.assertEqual(upserted, 2)
+            self.assertEqual([c["sku"] for c in remaining], ["SKU2", "SKU3", "SKU4"])
+            name, params = admin.rpc.call_args_list[0].args
+            self.assertEqual(name, "import_inventory_upsert")
+            self.assertEqual([r["sku"] for r in params["p_rows"]], ["SKU0", "SKU1"])
+            self.assertNotIn("user_id", params["p_rows"][0])
+
+            admin.rpc.reset_mock()
+            self.assertEqual(m._import_inventory_upsert_rpc(admin, "u1", None, cands), (0, cands))
+            admin.rpc.assert_not_called()
+
+    def test_import_inventory_upsert_rpc_raises_on_ambiguous_failure(self):
+        """A timeout may have committed the chunk: raise instead of re-applying quantities per SKU."""
+        m = self.app
+        cands = [{"sku": f"SKU{i}", "name": f"Item {i}", "quantity": 1, "user_id": "u1"} for i in range(3)]
+        admin = MagicMock()
+        admin.rpc.return_value.execute.side_effect = TimeoutError("read timed out")
+        with patch.object(m, "_import_inventory_rpc_disabled_until", 0.0):
+            with self.assertRaises(TimeoutError):
+                m._import_inventory_upsert_rpc(admin, "u1", None, cands)
+            self.assertEqual(m._import_inventory_rpc_disabled_until, 0.0)
+
+    def test_import_inventory_retry_applies_each_slice_once(self):
+        """A later slice fails after earlier ones (and itself) committed; the retried chunk adds nothing twice."""
+        m = self.app
+        cands = [{"sku": f"SKU{i}", "name": f"Item {i}", "quantity": i + 1, "user_id": "u1"} for i in range(5)]
+        inventory, applied = {}, {}
+        fail_once = {"job-1:3:2"}
+
+        def fake_rpc(name, params):
+            # import_inventory_upsert from migration 031: the apply key is recorded with the upsert.
+            key = params["p_apply_key"]
+            if key not in applied:
+                for row in params["p_rows"]:
+                    inventory[row["sku"]] = inventory.get(row["sku"], 0) + row["quantity"]
+                applied[key] = len(params["p_rows"])
+            result = MagicMock()
+            if key in fail_once:
+                fail_once.discard(key)
+                result.execute.side_effect = TimeoutError("read timed out after commit")
+            else:
+                result.execute.return_value = MagicMock(data=applied[key])
+            return result
+
+        admin = MagicMock()
+        admin.rpc.side_effect = fake_rpc
+        with patch.object(m, "_IMPORT_INVENTORY_RPC_CHUNK", 2), \
+                patch.object(m, "_import_inventory_rpc_disabled_until", 0.0):
+            with self.assertRaises(TimeoutError):
+                m._import_inventory_upsert_rpc(admin, "u1", None, cands, apply_key="job-1:3")
+            upserted, remaining = m._import_inventory_upsert_rpc(admin, "u1", None, cands, apply_key="job-1:3")
+
+        self.assertEqual((upserted, remaining), (5, []))
+        self.assertEqual(inventory, {c["sku"]: c["quantity"] for c in cands})
+        self.assertEqual(sorted(applied), ["job-1:3:0", "job-1:3:2", "job-1:3:4"])
+
+    def test_upload_import_streams_csv_through_pipeline_in_batches(self):
+        """The raw file is parsed incrementally and fed to the batch pipeline under one import_batches row."""
+        m = self.app
+        body = (
+            "\ufeffFNSKU,ASIN,Description,Pallet\n"
+            "X001,B000000001,Widget one,P1\n"
+            "X002,B000000002,Widget two,P1\n"
+            ",,,\n"
+            "X003,B000000003,Widget three,P2\n"
+        ).encode("utf-8")
+        calls = []
+
+        def fake_process(items, user_id, tenant_id, **kw):
+            calls.append((list(items), kw))
+            return {"processed": len(items), "valid": len(items), "skipped": 0, "enrichments_charged": 1}
+
+        with patch.object(m, "supabase_admin", MagicMock()), \
+                patch.object(m, "get_ids_from_request", return_value=("u1", None)), \
+                patch.object(m, "IMPORT_UPLOAD_BATCH_ROWS", 2), \
+                patch.object(m, "_import_create_batch_row", return_value="batch-1") as create, \
+                patch.object(m, "_import_process_items", side_effect=fake_process):
+            resp = m.app.test_client().post(
+                "/api/import/upload?file_name=m.csv&enrichment_mode=missing_only&max_enrichment_calls=5",
+                data=body, content_type="text/csv",
+            )
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual((data["processed"], data["batches"], data["enrichments_charged"]), (3, 2, 2))
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual([len(items) for items, _ in calls], [2, 1])
+        first_row = calls[0][0][0]
+        self.assertEqual(first_row["FNSKU"], "X001")
+        self.assertEqual(first_row["manifest_extras"], {"Pallet": "P1"})
+        self.assertEqual([kw["row_offset"] for _, kw in calls], [0, 2])
+        self.assertEqual([kw["max_enrichment_calls"] for _, kw in calls], [5, 4])
+        self.assertTrue(all(kw["import_batch_id"] == "batch-1" for _, kw in calls))
+
+    @unittest.skipUnless(importlib.util.find_spec("openpyxl"), "openpyxl not installed")
+    def test_upload_import_reads_xlsx_request_body(self):
+        """A raw .xlsx body (non-seekable request stream) is spooled before openpyxl opens it."""
+        import openpyxl
+
+        m = self.app
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["FNSKU", "ASIN", "Qty"])
+        sheet.append(["X001", "B000000001", 2])
+        sheet.append([None, None, None])
+        sheet.append(["X002", "B000000002", 1])
+        body = io.BytesIO()
+        workbook.save(body)
+        calls = []
+
+        def fake_process(items, user_id, tenant_id, **kw):
+            calls.append(list(items))
+            return {"processed": len(items), "valid": len(items), "skipped": 0}
+
+        with patch.object(m, "supabase_admin", MagicMock()), \
+                patch.object(m, "get_ids_from_request", return_value=("u1", None)), \
+                patch.object(m, "_import_create_batch_row", return_value="batch-1"), \
+                patch.object(m, "_import_process_items", side_effect=fake_process):
+            resp = m.app.test_client().post(
+                "/api/import/upload?file_name=m.xlsx", data=body.getvalue(),
+                content_type="application/octet-stream",
+            )
+
+        self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+        self.assertEqual(resp.get_json()["processed"], 2)
+        self.assertEqual([(r["FNSKU"], r["Qty"]) for r in calls[0]], [("X001", 2), ("X002", 1)])
+
+    def test_import_job_resumes_at_first_pending_chunk_without_repeating_stages(self):
+        """A restarted job skips done chunks, and stages a half-done chunk already committed."""
+        m = self.app
+        job = {
+            "id": "job-1", "user_id": "u1", "tenant_id": None, "status": "running", "attempts": 2,
+            "include_in_inventory": True, "enrichment_mode": "missing_only", "max_enrichment_calls": 10,
+            "chunks_total": 2, "import_session_id": "s1", "file_name": "m.csv",
+        }
+        chunks = [
+            {"import_batch_id": "job-1", "chunk_index": 0, "row_offset": 0, "items": [], "status": "done",
+             "stages_done": list(m._IMPORT_STAGES), "result": {"processed": 2, "enrichments_charged": 3}},
+            {"import_batch_id": "job-1", "chunk_index": 1, "row_offset": 2, "items": [{"asin": "B000000001"}],
+             "status": "pending", "stages_done": ["rows", "products", "manifest_data", "enrichment", "inventory"]},
+        ]
+        db = _FakeSupabase(import_batches=[job], import_job_chunks=chunks)
+        calls = []
+
+        def fake_process(items, user_id, tenant_id, **kw):
+            calls.append((items, kw))
+            for stage in m._IMPORT_STAGES:
+                kw["on_stage"](stage)
+            return {"processed": len(items), "valid": 1, "enrichments_charged": 0}
+
+        with patch.object(m, "supabase_admin", db), \
+                patch.object(m, "_import_process_items", side_effect=fake_process):
+            self.assertEqual(m._import_job_run("job-1"), "completed")
+
+        self.assertEqual(len(calls), 1)
+        items, kw = calls[0]
+        self.assertEqual(items, [{"asin": "B000000001"}])
+        self.assertEqual(kw["row_offset"], 2)
+        self.assertEqual(kw["import_batch_id"], "job-1")
+        self.assertEqual(kw["max_enrichment_calls"], 7)
+        self.assertIn("inventory", kw["skip_stages"])
+        self.assertNotIn("audit", kw["skip_stages"])
+        self.assertEqual(chunks[1]["status"], "done")
+        self.assertEqual(chunks[1]["stages_done"], list(m._IMPORT_STAGES))
+        self.assertEqual((job["status"], job["chunks_done"], job["rows_done"]), ("completed", 2, 3))
+
+    def test_compiled_columns_match_get_value_and_are_cached(self):
+        """The per-file header mapping picks exactly what _import_get_value would, once per key set."""
+        m = self.app
+        header_sets = [
+            ("FNSKU", "B00 Asin", "X-Z ASIN", "Description", "MSRP", "Qty", "Category", "Pallet"),
+            ("fnsku", "asin", "lpn", "upc", "product_name", "price", "quantity", "brand", "category"),
+            ("sku", "Name", "retail", "Units", "vendor", "type"),
+            ("Title", "barcode", "unit_price"),
+        ]
+        for headers in header_sets:
+            row = {h: f"v:{h}" for h in headers}
+            columns = m._import_compile_columns(headers)
+            for field in m._IMPORT_MAPPED_FIELDS:
+                expected = m._import_get_value(row, field)
+                got = row[columns[field]] if columns[field] is not None else None
+                self.assertEqual(got, expected, (headers, field))
+
+        m._import_compile_columns.cache_clear()
+        rows = [{"FNSKU": f"X00{i}", "Qty": "1"} for i in range(50)]
+        with patch.object(m, "supabase_admin", None):
+            m._import_process_items(rows, "u1", None)
+        info = m._import_compile_columns.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 0))
+
+    def test_client_headers_compile_the_mapping_for_matching_rows(self):
+        """batch_import's `headers` drive the mapping; rows keyed differently fall back to their own keys."""
+        m = self.app
+        m._import_compile_columns.cache_clear()
+        rows = [{"FNSKU": "X001", "Qty": "2"}, {"Qty": "3", "FNSKU": "X002"}, {"fnsku": "X003"}]
+        with patch.object(m, "supabase_admin", None), \
+                patch.object(m, "_import_compile_columns", wraps=m._import_compile_columns) as compile_columns:
+            result = m._import_process_items(rows, "u1", None, headers=["FNSKU", "Qty"])
+        self.assertEqual([c.args[0] for c in compile_columns.call_args_list], [("FNSKU", "Qty"), ("fnsku",)])
+        self.assertEqual(result["valid"], 3)
+
+        with patch.object(m, "supabase_admin", MagicMock()), \
+                patch.object(m, "get_ids_from_request", return_value=("u1", None)), \
+                patch.object(m, "_import_process_items", return_value={"import_ok": True}) as process:
+            m.app.test_client().post("/api/import/batch", json={"items": rows, "headers": ["FNSKU", "Qty"]})
+        self.assertEqual(process.call_args.kwargs["headers"], ["FNSKU", "Qty"])
+
+    def _row_path_reference(self, items):
+        """The per-row normalization the columnar path replaced (normalize_identifiers / validate_row)."""
+        m = self.app
+        outcomes, products, manifest, skipped = [], [], [], 0
+        for idx, row in enumerate(items):
+            try:
+                g = m._import_get_value
+                n = m.normalize_identifiers(fnsku=g(row, "fnsku"), asin=g(row, "asin"), lpn=g(row, "lpn"), upc=g(row, "upc"))
+                if not m.validate_row(fnsku=n["fnsku"], asin=n["asin"], lpn=n["lpn"]):
+                    skipped += 1
+                    continue
+                raw_price = g(row, "price")
+                try:
+                    if raw_price is None or raw_price == "":
+                        price_num = 0.0
+                    elif isinstance(raw_price, (int, float)):
+                        price_num = float(raw_price)
+                    else:
+                        price_num = float(str(raw_price).strip())
+                except (ValueError, TypeError):
+                    price_num = 0.0
+                outcomes.append((idx, n["fnsku"], n["asin"], n["lpn"], n["upc"], price_num,
+                                 m._import_parse_quantity(g(row, "quantity"))))
+                price_str = None
+                if raw_price is not None:
+                    if isinstance(raw_price, (int, float)):
+                        price_str = str(raw_price)
+                    else:
+                        try:
+                            price_str = str(float(raw_price))
+                        except (ValueError, TypeError):
+                            price_str = None
+                if n["fnsku"] or n["asin"]:
+                    products.append((n["fnsku"], n["asin"], n["upc"], price_str))
+                if n["lpn"]:
+                    manifest.append((n["lpn"], n["fnsku"], n["asin"], n["upc"], price_str))
+            except Exception:
+                skipped += 1
+        return outcomes, products, manifest, skipped
+
+    def test_columnar_normalization_matches_row_path(self):
+        """Outcomes, products / manifest_data payloads and skip counts equal the per-row path."""
+        m = self.app
+        rng = random.Random(24)
+        idents = [None, "", "   ", " x00abc12 ", "b0cdefghij", 123, 0, "lpnRR1", "X00ABC12"]
+        upcs = [None, "", " ", "012345678905", "7.24129E+11", "12,345.0", "1.5", "abc", 1e20, 72412900000.0, "nan", "1e999"]
+        prices = [None, "", " 9.99 ", "N/A", 5, 5.0, "1,299.00", True, "inf", [1]]
+        quantities = [None, "", "2", "2.7", "0", "-3", "x", 3.9, "inf", "nan", 7]
+        items = [
+            {"FNSKU": rng.choice(idents), "ASIN": rng.choice(idents), "LPN": rng.choice(idents),
+             "UPC": rng.choice(upcs), "Price": rng.choice(prices), "Qty": rng.choice(quantities), "Title": "t"}
+            for _ in range(600)
+        ]
+        outcomes, products, manifest, skipped = self._row_path_reference(items)
+
+        db = _FakeSupabase()
+        posted = {}
+
+        def fake_post(url, json=None, **kw):
+            posted[url.rsplit("/", 1)[-1]] = json
+            return MagicMock(status_code=201, json=MagicMock(return_value=[]))
+
+        with patch.dict(os.environ, {"SUPABASE_URL": "https://db.example", "SUPABASE_SERVICE_KEY": "k"}), \
+                patch.object(m, "supabase_admin", db), \
+                patch.object(m.upstream_http, "post", side_effect=fake_post):
+            result = m._import_process_items(items, "u1", None, import_batch_id="b1")
+
+        audit = db.tables["import_batch_items"]
+        got = [
+            (a["row_index"], a["fnsku"], a["asin"], a["lpn"], a["raw_row"]["upc"], a["raw_row"]["price"], a["raw_row"]["quantity"])
+            for a in audit
+        ]
+        self.assertEqual(got, outcomes)
+        self.assertEqual((result["valid"], result["skipped"]), (len(outcomes), skipped))
+        unique_products = {}
+        for product in products:
+            unique_products.setdefault(product[:2], product)
+        self.assertEqual(
+            [(p["fnsku"], p["asin"], p["upc"], p["price"]) for p in posted.get("products", [])],
+            list(unique_products.values()),
+        )
+        self.assertEqual(
+            [(r["X-Z ASIN"], r["Fn Sku"], r["B00 Asin"], r["UPC"], r["MSRP"]) for r in posted.get("manifest_data", [])],
+            manifest,
+        )
+
 if __name__ == "__main__":
     unittest.main()
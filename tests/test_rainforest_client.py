@@ -0,0 +1,71 @@
+"""Unit tests for the shared Rainforest client (rate limit, retries, circuit breaker; no network)."""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+import rainforest_client
+import upstream_http
+
+
+def setup_function():
+    rainforest_client.reset()
+
+
+def teardown_function():
+    rainforest_client.reset()
+
+
+def _resp(status):
+    return MagicMock(status_code=status)
+
+
+def test_retries_5xx_within_budget_then_succeeds():
+    with patch('upstream_http.get', side_effect=[_resp(503), _resp(200)]) as get, \
+            patch('rainforest_client.time.sleep'):
+        resp = rainforest_client.get_product('B000TEST01', key='k', max_retries=1)
+    assert resp.status_code == 200
+    assert get.call_count == 2
+    assert get.call_args.kwargs['params']['asin'] == 'B000TEST01'
+    assert get.call_args.kwargs['timeout'] == rainforest_client.RAINFOREST_REQUEST_TIMEOUT
+    outcomes = rainforest_client.metrics_snapshot()['outcomes']
+    assert outcomes == {'http_5xx': 1, 'ok': 1}
+
+
+def test_breaker_opens_after_consecutive_failures_and_fails_fast():
+    failures = rainforest_client.breaker.failure_threshold
+    with patch('upstream_http.get', side_effect=requests.exceptions.Timeout('slow')) as get:
+        for _ in range(failures):
+            with pytest.raises(requests.exceptions.Timeout):
+                rainforest_client.get_product('B000TEST01', key='k', max_retries=0)
+        with pytest.raises(upstream_http.CircuitOpenError):
+            rainforest_client.get_product('B000TEST01', key='k')
+    assert get.call_count == failures
+    snapshot = rainforest_client.metrics_snapshot()
+    assert snapshot['breaker'] == 'open'
+    assert snapshot['outcomes']['breaker_open'] == 1
+
+
+def test_half_open_probe_success_closes_breaker():
+    breaker = upstream_http.CircuitBreaker('test', failure_threshold=1, open_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow() is True       # the probe
+    assert breaker.allow() is False      # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() is True
+
+
+def test_missing_key_and_rate_limit_do_not_call_vendor():
+    with patch('upstream_http.get') as get, patch.dict(os.environ, {}, clear=False):
+        os.environ.pop('RAINFOREST_API_KEY', None)
+        with pytest.raises(rainforest_client.RainforestUnavailable):
+            rainforest_client.get_product('B000TEST01')
+        with patch.object(rainforest_client, '_rate_limiter', upstream_http.TokenBucket(1, 1)):
+            rainforest_client._rate_limiter.try_acquire()
+            with patch('rainforest_client.RAINFOREST_RATE_MAX_WAIT_SECONDS', 0):
+                with pytest.raises(rainforest_client.RainforestUnavailable):
+                    rainforest_client.get_product('B000TEST01', key='k')
+    get.assert_not_called()
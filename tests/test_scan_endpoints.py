@@ -1,4 +1,6 @@
 import sys
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import MagicMock, patch
@@ -22,6 +24,19 @@ class TestScanEndpoints(unittest.TestCase):
         app_mod._clear_negative_cache('XPENDING001')
         app_mod._clear_negative_cache('XTERMINAL01')
         app_mod._invalidate_used_scan_count_cache()
+        app_mod._product_l1_clear()
+        app_mod._fnsku_resolver_clear()
+        app_mod._resolve_scan_rpc_disabled_until = 0.0
+        app_mod._cache_access_pending.clear()
+        app_mod._scan_history_clear()
+        app_mod._log_scans_rpc_disabled_until = 0.0
+        app_mod._auth_claims_clear()
+        app_mod._fnsku_vendor_breaker.reset()
+
+    def tearDown(self):
+        app_mod._fnsku_resolver_clear()
+        app_mod._fnsku_vendor_breaker.reset()
+        app_mod._scan_history_clear()
 
     def test_scan_product_invalid_json_returns_400(self):
         resp = self.client.post("/api/scan", data="")
@@ -85,13 +100,20 @@ class TestScanEndpoints(unittest.TestCase):
                 'succeeded': True,
                 'data': {'id': 't1', 'taskState': 0, 'asin': '', 'productName': 'Pending Item'},
             }
-            with patch('app.requests.get', return_value=mock_resp):
+            with patch('app.upstream_http.get', return_value=mock_resp):
                 resp = self.client.get('/api/scan/status?code=XPENDING001&attempt=1')
             self.assertEqual(resp.status_code, 200)
             payload = resp.get_json() or {}
             self.assertTrue(payload.get('lookup_still_pending') or payload.get('processing'))
             self.assertFalse(payload.get('not_in_api_database'))
             self.assertFalse(app_mod._is_negatively_cached('XPENDING001'))
+            self.assertEqual(app_mod._fnsku_resolver_status('XPENDING001')['state'], 'pending')
+
+            # Follow-up polls are answered from the resolver without another vendor call.
+            with patch('app.upstream_http.get') as vendor_get:
+                resp = self.client.get('/api/scan/status?code=XPENDING001&attempt=2')
+            vendor_get.assert_not_called()
+            self.assertTrue((resp.get_json() or {}).get('lookup_still_pending'))
         finally:
             app_mod.supabase_admin = original_admin
             if original_key is None:
@@ -123,7 +145,7 @@ class TestScanEndpoints(unittest.TestCase):
                     'productName': 'Gone',
                 },
             }
-            with patch('app.requests.get', return_value=mock_resp):
+            with patch('app.upstream_http.get', return_value=mock_resp):
                 resp = self.client.get('/api/scan/status?code=XTERMINAL01&attempt=2')
             self.assertEqual(resp.status_code, 200)
             payload = resp.get_json() or {}
@@ -166,6 +188,303 @@ class TestScanEndpoints(unittest.TestCase):
         finally:
             app_mod.supabase_admin = original_admin
 
+    def test_scan_status_repeat_hit_served_from_l1_cache(self):
+        mock_admin = MagicMock()
+        hit = MagicMock()
+        hit.data = [{
+            'id': 7,
+            'fnsku': 'X004AWUF9B',
+            'asin': 'B0D8B91PQF',
+            'product_name': 'Ceiling Fan',
+            'price': 84.99,
+            'image_url': 'https://example.com/fan.jpg',
+            'rainforest_raw_data': None,
+        }]
+        execute = mock_admin.table.return_value.select.return_value.eq.return_value.limit.return_value.execute
+        execute.return_value = hit
+
+        original_admin = app_mod.supabase_admin
+        app_mod.supabase_admin = mock_admin
+        try:
+            for _ in range(3):
+                resp = self.client.get('/api/scan/status?code=X004AWUF9B')
+                self.assertEqual((resp.get_json() or {}).get('asin'), 'B0D8B91PQF')
+            self.assertEqual(execute.call_count, 1)
+
+            app_mod._product_l1_invalidate('B0D8B91PQF')
+            self.client.get('/api/scan/status?code=X004AWUF9B')
+            self.assertEqual(execute.call_count, 2)
+        finally:
+            app_mod.supabase_admin = original_admin
+
+    def test_scan_projection_built_at_write_and_used_on_hit(self):
+        raw = {'product': {
+            'brand': 'YUHAO',
+            'main_image': {'link': 'https://example.com/main.jpg'},
+            'images': [{'link': 'https://example.com/side.jpg'}],
+            'videos_additional': [{'url': 'https://example.com/v.mp4'}],
+            'videos_count': 1,
+        }}
+        row = {
+            'fnsku': 'X004AWUF9B',
+            'asin': 'B0D8B91PQF',
+            'product_name': 'Ceiling Fan with Lights',
+            'price': 84.99,
+            'image_url': '["https://example.com/fan.jpg"]',
+            'category': 'Home',
+            'rainforest_raw_data': raw,
+        }
+        proj = app_mod._build_scan_projection(row)
+        self.assertEqual(proj['images'], [
+            'https://example.com/fan.jpg', 'https://example.com/main.jpg', 'https://example.com/side.jpg',
+        ])
+        self.assertEqual(proj['brand'], 'YUHAO')
+        self.assertEqual(proj['videos_count'], 1)
+        self.assertTrue(proj['complete'])
+        self.assertFalse(app_mod._build_scan_projection(dict(row, product_name='Product X004AWUF9B'))['complete'])
+
+        # A hit carrying the stored projection never re-parses the raw blob.
+        stored = dict(row, rainforest_raw_data=None, scan_projection=proj)
+        with patch('app._all_image_urls_from_rainforest_raw') as parse_raw:
+            payload = app_mod._scan_status_cache_response(stored, 'X004AWUF9B')
+        parse_raw.assert_not_called()
+        self.assertEqual(payload['images_count'], 3)
+        self.assertEqual(payload['brand'], 'YUHAO')
+        self.assertEqual(payload['price'], '84.99')
+
+    def test_api_cache_lookup_selects_slim_columns_and_backfills_projection(self):
+        supabase = MagicMock()
+        table = supabase.table.return_value
+        slim = MagicMock(data=[{
+            'id': 9, 'fnsku': 'X00SLIM001', 'asin': 'B0SLIM0001', 'product_name': 'Slim Row Product',
+            'price': 10.0, 'image_url': None, 'scan_projection': None,
+        }])
+        raw = MagicMock(data=[{'rainforest_raw_data': {'product': {'main_image': {'link': 'https://example.com/m.jpg'}}}}])
+        table.select.return_value.eq.return_value.limit.return_value.execute.side_effect = [slim, raw]
+
+        row = app_mod._api_cache_lookup(supabase, 'fnsku', 'X00SLIM001')
+        self.assertEqual(table.select.call_args_list[0].args[0], app_mod.API_CACHE_COLUMNS_SCAN)
+        self.assertNotIn('rainforest_raw_data', app_mod.API_CACHE_COLUMNS_SCAN)
+        self.assertEqual(table.select.call_args_list[1].args[0], 'rainforest_raw_data')
+        self.assertEqual(row['scan_projection']['images'], ['https://example.com/m.jpg'])
+        self.assertNotIn('rainforest_raw_data', row)
+        table.update.assert_called_once_with({'scan_projection': row['scan_projection']})
+
+        # Projection is now current: the next lookup is a pure L1 hit.
+        app_mod._api_cache_lookup(supabase, 'fnsku', 'X00SLIM001')
+        self.assertEqual(table.select.call_count, 2)
+
+    def test_cache_access_hits_are_batched_into_one_flush(self):
+        mock_admin = MagicMock()
+        original_admin = app_mod.supabase_admin
+        app_mod.supabase_admin = mock_admin
+        try:
+            with patch('app._cache_access_ensure_started'):
+                app_mod._cache_access_record({'id': 1, 'lookup_count': 5}, '2026-01-01T00:00:00+00:00')
+                app_mod._cache_access_record({'id': 1, 'lookup_count': 5}, '2026-01-01T00:00:09+00:00')
+                app_mod._cache_access_record({'id': 2}, '2026-01-01T00:00:03+00:00')
+            mock_admin.table.assert_not_called()
+
+            self.assertEqual(app_mod._cache_access_flush(), 2)
+            mock_admin.rpc.assert_called_once()
+            name, params = mock_admin.rpc.call_args.args
+            self.assertEqual(name, 'bump_api_lookup_cache_access')
+            by_id = {r['id']: r for r in params['p_rows']}
+            self.assertEqual(by_id[1]['hits'], 2)
+            self.assertEqual(by_id[1]['last_accessed'], '2026-01-01T00:00:09+00:00')
+            self.assertEqual(app_mod._cache_access_flush(), 0)
+
+            # Without the RPC, fall back to one UPDATE per row.
+            mock_admin.rpc.side_effect = Exception('function does not exist')
+            with patch('app._cache_access_ensure_started'):
+                app_mod._cache_access_record({'id': 1, 'lookup_count': 5})
+            self.assertEqual(app_mod._cache_access_flush(), 1)
+            mock_admin.table.return_value.update.assert_called_once()
+            self.assertEqual(mock_admin.table.return_value.update.call_args.args[0]['lookup_count'], 6)
+
+            # A transient failure keeps the hits for the additive RPC instead of an absolute write.
+            mock_admin.table.reset_mock()
+            mock_admin.rpc.side_effect = [TimeoutError('read timed out'), MagicMock()]
+            with patch('app._cache_access_ensure_started'):
+                app_mod._cache_access_record({'id': 3, 'lookup_count': 5})
+                self.assertEqual(app_mod._cache_access_flush(), 0)
+                app_mod._cache_access_record({'id': 3, 'lookup_count': 5})
+            self.assertEqual(app_mod._cache_access_flush(), 1)
+            mock_admin.table.assert_not_called()
+            self.assertEqual([(r['id'], r['hits']) for r in mock_admin.rpc.call_args.args[1]['p_rows']], [(3, 2)])
+        finally:
+            app_mod.supabase_admin = original_admin
+
+    def test_product_l1_cache_is_bounded_and_skips_pending_rows(self):
+        original_max = app_mod.PRODUCT_L1_CACHE_MAX_ENTRIES
+        app_mod.PRODUCT_L1_CACHE_MAX_ENTRIES = 2
+        try:
+            app_mod._product_l1_put('fnsku', 'XPENDING001', {'fnsku': 'XPENDING001', 'asin': ''})
+            self.assertIsNone(app_mod._product_l1_get('fnsku', 'XPENDING001'))
+            for code in ('XA00000001', 'XA00000002', 'XA00000003'):
+                app_mod._product_l1_put('fnsku', code, {'fnsku': code, 'asin': 'B000000001'})
+            self.assertIsNone(app_mod._product_l1_get('fnsku', 'XA00000001'))
+            self.assertIsNotNone(app_mod._product_l1_get('fnsku', 'xa00000003'))
+        finally:
+            app_mod.PRODUCT_L1_CACHE_MAX_ENTRIES = original_max
+
+    def test_lookup_product_for_scan_uses_single_rpc_round_trip(self):
+        row = {"fnsku": "X00RPC0001", "asin": "B0RPC00001", "product_name": "Rpc Product"}
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value = MagicMock(
+            data={"product": row, "manifest_item": None, "source": "api_lookup_cache"}
+        )
+
+        product, item, source = app_mod.lookup_product_for_scan("x00rpc0001", "FNSKU", supabase)
+        self.assertEqual(product["asin"], "B0RPC00001")
+        self.assertIsNone(item)
+        self.assertEqual(source, "api_lookup_cache")
+        supabase.rpc.assert_called_once_with(
+            "resolve_scan_product", {"p_code": "X00RPC0001", "p_code_type": "FNSKU"}
+        )
+        supabase.table.assert_not_called()
+
+        # Repeat scan is answered from the L1 cache without another call.
+        app_mod.lookup_product_for_scan("X00RPC0001", "FNSKU", supabase)
+        self.assertEqual(supabase.rpc.call_count, 1)
+
+    def test_lookup_product_for_scan_falls_back_when_rpc_missing(self):
+        item = {"X-Z ASIN": "LPN0000001", "Fn Sku": "X00LPN0001", "B00 Asin": ""}
+        product = {"fnsku": "X00LPN0001", "title": "Manifest Product"}
+        supabase = MagicMock()
+        supabase.rpc.side_effect = Exception("function resolve_scan_product does not exist")
+
+        def table(name):
+            t = MagicMock()
+            if name == "manifest_data":
+                t.select.return_value.eq.return_value.maybe_single.return_value.execute.return_value = MagicMock(data=item)
+            elif name == "products":
+                t.select.return_value.or_.return_value.maybe_single.return_value.execute.return_value = MagicMock(data=product)
+            return t
+        supabase.table.side_effect = table
+
+        found, found_item, source = app_mod.lookup_product_for_scan("LPN0000001", "LPN", supabase)
+        self.assertEqual(found, product)
+        self.assertEqual(found_item, item)
+        self.assertEqual(source, "manifest_data")
+        # The failed RPC is not retried on every scan.
+        app_mod.lookup_product_for_scan("LPN0000001", "LPN", supabase)
+        self.assertEqual(supabase.rpc.call_count, 1)
+
+    def test_fnsku_resolver_saves_when_asin_arrives(self):
+        original_key = app_mod.os.environ.get('FNSKU_API_KEY')
+        app_mod.os.environ['FNSKU_API_KEY'] = 'test-key'
+        try:
+            with patch('app._fnsku_resolver_ensure_started'):
+                self.assertTrue(app_mod._fnsku_resolver_submit('XRESOLVE01', {'id': 't9', 'taskState': 1}, fetch_rainforest=False))
+            task = app_mod._fnsku_resolver_tasks['XRESOLVE01']
+
+            pending = MagicMock(status_code=200, text='{}')
+            pending.json.return_value = {'succeeded': True, 'data': {'id': 't9', 'taskState': 1, 'asin': ''}}
+            with patch('app.upstream_http.get', return_value=pending):
+                app_mod._fnsku_resolver_poll_one(task)
+            self.assertEqual(app_mod._fnsku_resolver_status('XRESOLVE01')['state'], 'pending')
+
+            ready = MagicMock(status_code=200, text='{}')
+            ready.json.return_value = {'succeeded': True, 'data': {'id': 't9', 'taskState': 2, 'asin': 'B0D8B91PQF'}}
+            saved = ({'success': True, 'fnsku': 'XRESOLVE01', 'asin': 'B0D8B91PQF'}, 11)
+            with patch('app.upstream_http.get', return_value=ready), \
+                    patch('app._build_fnsku_scan_response_and_save', return_value=saved) as save_mock:
+                app_mod._fnsku_resolver_poll_one(task)
+            save_mock.assert_called_once()
+            self.assertEqual(save_mock.call_args[0][:2], ('XRESOLVE01', 'B0D8B91PQF'))
+            status = app_mod._fnsku_resolver_status('XRESOLVE01')
+            self.assertEqual(status['state'], 'resolved')
+            self.assertEqual(status['response']['asin'], 'B0D8B91PQF')
+        finally:
+            if original_key is None:
+                app_mod.os.environ.pop('FNSKU_API_KEY', None)
+            else:
+                app_mod.os.environ['FNSKU_API_KEY'] = original_key
+
+    def test_scan_stream_pushes_cache_hit_and_resolver_outcome(self):
+        mock_admin = MagicMock()
+        hit = MagicMock()
+        hit.data = [{'fnsku': 'X004AWUF9B', 'asin': 'B0D8B91PQF', 'product_name': 'Ceiling Fan'}]
+        miss = MagicMock()
+        miss.data = []
+        eq = mock_admin.table.return_value.select.return_value.eq
+        eq.side_effect = lambda _col, code: MagicMock(**{
+            'limit.return_value.execute.return_value': hit if code == 'X004AWUF9B' else miss
+        })
+
+        original_admin = app_mod.supabase_admin
+        original_timeout = app_mod.SCAN_STREAM_TIMEOUT_SECONDS
+        app_mod.supabase_admin = mock_admin
+        app_mod.SCAN_STREAM_TIMEOUT_SECONDS = 5
+        try:
+            def finish_later():
+                time.sleep(0.2)
+                task = app_mod._fnsku_resolver_tasks['XPENDING001']
+                app_mod._fnsku_resolver_finish(task, 'not_found')
+
+            with patch('app._fnsku_resolver_ensure_started'), \
+                    patch('app.get_ids_from_request', return_value=('user-1', None)):
+                app_mod._fnsku_resolver_submit('XPENDING001', {'id': 't1'}, fetch_rainforest=False)
+                finisher = threading.Thread(target=finish_later)
+                finisher.start()
+                resp = self.client.get('/api/scan/stream?codes=X004AWUF9B,XPENDING001,XUNSCANNED1')
+                body = resp.get_data(as_text=True)
+                finisher.join(2)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.mimetype.startswith('text/event-stream'))
+            events = [line[len('event: '):] for line in body.splitlines() if line.startswith('event: ')]
+            # A code nobody scanned is not handed to the resolver.
+            self.assertEqual(events, ['resolved', 'timeout', 'not_in_api_database', 'done'])
+            self.assertNotIn('XUNSCANNED1', app_mod._fnsku_resolver_tasks)
+            self.assertIn('"asin": "B0D8B91PQF"', body)
+        finally:
+            app_mod.supabase_admin = original_admin
+            app_mod.SCAN_STREAM_TIMEOUT_SECONDS = original_timeout
+
+    def test_scan_stream_requires_user_and_well_formed_codes(self):
+        resp = self.client.get('/api/scan/stream?codes=X004AWUF9B')
+        self.assertEqual(resp.status_code, 401)
+        with patch('app.get_ids_from_request', return_value=('user-1', None)):
+            resp = self.client.get('/api/scan/stream?codes=X004AWUF9B,not%20a%20code')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_singleflight_coalesces_concurrent_calls(self):
+        calls = []
+        release = threading.Event()
+
+        def resolve():
+            calls.append(1)
+            release.wait(2)
+            return {'status': 'resolved', 'asin': 'B0D8B91PQF'}
+
+        results = []
+
+        def worker():
+            results.append(app_mod._singleflight_do('fnsku:XSHARED0001:rf', resolve))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sum(1 for _result, shared in results if not shared), 1)
+        self.assertTrue(all(result['asin'] == 'B0D8B91PQF' for result, _shared in results))
+
+    def test_singleflight_propagates_leader_error(self):
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            app_mod._singleflight_do('fnsku:XERROR0001:rf', fail)
+        # The failed call is not remembered.
+        self.assertEqual(app_mod._singleflight_do('fnsku:XERROR0001:rf', lambda: 1), (1, False))
+
     def test_log_scan_to_history_does_not_sleep(self):
         mock_client = MagicMock()
         existing = MagicMock()
@@ -184,5 +503,350 @@ class TestScanEndpoints(unittest.TestCase):
                 sleep_mock2.assert_not_called()
 
 
+    def test_scan_history_queue_dedupes_counts_pending_and_bulk_inserts(self):
+        mock_client = MagicMock()
+        dedup = mock_client.from_.return_value.select.return_value.eq.return_value.in_.return_value.eq.return_value
+        dedup.execute.return_value = MagicMock(data=[{'scanned_code': 'XOLD000001'}])
+
+        with patch('app._scan_history_ensure_started'):
+            self.assertTrue(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000001', '', mock_client))
+            self.assertFalse(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000001', '', mock_client))
+            self.assertTrue(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XOLD000001', '', mock_client))
+            self.assertTrue(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000002', '', mock_client))
+        mock_client.table.assert_not_called()
+        self.assertEqual(app_mod._scan_history_pending_count('user-1', 'tenant-1'), 3)
+        self.assertEqual(app_mod._scan_history_pending_count('user-2', 'tenant-1'), 0)
+
+        self.assertEqual(app_mod._scan_history_flush(), 2)
+        mock_client.table.return_value.insert.assert_called_once()
+        inserted = mock_client.table.return_value.insert.call_args.args[0]
+        self.assertEqual(sorted(r['scanned_code'] for r in inserted), ['XNEW000001', 'XNEW000002'])
+        self.assertEqual(app_mod._scan_history_pending_count('user-1', 'tenant-1'), 0)
+
+        # Known codes are rejected in memory without another round-trip.
+        with patch('app._scan_history_ensure_started'):
+            self.assertFalse(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XOLD000001', '', mock_client))
+        self.assertEqual(app_mod._scan_history_flush(), 0)
+        self.assertEqual(mock_client.from_.call_count, 1)
+
+
+    def test_used_scan_count_flushes_queued_scans_in_one_rpc_and_ignores_repeats(self):
+        mock_client = MagicMock()
+        trial_start = app_mod.datetime(2026, 1, 1, tzinfo=app_mod.timezone.utc)
+        original_admin = app_mod.supabase_admin
+        app_mod.supabase_admin = mock_client
+        try:
+            with patch('app._scan_history_ensure_started'), \
+                    patch('app.get_trial_start_date', return_value=trial_start):
+                # XOLD000001 is already in scan_history, but this process has not seen it yet.
+                mock_client.rpc.return_value.execute.return_value = MagicMock(data={'new_codes': [], 'used': 7})
+                self.assertTrue(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XOLD000001', '', mock_client))
+                self.assertEqual(app_mod.get_used_scan_count('user-1', 'tenant-1', trial_start), 7)
+
+                # A genuinely new code is counted, from the usage the same call returned.
+                mock_client.rpc.return_value.execute.return_value = MagicMock(data={'new_codes': ['XNEW000009'], 'used': 8})
+                self.assertTrue(app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000009', '', mock_client))
+                self.assertEqual(app_mod.get_used_scan_count('user-1', 'tenant-1', trial_start), 8)
+            self.assertEqual(mock_client.rpc.call_count, 2)
+            mock_client.from_.assert_not_called()
+            self.assertEqual(app_mod._scan_history_pending_count('user-1', 'tenant-1'), 0)
+        finally:
+            app_mod.supabase_admin = original_admin
+            app_mod._invalidate_used_scan_count_cache()
+
+    def test_log_scans_rpc_is_only_disabled_when_missing(self):
+        from postgrest.exceptions import APIError
+
+        mock_client = MagicMock()
+        mock_client.from_.return_value.select.return_value.eq.return_value.in_.return_value.eq.return_value \
+            .execute.return_value = MagicMock(data=[])
+        mock_client.rpc.return_value.execute.side_effect = TimeoutError('read timed out')
+        with patch('app._scan_history_ensure_started'), patch('app.get_trial_start_date', return_value=None):
+            app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000001', '', mock_client)
+            self.assertEqual(app_mod._scan_history_flush(), 1)
+            self.assertEqual(app_mod._log_scans_rpc_disabled_until, 0.0)
+
+            mock_client.rpc.return_value.execute.side_effect = APIError(
+                {'code': 'PGRST202', 'message': 'Could not find the function public.log_scans_and_count'}
+            )
+            app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000002', '', mock_client)
+            self.assertEqual(app_mod._scan_history_flush(), 1)
+            self.assertGreater(app_mod._log_scans_rpc_disabled_until, app_mod._time.time())
+        app_mod._invalidate_used_scan_count_cache()
+
+    def test_scan_history_flush_logs_and_counts_in_one_rpc(self):
+        mock_client = MagicMock()
+        mock_client.rpc.return_value.execute.return_value = MagicMock(data={'new_codes': ['XNEW000001'], 'used': 7})
+        trial_start = app_mod.datetime(2026, 1, 1, tzinfo=app_mod.timezone.utc)
+        original_admin = app_mod.supabase_admin
+        app_mod.supabase_admin = mock_client
+        try:
+            with patch('app._scan_history_ensure_started'), \
+                    patch('app.get_trial_start_date', return_value=trial_start):
+                app_mod.log_scan_to_history('user-1', 'tenant-1', 'XNEW000001', '', mock_client, api_lookup_cache_id=5)
+                app_mod.log_scan_to_history('user-1', 'tenant-1', 'XOLD000001', '', mock_client)
+                self.assertEqual(app_mod._scan_history_flush(), 1)
+
+                mock_client.rpc.assert_called_once()
+                name, params = mock_client.rpc.call_args.args
+                self.assertEqual(name, 'log_scans_and_count')
+                self.assertEqual(params['p_user_id'], 'user-1')
+                self.assertEqual(params['p_tenant_id'], 'tenant-1')
+                self.assertEqual([r['scanned_code'] for r in params['p_scans']], ['XNEW000001', 'XOLD000001'])
+                self.assertEqual(params['p_scans'][0]['api_lookup_cache_id'], 5)
+                mock_client.table.assert_not_called()
+                mock_client.from_.assert_not_called()
+
+                # Usage returned by the RPC answers the next count without a count query.
+                self.assertEqual(app_mod.get_used_scan_count('user-1', 'tenant-1', trial_start), 7)
+                mock_client.from_.assert_not_called()
+        finally:
+            app_mod.supabase_admin = original_admin
+            app_mod._invalidate_used_scan_count_cache()
+
+
+    def test_get_ids_from_request_verifies_jwt_locally_and_caches_claims(self):
+        secret = 'test-jwt-secret-0123456789abcdef0123456789'
+        token = app_mod.jwt.encode(
+            {
+                'sub': 'user-1',
+                'aud': 'authenticated',
+                'exp': int(time.time()) + 3600,
+                'app_metadata': {'tenant_id': 'tenant-1'},
+            },
+            secret,
+            algorithm='HS256',
+        )
+        mock_client = MagicMock()
+        headers = {'Authorization': f'Bearer {token}'}
+        with patch('app.SUPABASE_JWT_SECRET', secret), patch('app.supabase', mock_client):
+            with app_mod.app.test_request_context('/api/scan', headers=headers):
+                with patch('app._verify_access_token_locally', wraps=app_mod._verify_access_token_locally) as verify:
+                    self.assertEqual(app_mod.get_ids_from_request(), ('user-1', 'tenant-1'))
+                    self.assertEqual(app_mod.get_ids_from_request(), ('user-1', 'tenant-1'))
+                    self.assertEqual(verify.call_count, 1)
+            with app_mod.app.test_request_context('/api/scan', headers=headers):
+                with patch('app._verify_access_token_locally') as verify:
+                    self.assertEqual(app_mod.get_ids_from_request(), ('user-1', 'tenant-1'))
+                    verify.assert_not_called()
+
+            expired = app_mod.jwt.encode(
+                {'sub': 'user-1', 'aud': 'authenticated', 'exp': int(time.time()) - 10},
+                secret,
+                algorithm='HS256',
+            )
+            with app_mod.app.test_request_context('/api/scan', headers={'Authorization': f'Bearer {expired}'}):
+                self.assertEqual(app_mod.get_ids_from_request(), (None, None))
+        mock_client.auth.get_user.assert_not_called()
+
+
+    def test_debug_events_are_off_by_default_and_queued_to_file_when_enabled(self):
+        import json
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('app._DEBUG_EVENT_DIR', tmp):
+                app_mod._debug_event('testsess', 'H1', 'tests', 'off')
+                with patch('app.DEBUG_EVENT_LOGS', True):
+                    app_mod._dbg_scan_perf_log('H2', 'tests', 'on', {'code': 'X1'})
+                path = Path(tmp) / 'debug-879cbd.log'
+                deadline = time.time() + 2
+                while time.time() < deadline and not (path.exists() and path.read_text()):
+                    time.sleep(0.01)
+                self.assertFalse((Path(tmp) / 'debug-testsess.log').exists())
+                rec = json.loads(path.read_text().splitlines()[0])
+                app_mod._debug_event_file_handler.close()
+        self.assertEqual(rec['sessionId'], '879cbd')
+        self.assertEqual(rec['message'], 'on')
+        self.assertEqual(rec['data'], {'code': 'X1'})
+
+    def test_hot_path_sampler_decides_once_per_request(self):
+        sampler = app_mod._HotPathSampler()
+        info = app_mod.logging.LogRecord('app.scan', app_mod.logging.INFO, __file__, 1, 'x', None, None)
+        warning = app_mod.logging.LogRecord('app.scan', app_mod.logging.WARNING, __file__, 1, 'x', None, None)
+        with patch('app.HOT_PATH_LOG_SAMPLE_RATE', 0.5):
+            with app_mod.app.test_request_context('/api/scan'):
+                with patch('app.random.random', side_effect=[0.9, 0.1]):
+                    self.assertFalse(sampler.filter(info))
+                    self.assertFalse(sampler.filter(info))
+                self.assertTrue(sampler.filter(warning))
+            with app_mod.app.test_request_context('/api/scan'):
+                with patch('app.random.random', return_value=0.1):
+                    self.assertTrue(sampler.filter(info))
+
+
+    def test_fnsku_breaker_open_queues_scan_and_resolver_probes_later(self):
+        breaker = app_mod._fnsku_vendor_breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+        mock_admin = MagicMock()
+        empty = MagicMock()
+        empty.data = []
+        mock_admin.table.return_value.select.return_value.eq.return_value.limit.return_value.execute.return_value = empty
+        original_admin = app_mod.supabase_admin
+        original_key = app_mod.os.environ.get('FNSKU_API_KEY')
+        app_mod.supabase_admin = mock_admin
+        app_mod.os.environ['FNSKU_API_KEY'] = 'test-key'
+        try:
+            with patch('app._fnsku_resolver_ensure_started'), \
+                    patch('app.upstream_http.get') as vendor_get, \
+                    patch('app.upstream_http.post') as vendor_post:
+                outcome = app_mod._resolve_fnsku_external('XQUEUED0001', 'test-key', None, False)
+                resp = self.client.get('/api/scan/status?code=XQUEUED0002&attempt=1')
+                task = app_mod._fnsku_resolver_tasks['XQUEUED0001']
+                app_mod._fnsku_resolver_poll_one(task)
+            vendor_get.assert_not_called()
+            vendor_post.assert_not_called()
+            self.assertEqual(outcome['status'], 'pending')
+            self.assertTrue(outcome['queued'])
+            self.assertTrue((resp.get_json() or {}).get('lookup_still_pending'))
+            self.assertTrue(task['needs_add'])
+            self.assertEqual(task['attempts'], 0)
+
+            # Once the open window passes, the resolver's poll is the half-open probe and creates the task.
+            added = MagicMock(status_code=200)
+            added.json.return_value = {'succeeded': True, 'data': {'id': 't9', 'taskState': 0, 'asin': ''}}
+            polled = MagicMock(status_code=200, text='{}')
+            polled.json.return_value = {'succeeded': True, 'data': {'id': 't9', 'taskState': 0, 'asin': ''}}
+            with patch.object(breaker, 'open_seconds', 0), \
+                    patch('app.upstream_http.post', return_value=added) as vendor_post, \
+                    patch('app.upstream_http.get', return_value=polled):
+                app_mod._fnsku_resolver_poll_one(task)
+            vendor_post.assert_called_once()
+            self.assertFalse(task['needs_add'])
+            self.assertEqual(task['task_id'], 't9')
+            self.assertEqual(task['state'], 'pending')
+            self.assertEqual(breaker.state, 'closed')
+        finally:
+            app_mod.supabase_admin = original_admin
+            if original_key is None:
+                app_mod.os.environ.pop('FNSKU_API_KEY', None)
+            else:
+                app_mod.os.environ['FNSKU_API_KEY'] = original_key
+
+    def test_fnsku_breaker_open_without_resolver_room_is_retryable_and_not_logged(self):
+        breaker = app_mod._fnsku_vendor_breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        mock_admin = MagicMock()
+        empty = MagicMock()
+        empty.data = []
+        mock_admin.table.return_value.select.return_value.eq.return_value.limit.return_value.execute.return_value = empty
+        mock_admin.rpc.return_value.execute.return_value = empty
+        original_admin = app_mod.supabase_admin
+        original_key = app_mod.os.environ.get('FNSKU_API_KEY')
+        app_mod.supabase_admin = mock_admin
+        app_mod.os.environ['FNSKU_API_KEY'] = 'test-key'
+        try:
+            with patch('app._fnsku_resolver_submit', return_value=False), \
+                    patch('app.get_ids_from_request', return_value=('user-1', None)), \
+                    patch('app.get_used_scan_count', return_value=0), \
+                    patch('app.log_scan_to_history') as log_scan, \
+                    patch('app.upstream_http.post') as vendor_post:
+                outcome = app_mod._resolve_fnsku_external('XNOROOM0001', 'test-key', None, False)
+                resp = self.client.post('/api/scan', json={'code': 'XNOROOM0002', 'user_id': 'user-1'})
+            self.assertEqual(outcome['status'], 'vendor_unavailable')
+            self.assertFalse(outcome['queued'])
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual((resp.get_json() or {}).get('error'), 'vendor_unavailable')
+            log_scan.assert_not_called()
+            vendor_post.assert_not_called()
+        finally:
+            app_mod.supabase_admin = original_admin
+            if original_key is None:
+                app_mod.os.environ.pop('FNSKU_API_KEY', None)
+            else:
+                app_mod.os.environ['FNSKU_API_KEY'] = original_key
+
+    def test_scan_enrichment_reuses_result_when_another_worker_holds_the_lock(self):
+        mock_admin = MagicMock()
+        mock_admin.rpc.return_value.execute.return_value = MagicMock(data=False)
+        cached = {'product': {'title': 'Shared Widget', 'asin': 'B000SHARE1'}}
+        lock_row = mock_admin.table.return_value.select.return_value.eq.return_value.limit.return_value
+        cache_row = (mock_admin.table.return_value.select.return_value.eq.return_value.gte.return_value
+                     .order.return_value.limit.return_value)
+        lock_row.execute.return_value = MagicMock(data=[{'result': None}])
+        cache_row.execute.return_value = MagicMock(
+            data=[{'rainforest_raw_data': app_mod.json.dumps(cached), 'updated_at': '2026-10-17T00:00:00+00:00'}]
+        )
+        original_admin = app_mod.supabase_admin
+        app_mod.supabase_admin = mock_admin
+        try:
+            # An import holder's api_lookup_cache row is picked up.
+            with patch('app._ENRICHMENT_WAIT_POLL_SECONDS', 0), \
+                    patch('app.rainforest_client.get_product') as rf_get:
+                resp = app_mod._rainforest_get_product_shared('b000share1', key='k')
+            rf_get.assert_not_called()
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json(), cached)
+            name, params = mock_admin.rpc.call_args.args
+            self.assertEqual(name, 'try_lock_enrichment')
+            self.assertEqual(params['p_key'], 'asin:B000SHARE1')
+
+            # So is a scan holder's result left on the lock row.
+            lock_row.execute.return_value = MagicMock(data=[{'result': cached}])
+            cache_row.execute.return_value = MagicMock(data=[])
+            with patch('app._ENRICHMENT_WAIT_POLL_SECONDS', 0), \
+                    patch('app.rainforest_client.get_product') as rf_get:
+                resp = app_mod._rainforest_get_product_shared('B000SHARE1', key='k')
+            rf_get.assert_not_called()
+            self.assertEqual(resp.json(), cached)
+
+            # With the lock, this worker pays for the call and leaves the result on the lock row for
+            # waiters instead of releasing it; nothing extra is written to api_lookup_cache.
+            mock_admin.rpc.reset_mock()
+            mock_admin.rpc.return_value.execute.return_value = MagicMock(data=True)
+            mock_admin.table.return_value.update.return_value.eq.return_value.execute.return_value = MagicMock(
+                data=[{'canonical_key': 'asin:B000SHARE1'}]
+            )
+            events = []
+            paid = MagicMock(status_code=200)
+            paid.json.return_value = cached
+            mock_admin.rpc.side_effect = lambda name, params: events.append(name) or mock_admin.rpc.return_value
+            with patch('app.rainforest_client.get_product', return_value=paid) as rf_get, \
+                    patch('app.import_save_rainforest_to_cache') as save:
+                app_mod._rainforest_get_product_shared('B000SHARE1', key='k')
+            rf_get.assert_called_once_with('B000SHARE1', key='k')
+            save.assert_not_called()
+            self.assertEqual(events, ['try_lock_enrichment'])
+            mock_admin.table.assert_called_with('global_enrichment_locks')
+            update = mock_admin.table.return_value.update
+            update.assert_called_once()
+            self.assertEqual(update.call_args.args[0]['result'], cached)
+            self.assertIn('locked_until', update.call_args.args[0])
+            update.return_value.eq.assert_called_once_with('canonical_key', 'asin:B000SHARE1')
+
+            # Without the result column (migration 032 not applied) the lock is released as before.
+            mock_admin.table.return_value.update.return_value.eq.return_value.execute.side_effect = RuntimeError(
+                'column "result" does not exist'
+            )
+            events.clear()
+            with patch('app.rainforest_client.get_product', return_value=paid):
+                app_mod._rainforest_get_product_shared('B000SHARE1', key='k')
+            self.assertEqual(events, ['try_lock_enrichment', 'release_enrichment_lock'])
+
+            # A holder that releases without a result hands the lock over instead of making the waiter sit it out.
+            mock_admin.rpc.side_effect = None
+            mock_admin.rpc.reset_mock()
+            mock_admin.rpc.return_value.execute.side_effect = [
+                MagicMock(data=False), MagicMock(data=True), MagicMock(data=None),
+            ]
+            lock_row.execute.return_value = MagicMock(data=[])
+            with patch('app._ENRICHMENT_WAIT_POLL_SECONDS', 0), \
+                    patch('app.ENRICHMENT_WAIT_SECONDS', 30), \
+                    patch('app.rainforest_client.get_product', return_value=paid) as rf_get:
+                started = time.monotonic()
+                app_mod._rainforest_get_product_shared('B000SHARE1', key='k')
+            self.assertLess(time.monotonic() - started, 5)
+            rf_get.assert_called_once()
+            self.assertEqual(
+                [c.args[0] for c in mock_admin.rpc.call_args_list],
+                ['try_lock_enrichment', 'try_lock_enrichment', 'release_enrichment_lock'],
+            )
+        finally:
+            app_mod.supabase_admin = original_admin
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,33 @@
+"""Unit tests for the pooled upstream HTTP sessions (no network)."""
+
+from unittest.mock import MagicMock, patch
+
+import upstream_http
+
+
+def teardown_function():
+    upstream_http.close_all()
+
+
+def test_one_pooled_session_per_host():
+    a = upstream_http.session_for('https://api.rainforestapi.com/request')
+    b = upstream_http.session_for('https://API.rainforestapi.com/other?x=1')
+    c = upstream_http.session_for('https://ato.fnskutoasin.com/api/v1/ScanTask/AddOrGet')
+    assert a is b
+    assert a is not c
+    adapter = a.get_adapter('https://api.rainforestapi.com/request')
+    assert adapter._pool_maxsize == upstream_http.UPSTREAM_POOL_MAXSIZE
+
+
+def test_sessions_do_not_keep_cookies():
+    session = upstream_http.session_for('https://graph.facebook.com/v18.0/me')
+    assert session.cookies.get_policy().allowed_domains() == ()
+
+
+def test_default_timeout_only_when_caller_passes_none():
+    session = upstream_http.session_for('https://api.upcitemdb.com/prod/trial/lookup')
+    with patch.object(session, 'request', return_value=MagicMock(status_code=200)) as req:
+        upstream_http.get('https://api.upcitemdb.com/prod/trial/lookup', params={'upc': '1'})
+        upstream_http.post('https://api.upcitemdb.com/prod/trial/lookup', json={}, timeout=5)
+    assert req.call_args_list[0].kwargs['timeout'] == upstream_http.UPSTREAM_DEFAULT_TIMEOUT
+    assert req.call_args_list[1].kwargs['timeout'] == 5
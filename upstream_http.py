@@ -0,0 +1,196 @@
+"""
+Pooled HTTP sessions for upstream vendor APIs (FNSKU, Rainforest, UPCitemdb, eBay, Shopify,
+Facebook Graph, Supabase REST).
+
+One requests.Session per host keeps TCP/TLS connections alive between calls instead of a fresh
+handshake per request. Sessions never store cookies, so they are safe to share between the
+request threads and the batch / resolver thread pools.
+
+TokenBucket and CircuitBreaker are the shared pieces for vendor clients that need rate limiting
+and fail-fast behaviour (see rainforest_client.py).
+
+Environment:
+  UPSTREAM_POOL_MAXSIZE          connections kept per host (default 32)
+  UPSTREAM_DEFAULT_TIMEOUT       seconds, used when a caller passes no timeout (default 30)
+"""
+
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+UPSTREAM_POOL_MAXSIZE = int(os.environ.get('UPSTREAM_POOL_MAXSIZE', '32'))
+UPSTREAM_DEFAULT_TIMEOUT = float(os.environ.get('UPSTREAM_DEFAULT_TIMEOUT', '30'))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _new_session():
+    session = requests.Session()
+    # Shared across threads and tenants: never carry cookies from one call into the next.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    # pool_block=False: a burst beyond the pool opens extra short-lived connections rather than waiting.
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, UPSTREAM_POOL_MAXSIZE), max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def session_for(url):
+    """The shared session for url's scheme + host, created on first use."""
+    parts = urlsplit(url)
+    key = (parts.scheme.lower(), parts.netloc.lower())
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _new_session()
+    return session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', UPSTREAM_DEFAULT_TIMEOUT)
+    return session_for(url).request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return request('GET', url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('PUT', url, data=data, **kwargs)
+
+
+def close_all():
+    """Close every pooled session (tests, shutdown)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception:
+            pass
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a vendor whose circuit breaker is open."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `burst` banked."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, max_wait):
+        """Take one token, waiting up to max_wait seconds. Returns False if none became available."""
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + max(0.0, max_wait)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls go through; `failure_threshold` failures in a row open it.
+    open: allow() is False for `open_seconds`, then one probe is let through (half-open).
+    half_open: the probe's success closes the breaker, its failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, open_seconds=30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_seconds = float(open_seconds)
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.open_seconds:
+                return 'half_open'
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = 'half_open'
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give back a half-open probe slot that allow() granted but was not used."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._opened_at = 0.0
+            self._probe_in_flight = False